@@ -1,14 +1,28 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Path, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 import uvicorn
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
 import os
+import hashlib
+import bisect
+import math
+import asyncio
 
 from services.llm_service import LLMService
 from services.product_service import ProductService
+from services.cache_service import RecommendationCache, SerializedResponseCache
+from config import config
+from services.coalescer import RequestCoalescer
+from services.refinement_service import RefinementStore
+from services.request_log import RequestRecorder
+from services.session_store import SessionStore
+from services.speculation import SpeculativeScheduler
+from services.metrics import ServerTimingMiddleware, metrics
+from services.serialization import CompressionMiddleware, FastJSONResponse, ProductEncoder, acompress, dumps, negotiate_encoding
 
-app = FastAPI(title="AI Product Recommendation API")
+app = FastAPI(title="AI Product Recommendation API", default_response_class=FastJSONResponse)
 
 # Enable CORS
 app.add_middleware(
@@ -17,11 +31,57 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["ETag", "X-Next-Cursor", "X-Total-Count"],  # Paging and conditional /api/products requests
 )
 
+# Compress large JSON responses for clients that accept gzip or brotli
+if config['COMPRESSION_ENABLED']:
+    app.add_middleware(CompressionMiddleware)
+
+# Report each request's stage breakdown in a Server-Timing header
+if config['METRICS_TIMING_HEADER']:
+    app.add_middleware(ServerTimingMiddleware)
+
 # Initialize services
 product_service = ProductService()
-llm_service = LLMService()
+llm_service = LLMService(product_service)
+recommendation_cache = RecommendationCache()
+request_coalescer = RequestCoalescer()
+refinements = RefinementStore()
+request_recorder = RequestRecorder()
+session_store = SessionStore(product_service)
+speculation = SpeculativeScheduler(llm_service.spare_llm_slots, recommendation_cache.contains)
+products_page_cache = SerializedResponseCache(config['PRODUCTS_PAGE_CACHE_SIZE'])
+product_encoder = ProductEncoder(product_service)
+if config['PREENCODE_PRODUCTS']:
+    product_encoder.encodings()
+    product_service.on_reload(product_encoder.encodings)
+
+def collect_service_metrics():
+    """
+    Cache hit ratios, cache sizes and catalog size, read when /metrics is scraped
+    """
+    caches = {
+        "recommendations": recommendation_cache.stats(),
+        "semantic": llm_service.semantic_cache.stats(),
+        "products_pages": products_page_cache.stats()
+    }
+    samples = []
+    for name, stats in caches.items():
+        lookups = stats["hits"] + stats["misses"]
+        samples.append((name, stats, stats["hits"] / lookups if lookups else 0.0))
+    return [
+        ("cache_hit_ratio", "gauge", "Share of cache lookups that were hits",
+         [({"cache": name}, round(ratio, 4)) for name, _, ratio in samples]),
+        ("cache_entries", "gauge", "Entries held in memory by each cache",
+         [({"cache": name}, stats["entries"]) for name, stats, _ in samples]),
+        ("coalesced_requests_total", "counter", "Recommendation requests that shared another request's LLM call",
+         [({}, request_coalescer.coalesced)]),
+        ("catalog_products", "gauge", "Products in the current catalog snapshot",
+         [({}, len(product_service.ordered_ids))])
+    ]
+
+metrics.add_collector(collect_service_metrics)
 
 # Define request models
 class UserPreferences(BaseModel):
@@ -32,38 +92,621 @@ class UserPreferences(BaseModel):
 class RecommendationRequest(BaseModel):
     preferences: UserPreferences
     browsing_history: List[str] = []
+    session_id: Optional[str] = Field(None, min_length=1, max_length=128)
+
+class BatchRecommendationRequest(BaseModel):
+    requests: List[RecommendationRequest]
+
+class CatalogDelta(BaseModel):
+    upserts: List[Dict[str, Any]] = []
+    deletes: List[str] = []
+
+class InventoryUpdate(BaseModel):
+    inventory: Dict[str, int]
+
+class ViewEvents(BaseModel):
+    product_ids: List[str]
+    preferences: Optional[UserPreferences] = None
+
+# Session IDs are chosen by clients; keep them short enough to be cheap keys
+SESSION_ID = Path(..., min_length=1, max_length=128)
+
+@app.on_event("startup")
+async def start_catalog_watcher():
+    """
+    Start polling the catalog file for changes when hot reload is enabled
+    """
+    if config['CATALOG_RELOAD_INTERVAL'] > 0:
+        product_service.start_watcher(config['CATALOG_RELOAD_INTERVAL'])
+
+@app.on_event("shutdown")
+async def stop_catalog_watcher():
+    product_service.stop_watcher()
+
+@app.on_event("shutdown")
+async def stop_cpu_stage():
+    llm_service.cpu_stage.shutdown()
+
+@app.on_event("shutdown")
+async def flush_request_log():
+    request_recorder.flush()
+
+@app.on_event("shutdown")
+async def stop_speculation():
+    speculation.stop()
+
+@app.on_event("startup")
+async def warm_up_llm_connections():
+    """
+    Open pooled connections to each LLM backend before the first request
+    """
+    if config['LLM_WARMUP_CONNECTIONS'] > 0:
+        for name, warmup in (await llm_service.router.warm_up()).items():
+            print(f"Opened {warmup['opened']} connections to LLM backend {name} in {warmup['ms']}ms")
+
+@app.on_event("shutdown")
+async def close_llm_connections():
+    await llm_service.router.aclose()
 
 @app.get("/api/products")
-async def get_products():
+async def get_products(
+    request: Request,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_rating: Optional[float] = None,
+    fields: Optional[str] = None,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    cursor: Optional[str] = None
+):
     """
-    Return the full product catalog
+    Return the product catalog, optionally filtered, projected and paginated
+    
+    - category / brand: comma-separated values, matching any of them
+    - min_price / max_price / min_rating: inclusive bounds
+    - fields: comma-separated fields to return (id is always included)
+    - limit with offset or cursor: page through results; the next page's
+      cursor is returned in the X-Next-Cursor header, the match count in
+      X-Total-Count
+    
+    Without parameters the full catalog is returned, as before. Responses
+    carry an ETag derived from the catalog version and the query, and
+    If-None-Match requests get a 304.
     """
-    products = product_service.get_all_products()
-    return products
+    request_recorder.record_products(request.query_params)
+    if limit is not None:
+        limit = max(1, min(limit, config['PRODUCTS_MAX_PAGE_SIZE']))
+    query = (
+        tuple(sorted(set(category.split(',')))) if category else None,
+        tuple(sorted(set(brand.split(',')))) if brand else None,
+        min_price, max_price, min_rating,
+        tuple(sorted(set(fields.split(',')) | {'id'})) if fields else None,
+        limit, offset, cursor
+    )
+    # Render from one snapshot so a concurrent catalog reload can't mix versions
+    catalog = product_service.snapshot
+    cache_key = (catalog.catalog_version, query)
+    etag = 'W/"{}-{}"'.format(
+        catalog.catalog_version,
+        hashlib.sha1(repr(query).encode('utf-8')).hexdigest()[:16]
+    )
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    page = products_page_cache.get(cache_key)
+    if page is None:
+        # The last item holds the page compressed per content coding
+        page = (*render_products_page(catalog, query), {})
+        products_page_cache.set(cache_key, page)
+    body, total, next_cursor, compressed = page
+    
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Total-Count": str(total)}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    
+    # Compress each cached page once per encoding; CompressionMiddleware passes
+    # encoded responses through
+    encoding = negotiate_encoding(request.headers.get("accept-encoding", "")) if config['COMPRESSION_ENABLED'] else None
+    if encoding is not None and len(body) >= config['COMPRESSION_MIN_BYTES']:
+        if encoding not in compressed:
+            compressed[encoding] = await acompress(body, encoding)
+        body = compressed[encoding]
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def etag_matches(if_none_match, etag):
+    """
+    Whether an If-None-Match header matches an ETag
+    
+    The header may list several ETags separated by commas, or be "*".
+    Tags are compared weakly (ignoring a W/ prefix), as If-None-Match requires.
+    """
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if (candidate[2:] if candidate.startswith('W/') else candidate) == opaque:
+            return True
+    return False
+
+def render_products_page(catalog, query):
+    """
+    Filter, paginate and JSON-encode one /api/products page
+    
+    Parameters:
+    - catalog (CatalogSnapshot): Catalog snapshot to read from
+    - query (tuple): Normalized query parameters
+    
+    Returns:
+    - tuple: (encoded body, total matches, next cursor or None)
+    """
+    categories, brands, min_price, max_price, min_rating, fields, limit, offset, cursor = query
+    matching_ids = catalog.query_products(categories, brands, min_price, max_price, min_rating)
+    total = len(matching_ids)
+    
+    # Cursors are catalog positions, so pages stay stable under offset drift
+    start = max(0, offset)
+    if cursor:
+        try:
+            after = int(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        start = bisect.bisect_right(matching_ids, after, key=catalog.positions.__getitem__)
+    end = total if limit is None else min(total, start + limit)
+    page_ids = matching_ids[start:end]
+    next_cursor = str(catalog.positions[page_ids[-1]]) if page_ids and end < total else None
+    
+    products = [catalog.get_product_by_id(product_id) for product_id in page_ids]
+    if fields:
+        products = [{field: product[field] for field in fields if field in product} for product in products]
+        return dumps(products), total, next_cursor
+    return product_encoder.encode_list(products, catalog), total, next_cursor
 
 @app.post("/api/recommendations")
-async def get_recommendations(request: RecommendationRequest):
+async def get_recommendations(request: RecommendationRequest, tiered: bool = False, compact: bool = False):
     """
     Generate personalized product recommendations based on user preferences
     and browsing history
+    
+    With tiered=true, a cache miss is answered at once with rule-based
+    recommendations and a `refinement` object: its token identifies the LLM
+    result being computed in the background, which can be polled at
+    poll_url or awaited as a Server-Sent Event at events_url. Identical
+    requests share the refinement.
+    
+    With compact=true, each product carries only the fields the
+    recommendation cards show (see COMPACT_FIELDS).
+    
+    With a session_id, the session's recent products and most viewed
+    categories and brands stand in for the browsing history (see
+    request_history).
     """
     try:
         # Extract user preferences and browsing history from request
         user_preferences = request.preferences.dict()
-        browsing_history = request.browsing_history
-        
-        # Use the LLM service to generate recommendations
-        recommendations = llm_service.generate_recommendations(
+        browsing_history = await request_history(request)
+        request_recorder.record_recommendations(
             user_preferences,
             browsing_history,
-            product_service.get_all_products()
+            {"tiered": tiered, "compact": compact},
+            session=request.session_id is not None
         )
         
-        return recommendations
+        # Serve identical requests from the result cache
+        cache_key = recommendation_cache.make_key(
+            user_preferences,
+            browsing_history,
+            product_service.catalog_version
+        )
+        recommendations = recommendation_cache.get(cache_key)
+        speculation.record_request(cache_key, recommendations is not None)
+        if recommendations is None and tiered:
+            recommendations = await tiered_recommendations(cache_key, user_preferences, browsing_history)
+        elif recommendations is None:
+            recommendations = await refine_recommendations(cache_key, user_preferences, browsing_history)
+        return recommendations_response(recommendations, compact)
     
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def request_history(request):
+    """
+    Browsing history of a recommendation request
+    
+    Without a session_id, the browsing_history sent. With one, any products in
+    browsing_history are recorded as new views of that session first, and the
+    session's bounded state is used: its last SESSION_WINDOW products plus its
+    most viewed categories and brands. An unknown or expired session is an
+    empty history.
+    """
+    if request.session_id is None:
+        return request.browsing_history
+    if request.browsing_history:
+        state = await session_store.arecord_views(request.session_id, request.browsing_history)
+    else:
+        state = await session_store.aget(request.session_id)
+    return session_store.history(state)
+
+def recommendations_response(recommendations, compact=False):
+    """
+    JSON response for a recommendations result, splicing in the pre-encoded products
+    """
+    with metrics.stage("serialize"):
+        body = product_encoder.encode_recommendations(recommendations, compact)
+    return Response(content=body, media_type="application/json")
+
+async def refine_recommendations(cache_key, user_preferences, browsing_history):
+    """
+    Generate LLM recommendations for a request and cache them
+    """
+    # Use the LLM service to generate recommendations without blocking the event loop;
+    # concurrent identical requests share a single LLM call
+    recommendations = await request_coalescer.run(
+        cache_key,
+        lambda: llm_service.agenerate_recommendations(
+            user_preferences,
+            browsing_history,
+            product_service.get_all_products()
+        )
+    )
+    recommendation_cache.set(cache_key, recommendations)
+    return recommendations
+
+async def tiered_recommendations(cache_key, user_preferences, browsing_history):
+    """
+    Return the refined result if it is ready, else the heuristic tier with a
+    refinement token, starting the refinement if it isn't running yet
+    
+    A refinement that ended in the fallback is retried after
+    REFINEMENT_RETRY_SECONDS; until then the refinement status is retry,
+    with the seconds left in retry_after.
+    """
+    status, refined = refinements.result(cache_key)
+    if status == "done":
+        return refined
+    if status != "pending" and refinements.start(
+        cache_key,
+        lambda: refine_recommendations(cache_key, user_preferences, browsing_history)
+    ):
+        status = "pending"
+    
+    recommendations = await llm_service.agenerate_heuristic_recommendations(
+        user_preferences,
+        browsing_history,
+        product_service.get_all_products()
+    )
+    recommendations["refinement"] = {
+        "token": cache_key,
+        "status": "pending",
+        "poll_url": f"/api/recommendations/refined/{cache_key}",
+        "events_url": f"/api/recommendations/refined/{cache_key}/events"
+    }
+    if status != "pending":
+        recommendations["refinement"]["status"] = "retry"
+        recommendations["refinement"]["retry_after"] = round(refinements.retry_after(cache_key), 1)
+    return recommendations
+
+@app.get("/api/recommendations/refined/{token}")
+async def get_refined_recommendations(token: str):
+    """
+    Poll a tiered response's refinement
+    
+    Returns 202 with status pending while the LLM call runs, the refined
+    result with status done once it has finished, 503 with status retry
+    (and a Retry-After header) if it ended in the fallback, and 404 for
+    unknown or expired tokens. Re-sending the tiered request after
+    retry_after seconds starts another refinement.
+    """
+    status, refined = refinements.result(token)
+    if status == "unknown":
+        refined = recommendation_cache.get(token)
+        if refined is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired refinement token")
+        status = "done"
+    if status == "pending":
+        return Response(content=dumps({"status": status}), status_code=202, media_type="application/json")
+    if status == "failed":
+        raise HTTPException(status_code=500, detail="Refinement failed")
+    if status == "fallback":
+        retry_after = refinements.retry_after(token)
+        return Response(
+            content=dumps({"status": "retry", "retry_after": round(retry_after, 1)}),
+            status_code=503,
+            media_type="application/json",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+    body = b'{"status":"done","result":' + product_encoder.encode_recommendations(refined) + b'}'
+    return Response(content=body, media_type="application/json")
+
+@app.get("/api/recommendations/refined/{token}/events")
+async def stream_refined_recommendations(token: str):
+    """
+    Push a tiered response's refinement over Server-Sent Events
+    
+    Emits one `refined` event with the result when the LLM call finishes,
+    or an `error` event if it failed, ended in the fallback (status retry),
+    the token is unknown or it didn't finish within LLM_TIMEOUT.
+    """
+    return StreamingResponse(
+        stream_refinement_events(token),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def stream_refinement_events(token):
+    """
+    Yield the SSE event for a refinement once it is available
+    """
+    # Allow for the CPU stages and queueing around the LLM call itself
+    status, refined = await refinements.wait(token, config['LLM_TIMEOUT'] + 5.0)
+    if status == "unknown":
+        refined = recommendation_cache.get(token)
+        status = "unknown" if refined is None else "done"
+    if status == "done":
+        yield format_sse("refined", refined)
+    elif status == "fallback":
+        yield format_sse("error", {"status": "retry", "retry_after": round(refinements.retry_after(token), 1)})
+    else:
+        yield format_sse("error", {"status": status})
+
+@app.post("/api/recommendations/stream")
+async def stream_recommendations(request: RecommendationRequest, compact: bool = False):
+    """
+    Stream personalized recommendations over Server-Sent Events
+    
+    Emits a `recommendation` event for each product as soon as the LLM has
+    produced it, then a `summary` event with the final result. With
+    compact=true, products carry only COMPACT_FIELDS, as on /api/recommendations.
+    """
+    return StreamingResponse(
+        stream_recommendation_events(request, compact),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def format_sse(event, data):
+    """
+    Format one Server-Sent Event; data is a JSON-encodable value or encoded JSON bytes
+    """
+    encoded = data if isinstance(data, bytes) else dumps(data)
+    return f"event: {event}\ndata: {encoded.decode('utf-8')}\n\n"
+
+def format_recommendation_sse(event, data, compact=False):
+    """
+    Format a recommendation or summary event, splicing in the pre-encoded products
+    """
+    if event == "recommendation":
+        return format_sse(event, product_encoder.encode_item(data, compact))
+    if event == "summary":
+        return format_sse(event, product_encoder.encode_recommendations(data, compact))
+    return format_sse(event, data)
+
+async def stream_recommendation_events(request, compact=False):
+    """
+    Yield SSE events for a recommendation request, replaying cached results
+    """
+    user_preferences = request.preferences.dict()
+    browsing_history = await request_history(request)
+    request_recorder.record_recommendations(
+        user_preferences,
+        browsing_history,
+        {"compact": compact},
+        endpoint="stream",
+        session=request.session_id is not None
+    )
+    cache_key = recommendation_cache.make_key(
+        user_preferences,
+        browsing_history,
+        product_service.catalog_version
+    )
+    cached = recommendation_cache.get(cache_key)
+    speculation.record_request(cache_key, cached is not None)
+    if cached is not None:
+        for recommendation in cached["recommendations"]:
+            yield format_recommendation_sse("recommendation", recommendation, compact)
+        yield format_recommendation_sse("summary", cached, compact)
+        return
+    
+    async for event, data in llm_service.astream_recommendations(
+        user_preferences,
+        browsing_history,
+        product_service.get_all_products()
+    ):
+        if event == "summary":
+            recommendation_cache.set(cache_key, data)
+        yield format_recommendation_sse(event, data, compact)
+
+@app.post("/api/recommendations/batch")
+async def get_batch_recommendations(request: BatchRecommendationRequest):
+    """
+    Generate recommendations for many users in one call
+    
+    Results are streamed back as NDJSON, one line per input request in
+    completion order, each tagged with the request's index. Identical
+    requests are computed once.
+    """
+    return StreamingResponse(
+        stream_batch_recommendations(request.requests),
+        media_type="application/x-ndjson"
+    )
+
+async def stream_batch_recommendations(requests):
+    """
+    Yield NDJSON lines for a batch: cached results first, then each computed result
+    """
+    all_products = product_service.get_all_products()
+    waiting = {}  # cache key -> indices of requests waiting on it
+    distinct = []  # (cache key, preferences, browsing history) to compute
+    
+    resolved = []
+    for item in requests:
+        resolved.append((item.preferences.dict(), await request_history(item), item.session_id is not None))
+    request_recorder.record_batch(resolved)
+    
+    for index, (user_preferences, browsing_history, _) in enumerate(resolved):
+        cache_key = recommendation_cache.make_key(
+            user_preferences,
+            browsing_history,
+            product_service.catalog_version
+        )
+        if cache_key in waiting:
+            waiting[cache_key].append(index)
+            continue
+        cached = recommendation_cache.get(cache_key)
+        if cached is not None:
+            yield dumps({"index": index, **cached}) + b"\n"
+            continue
+        waiting[cache_key] = [index]
+        distinct.append((cache_key, user_preferences, browsing_history))
+    
+    batch = [(user_preferences, browsing_history) for _, user_preferences, browsing_history in distinct]
+    async for position, recommendations in llm_service.agenerate_batch_recommendations(batch, all_products):
+        cache_key = distinct[position][0]
+        recommendation_cache.set(cache_key, recommendations)
+        for index in waiting[cache_key]:
+            yield dumps({"index": index, **recommendations}) + b"\n"
+
+@app.post("/api/sessions/{session_id}/views")
+async def record_session_views(events: ViewEvents, session_id: str = SESSION_ID):
+    """
+    Record product views of a session, creating the session on its first event
+    
+    Each ID is resolved against the catalog once, here (unknown IDs are
+    ignored), and folded into the session's recent window and category and
+    brand view counts. Recommendation requests then send just the session_id.
+    
+    With the user's current preferences and SPECULATION_ENABLED, the
+    recommendations for the updated session are precomputed in the
+    background (see SpeculativeScheduler), so the request that usually
+    follows a view is answered from the cache.
+    """
+    state = await session_store.arecord_views(session_id, events.product_ids)
+    if events.preferences is not None:
+        speculate(session_id, events.preferences.dict(), session_store.history(state))
+    return session_store.summary(session_id, state)
+
+def speculate(session_id, user_preferences, browsing_history):
+    """
+    Queue the precomputation of the request a session would send next
+    """
+    cache_key = recommendation_cache.make_key(user_preferences, browsing_history, product_service.catalog_version)
+    speculation.schedule(
+        session_id,
+        cache_key,
+        lambda: refine_recommendations(cache_key, user_preferences, browsing_history)
+    )
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str = SESSION_ID):
+    """
+    Return a session's recent products and view counts, or 404 once it has expired
+    """
+    state = await session_store.aget(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return session_store.summary(session_id, state)
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str = SESSION_ID):
+    """
+    Forget a session, e.g. when the user clears their browsing history
+    """
+    return {"deleted": await session_store.adelete(session_id)}
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    """
+    Return recommendation cache, semantic cache, request coalescing, tiered refinement, product page
+    cache, request log, session, speculation, CPU stage and LLM routing counters (per-backend
+    latency, breaker state and connection pool)
+    """
+    stats = recommendation_cache.stats()
+    stats["semantic"] = llm_service.semantic_cache.stats()
+    stats["coalescing"] = request_coalescer.stats()
+    stats["refinements"] = refinements.stats()
+    stats["products_pages"] = products_page_cache.stats()
+    stats["request_log"] = request_recorder.stats()
+    stats["sessions"] = await session_store.astats()
+    stats["speculation"] = speculation.stats()
+    stats["cpu_stage"] = llm_service.cpu_stage.stats()
+    stats["llm_router"] = llm_service.router.stats()
+    return stats
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Return stage latency histograms, fallback and token counters, cache hit
+    ratios and catalog size in Prometheus text format
+    
+    Histograms and counters stay empty unless METRICS_ENABLED is set.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/catalog")
+async def get_catalog_status():
+    """
+    Return the current catalog version, size, stock counts and last reload
+    """
+    availability = llm_service.availability
+    return {
+        "catalog_version": product_service.catalog_version,
+        "products": len(product_service.ordered_ids),
+        "availability": availability.stats() if availability is not None else None,
+        "source": product_service.store_path or product_service.data_path,
+        "reload_interval": config['CATALOG_RELOAD_INTERVAL'],
+        "last_reload": product_service.last_reload
+    }
+
+@app.post("/api/catalog/reload")
+async def reload_catalog():
+    """
+    Re-read the catalog file now and swap it in if it changed
+    
+    The new snapshot is built in a worker thread; requests keep being served
+    from the current catalog until the swap.
+    """
+    try:
+        return await asyncio.get_running_loop().run_in_executor(None, product_service.reload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Catalog reload failed: {str(e)}")
+
+@app.post("/api/catalog/delta")
+async def apply_catalog_delta(delta: CatalogDelta):
+    """
+    Upsert and delete products without reloading the whole catalog
+    
+    Only the changed products' index entries are rebuilt. The change is held in
+    memory by this process and replaced by the next reload of the catalog file.
+    """
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, product_service.apply_delta, delta.upserts, delta.deletes
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/catalog/inventory")
+async def update_inventory(update: InventoryUpdate):
+    """
+    Set the stock level of products
+    
+    Applied as a delta of the changed products, so only their index entries,
+    prompt lines and availability bits are rebuilt. Like other deltas it is
+    held in memory by this process until the next catalog reload.
+    """
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            None, product_service.update_inventory, update.inventory
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # Custom exception handler for more user-friendly error messages
 @app.exception_handler(Exception)
 async def generic_exception_handler(request: Request, exc: Exception):
@@ -0,0 +1,10 @@
+"""
+Benchmarks and load tests for the recommendation backend
+
+Scripts in this package run offline against local stub servers.
+Run them from the backend directory, e.g. `python -m benchmarks.load_products_latency`.
+`python -m benchmarks.suite --output bench.json` runs the pipeline micro-benchmarks
+and a load run, and compares with an earlier results file with --compare.
+`python -m benchmarks.replay --log requests.jsonl.gz` replays traffic recorded by
+the API (REQUEST_LOG_PATH) in closed-loop, Poisson or recorded-timing scenarios.
+"""
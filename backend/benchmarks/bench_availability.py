@@ -0,0 +1,148 @@
+"""
+Benchmark: availability pruning on catalogs with many out-of-stock products
+
+For each out-of-stock fraction a synthetic catalog is generated and the same
+recommendation requests are run through the prompt pipeline in process with
+AVAILABILITY_FILTER off and on. Reported per setting:
+- prompt tokens and products per prompt
+- oos_in_prompt: share of prompt products that are out of stock
+- oos_recommended: share of recommended products (stub LLM answer, and the
+  fallback ranking) that are out of stock
+- candidate filter + prompt build latency, and fallback latency
+
+With --end-to-end, the API is also started against the stub LLM for every
+setting and a closed-loop load reports request latency and throughput.
+
+Usage:
+    python -m benchmarks.bench_availability --size 20000 --fractions 0,0.3,0.6
+    python -m benchmarks.bench_availability --size 20000 --fractions 0.6 --end-to-end --output availability.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+
+from benchmarks.bench_cpu_stage import make_payloads, run_load
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+from benchmarks.stub_llm import build_recommendation_content
+from benchmarks.synthetic import generate_catalog, write_catalog
+from services.llm_service import LLMService
+from services.product_service import ProductService
+
+def out_of_stock_share(products):
+    """
+    Share of a list of products with no units left
+    """
+    if not products:
+        return 0.0
+    return sum(1 for product in products if product.get("inventory", 1) <= 0) / len(products)
+
+def run_in_process(products, payloads, enabled):
+    """
+    Build prompts and fallbacks for every payload with the filter on or off
+    """
+    service = LLMService(ProductService(products=products))
+    service.availability_enabled = enabled
+    try:
+        all_products = service.product_service.get_all_products()
+        tokens, counts, oos_prompt, oos_llm, oos_fallback = [], [], [], [], []
+        build_ms, fallback_ms = [], []
+        for payload in payloads:
+            browsed = service._resolve_browsed_products(payload["browsing_history"], all_products)
+            start = time.perf_counter()
+            prompt_result = service._build_recommendation_prompt(payload["preferences"], browsed, all_products)
+            build_ms.append((time.perf_counter() - start) * 1000)
+            tokens.append(prompt_result.tokens)
+            counts.append(len(prompt_result.product_ids))
+            oos_prompt.append(out_of_stock_share([service.product_service.products_by_id[pid] for pid in prompt_result.product_ids]))
+            
+            answer = service._parse_recommendation_response(build_recommendation_content(prompt_result.prompt), all_products)
+            oos_llm.append(out_of_stock_share([item["product"] for item in answer["recommendations"]]))
+            
+            start = time.perf_counter()
+            fallback = service._generate_fallback_recommendations(payload["preferences"], browsed, all_products)
+            fallback_ms.append((time.perf_counter() - start) * 1000)
+            oos_fallback.append(out_of_stock_share([item["product"] for item in fallback["recommendations"]]))
+        return {
+            "prompt_tokens": round(sum(tokens) / len(tokens), 1),
+            "prompt_products": round(sum(counts) / len(counts), 1),
+            "oos_in_prompt": round(sum(oos_prompt) / len(oos_prompt), 4),
+            "oos_recommended_llm": round(sum(oos_llm) / len(oos_llm), 4),
+            "oos_recommended_fallback": round(sum(oos_fallback) / len(oos_fallback), 4),
+            "prompt_build": summarize(build_ms),
+            "fallback": summarize(fallback_ms)
+        }
+    finally:
+        service.cpu_stage.shutdown()
+
+def run_end_to_end(data_path, payloads, enabled, args):
+    """
+    Closed-loop load against an API started with the filter on or off
+    """
+    api = start_api_server(args.api_port, args.stub_port, env={
+        "DATA_PATH": data_path,
+        "CACHE_ENABLED": "false",
+        "LLM_MAX_CONCURRENCY": "1024",
+        "AVAILABILITY_FILTER": "true" if enabled else "false"
+    })
+    try:
+        base_url = f"http://127.0.0.1:{args.api_port}"
+        run_load(base_url, payloads, args.concurrency, 1.0)
+        latencies, fallbacks, _, elapsed = run_load(base_url, payloads, args.concurrency, args.duration)
+        return {
+            "requests": len(latencies),
+            "throughput_rps": round(len(latencies) / elapsed, 1),
+            "fallback_share": round(fallbacks / len(latencies), 3) if latencies else None,
+            "latency": summarize(latencies)
+        }
+    finally:
+        stop_processes(api)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--fractions", default="0,0.3,0.6", help="Out-of-stock fractions of the synthetic catalogs")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--end-to-end", action="store_true", help="Also load the API against the stub LLM")
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the report JSON here as well as printing it")
+    args = parser.parse_args()
+    
+    report = {"config": vars(args), "catalogs": []}
+    stub = start_stub_llm(args.stub_port, args.stub_latency) if args.end_to_end else None
+    try:
+        for fraction in [float(value) for value in args.fractions.split(",")]:
+            products = generate_catalog(args.size, seed=args.seed, out_of_stock_fraction=fraction)
+            payloads = make_payloads(products, args.requests, seed=args.seed)
+            entry = {
+                "out_of_stock_fraction": fraction,
+                "off": run_in_process(products, payloads, False),
+                "on": run_in_process(products, payloads, True)
+            }
+            if args.end_to_end:
+                with tempfile.TemporaryDirectory() as directory:
+                    data_path = os.path.join(directory, "products.json")
+                    write_catalog(products, data_path)
+                    entry["off"]["end_to_end"] = run_end_to_end(data_path, payloads, False, args)
+                    entry["on"]["end_to_end"] = run_end_to_end(data_path, payloads, True, args)
+            report["catalogs"].append(entry)
+    finally:
+        stop_processes(stub)
+    
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
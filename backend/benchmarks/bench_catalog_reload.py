@@ -0,0 +1,148 @@
+"""
+Benchmark: catalog hot reload latency and request latency during a reload
+
+Starts the API server on a large synthetic catalog and keeps a client
+issuing filtered /api/products requests (a different price bound each time,
+so the page cache doesn't answer them) while the catalog changes:
+- full reload: the catalog file is rewritten with 1% of prices changed and
+  POST /api/catalog/reload builds and swaps the new snapshot
+- delta: POST /api/catalog/delta upserts and deletes a few hundred products
+- watcher: with CATALOG_RELOAD_INTERVAL set, time from the file being
+  replaced until GET /api/catalog reports the new version
+
+Request latency is reported at idle and for requests overlapping each
+reload, along with the server-side reload time.
+
+Usage:
+    python -m benchmarks.bench_catalog_reload --size 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.common import start_api_server, stop_processes, summarize
+from benchmarks.synthetic import generate_catalog, write_catalog
+
+class LatencyProbe:
+    """
+    Background client timing /api/products requests until stopped
+    """
+    
+    def __init__(self, base_url, category):
+        self.base_url = base_url
+        self.category = category
+        self.samples = []  # (start, end) perf_counter pairs
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        session = requests.Session()
+        rng = random.Random(0)
+        while not self._stop.is_set():
+            params = {"category": self.category, "min_price": round(rng.uniform(0, 500), 2), "limit": 20}
+            start = time.perf_counter()
+            session.get(f"{self.base_url}/api/products", params=params).raise_for_status()
+            self.samples.append((start, time.perf_counter()))
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+    
+    def latencies(self, window=None):
+        """
+        Latencies in milliseconds, optionally only for requests overlapping (start, end)
+        """
+        return [
+            (end - start) * 1000 for start, end in self.samples
+            if window is None or (end >= window[0] and start <= window[1])
+        ]
+
+def timed_reload(session, probe, url, payload=None):
+    """
+    Run one reload request, returning the server summary, wall time and overlapping latencies
+    """
+    start = time.perf_counter()
+    response = session.post(url, json=payload, timeout=600)
+    end = time.perf_counter()
+    response.raise_for_status()
+    return {
+        "server": response.json(),
+        "wall_ms": round((end - start) * 1000, 1),
+        "requests_during": summarize(probe.latencies((start, end)))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--idle-seconds", type=float, default=3.0)
+    parser.add_argument("--delta-upserts", type=int, default=500)
+    parser.add_argument("--delta-deletes", type=int, default=50)
+    parser.add_argument("--watch-interval", type=float, default=1.0)
+    args = parser.parse_args()
+    
+    rng = random.Random(1)
+    products = generate_catalog(args.size)
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    report = {"size": args.size}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = os.path.join(directory, "products.json")
+        write_catalog(products, data_path)
+        api = start_api_server(args.api_port, 1, env={
+            "DATA_PATH": data_path,
+            "CATALOG_RELOAD_INTERVAL": str(args.watch_interval)
+        })
+        session = requests.Session()
+        try:
+            probe = LatencyProbe(base_url, products[0]["category"]).start()
+            time.sleep(args.idle_seconds)
+            report["idle"] = summarize(probe.latencies())
+            
+            # Full reload of a rewritten file, triggered explicitly; the watcher
+            # sees the same file afterwards and finds nothing to do
+            for product in rng.sample(products, len(products) // 100):
+                product["price"] = round(product["price"] * rng.uniform(0.8, 1.2), 2)
+            write_catalog(products, data_path)
+            report["full_reload"] = timed_reload(session, probe, f"{base_url}/api/catalog/reload")
+            
+            time.sleep(args.watch_interval * 2)
+            upserts = [dict(product, price=round(product["price"] * 0.9, 2)) for product in rng.sample(products, args.delta_upserts)]
+            deletes = [product["id"] for product in rng.sample(products, args.delta_deletes)]
+            report["delta"] = timed_reload(session, probe, f"{base_url}/api/catalog/delta", {"upserts": upserts, "deletes": deletes})
+            
+            # File replaced behind the server's back: the watcher picks it up
+            for product in rng.sample(products, len(products) // 100):
+                product["rating"] = round(rng.uniform(3.0, 5.0), 1)
+            temp_path = data_path + ".tmp"
+            write_catalog(products, temp_path)
+            before = session.get(f"{base_url}/api/catalog").json()["catalog_version"]
+            start = time.perf_counter()
+            os.replace(temp_path, data_path)
+            while session.get(f"{base_url}/api/catalog").json()["catalog_version"] == before:
+                time.sleep(0.05)
+            end = time.perf_counter()
+            report["watcher"] = {
+                "detect_and_swap_ms": round((end - start) * 1000, 1),
+                "server": session.get(f"{base_url}/api/catalog").json()["last_reload"],
+                "requests_during": summarize(probe.latencies((start, end)))
+            }
+            probe.stop()
+        finally:
+            stop_processes(api)
+    
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: cold start and memory per worker, JSON catalog vs memory-mapped store
+
+For each catalog size a synthetic products.json is written and converted with
+build_catalog_store. Each configuration is then loaded in a fresh Python
+process, the way a uvicorn worker starts, which reports:
+- catalog_ms: ProductService construction
+- ready_ms: ProductService plus LLMService (fallback scorer, prompt fragments)
+- rss_mb / rss_anon_mb / rss_file_mb from /proc/self/status after startup and
+  after a short workload; file-backed pages of the mapped catalog are shared
+  between workers, anonymous pages are private to each one
+
+Usage:
+    python -m benchmarks.bench_catalog_startup --sizes 1000,100000,1000000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import BACKEND_DIR
+from benchmarks.synthetic import generate_catalog, write_catalog
+
+def memory_usage():
+    """
+    Resident memory of this process in MB, split into anonymous and file-backed pages
+    """
+    fields = {}
+    with open("/proc/self/status") as status:
+        for line in status:
+            name, _, value = line.partition(":")
+            if name in ("VmRSS", "RssAnon", "RssFile"):
+                fields[name] = round(int(value.split()[0]) / 1024, 1)
+    return {"rss_mb": fields.get("VmRSS"), "rss_anon_mb": fields.get("RssAnon"), "rss_file_mb": fields.get("RssFile")}
+
+def run_worker(data_path, store_path, lookups):
+    """
+    Child process: start the services like an API worker and report timings and memory
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+    import random
+    from services.product_service import ProductService
+    from services.llm_service import LLMService
+    baseline = memory_usage()
+    
+    start = time.perf_counter()
+    product_service = ProductService(data_path, store_path=store_path)
+    catalog_ms = (time.perf_counter() - start) * 1000
+    llm_service = LLMService(product_service)
+    ready_ms = (time.perf_counter() - start) * 1000
+    after_start = memory_usage()
+    
+    # A short workload: ID lookups, a filtered query and fallback recommendations
+    rng = random.Random(0)
+    ids = product_service.ordered_ids
+    start = time.perf_counter()
+    for _ in range(lookups):
+        product_service.get_product_by_id(ids[rng.randrange(len(ids))])
+    lookup_us = (time.perf_counter() - start) * 1e6 / lookups
+    products = product_service.get_all_products()
+    category = next(iter(product_service.category_index))
+    start = time.perf_counter()
+    product_service.query_products(categories=[category], min_price=50, max_price=100)
+    llm_service._generate_fallback_recommendations({"categories": [category], "priceRange": "50-100"}, [], products)
+    workload_ms = (time.perf_counter() - start) * 1000
+    
+    print(json.dumps({
+        "catalog_ms": round(catalog_ms, 1),
+        "ready_ms": round(ready_ms, 1),
+        "lookup_us": round(lookup_us, 2),
+        "query_and_fallback_ms": round(workload_ms, 1),
+        "products": len(products),
+        "after_imports": baseline,
+        "after_start": after_start,
+        "after_workload": memory_usage()
+    }))
+
+def measure(data_path, store_path, lookups):
+    """
+    Run one worker start in a fresh process and return its report
+    """
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_catalog_startup", "--worker", data_path, store_path, "--lookups", str(lookups)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--worker", nargs=2, metavar=("DATA_PATH", "STORE_PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.worker:
+        run_worker(args.worker[0], args.worker[1], args.lookups)
+        return
+    
+    from services.catalog_store import build_catalog_store
+    
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [int(s) for s in args.sizes.split(",")]:
+            data_path = os.path.join(directory, f"products_{size}.json")
+            store_path = os.path.join(directory, f"products_{size}.col")
+            write_catalog(generate_catalog(size), data_path)
+            start = time.perf_counter()
+            build_catalog_store(data_path, store_path)
+            build_ms = (time.perf_counter() - start) * 1000
+            
+            report.append({
+                "size": size,
+                "json_bytes": os.path.getsize(data_path),
+                "store_bytes": os.path.getsize(store_path),
+                "store_build_ms": round(build_ms, 1),
+                "json": measure(data_path, "", args.lookups),
+                "store": measure(data_path, store_path, args.lookups)
+            })
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
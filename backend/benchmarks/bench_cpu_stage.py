@@ -0,0 +1,155 @@
+"""
+Benchmark: recommendation throughput with the CPU stage inline, in threads or in processes
+
+Runs the API against a fast stub LLM on a large synthetic catalog, so the
+per-request CPU work (candidate filtering, prompt building, response parsing)
+dominates rather than the LLM wait. For each CPU_POOL_MODE and uvicorn worker
+count, a fixed number of concurrent clients post varied recommendation
+requests for a fixed duration. Reports throughput, latency, the share of
+requests shed to the fallback, the latency of a cheap GET /api/catalog probe
+sent meanwhile (how responsive the event loop stays) and the CPU stage
+counters of one worker.
+
+The result cache is disabled and LLM_MAX_CONCURRENCY raised so neither hides
+the CPU cost. Run it on a machine with several cores (e.g. 8) to see
+process-mode scaling; with one core every mode is bound by the same CPU.
+
+Usage:
+    python -m benchmarks.bench_cpu_stage --size 100000 --modes inline,thread,process --uvicorn-workers 1,4
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+from benchmarks.synthetic import generate_catalog, write_catalog
+
+def make_payloads(products, count, seed=0):
+    """
+    Recommendation requests with varied preferences and browsing histories
+    """
+    rng = random.Random(seed)
+    categories = sorted({product["category"] for product in products})
+    brands = sorted({product["brand"] for product in products})
+    price_ranges = ["all", "under-50", "50-100", "100-200", "over-200"]
+    return [
+        {
+            "preferences": {
+                "priceRange": rng.choice(price_ranges),
+                "categories": rng.sample(categories, rng.randint(0, 2)),
+                "brands": rng.sample(brands, rng.randint(0, 1))
+            },
+            "browsing_history": [product["id"] for product in rng.sample(products, rng.randint(0, 4))]
+        }
+        for _ in range(count)
+    ]
+
+def run_load(base_url, payloads, concurrency, duration):
+    """
+    Post payloads from concurrent clients for duration seconds
+    
+    Returns:
+    - tuple: (latencies in ms, number of fallback answers, probe latencies in ms, elapsed seconds)
+    """
+    latencies = []
+    probe_latencies = []
+    fallbacks = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    
+    def client(offset):
+        session = requests.Session()
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = session.post(f"{base_url}/api/recommendations", json=payloads[i % len(payloads)], timeout=60)
+            response.raise_for_status()
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                fallbacks[0] += 1 if response.json().get("fallback") else 0
+            i += concurrency
+    
+    def probe():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            session.get(f"{base_url}/api/catalog", timeout=60).raise_for_status()
+            probe_latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.05)
+    
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+    threads.append(threading.Thread(target=probe))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, fallbacks[0], probe_latencies, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--modes", default="inline,thread,process")
+    parser.add_argument("--uvicorn-workers", default="1,4")
+    parser.add_argument("--pool-workers", type=int, default=0, help="CPU_POOL_WORKERS; 0 for one per CPU")
+    parser.add_argument("--max-pending", type=int, default=64, help="CPU_POOL_MAX_PENDING")
+    parser.add_argument("--prompt-products", type=int, default=100, help="PROMPT_MAX_PRODUCTS")
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15.0)
+    args = parser.parse_args()
+    
+    products = generate_catalog(args.size)
+    payloads = make_payloads(products, 500)
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    report = {"size": args.size, "cpus": os.cpu_count(), "config": vars(args), "runs": []}
+    
+    with tempfile.TemporaryDirectory() as directory:
+        data_path = os.path.join(directory, "products.json")
+        write_catalog(products, data_path)
+        stub = start_stub_llm(args.stub_port, args.stub_latency)
+        try:
+            for uvicorn_workers in [int(w) for w in args.uvicorn_workers.split(",")]:
+                for mode in args.modes.split(","):
+                    api = start_api_server(args.api_port, args.stub_port, env={
+                        "DATA_PATH": data_path,
+                        "CACHE_ENABLED": "false",
+                        "LLM_MAX_CONCURRENCY": "1024",
+                        "PROMPT_MAX_PRODUCTS": str(args.prompt_products),
+                        "CPU_POOL_MODE": mode,
+                        "CPU_POOL_WORKERS": str(args.pool_workers),
+                        "CPU_POOL_MAX_PENDING": str(args.max_pending)
+                    }, extra_args=["--workers", str(uvicorn_workers)])
+                    try:
+                        # Warm up every worker (and fork process pools) before measuring
+                        run_load(base_url, payloads, args.concurrency, 2.0)
+                        latencies, fallbacks, probe_latencies, elapsed = run_load(base_url, payloads, args.concurrency, args.duration)
+                        report["runs"].append({
+                            "mode": mode,
+                            "uvicorn_workers": uvicorn_workers,
+                            "requests": len(latencies),
+                            "throughput_rps": round(len(latencies) / elapsed, 1),
+                            "fallback_share": round(fallbacks / len(latencies), 3) if latencies else None,
+                            "latency": summarize(latencies),
+                            "probe_latency": summarize(probe_latencies),
+                            "cpu_stage": requests.get(f"{base_url}/api/cache/stats").json()["cpu_stage"]
+                        })
+                    finally:
+                        stop_processes(api)
+        finally:
+            stop_processes(stub)
+    
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark: multi-backend LLM routing, failover and hedged requests
+
+Starts two stub LLMs standing in for two providers. Each answers most
+completions after --latency but a share (--slow-rate) only after
+--slow-latency, and the primary also fails a share (--error-rate) with a 500.
+The API is run in three configurations:
+- single: the primary stub only, as before routing
+- router: both stubs in LLM_BACKENDS, failover and latency-aware selection
+- router_hedge: the same plus LLM_HEDGE, a second copy to the other stub
+  when the first hasn't answered by its rolling p95
+
+Concurrent clients post distinct recommendation requests; the report has
+end-to-end p50/p95/p99 latency, the share answered by the rule-based
+fallback, which backend answered, the stubs' request counts (the cost of
+hedging) and the API's llm_router counters.
+
+LLM_TIMEOUT is set to --timeout so slow answers show up as tail latency and
+fallbacks, as they would with a real provider.
+
+Usage:
+    python -m benchmarks.bench_llm_router --requests 300 --concurrency 8 --slow-rate 0.1 --error-rate 0.05
+"""
+
+import argparse
+import json
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_llm_transport import make_payloads
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+
+SETTINGS = ("single", "router", "router_hedge")
+
+def backends_env(args, setting):
+    """
+    API environment for a routing setting
+    """
+    backends = [{"name": "primary", "base_url": f"http://127.0.0.1:{args.stub_port}/v1", "model": "stub"}]
+    if setting != "single":
+        backends.append({"name": "secondary", "base_url": f"http://127.0.0.1:{args.stub_port + 1}/v1", "model": "stub"})
+    return {
+        "CACHE_ENABLED": "false",
+        "LLM_TIMEOUT": str(args.timeout),
+        "LLM_BACKENDS": json.dumps(backends),
+        "LLM_HEDGE": "true" if setting == "router_hedge" else "false",
+        "LLM_HEDGE_DEFAULT_DELAY": str(args.hedge_default_delay)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055, help="Primary stub; the secondary uses the next port")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--slow-rate", type=float, default=0.1)
+    parser.add_argument("--slow-latency", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Share of primary completions that fail")
+    parser.add_argument("--timeout", type=float, default=5.0, help="LLM_TIMEOUT for the API")
+    parser.add_argument("--hedge-default-delay", type=float, default=0.5)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--settings", default=",".join(SETTINGS))
+    args = parser.parse_args()
+    
+    payloads = make_payloads(args.requests)
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    slow_args = ["--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency)]
+    report = {"config": vars(args), "runs": []}
+    for name in args.settings.split(","):
+        primary = start_stub_llm(args.stub_port, args.latency, slow_args + ["--error-rate", str(args.error_rate), "--seed", "1"])
+        secondary = start_stub_llm(args.stub_port + 1, args.latency, slow_args + ["--seed", "2"])
+        api = None
+        try:
+            api = start_api_server(args.api_port, args.stub_port, env=backends_env(args, name))
+            session = requests.Session()
+            
+            def post(payload):
+                start = time.perf_counter()
+                response = session.post(f"{base_url}/api/recommendations", json=payload, timeout=60)
+                response.raise_for_status()
+                body = response.json()
+                backend = "fallback" if body.get("fallback") else (body.get("metrics") or {}).get("llm_backend")
+                return (time.perf_counter() - start) * 1000, backend
+            
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                results = list(executor.map(post, payloads))
+            answered_by = Counter(backend for _, backend in results)
+            router = session.get(f"{base_url}/api/cache/stats").json()["llm_router"]
+            report["runs"].append({
+                "setting": name,
+                "latency": summarize([ms for ms, _ in results]),
+                "fallback_share": round(answered_by["fallback"] / len(results), 3),
+                "answered_by": dict(answered_by),
+                "stub_requests": {
+                    "primary": requests.get(f"http://127.0.0.1:{args.stub_port}/stats").json(),
+                    "secondary": requests.get(f"http://127.0.0.1:{args.stub_port + 1}/stats").json()
+                },
+                "llm_router": {
+                    "hedges": router["hedges"],
+                    "hedge_wins": router["hedge_wins"],
+                    "failovers": router["failovers"],
+                    "rejected": router["rejected"],
+                    "backends": [
+                        {key: backend[key] for key in ("name", "state", "calls", "failures", "error_rate", "p50_ms", "p95_ms", "breaker_trips")}
+                        for backend in router["backends"]
+                    ]
+                }
+            })
+        finally:
+            stop_processes(api, primary, secondary)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Benchmark: LLM connection pooling, keep-alive and warm-up
+
+Runs the API against the stub LLM through a local TCP proxy that counts
+connections and delays each new one by --connect-delay, standing in for the
+TCP and TLS handshakes to a remote provider. For each transport setting:
+- no_keepalive: LLM_POOL_MAX_KEEPALIVE=0, a new connection per completion
+- pooled: the default keep-alive pool
+- pooled_warm: the pool plus LLM_WARMUP_CONNECTIONS opened at startup
+
+it reports the latency of the first request after startup, latency under
+concurrent load, connections opened (seen by the proxy and the stub) and the
+API's connection counters for the LLM backend (reuse ratio, peak pool utilization).
+
+Usage:
+    python -m benchmarks.bench_llm_transport --connect-delay 0.05 --requests 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+
+SETTINGS = {
+    "no_keepalive": {"LLM_POOL_MAX_KEEPALIVE": "0"},
+    "pooled": {},
+    "pooled_warm": {"LLM_WARMUP_CONNECTIONS": "8"}
+}
+
+class DelayingProxy:
+    """
+    TCP proxy that sleeps before relaying each new connection and counts them
+    """
+    
+    def __init__(self, port, upstream_port, connect_delay):
+        self.port = port
+        self.upstream_port = upstream_port
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", self.port))
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+    
+    async def _handle(self, client_reader, client_writer):
+        self.connections += 1
+        await asyncio.sleep(self.connect_delay)
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.upstream_port)
+        
+        async def pipe(reader, writer):
+            try:
+                while True:
+                    data = await reader.read(65536)
+                    if not data:
+                        break
+                    writer.write(data)
+                    await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+        
+        await asyncio.gather(pipe(client_reader, upstream_writer), pipe(upstream_reader, client_writer))
+    
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+        return self
+    
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+def make_payloads(count, seed=0):
+    """
+    Distinct requests over the sample catalog, so coalescing doesn't merge them
+    """
+    rng = random.Random(seed)
+    product_ids = [f"prod{i:03d}" for i in range(1, 51)]
+    categories = ["Electronics", "Home", "Clothing", "Beauty", "Sports", "Books"]
+    return [
+        {
+            "preferences": {"priceRange": "all", "categories": rng.sample(categories, 2), "brands": []},
+            "browsing_history": rng.sample(product_ids, 3)
+        }
+        for _ in range(count)
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--proxy-port", type=int, default=5056)
+    parser.add_argument("--stub-latency", type=float, default=0.05)
+    parser.add_argument("--connect-delay", type=float, default=0.05, help="Seconds added to each new connection")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--settings", default=",".join(SETTINGS))
+    args = parser.parse_args()
+    
+    payloads = make_payloads(args.requests + 1)
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    report = {"config": vars(args), "runs": []}
+    for name in args.settings.split(","):
+        stub = start_stub_llm(args.stub_port, args.stub_latency)
+        proxy = DelayingProxy(args.proxy_port, args.stub_port, args.connect_delay).start()
+        api = None
+        try:
+            api = start_api_server(args.api_port, args.proxy_port, env=dict({"CACHE_ENABLED": "false"}, **SETTINGS[name]))
+            session = requests.Session()
+            
+            def post(payload):
+                start = time.perf_counter()
+                session.post(f"{base_url}/api/recommendations", json=payload, timeout=60).raise_for_status()
+                return (time.perf_counter() - start) * 1000
+            
+            first_ms = post(payloads[0])
+            with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                latencies = list(executor.map(post, payloads[1:]))
+            transport = session.get(f"{base_url}/api/cache/stats").json()["llm_router"]["backends"][0]["transport"]
+            report["runs"].append({
+                "setting": name,
+                "first_request_ms": round(first_ms, 1),
+                "latency": summarize(latencies),
+                "proxy_connections": proxy.connections,
+                "stub": requests.get(f"http://127.0.0.1:{args.stub_port}/stats").json(),
+                "llm_transport": {
+                    key: transport[key]
+                    for key in ("requests", "new_connections", "reused_connections", "reuse_ratio", "peak_active", "peak_pool_utilization", "warmup")
+                }
+            })
+        finally:
+            stop_processes(api, stub)
+            proxy.stop()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: cost of the stage timers and counters on the request path
+
+Times an empty block wrapped in Metrics.stage() and bare count_fallback()
+calls with metrics disabled, with histograms and counters enabled, and with
+the Server-Timing collection on as well. Also reports how long rendering
+/metrics takes once every stage has samples.
+
+Usage:
+    python -m benchmarks.bench_metrics_overhead --iterations 200000
+"""
+
+import argparse
+import json
+import time
+
+from services.metrics import Metrics, request_timings
+
+STAGES = ("history", "filter", "prompt", "llm", "parse", "fallback")
+
+def per_call_ns(func, iterations):
+    """
+    Mean nanoseconds per call of func over a number of iterations
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return round((time.perf_counter() - start) * 1e9 / iterations, 1)
+
+def measure(metrics, iterations):
+    """
+    Per-call cost of a timed stage and of a counter increment
+    """
+    def timed_stage():
+        with metrics.stage("prompt"):
+            pass
+    
+    def counter():
+        metrics.count_fallback("api_error")
+    
+    return {
+        "stage_ns": per_call_ns(timed_stage, iterations),
+        "count_ns": per_call_ns(counter, iterations)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+    
+    results = {
+        "baseline_ns": per_call_ns(lambda: None, args.iterations),
+        "disabled": measure(Metrics(enabled=False, timing_header=False), args.iterations),
+        "enabled": measure(Metrics(enabled=True, timing_header=False), args.iterations)
+    }
+    
+    token = request_timings.set({})
+    try:
+        results["enabled_with_timing_header"] = measure(Metrics(enabled=True, timing_header=True), args.iterations)
+    finally:
+        request_timings.reset(token)
+    
+    metrics = Metrics(enabled=True, timing_header=False)
+    for stage in STAGES:
+        for i in range(1000):
+            metrics.observe(stage, i / 1000)
+    start = time.perf_counter()
+    body = metrics.render()
+    results["render_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    results["render_bytes"] = len(body)
+    
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark: fragment-based prompt assembly vs per-request string concatenation
+
+Builds recommendation prompts for synthetic catalogs with the legacy
+builder (every product line formatted and appended with += on each request)
+and with PromptBuilder (lines pre-rendered once, joined within a token
+budget). Reports build time, prompt size and estimated tokens per candidate
+count and budget, and checks both produce the same prompt when the budget
+is not binding.
+
+Usage:
+    python -m benchmarks.bench_prompt_build --size 20000 --candidates 30,100,500,2000 --budgets 0,2000,8000
+"""
+
+import argparse
+import json
+import random
+import time
+
+from benchmarks.synthetic import generate_catalog
+from services.product_service import ProductService
+from services.prompt_builder import (
+    PromptBuilder, TokenCounter, RECOMMENDATION_PROMPT_HEADER, RECOMMENDATION_PROMPT_TASK
+)
+
+PROFILE = {"priceRange": "50-100", "categories": ["Electronics", "Home"], "brands": ["SoundWave"]}
+
+def legacy_prompt(user_preferences, browsed_products, relevant_products):
+    """
+    The prompt construction _create_recommendation_prompt used before PromptBuilder
+    """
+    prompt = RECOMMENDATION_PROMPT_HEADER
+    if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
+        price_labels = {
+            'under-50': 'Under $50',
+            '50-100': '$50-$100',
+            '100-200': '$100-$200',
+            'over-200': 'Over $200'
+        }
+        prompt += f"\n- Budget: {price_labels.get(user_preferences['priceRange'], 'Any')}"
+    if user_preferences.get('categories'):
+        prompt += f"\n- Preferred Categories: {', '.join(user_preferences['categories'])}"
+    if user_preferences.get('brands'):
+        prompt += f"\n- Preferred Brands: {', '.join(user_preferences['brands'])}"
+    
+    prompt += "\n\nBROWSING HISTORY (products they showed interest in):"
+    if browsed_products:
+        for product in browsed_products[-5:]:
+            prompt += f"\n- {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')}"
+    else:
+        prompt += "\n- No browsing history yet"
+    
+    prompt += f"\n\nAVAILABLE PRODUCTS ({len(relevant_products)} products):"
+    for product in relevant_products:
+        features_str = ', '.join(product.get('features', [])[:3])
+        prompt += f"\n- ID: {product['id']} | {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')} | Features: {features_str}"
+    return prompt + RECOMMENDATION_PROMPT_TASK
+
+def time_call(func, repeat):
+    """
+    Best-of-N wall time of a call in milliseconds, plus its last result
+    """
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--candidates", default="30,100,500,2000")
+    parser.add_argument("--budgets", default="0,2000,8000", help="Prompt token budgets; 0 means unlimited")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    
+    products = generate_catalog(args.size)
+    product_service = ProductService(products=products)
+    counter = TokenCounter()
+    rng = random.Random(7)
+    browsed = rng.sample(products, 5)
+    
+    start = time.perf_counter()
+    PromptBuilder(product_service, counter, token_budget=10 ** 9).fragments()
+    prerender_ms = (time.perf_counter() - start) * 1000
+    
+    report = {"size": args.size, "prerender_ms": round(prerender_ms, 3), "token_counter": "tiktoken" if counter.encoding else "estimate", "runs": []}
+    for count in [int(c) for c in args.candidates.split(",")]:
+        candidates = rng.sample(products, min(count, len(products)))
+        legacy_ms, legacy = time_call(lambda: legacy_prompt(PROFILE, browsed, candidates), args.repeat)
+        legacy_tokens = counter.count(legacy)
+        
+        for budget in [int(b) for b in args.budgets.split(",")]:
+            builder = PromptBuilder(product_service, counter, token_budget=budget or 10 ** 9)
+            fragment_ms, result = time_call(lambda: builder.build(PROFILE, browsed, candidates), args.repeat)
+            report["runs"].append({
+                "candidates": len(candidates),
+                "budget": budget or None,
+                "legacy_ms": round(legacy_ms, 3),
+                "fragment_ms": round(fragment_ms, 3),
+                "speedup": round(legacy_ms / fragment_ms, 1) if fragment_ms else None,
+                "legacy_chars": len(legacy),
+                "legacy_tokens": legacy_tokens,
+                "prompt_chars": len(result.prompt),
+                "prompt_tokens": result.tokens,
+                "products_included": result.products,
+                "within_budget": not budget or result.tokens <= budget,
+                "identical": result.prompt == legacy if not budget else None
+            })
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Benchmark: LLM response parsing, legacy regex/repair parser vs the staged parser
+
+Parses a corpus of LLM responses with the parser _parse_recommendation_response
+used before (greedy DOTALL regex, quote/comma repair, a fresh {id: product}
+lookup over the catalog per response) and with the current one (structured
+JSON, balanced-array scan, repair, salvage of truncated arrays, persistent ID
+index). Reports, per kind of response, the success rate (at least one
+recommendation and no error), mean parse time, which stage succeeded and
+whether both parsers agree when both succeed.
+
+The corpus is a JSONL file of {"kind": ..., "response": ...} lines, e.g.
+responses captured from a provider. Without --corpus, a synthetic corpus of
+the malformations seen in practice is generated; --write-corpus saves it.
+
+Usage:
+    python -m benchmarks.bench_response_parse --size 100000 --repeat 20
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+from collections import Counter, defaultdict
+
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+
+from benchmarks.synthetic import generate_catalog
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.response_parser import parse_recommendation_items
+
+def legacy_parse(llm_response, all_products):
+    """
+    The parsing _parse_recommendation_response did before the staged parser,
+    returning the recommended product IDs (or None on failure)
+    """
+    llm_response = llm_response.strip()
+    json_match = re.search(r'\[.*\]', llm_response, re.DOTALL)
+    if json_match:
+        json_str = json_match.group()
+    else:
+        start_idx = llm_response.find('[')
+        end_idx = llm_response.rfind(']') + 1
+        if start_idx == -1 or end_idx == 0:
+            return None
+        json_str = llm_response[start_idx:end_idx]
+    try:
+        rec_data = json.loads(json_str)
+    except json.JSONDecodeError:
+        json_str = json_str.replace("'", '"')
+        json_str = re.sub(r',\s*}', '}', json_str)
+        json_str = re.sub(r',\s*]', ']', json_str)
+        try:
+            rec_data = json.loads(json_str)
+        except json.JSONDecodeError:
+            return None
+    if not isinstance(rec_data, list):
+        return None
+    product_lookup = {p['id']: p for p in all_products}
+    found = [rec for rec in rec_data if isinstance(rec, dict) and rec.get('product_id') in product_lookup]
+    found.sort(key=lambda rec: float(rec.get('score', 5.0)), reverse=True)
+    return [rec['product_id'] for rec in found[:5]] or None
+
+def generate_corpus(products, per_kind, seed=0):
+    """
+    Synthetic responses covering clean, wrapped and malformed answers
+    """
+    rng = random.Random(seed)
+    
+    def items(count=5):
+        return [
+            {
+                "product_id": product["id"],
+                "explanation": f"Matches your interest in {product['category']} and it's well reviewed [{rng.randint(1, 9)}/10].",
+                "score": round(rng.uniform(5, 10), 1)
+            }
+            for product in rng.sample(products, count)
+        ]
+    
+    def array(count=5, indent=2):
+        return json.dumps(items(count), indent=indent)
+    
+    def trailing_commas(text):
+        return re.sub(r'(["\d])\n(\s*[}\]])', r'\1,\n\2', text)
+    
+    kinds = {
+        "clean": lambda: array(),
+        "structured": lambda: json.dumps({"recommendations": items()}),
+        "fenced": lambda: f"Here are my recommendations:\n```json\n{array()}\n```\nLet me know if you need more!",
+        "citation_before": lambda: f"Based on the history [1] and preferences [2]:\n{array()}",
+        "brackets_after": lambda: f"{array()}\n\nNote: scores are relative [1-10].",
+        "trailing_commas": lambda: trailing_commas(array()),
+        "single_quotes": lambda: str([{"product_id": item["product_id"], "explanation": "Great fit", "score": item["score"]} for item in items()]),
+        "truncated": lambda: array()[:-rng.randint(40, 120)],
+        "long": lambda: array(50, indent=None),
+        "garbage": lambda: "I'm sorry, I can't help with that request."
+    }
+    return [{"kind": kind, "response": make()} for kind, make in kinds.items() for _ in range(per_kind)]
+
+def time_parse(func, response, repeat):
+    """
+    Mean milliseconds per call and the last result
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(response)
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--per-kind", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--corpus", help="JSONL corpus of {kind, response} lines")
+    parser.add_argument("--write-corpus", help="Write the generated corpus to this path")
+    args = parser.parse_args()
+    
+    products = generate_catalog(args.size)
+    product_service = ProductService(products=products)
+    llm_service = LLMService(product_service)
+    if args.corpus:
+        with open(args.corpus) as file:
+            corpus = [json.loads(line) for line in file if line.strip()]
+    else:
+        corpus = generate_corpus(products, args.per_kind)
+        if args.write_corpus:
+            with open(args.write_corpus, "w") as file:
+                file.writelines(json.dumps(entry) + "\n" for entry in corpus)
+    
+    by_kind = defaultdict(lambda: {"responses": 0, "legacy_ok": 0, "new_ok": 0, "agree": 0, "legacy_ms": 0.0, "new_ms": 0.0, "paths": Counter()})
+    for entry in corpus:
+        stats = by_kind[entry.get("kind", "recorded")]
+        response = entry["response"]
+        legacy_ms, legacy = time_parse(lambda text: legacy_parse(text, products), response, args.repeat)
+        new_ms, result = time_parse(lambda text: llm_service._parse_recommendation_response(text, products), response, args.repeat)
+        new_ids = [rec["product"]["id"] for rec in result["recommendations"]] if not result.get("error") else None
+        stats["responses"] += 1
+        stats["legacy_ms"] += legacy_ms
+        stats["new_ms"] += new_ms
+        stats["legacy_ok"] += legacy is not None
+        stats["new_ok"] += bool(new_ids)
+        stats["paths"][parse_recommendation_items(response).path] += 1
+        if legacy is not None and new_ids:
+            stats["agree"] += set(legacy) == set(new_ids)
+    
+    report = {"size": args.size, "responses": len(corpus), "kinds": {}}
+    totals = Counter()
+    for kind, stats in by_kind.items():
+        count = stats["responses"]
+        totals.update({"responses": count, "legacy_ok": stats["legacy_ok"], "new_ok": stats["new_ok"]})
+        totals["legacy_ms"] += stats["legacy_ms"]
+        totals["new_ms"] += stats["new_ms"]
+        report["kinds"][kind] = {
+            "legacy_success": round(stats["legacy_ok"] / count, 3),
+            "new_success": round(stats["new_ok"] / count, 3),
+            "legacy_mean_ms": round(stats["legacy_ms"] / count, 4),
+            "new_mean_ms": round(stats["new_ms"] / count, 4),
+            "new_paths": dict(stats["paths"]),
+            "agree_when_both_succeed": stats["agree"]
+        }
+    report["overall"] = {
+        "legacy_success": round(totals["legacy_ok"] / totals["responses"], 3),
+        "new_success": round(totals["new_ok"] / totals["responses"], 3),
+        "legacy_mean_ms": round(totals["legacy_ms"] / totals["responses"], 4),
+        "new_mean_ms": round(totals["new_ms"] / totals["responses"], 4)
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
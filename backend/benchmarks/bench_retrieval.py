@@ -0,0 +1,96 @@
+"""
+Benchmark: IVF semantic retrieval vs exact search and the rule-based filter
+
+For synthetic catalogs, builds the hashed TF-IDF embeddings and IVF index,
+then for random browsing histories measures:
+- recall@k of the approximate search against exact brute-force search
+- query latency of the IVF search, exact search and _filter_relevant_products
+- index build, save and load time
+
+Usage:
+    python -m benchmarks.bench_retrieval --sizes 10000,100000 --queries 200
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+
+import numpy as np
+
+from benchmarks.common import summarize
+from benchmarks.synthetic import generate_catalog
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.retrieval_service import CandidateRetriever
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+    
+    rng = random.Random(0)
+    report = []
+    for size in [int(s) for s in args.sizes.split(",")]:
+        products = generate_catalog(size)
+        product_service = ProductService(products=products)
+        llm_service = LLMService(product_service)
+        
+        start = time.perf_counter()
+        retriever = CandidateRetriever(product_service, nprobe=args.nprobe, index_path="")
+        build_ms = (time.perf_counter() - start) * 1000
+        
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.npz")
+            start = time.perf_counter()
+            retriever.save(path)
+            save_ms = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            CandidateRetriever(product_service, nprobe=args.nprobe, index_path=path)
+            load_ms = (time.perf_counter() - start) * 1000
+        
+        recalls, ann_ms, exact_ms, filter_ms = [], [], [], []
+        for _ in range(args.queries):
+            browsed = rng.sample(products, 3)
+            preferences = {"priceRange": "all", "categories": [], "brands": []}
+            query = retriever.query_vector(browsed)
+            exclude = np.asarray([retriever.rows_by_id[p['id']] for p in browsed])
+            
+            start = time.perf_counter()
+            ann_rows, _ = retriever.index.search(query, args.k, exclude=exclude)
+            ann_ms.append((time.perf_counter() - start) * 1000)
+            
+            start = time.perf_counter()
+            exact_rows, _ = retriever.index.exact_search(query, args.k, exclude=exclude)
+            exact_ms.append((time.perf_counter() - start) * 1000)
+            
+            start = time.perf_counter()
+            llm_service._filter_relevant_products(preferences, browsed, products)
+            filter_ms.append((time.perf_counter() - start) * 1000)
+            
+            recalls.append(len(set(ann_rows.tolist()) & set(exact_rows.tolist())) / max(1, len(exact_rows)))
+        
+        report.append({
+            "size": size,
+            "k": args.k,
+            "nprobe": args.nprobe,
+            "clusters": len(retriever.index.centroids),
+            f"recall_at_{args.k}": round(sum(recalls) / len(recalls), 4),
+            "build_ms": round(build_ms, 1),
+            "save_ms": round(save_ms, 1),
+            "load_ms": round(load_ms, 1),
+            "ann_query": summarize(ann_ms),
+            "exact_query": summarize(exact_ms),
+            "rule_filter": summarize(filter_ms)
+        })
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
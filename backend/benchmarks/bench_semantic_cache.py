@@ -0,0 +1,151 @@
+"""
+Benchmark: semantic cache hit rate and quality drift on a replayed request log
+
+Replays a request log through the prompt pipeline in process, with the stub
+LLM's answer (benchmarks.stub_llm) standing in for the model. For each
+similarity threshold the log is replayed against an empty SemanticCache:
+misses store the fresh answer, hits are compared with the answer the request
+would have got on its own. Reported per threshold:
+- hit_rate: share of requests answered from the cache
+- overlap: mean share of the fresh answer's products found in the reused one
+- drift: 1 - overlap, how far reused rankings stray from fresh ones
+- lookup latency (signature + lookup)
+
+The exact-key hit rate of the same log (RecommendationCache keys) is
+reported for comparison.
+
+The log is a JSONL file of {"preferences", "browsing_history"} requests
+(--log). Without one, a synthetic log is generated in which --duplicate-share
+of the requests are near-duplicates of earlier ones: brands and categories
+reordered, or one browsed product added, dropped or swapped for another in
+the same category.
+
+Usage:
+    python -m benchmarks.bench_semantic_cache --size 10000 --requests 2000 --thresholds 0.6,0.7,0.8,0.9
+    python -m benchmarks.bench_semantic_cache --log requests.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+
+from benchmarks.bench_cpu_stage import make_payloads
+from benchmarks.common import summarize
+from benchmarks.stub_llm import build_recommendation_content
+from benchmarks.synthetic import generate_catalog
+from services.cache_service import RecommendationCache
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.semantic_cache import SemanticCache
+
+def perturb(payload, products_by_category, products, rng):
+    """
+    A near-duplicate of a request
+    """
+    preferences = dict(payload["preferences"])
+    history = list(payload["browsing_history"])
+    kind = rng.choice(("reorder", "add", "drop", "swap"))
+    if kind == "reorder":
+        preferences["categories"] = rng.sample(preferences["categories"], len(preferences["categories"]))
+        preferences["brands"] = rng.sample(preferences["brands"], len(preferences["brands"]))
+    elif kind == "drop" and history:
+        history.pop(rng.randrange(len(history)))
+    elif kind == "swap" and history:
+        index = rng.randrange(len(history))
+        category = products[history[index]]["category"]
+        history[index] = rng.choice(products_by_category[category])["id"]
+    else:
+        history.append(rng.choice(list(products.values()))["id"])
+    return {"preferences": preferences, "browsing_history": history}
+
+def synthetic_log(products, count, duplicate_share, seed):
+    """
+    Request log with near-duplicates of earlier requests
+    """
+    rng = random.Random(seed)
+    fresh = make_payloads(products, count, seed=seed)
+    by_id = {product["id"]: product for product in products}
+    by_category = {}
+    for product in products:
+        by_category.setdefault(product["category"], []).append(product)
+    log = []
+    for payload in fresh:
+        if log and rng.random() < duplicate_share:
+            log.append(perturb(rng.choice(log), by_category, by_id, rng))
+        else:
+            log.append(payload)
+    return log
+
+def replay(service, prepared, threshold):
+    """
+    Replay prepared requests against an empty semantic cache at a threshold
+    """
+    cache = SemanticCache(service.product_service, threshold=threshold, max_entries=len(prepared), ttl_seconds=float("inf"), enabled=True)
+    overlaps = []
+    latencies = []
+    for prompt_result, browsed, fresh in prepared:
+        start = time.perf_counter()
+        signature = cache.signature(prompt_result.product_ids, browsed)
+        reused = cache.lookup(signature, browsed)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if reused is None:
+            cache.store(signature, fresh)
+            continue
+        fresh_ids = {item["product"]["id"] for item in fresh["recommendations"]}
+        reused_ids = {item["product"]["id"] for item in reused["recommendations"]}
+        overlaps.append(len(fresh_ids & reused_ids) / len(fresh_ids) if fresh_ids else 1.0)
+    overlap = sum(overlaps) / len(overlaps) if overlaps else None
+    return {
+        "threshold": threshold,
+        "hit_rate": round(len(overlaps) / len(prepared), 4),
+        "overlap": round(overlap, 4) if overlap is not None else None,
+        "drift": round(1 - overlap, 4) if overlap is not None else None,
+        "lookup": summarize(latencies),
+        "cache": cache.stats()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="Synthetic catalog size")
+    parser.add_argument("--log", default=None, help="JSONL request log to replay instead of a synthetic one")
+    parser.add_argument("--requests", type=int, default=2000, help="Synthetic log length")
+    parser.add_argument("--duplicate-share", type=float, default=0.5, help="Share of near-duplicates in the synthetic log")
+    parser.add_argument("--thresholds", default="0.6,0.7,0.8,0.9")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    products = generate_catalog(args.size, seed=args.seed)
+    service = LLMService(ProductService(products=products))
+    try:
+        if args.log:
+            with open(args.log, "r") as file:
+                log = [json.loads(line) for line in file if line.strip()]
+        else:
+            log = synthetic_log(products, args.requests, args.duplicate_share, args.seed)
+        
+        all_products = service.product_service.get_all_products()
+        prepared = []
+        for payload in log:
+            browsed = service._resolve_browsed_products(payload["browsing_history"], all_products)
+            prompt_result = service._build_recommendation_prompt(payload["preferences"], browsed, all_products)
+            fresh = service._parse_recommendation_response(build_recommendation_content(prompt_result.prompt), all_products)
+            prepared.append((prompt_result, browsed, fresh))
+        
+        exact = RecommendationCache(enabled=False)
+        keys = [exact.make_key(payload["preferences"], payload["browsing_history"], "v") for payload in log]
+        report = {
+            "config": vars(args),
+            "requests": len(log),
+            "exact_hit_rate": round(1 - len(set(keys)) / len(keys), 4),
+            "thresholds": [replay(service, prepared, float(threshold)) for threshold in args.thresholds.split(",")]
+        }
+    finally:
+        service.cpu_stage.shutdown()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
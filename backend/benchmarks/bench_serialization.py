@@ -0,0 +1,114 @@
+"""
+Benchmark: response serialization and bytes on the wire
+
+Encodes recommendation responses and /api/products pages from a synthetic
+catalog three ways and reports the CPU time per response and the body size,
+raw and compressed:
+- legacy: what the endpoints did before, jsonable_encoder plus
+  JSONResponse for recommendations and json.dumps for product pages
+- preencoded: ProductEncoder splicing the per-snapshot product bytes
+- compact: preencoded, with products cut down to COMPACT_FIELDS
+  (recommendations only)
+
+Usage:
+    python -m benchmarks.bench_serialization --size 10000 --responses 500
+"""
+
+import argparse
+import gzip
+import json
+import random
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from benchmarks.common import summarize
+from benchmarks.synthetic import generate_catalog
+from services.product_service import ProductService
+from services.serialization import ProductEncoder, brotli, orjson
+
+def make_results(products, count, seed):
+    """
+    Recommendation results shaped like the API's, five products each
+    """
+    rng = random.Random(seed)
+    results = []
+    for _ in range(count):
+        picked = rng.sample(products, 5)
+        results.append({
+            "recommendations": [
+                {
+                    "product": product,
+                    "explanation": f"Matches your interest in {product['category']} and fits your budget.",
+                    "confidence_score": rng.randint(5, 10)
+                }
+                for product in picked
+            ],
+            "count": len(picked)
+        })
+    return results
+
+def measure(encode, inputs):
+    """
+    Time encode over every input and size its output
+    
+    Returns:
+    - dict: Latency summary, mean raw/gzip/brotli bytes per response
+    """
+    encode(inputs[0])
+    latencies = []
+    bodies = []
+    for value in inputs:
+        start = time.perf_counter()
+        body = encode(value)
+        latencies.append((time.perf_counter() - start) * 1000)
+        bodies.append(body)
+    sizes = {
+        "raw_bytes": round(sum(len(body) for body in bodies) / len(bodies)),
+        "gzip_bytes": round(sum(len(gzip.compress(body, compresslevel=6)) for body in bodies) / len(bodies))
+    }
+    if brotli is not None:
+        sizes["br_bytes"] = round(sum(len(brotli.compress(body, quality=4)) for body in bodies) / len(bodies))
+    return {"latency": summarize(latencies), **sizes}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="Catalog size")
+    parser.add_argument("--responses", type=int, default=500, help="Responses encoded per variant")
+    parser.add_argument("--page-size", type=int, default=50, help="Products per /api/products page")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    products = generate_catalog(args.size, seed=args.seed)
+    encoder = ProductEncoder(ProductService(products=products))
+    start = time.perf_counter()
+    encoder.encodings()
+    preencode_s = time.perf_counter() - start
+    
+    results = make_results(products, args.responses, args.seed)
+    rng = random.Random(args.seed)
+    pages = []
+    for _ in range(args.responses):
+        offset = rng.randrange(max(1, args.size - args.page_size))
+        pages.append(products[offset:offset + args.page_size])
+    
+    report = {
+        "config": vars(args),
+        "orjson": orjson is not None,
+        "brotli": brotli is not None,
+        "preencode_s": round(preencode_s, 3),
+        "recommendations": {
+            "legacy": measure(lambda result: JSONResponse(jsonable_encoder(result)).body, results),
+            "preencoded": measure(encoder.encode_recommendations, results),
+            "compact": measure(lambda result: encoder.encode_recommendations(result, compact=True), results)
+        },
+        "products_page": {
+            "legacy": measure(lambda page: json.dumps(page).encode('utf-8'), pages),
+            "preencoded": measure(encoder.encode_list, pages)
+        }
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Benchmark: session store memory, event cost, and per-request history cost
+
+Three measurements on a synthetic catalog:
+- memory: bytes per session of the memory backend (tracemalloc) after every
+  session received --views view events, and that projected to
+  SESSION_MAX_SESSIONS sessions
+- events: cost of recording one view event, memory and disk backends
+- requests: server-side history cost of a recommendation request for
+  several history lengths, sending the full browsing_history (decode the
+  body, resolve every ID, build the cache key) versus a session_id (decode,
+  read the session, resolve its window, build the key), with the request
+  body size of each
+
+Usage:
+    python -m benchmarks.bench_sessions --size 10000 --sessions 100000 --views 30
+    python -m benchmarks.bench_sessions --history-lengths 10,100,1000,5000
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+
+from benchmarks.common import summarize
+from benchmarks.synthetic import generate_catalog
+from config import config
+from services.cache_service import RecommendationCache
+from services.llm_service import LLMService
+from services.product_service import ProductService
+from services.session_store import SessionStore
+
+PREFERENCES = {"priceRange": "all", "categories": [], "brands": []}
+
+def measure_memory(product_service, ids, sessions, views, seed):
+    """
+    Bytes held per session by the memory backend
+    """
+    rng = random.Random(seed)
+    store = SessionStore(product_service, backend="memory", max_sessions=sessions)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for session in range(sessions):
+        store.record_views(f"session-{session}", [rng.choice(ids) for _ in range(views)])
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    per_session = used / sessions
+    return {
+        "sessions": sessions,
+        "views_per_session": views,
+        "bytes_per_session": round(per_session),
+        "projected_mb_at_max_sessions": round(per_session * config['SESSION_MAX_SESSIONS'] / 1e6, 1)
+    }
+
+def measure_events(product_service, ids, backend, path, count, seed):
+    """
+    Latency of recording one view event to one of 1000 sessions
+    """
+    rng = random.Random(seed)
+    store = SessionStore(product_service, backend=backend, path=path)
+    latencies = []
+    for _ in range(count):
+        session_id = f"session-{rng.randrange(1000)}"
+        product_id = rng.choice(ids)
+        start = time.perf_counter()
+        store.record_views(session_id, [product_id])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"backend": store.backend_name, "event": summarize(latencies)}
+
+def measure_requests(service, ids, length, repeats, seed):
+    """
+    History cost of a request sending the full history versus a session ID
+    """
+    rng = random.Random(seed)
+    all_products = service.product_service.get_all_products()
+    cache = RecommendationCache(enabled=False)
+    store = SessionStore(service.product_service, backend="memory")
+    history = [rng.choice(ids) for _ in range(length)]
+    store.record_views("session", history)
+    version = service.product_service.catalog_version
+    
+    full_body = json.dumps({"preferences": PREFERENCES, "browsing_history": history})
+    session_body = json.dumps({"preferences": PREFERENCES, "session_id": "session"})
+    full_ms, session_ms = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        payload = json.loads(full_body)
+        service._resolve_browsed_products(payload["browsing_history"], all_products)
+        cache.make_key(payload["preferences"], payload["browsing_history"], version)
+        full_ms.append((time.perf_counter() - start) * 1000)
+        
+        start = time.perf_counter()
+        payload = json.loads(session_body)
+        session_history = store.history(store.get(payload["session_id"]))
+        service._resolve_browsed_products(session_history, all_products)
+        cache.make_key(payload["preferences"], session_history, version)
+        session_ms.append((time.perf_counter() - start) * 1000)
+    return {
+        "history_length": length,
+        "full_history": {"body_bytes": len(full_body), "latency": summarize(full_ms)},
+        "session": {"body_bytes": len(session_body), "latency": summarize(session_ms)}
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="Synthetic catalog size")
+    parser.add_argument("--sessions", type=int, default=100000, help="Sessions created for the memory measurement")
+    parser.add_argument("--views", type=int, default=30, help="View events per session for the memory measurement")
+    parser.add_argument("--events", type=int, default=20000, help="View events timed per backend")
+    parser.add_argument("--history-lengths", default="10,100,1000")
+    parser.add_argument("--repeats", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    products = generate_catalog(args.size, seed=args.seed)
+    ids = [product["id"] for product in products]
+    service = LLMService(ProductService(products=products))
+    try:
+        report = {"config": vars(args), "memory": measure_memory(service.product_service, ids, args.sessions, args.views, args.seed)}
+        with tempfile.TemporaryDirectory() as directory:
+            report["events"] = [
+                measure_events(service.product_service, ids, "memory", None, args.events, args.seed),
+                measure_events(service.product_service, ids, "disk", os.path.join(directory, "sessions.db"), args.events, args.seed)
+            ]
+        report["requests"] = [
+            measure_requests(service, ids, int(length), args.repeats, args.seed)
+            for length in args.history_lengths.split(",")
+        ]
+    finally:
+        service.cpu_stage.shutdown()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark: precomputed item-to-item similarity table
+
+For synthetic catalogs of each size, builds the similarity table offline and
+reports build time and file size, the latency of merging a browsing
+history's neighbour lists (SimilarityTable.similar) from the mapped file,
+the recall of the IVF-built lists against exact neighbours for a sample of
+products, and the time to update the table after a small catalog change
+compared with a full rebuild.
+
+Usage:
+    python -m benchmarks.bench_similarity --sizes 10000,100000,1000000 --changes 100
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.common import summarize
+from benchmarks.synthetic import generate_catalog
+from services.similarity_service import (
+    SimilarityTable, build_similarity_table, nearest_neighbours, update_similarity_table
+)
+
+def lookup_latency(table, products, lookups, seed):
+    """
+    Time similar() for random browsing histories of 1 to 5 products
+    """
+    rng = random.Random(seed)
+    histories = [[p['id'] for p in rng.sample(products, rng.randint(1, 5))] for _ in range(lookups)]
+    table.similar(histories[0], 30)
+    latencies = []
+    for history in histories:
+        start = time.perf_counter()
+        table.similar(history, 30)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return summarize(latencies)
+
+def sampled_recall(table, sample, seed):
+    """
+    Share of the exact top-N neighbours found in the table, over sampled products
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(table), size=min(sample, len(table)), replace=False)
+    vectors = np.asarray(table.vectors, dtype=np.float32)
+    log_prices = np.asarray(table.log_prices, dtype=np.float32)
+    ratings = np.asarray(table.ratings, dtype=np.float32)
+    exact, _ = nearest_neighbours(vectors, log_prices, ratings, rows, np.arange(len(table)), table.top_n)
+    found = [len(set(exact[i]) & set(table.neighbours[row])) / table.top_n for i, row in enumerate(rows)]
+    return round(float(np.mean(found)), 3)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--recall-sample", type=int, default=200)
+    parser.add_argument("--changes", type=int, default=100, help="Products changed before the incremental update")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    report = {"config": vars(args), "runs": []}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in map(int, args.sizes.split(",")):
+            products = generate_catalog(size, seed=args.seed)
+            path = os.path.join(tmp, f"similarity_{size}.tbl")
+            
+            start = time.perf_counter()
+            build_similarity_table(products, path, "v1")
+            build_s = time.perf_counter() - start
+            table = SimilarityTable(path)
+            
+            changed = [dict(p) for p in products]
+            rng = random.Random(args.seed)
+            for row in rng.sample(range(size), args.changes):
+                changed[row]["price"] = round(changed[row]["price"] * rng.uniform(0.5, 1.5), 2)
+            start = time.perf_counter()
+            summary = update_similarity_table(table, changed, os.path.join(tmp, f"updated_{size}.tbl"), "v2")
+            update_s = time.perf_counter() - start
+            
+            report["runs"].append({
+                "size": size,
+                "build_s": round(build_s, 2),
+                "table_mb": round(os.path.getsize(path) / 1e6, 1),
+                "top_n": table.top_n,
+                "lookup": lookup_latency(table, products, args.lookups, args.seed),
+                "recall": sampled_recall(table, args.recall_sample, args.seed),
+                "update_s": round(update_s, 2),
+                "update": summary
+            })
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
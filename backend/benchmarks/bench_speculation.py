@@ -0,0 +1,108 @@
+"""
+Benchmark: speculative precomputation on view events
+
+Runs a stub LLM with a fixed latency and the API with SPECULATION_ENABLED
+off and on. Each simulated user views --views products, one at a time:
+post the view to its session (with its preferences), wait a think time,
+then request recommendations by session_id. Reports for each mode:
+- latency of the real recommendation requests
+- the speculation counters from /api/cache/stats: hit_ratio (speculative
+  results a real request used) and request_hit_ratio (real requests answered
+  by a finished or running speculative job)
+- LLM calls the stub served, i.e. the spend speculation added
+
+Usage:
+    python -m benchmarks.bench_speculation --latency 1.0 --think-time 1.5
+    python -m benchmarks.bench_speculation --users 8 --budget 30
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+import requests
+
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+
+CATEGORIES = ["Electronics", "Home", "Sports", "Beauty", "Clothing"]
+
+def simulate_user(base_url, user, args, latencies):
+    """
+    One user alternating view events and recommendation requests
+    """
+    rng = random.Random(args.seed + user)
+    session = requests.Session()
+    session_id = f"bench-{user}"
+    preferences = {"priceRange": "all", "categories": [rng.choice(CATEGORIES)], "brands": []}
+    for _ in range(args.views):
+        product_id = f"prod{rng.randint(1, 20):03d}"
+        session.post(
+            f"{base_url}/api/sessions/{session_id}/views",
+            json={"product_ids": [product_id], "preferences": preferences}
+        ).raise_for_status()
+        time.sleep(rng.uniform(0.5, 1.5) * args.think_time)
+        start = time.perf_counter()
+        session.post(
+            f"{base_url}/api/recommendations",
+            json={"preferences": preferences, "session_id": session_id}
+        ).raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    session.delete(f"{base_url}/api/sessions/{session_id}")
+
+def run_mode(args, enabled):
+    """
+    Run every simulated user against a fresh API server
+    """
+    env = {
+        "SPECULATION_ENABLED": "true" if enabled else "false",
+        "SPECULATION_BUDGET_PER_MINUTE": str(args.budget)
+    }
+    stub = api = None
+    try:
+        stub = start_stub_llm(args.stub_port, args.latency)
+        api = start_api_server(args.api_port, args.stub_port, env=env)
+        base_url = f"http://127.0.0.1:{args.api_port}"
+        stub_before = requests.get(f"http://127.0.0.1:{args.stub_port}/stats").json()["requests"]
+        
+        latencies = []
+        threads = [
+            threading.Thread(target=simulate_user, args=(base_url, user, args, latencies))
+            for user in range(args.users)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        stats = requests.get(f"{base_url}/api/cache/stats").json()
+        llm_calls = requests.get(f"http://127.0.0.1:{args.stub_port}/stats").json()["requests"] - stub_before
+        return {
+            "speculation": enabled,
+            "requests": summarize(latencies),
+            "llm_calls": llm_calls,
+            "counters": stats["speculation"]
+        }
+    finally:
+        stop_processes(api, stub)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--latency", type=float, default=1.0, help="Stub LLM latency (seconds)")
+    parser.add_argument("--think-time", type=float, default=1.5, help="Mean seconds between a view and the request")
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--views", type=int, default=8, help="Views (and requests) per user")
+    parser.add_argument("--budget", type=float, default=60, help="SPECULATION_BUDGET_PER_MINUTE")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    print(json.dumps({
+        "config": vars(args),
+        "modes": [run_mode(args, False), run_mode(args, True)]
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
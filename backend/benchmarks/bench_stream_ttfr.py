@@ -0,0 +1,88 @@
+"""
+Benchmark: time to first recommendation, streaming vs blocking endpoint
+
+Runs a stub LLM that streams tokens at a fixed rate, then for each request
+measures:
+- /api/recommendations: time until the full JSON response arrives
+- /api/recommendations/stream: time to the first `recommendation` event
+  and to the final `summary` event
+
+The result cache is disabled so every request reaches the stub.
+
+Usage:
+    python -m benchmarks.bench_stream_ttfr --token-rate 40 --first-token 0.5
+"""
+
+import argparse
+import json
+import time
+
+import requests
+
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+
+PAYLOADS = [
+    {"preferences": {"priceRange": "all", "categories": ["Electronics"], "brands": []}, "browsing_history": ["prod002", "prod007"]},
+    {"preferences": {"priceRange": "50-100", "categories": ["Home"], "brands": []}, "browsing_history": []},
+    {"preferences": {"priceRange": "all", "categories": [], "brands": ["SoundWave"]}, "browsing_history": ["prod001"]}
+]
+
+def time_blocking(session, base_url, payload):
+    """
+    Milliseconds until the blocking endpoint returns its full response
+    """
+    start = time.perf_counter()
+    session.post(f"{base_url}/api/recommendations", json=payload).raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+def time_stream(session, base_url, payload):
+    """
+    Milliseconds to the first recommendation event and to the summary event
+    """
+    start = time.perf_counter()
+    first = None
+    with session.post(f"{base_url}/api/recommendations/stream", json=payload, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line == "event: recommendation" and first is None:
+                first = (time.perf_counter() - start) * 1000
+            elif line == "event: summary":
+                break
+    return first, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--first-token", type=float, default=0.5, help="Stub latency before the first token (seconds)")
+    parser.add_argument("--token-rate", type=float, default=40.0, help="Stub tokens per second")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    
+    stub = api = None
+    try:
+        stub = start_stub_llm(args.stub_port, args.first_token, ["--token-rate", str(args.token_rate)])
+        api = start_api_server(args.api_port, args.stub_port, env={"CACHE_ENABLED": "false"})
+        base_url = f"http://127.0.0.1:{args.api_port}"
+        session = requests.Session()
+        
+        blocking, first_event, stream_total = [], [], []
+        for _ in range(args.rounds):
+            for payload in PAYLOADS:
+                blocking.append(time_blocking(session, base_url, payload))
+                first, total = time_stream(session, base_url, payload)
+                if first is not None:
+                    first_event.append(first)
+                stream_total.append(total)
+        
+        print(json.dumps({
+            "blocking_full_response": summarize(blocking),
+            "stream_first_recommendation": summarize(first_event),
+            "stream_summary": summarize(stream_total),
+            "config": vars(args)
+        }, indent=2))
+    finally:
+        stop_processes(api, stub)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Shared helpers for the benchmark scripts: subprocess servers and latency stats
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(samples, pct):
+    """
+    Nearest-rank percentile of a list of samples
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(samples_ms):
+    """
+    Summarize latency samples (milliseconds) as count/mean/p50/p95/p99/max
+    """
+    if not samples_ms:
+        return {"count": 0}
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(sum(samples_ms) / len(samples_ms), 3),
+        "p50_ms": round(percentile(samples_ms, 50), 3),
+        "p95_ms": round(percentile(samples_ms, 95), 3),
+        "p99_ms": round(percentile(samples_ms, 99), 3),
+        "max_ms": round(max(samples_ms), 3)
+    }
+
+def start_process(args, env=None):
+    """
+    Start a python module as a background process from the backend directory
+    """
+    process_env = dict(os.environ)
+    process_env.update(env or {})
+    return subprocess.Popen(
+        [sys.executable, "-m"] + list(args),
+        cwd=BACKEND_DIR,
+        env=process_env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+def start_stub_llm(port, latency, extra_args=()):
+    """
+    Start the stub LLM server and wait for it to accept connections
+    """
+    process = start_process(["benchmarks.stub_llm", "--port", str(port), "--latency", str(latency)] + list(extra_args))
+    wait_for_http(f"http://127.0.0.1:{port}/docs")
+    return process
+
+def start_api_server(port, stub_port, env=None, extra_args=()):
+    """
+    Start the recommendation API pointed at a local stub LLM
+    """
+    api_env = {
+        "OPENAI_API_KEY": "stub-key",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1"
+    }
+    api_env.update(env or {})
+    process = start_process(["uvicorn", "app:app", "--port", str(port), "--log-level", "warning"] + list(extra_args), env=api_env)
+    wait_for_http(f"http://127.0.0.1:{port}/api/products")
+    return process
+
+def wait_for_http(url, timeout=30.0):
+    """
+    Poll a URL until it answers or the timeout expires
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1.0)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not start within {timeout}s")
+
+def stop_processes(*processes):
+    """
+    Terminate background server processes
+    """
+    for process in processes:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
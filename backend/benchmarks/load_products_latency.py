@@ -0,0 +1,106 @@
+"""
+Load test: /api/products latency while /api/recommendations is saturated
+
+Starts a stub LLM with a slow completion latency and the API server pointed
+at it, measures /api/products latency at idle, then again while many clients
+hammer /api/recommendations. With the async LLM path the event loop stays
+free, so the two p99 figures should be close.
+
+Usage:
+    python -m benchmarks.load_products_latency --rec-clients 16 --llm-latency 2.0
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import requests
+
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+
+REC_PAYLOAD = {
+    "preferences": {"priceRange": "all", "categories": ["Electronics"], "brands": []},
+    "browsing_history": ["prod002", "prod007"]
+}
+
+def sample_products_latency(base_url, samples):
+    """
+    Time sequential GET /api/products calls, returning milliseconds
+    """
+    session = requests.Session()
+    latencies = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        session.get(f"{base_url}/api/products").raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def hammer_recommendations(base_url, stop_event, results, think_time):
+    """
+    Post recommendation requests in a loop until stopped, recording fallback usage
+    """
+    session = requests.Session()
+    while not stop_event.is_set():
+        try:
+            data = session.post(f"{base_url}/api/recommendations", json=REC_PAYLOAD, timeout=120).json()
+            results.append(bool(data.get("fallback")))
+        except requests.exceptions.RequestException:
+            results.append(None)
+        # Shed requests come back instantly; pause so clients don't spin on the CPU
+        stop_event.wait(think_time)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--rec-clients", type=int, default=16)
+    parser.add_argument("--think-time", type=float, default=0.1, help="Pause between a client's requests (seconds)")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+    
+    stub = api = None
+    try:
+        stub = start_stub_llm(args.stub_port, args.llm_latency)
+        api = start_api_server(args.api_port, args.stub_port, env={
+            "LLM_MAX_CONCURRENCY": str(args.max_concurrency),
+            "LLM_TIMEOUT": str(args.timeout)
+        })
+        base_url = f"http://127.0.0.1:{args.api_port}"
+        
+        idle = sample_products_latency(base_url, args.samples)
+        
+        stop_event = threading.Event()
+        rec_results = []
+        workers = [
+            threading.Thread(target=hammer_recommendations, args=(base_url, stop_event, rec_results, args.think_time), daemon=True)
+            for _ in range(args.rec_clients)
+        ]
+        for worker in workers:
+            worker.start()
+        time.sleep(args.llm_latency)  # let the LLM slots fill up
+        saturated = sample_products_latency(base_url, args.samples)
+        stop_event.set()
+        for worker in workers:
+            worker.join(timeout=args.timeout + args.llm_latency + 5)
+        
+        completed = [r for r in rec_results if r is not None]
+        report = {
+            "products_idle": summarize(idle),
+            "products_saturated": summarize(saturated),
+            "recommendations": {
+                "completed": len(completed),
+                "errors": len(rec_results) - len(completed),
+                "fallback_rate": round(sum(completed) / len(completed), 3) if completed else 0.0
+            },
+            "config": vars(args)
+        }
+        print(json.dumps(report, indent=2))
+    finally:
+        stop_processes(api, stub)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+Replay recorded traffic against a local API backed by the stub LLM
+
+Replays a request log written by the API (REQUEST_LOG_PATH, see
+services/request_log.py) in one or more scenarios and reports, per scenario
+and endpoint, the throughput, latency percentiles, error count, fallback
+share (recommendations) and cache hit rate.
+
+Scenarios (--scenarios, comma-separated):
+- closed:N      N clients each sending the next request once the previous answered
+- poisson:R     open loop, Poisson arrivals at R requests per second
+- recorded:S    open loop, the log's own arrival times sped up S times
+
+Open-loop latencies are measured from each request's scheduled send time, so
+time spent waiting for a free client (--max-in-flight) counts, as it would
+for a real user. Stream requests are timed to the end of the event stream,
+batch requests to the last NDJSON line. Requests recorded with a session
+(s=1) are replayed with the session window they resolved to as their
+browsing_history.
+
+Unless --url points at a running server, the stub LLM is started once and a
+fresh API server (empty caches) for every scenario. Without --log, a
+synthetic catalog of --size products and a synthetic log over it are used;
+--save-log writes that log out for later runs.
+
+Usage:
+    REQUEST_LOG_PATH=requests.jsonl.gz uvicorn app:app --port 5000   # record
+    python -m benchmarks.replay --log requests.jsonl.gz --scenarios closed:8,poisson:20,poisson:50
+    python -m benchmarks.replay --size 10000 --requests 1000 --scenarios recorded:10 --output replay.json
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.bench_cpu_stage import make_payloads
+from benchmarks.common import start_api_server, start_stub_llm, stop_processes, summarize
+from benchmarks.synthetic import generate_catalog, write_catalog
+from services.request_log import open_log, read_request_log
+
+ENDPOINTS = {
+    "products": ("GET", "/api/products"),
+    "recommendations": ("POST", "/api/recommendations"),
+    "stream": ("POST", "/api/recommendations/stream"),
+    "batch": ("POST", "/api/recommendations/batch")
+}
+
+def recommendation_body(entry):
+    """
+    Request body of a recorded recommendation request
+    """
+    preferences = {"priceRange": "all", "categories": [], "brands": []}
+    preferences.update(entry.get("p") or {})
+    return {"preferences": preferences, "browsing_history": entry.get("h") or []}
+
+def fallback_share(endpoint, response):
+    """
+    Share of the recommendation results in a response that came from the fallback
+    """
+    if endpoint == "recommendations":
+        return float(bool(response.json().get("fallback")))
+    if endpoint == "stream":
+        summary = response.text.rpartition("event: summary\ndata: ")[2]
+        return float(bool(summary) and bool(json.loads(summary.split("\n", 1)[0]).get("fallback")))
+    lines = [json.loads(line) for line in response.text.splitlines() if line.strip()]
+    return sum(bool(line.get("fallback")) for line in lines) / len(lines) if lines else 0.0
+
+def synthetic_log(products, count, products_share, rate, seed):
+    """
+    A request log over a synthetic catalog, with Poisson arrival times at rate per second
+    """
+    rng = random.Random(seed)
+    payloads = make_payloads(products, count, seed=seed)
+    log = []
+    t = 0.0
+    for payload in payloads:
+        t += rng.expovariate(rate)
+        if rng.random() < products_share:
+            query = {"limit": "50"}
+            if payload["preferences"]["categories"]:
+                query["category"] = ",".join(payload["preferences"]["categories"])
+            log.append({"t": round(t, 3), "e": "products", "q": query})
+        else:
+            preferences = {key: value for key, value in payload["preferences"].items() if value}
+            log.append({"t": round(t, 3), "e": "recommendations", "q": {}, "p": preferences, "h": payload["browsing_history"]})
+    return log
+
+def parse_scenario(text):
+    """
+    Split "kind:value" into (kind, value)
+    """
+    kind, _, value = text.partition(":")
+    if kind not in ("closed", "poisson", "recorded"):
+        raise ValueError(f"Unknown scenario {text!r}")
+    return kind, float(value or 1)
+
+def schedule(kind, value, entries, seed):
+    """
+    Send offsets (seconds from the start) of each entry for an open-loop scenario
+    """
+    if kind == "poisson":
+        rng = random.Random(seed)
+        offsets = []
+        t = 0.0
+        for _ in entries:
+            offsets.append(t)
+            t += rng.expovariate(value)
+        return offsets
+    start = entries[0]["t"]
+    offsets = []
+    for entry in entries:
+        # Logs spanning a restart or concatenated logs can go back in time
+        offsets.append(max(offsets[-1] if offsets else 0.0, (entry["t"] - start) / value))
+    return offsets
+
+class Client:
+    """
+    Sends log entries to the API, one requests.Session per thread
+    """
+    
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self._local = threading.local()
+    
+    def send(self, entry, scheduled=None):
+        """
+        Send one entry
+        
+        Parameters:
+        - entry (dict): Log entry
+        - scheduled (float): perf_counter time it was due, for open-loop latency
+        
+        Returns:
+        - tuple: (endpoint, latency in ms, ok, fallback share)
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        endpoint = entry["e"]
+        method, path = ENDPOINTS[endpoint]
+        body = None
+        if endpoint == "batch":
+            body = {"requests": [recommendation_body(item) for item in entry.get("r") or []]}
+        elif endpoint != "products":
+            body = recommendation_body(entry)
+        start = time.perf_counter() if scheduled is None else scheduled
+        try:
+            response = session.request(method, self.base_url + path, params=entry.get("q") or None, json=body, timeout=120)
+            ok = response.status_code < 400
+            fallback = fallback_share(endpoint, response) if ok and endpoint != "products" else 0.0
+        except requests.exceptions.RequestException:
+            ok, fallback = False, 0.0
+        return endpoint, (time.perf_counter() - start) * 1000, ok, fallback
+
+def run_closed(client, entries, concurrency):
+    """
+    Send every entry from concurrency clients, each waiting for its previous answer
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(client.send, entries))
+
+def run_open(client, entries, offsets, max_in_flight):
+    """
+    Send every entry at its offset, whether or not earlier ones have answered
+    """
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        start = time.perf_counter()
+        for entry, offset in zip(entries, offsets):
+            due = start + offset
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(client.send, entry, due))
+    return [future.result() for future in futures]
+
+def cache_counters(base_url):
+    """
+    Hit and miss counters of the API's caches
+    """
+    stats = requests.get(base_url + "/api/cache/stats", timeout=10).json()
+    counters = {"recommendations": (stats["hits"], stats["misses"])}
+    for name in ("products_pages", "semantic"):
+        if name in stats:
+            counters[name] = (stats[name]["hits"], stats[name]["misses"])
+    return counters
+
+def hit_rates(before, after):
+    """
+    Hit rate of each cache between two counter readings
+    """
+    rates = {}
+    for name, (hits, misses) in after.items():
+        hits -= before.get(name, (0, 0))[0]
+        misses -= before.get(name, (0, 0))[1]
+        rates[name] = round(hits / (hits + misses), 4) if hits + misses else None
+    return rates
+
+def summarize_results(results, elapsed):
+    """
+    Per-endpoint throughput, latency, errors and fallback share
+    """
+    report = {}
+    for endpoint in ENDPOINTS:
+        selected = [result for result in results if result[0] == endpoint]
+        if not selected:
+            continue
+        answered = [result for result in selected if result[2]]
+        report[endpoint] = {
+            "requests": len(selected),
+            "throughput_rps": round(len(selected) / elapsed, 2),
+            "latency": summarize([latency for _, latency, ok, _ in answered]),
+            "errors": len(selected) - len(answered),
+            "fallback_share": round(sum(result[3] for result in answered) / len(answered), 4)
+            if endpoint != "products" and answered else None
+        }
+    return report
+
+def run_scenario(base_url, scenario, entries, args):
+    """
+    Run one scenario and report it
+    """
+    kind, value = scenario
+    client = Client(base_url)
+    before = cache_counters(base_url)
+    start = time.perf_counter()
+    if kind == "closed":
+        results = run_closed(client, entries, int(value))
+    else:
+        results = run_open(client, entries, schedule(kind, value, entries, args.seed), args.max_in_flight)
+    elapsed = time.perf_counter() - start
+    return {
+        "scenario": f"{kind}:{value:g}",
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": summarize_results(results, elapsed),
+        "cache_hit_rate": hit_rates(before, cache_counters(base_url))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default=None, help="Recorded request log (JSONL, or .jsonl.gz)")
+    parser.add_argument("--scenarios", default="closed:8,poisson:20")
+    parser.add_argument("--requests", type=int, default=None, help="Entries replayed per scenario, cycling the log (all by default)")
+    parser.add_argument("--max-in-flight", type=int, default=64, help="Open-loop client threads")
+    parser.add_argument("--url", default=None, help="Replay against this server instead of starting one")
+    parser.add_argument("--catalog", default=None, help="DATA_PATH for the started API (its default catalog otherwise)")
+    parser.add_argument("--size", type=int, default=10000, help="Synthetic catalog size when no log is given")
+    parser.add_argument("--products-share", type=float, default=0.5, help="Share of product requests in a synthetic log")
+    parser.add_argument("--save-log", default=None, help="Write the synthetic log here")
+    parser.add_argument("--no-cache", action="store_true", help="Start the API with the result cache off")
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write the report JSON here as well as printing it")
+    args = parser.parse_args()
+    
+    scenarios = [parse_scenario(text) for text in args.scenarios.split(",")]
+    stub = api = None
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog_path = args.catalog
+        if args.log:
+            log = read_request_log(args.log)
+        else:
+            products = generate_catalog(args.size, seed=args.seed)
+            catalog_path = os.path.join(tmp, "products.json")
+            write_catalog(products, catalog_path)
+            log = synthetic_log(products, args.requests or 1000, args.products_share, 20.0, args.seed)
+            if args.save_log:
+                with open_log(args.save_log, "w") as file:
+                    file.writelines(json.dumps(entry, separators=(",", ":")) + "\n" for entry in log)
+        count = args.requests or len(log)
+        entries = [log[i % len(log)] for i in range(count)]
+        
+        env = {"CACHE_ENABLED": "false" if args.no_cache else "true", "REQUEST_LOG_PATH": ""}
+        if catalog_path:
+            env["DATA_PATH"] = catalog_path
+        report = {"config": vars(args), "log_entries": len(log), "scenarios": []}
+        try:
+            if args.url is None:
+                stub = start_stub_llm(args.stub_port, args.llm_latency, [
+                    "--seed", str(args.seed), "--malformed-rate", str(args.malformed_rate)
+                ])
+            for scenario in scenarios:
+                base_url = args.url
+                if base_url is None:
+                    api = start_api_server(args.api_port, args.stub_port, env=env)
+                    base_url = f"http://127.0.0.1:{args.api_port}"
+                try:
+                    report["scenarios"].append(run_scenario(base_url.rstrip("/"), scenario, entries, args))
+                finally:
+                    stop_processes(api)
+                    api = None
+        finally:
+            stop_processes(api, stub)
+    
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Local stub of an OpenAI-compatible chat completions server
+
+Used by the benchmarks so load tests never hit a real provider. The stub
+answers with a well-formed recommendation array built from the product IDs
+it finds in the prompt, after sleeping for a configurable latency. With
+--token-rate, completions also take time proportional to their length, and
+streaming requests (stream=true) emit the content as SSE chunks at that rate.
+--error-rate and --slow-rate make a share of completions fail with a 500 or
+wait --slow-latency instead, to exercise failover and hedging.
+--malformed-rate answers a share of completions with broken JSON (fenced,
+trailing commas, single quotes, truncated or no JSON at all), and --canned
+replays responses from a JSONL corpus of {"response": ...} lines in order
+instead of building them. Draws are seeded (--seed, 0 by default), so a run
+with the same arguments and request order gets the same answers.
+GET /stats reports the requests served, errors and slow answers injected, and
+the TCP connections they came on.
+
+Usage:
+    python -m benchmarks.stub_llm --port 5055 --latency 2.0 --token-rate 50
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+PRODUCT_ID_PATTERN = re.compile(r'ID: (\S+)')
+BATCH_USER_PATTERN = re.compile(r'USER (user_\d+)\n.*?CANDIDATES: ([^\n]*)', re.DOTALL)
+
+def build_recommendation_items(product_ids, count=5):
+    """
+    Build recommendation items for the first product IDs given
+    """
+    return [
+        {
+            "product_id": product_id,
+            "explanation": f"Stub recommendation #{i + 1}: it fits the stated preferences and is close to recently browsed products.",
+            "score": 9.0 - i
+        }
+        for i, product_id in enumerate(product_ids[:count])
+    ]
+
+def build_recommendation_content(prompt, count=5, structured=False):
+    """
+    Build the JSON answer for a prompt: an array for single-user prompts
+    (wrapped in a "recommendations" object when a JSON schema was requested),
+    or an object keyed by user for batch prompts
+    """
+    batch_users = BATCH_USER_PATTERN.findall(prompt)
+    if batch_users:
+        return json.dumps({
+            user: build_recommendation_items([c.strip() for c in candidates.split(',')], count)
+            for user, candidates in batch_users
+        })
+    items = build_recommendation_items(PRODUCT_ID_PATTERN.findall(prompt), count)
+    return json.dumps({"recommendations": items} if structured else items)
+
+MALFORMATIONS = ("fenced", "trailing_commas", "single_quotes", "truncated", "garbage")
+
+def malform(content, rng, kind=None):
+    """
+    Break a JSON answer in one of the ways LLMs do
+    
+    Parameters:
+    - content (str): Well-formed answer
+    - rng (random.Random): Source of the random choice of malformation
+    - kind (str): One of MALFORMATIONS, drawn at random when omitted
+    
+    Returns:
+    - tuple: (kind of malformation, broken content)
+    """
+    kind = kind or rng.choice(MALFORMATIONS)
+    if kind == "fenced":
+        return kind, f"Here are my recommendations:\n```json\n{content}\n```"
+    if kind == "trailing_commas":
+        return kind, content.replace("}", ",}").replace("]", ",]")
+    if kind == "single_quotes":
+        return kind, content.replace('"', "'")
+    if kind == "truncated":
+        return kind, content[:max(1, len(content) * 2 // 3)]
+    return kind, "I'm sorry, I can't help with that request."
+
+def load_canned(path):
+    """
+    Read canned responses from a JSONL file of {"response": ...} lines
+    """
+    with open(path, "r") as file:
+        return [json.loads(line)["response"] for line in file if line.strip()]
+
+CHARS_PER_TOKEN = 4
+
+def stream_chunks(content, model, token_rate):
+    """
+    Yield OpenAI-style SSE chunks for content, one token's worth at a time
+    """
+    async def generate():
+        for start in range(0, len(content), CHARS_PER_TOKEN):
+            if token_rate:
+                await asyncio.sleep(1.0 / token_rate)
+            chunk = {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": content[start:start + CHARS_PER_TOKEN]},
+                    "finish_reason": None
+                }]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+    return generate()
+
+def create_app(latency=1.0, token_rate=None, error_rate=0.0, slow_rate=0.0, slow_latency=0.0, seed=0, malformed_rate=0.0, canned=None):
+    """
+    Create the stub server app
+    
+    Parameters:
+    - latency (float): Seconds before the first token
+    - token_rate (float): Tokens per second after the first; None for instant
+    - error_rate (float): Share of completions answered with a 500
+    - slow_rate (float): Share of completions delayed by slow_latency instead of latency
+    - slow_latency (float): Seconds before the first token of a slow completion
+    - seed (int): Seed for the error, slow and malformed draws
+    - malformed_rate (float): Share of completions answered with broken JSON
+    - canned (list): Responses replayed in order instead of building them
+    """
+    rng = random.Random(seed)
+    stub = FastAPI(title="Stub LLM")
+    # Client (host, port) pairs seen: each one is a TCP connection the caller opened
+    connections = set()
+    counters = {"requests": 0, "errors": 0, "slow": 0, "malformed": 0, "canned": 0}
+    
+    @stub.middleware("http")
+    async def count_connections(request: Request, call_next):
+        counters["requests"] += 1
+        connections.add(tuple(request.scope.get("client") or ()))
+        return await call_next(request)
+    
+    @stub.get("/stats")
+    async def stats():
+        return dict(counters, connections=len(connections))
+    
+    @stub.get("/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "stub", "object": "model"}]}
+    
+    @stub.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = body["messages"][-1]["content"]
+        model = body.get("model", "stub")
+        slow = rng.random() < slow_rate
+        counters["slow"] += slow
+        await asyncio.sleep(slow_latency if slow else latency)
+        if rng.random() < error_rate:
+            counters["errors"] += 1
+            return JSONResponse({"error": {"message": "Injected stub error", "type": "server_error"}}, status_code=500)
+        structured = (body.get("response_format") or {}).get("type") == "json_schema"
+        if canned:
+            content = canned[counters["canned"] % len(canned)]
+            counters["canned"] += 1
+        else:
+            content = build_recommendation_content(prompt, structured=structured)
+        if rng.random() < malformed_rate:
+            counters["malformed"] += 1
+            _, content = malform(content, rng)
+        if body.get("stream"):
+            return StreamingResponse(stream_chunks(content, model, token_rate), media_type="text/event-stream")
+        if token_rate:
+            await asyncio.sleep(len(content) / CHARS_PER_TOKEN / token_rate)
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4
+            }
+        }
+    
+    return stub
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stub OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--latency", type=float, default=1.0, help="Seconds before the first token")
+    parser.add_argument("--token-rate", type=float, default=None, help="Tokens per second after the first")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of completions that fail with a 500")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Share of completions delayed by --slow-latency")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="Seconds before the first token of a slow completion")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of completions answered with broken JSON")
+    parser.add_argument("--canned", default=None, help="JSONL file of {\"response\": ...} lines to replay in order")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    
+    canned = load_canned(args.canned) if args.canned else None
+    app = create_app(
+        args.latency, args.token_rate, args.error_rate, args.slow_rate, args.slow_latency,
+        args.seed, args.malformed_rate, canned
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""
+Benchmark suite: recommendation pipeline micro-benchmarks and an end-to-end load run
+
+Runs offline against synthetic catalogs and the stub LLM, and writes the
+results as JSON so runs from different commits can be compared.
+
+Micro-benchmarks, per catalog size (--sizes), time the pipeline steps on a
+fixed set of generated requests:
+- filter: _filter_relevant_products
+- prompt: _create_recommendation_prompt on the filtered candidates
+- parse: _parse_recommendation_response on the stub LLM's answer to that
+  prompt, clean and with each of the stub's malformations
+- fallback: _generate_fallback_recommendations
+
+The load scenario (skipped with --skip-load) starts the stub LLM with a fixed
+latency and seed, and the API on a --load-size catalog with the result cache
+off. Concurrent clients then send --requests calls to /api/products and to
+/api/recommendations, and the throughput, latency percentiles and fallback
+share of each endpoint are reported.
+
+With --compare, every *_ms figure is compared with a previous results file,
+and figures more than --threshold times slower are listed as regressions.
+
+Usage:
+    python -m benchmarks.suite --sizes 1000,10000,100000 --output bench.json
+    python -m benchmarks.suite --skip-load --compare bench.json --output bench_new.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("OPENAI_API_KEY", "stub-key")
+
+import requests
+
+from benchmarks.bench_cpu_stage import make_payloads
+from benchmarks.common import BACKEND_DIR, start_api_server, start_stub_llm, stop_processes, summarize
+from benchmarks.stub_llm import MALFORMATIONS, build_recommendation_content, malform
+from benchmarks.synthetic import generate_catalog, write_catalog
+from services.llm_service import LLMService
+from services.product_service import ProductService
+
+def time_calls(func, inputs, repeat):
+    """
+    Time func over every input, best of repeat passes
+    
+    Returns:
+    - dict: Mean and worst milliseconds per call in the best pass
+    """
+    best = None
+    for _ in range(repeat):
+        samples = []
+        for args in inputs:
+            start = time.perf_counter()
+            func(*args)
+            samples.append((time.perf_counter() - start) * 1000)
+        if best is None or sum(samples) < sum(best):
+            best = samples
+    return {
+        "mean_ms": round(sum(best) / len(best), 4),
+        "max_ms": round(max(best), 4)
+    }
+
+def micro_benchmarks(size, request_count, repeat, seed):
+    """
+    Time the pipeline steps on a catalog of the given size
+    """
+    products = generate_catalog(size, seed=seed)
+    service = LLMService(ProductService(products=products))
+    try:
+        all_products = service.product_service.get_all_products()
+        payloads = make_payloads(products, request_count, seed=seed)
+        requests_in = [
+            (payload["preferences"], service._resolve_browsed_products(payload["browsing_history"], all_products))
+            for payload in payloads
+        ]
+        candidates = [
+            service._filter_relevant_products(preferences, browsed, all_products)
+            for preferences, browsed in requests_in
+        ]
+        prompts = [
+            service._create_recommendation_prompt(preferences, browsed, all_products, relevant)
+            for (preferences, browsed), relevant in zip(requests_in, candidates)
+        ]
+        answers = [build_recommendation_content(prompt) for prompt in prompts]
+        rng = random.Random(seed)
+        malformed = {kind: [malform(answer, rng, kind)[1] for answer in answers] for kind in MALFORMATIONS}
+        
+        parse = {"clean": time_calls(service._parse_recommendation_response, [(answer, all_products) for answer in answers], repeat)}
+        for kind, responses in malformed.items():
+            parse[kind] = time_calls(service._parse_recommendation_response, [(response, all_products) for response in responses], repeat)
+        
+        return {
+            "size": size,
+            "requests": request_count,
+            "filter": time_calls(
+                service._filter_relevant_products,
+                [(preferences, browsed, all_products) for preferences, browsed in requests_in], repeat
+            ),
+            "prompt": time_calls(
+                service._create_recommendation_prompt,
+                [(preferences, browsed, all_products, relevant) for (preferences, browsed), relevant in zip(requests_in, candidates)], repeat
+            ),
+            "parse": parse,
+            "fallback": time_calls(
+                service._generate_fallback_recommendations,
+                [(preferences, browsed, all_products) for preferences, browsed in requests_in], repeat
+            )
+        }
+    finally:
+        service.cpu_stage.shutdown()
+
+def run_endpoint(send, payloads, concurrency):
+    """
+    Send every payload from concurrent clients
+    
+    Returns:
+    - dict: Throughput, latency summary and fallback share
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, payloads))
+    elapsed = time.perf_counter() - start
+    latencies = [ms for ms, _ in results]
+    return {
+        "throughput_rps": round(len(results) / elapsed, 2),
+        "latency": summarize(latencies),
+        "fallback_share": round(sum(fallback for _, fallback in results) / len(results), 3)
+    }
+
+def load_scenario(args):
+    """
+    Run concurrent clients against /api/products and /api/recommendations
+    """
+    products = generate_catalog(args.load_size, seed=args.seed)
+    payloads = make_payloads(products, args.requests, seed=args.seed)
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    stub = api = None
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog_path = os.path.join(tmp, "products.json")
+        write_catalog(products, catalog_path)
+        try:
+            stub = start_stub_llm(args.stub_port, args.llm_latency, [
+                "--seed", str(args.seed), "--malformed-rate", str(args.malformed_rate)
+            ])
+            api = start_api_server(args.api_port, args.stub_port, env={
+                "DATA_PATH": catalog_path,
+                "CACHE_ENABLED": "false",
+                "LLM_MAX_CONCURRENCY": str(args.concurrency)
+            })
+            session = requests.Session()
+            
+            def get_products(payload):
+                params = {"limit": 50}
+                if payload["preferences"]["categories"]:
+                    params["category"] = ",".join(payload["preferences"]["categories"])
+                start = time.perf_counter()
+                session.get(f"{base_url}/api/products", params=params, timeout=60).raise_for_status()
+                return (time.perf_counter() - start) * 1000, False
+            
+            def post_recommendations(payload):
+                start = time.perf_counter()
+                response = session.post(f"{base_url}/api/recommendations", json=payload, timeout=60)
+                response.raise_for_status()
+                return (time.perf_counter() - start) * 1000, bool(response.json().get("fallback"))
+            
+            return {
+                "products": run_endpoint(get_products, payloads, args.concurrency),
+                "recommendations": run_endpoint(post_recommendations, payloads, args.concurrency)
+            }
+        finally:
+            stop_processes(api, stub)
+
+def flatten_ms(results, prefix=""):
+    """
+    Map dotted paths to every *_ms figure in a results tree
+    """
+    figures = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            path = f"{prefix}.{key}" if prefix else str(key)
+            if key.endswith("_ms") and isinstance(value, (int, float)):
+                figures[path] = value
+            else:
+                figures.update(flatten_ms(value, path))
+    elif isinstance(results, list):
+        for item in results:
+            label = item.get("size") if isinstance(item, dict) else None
+            figures.update(flatten_ms(item, f"{prefix}[{label}]"))
+    return figures
+
+def compare(current, baseline, threshold):
+    """
+    Ratios of current to baseline timings, and the ones over the threshold
+    """
+    now = flatten_ms(current)
+    before = flatten_ms(baseline)
+    ratios = {
+        path: round(now[path] / before[path], 3)
+        for path in sorted(now.keys() & before.keys())
+        if before[path] > 0
+    }
+    return {
+        "baseline_commit": baseline.get("meta", {}).get("commit"),
+        "threshold": threshold,
+        "regressions": {path: ratio for path, ratio in ratios.items() if ratio > threshold},
+        "ratios": ratios
+    }
+
+def git_commit():
+    """
+    The commit being benchmarked, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Catalog sizes for the micro-benchmarks")
+    parser.add_argument("--micro-requests", type=int, default=50, help="Generated requests timed per size")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-load", action="store_true")
+    parser.add_argument("--load-size", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint in the load run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.1)
+    parser.add_argument("--malformed-rate", type=float, default=0.1, help="Share of stub answers with broken JSON")
+    parser.add_argument("--api-port", type=int, default=5001)
+    parser.add_argument("--stub-port", type=int, default=5055)
+    parser.add_argument("--output", default=None, help="Write the results JSON here as well as printing it")
+    parser.add_argument("--compare", default=None, help="Previous results JSON to compare timings with")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+    
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count()
+        },
+        "config": vars(args),
+        "micro": [
+            micro_benchmarks(int(size), args.micro_requests, args.repeat, args.seed)
+            for size in args.sizes.split(",")
+        ]
+    }
+    if not args.skip_load:
+        results["load"] = load_scenario(args)
+    if args.compare:
+        with open(args.compare, "r") as file:
+            results["comparison"] = compare(results, json.load(file), args.threshold)
+    
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    print(text)
+
+if __name__ == "__main__":
+    main()
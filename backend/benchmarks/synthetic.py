@@ -0,0 +1,83 @@
+"""
+Synthetic catalog generator for benchmarks
+
+Vocabularies (categories, subcategories, brands, tags, features) are taken
+from the sample data/products.json so generated products look like the real
+ones, and extra synthetic brands are added so brand cardinality grows with
+catalog size. Generation is deterministic for a given size and seed.
+"""
+
+import json
+import os
+import random
+
+from benchmarks.common import BACKEND_DIR
+
+SAMPLE_PATH = os.path.join(BACKEND_DIR, "data", "products.json")
+
+ADJECTIVES = ["Ultra", "Premium", "Compact", "Smart", "Classic", "Eco", "Pro", "Deluxe", "Portable", "Modern"]
+
+def load_vocabulary(sample_path=SAMPLE_PATH):
+    """
+    Collect per-category subcategories, tags and features from the sample catalog
+    """
+    with open(sample_path, "r") as file:
+        sample = json.load(file)
+    vocabulary = {}
+    for product in sample:
+        entry = vocabulary.setdefault(product["category"], {"subcategories": set(), "tags": set(), "features": set()})
+        entry["subcategories"].add(product["subcategory"])
+        entry["tags"].update(product.get("tags", []))
+        entry["features"].update(product.get("features", []))
+    brands = sorted({product["brand"] for product in sample})
+    return {
+        category: {key: sorted(values) for key, values in entry.items()}
+        for category, entry in sorted(vocabulary.items())
+    }, brands
+
+def generate_catalog(size, seed=0, out_of_stock_fraction=0.1):
+    """
+    Generate a list of product dicts shaped like data/products.json
+    
+    Parameters:
+    - size (int): Number of products
+    - seed (int): Random seed
+    - out_of_stock_fraction (float): Share of products with zero inventory
+    
+    Returns:
+    - list: Product dicts
+    """
+    rng = random.Random(seed)
+    vocabulary, sample_brands = load_vocabulary()
+    categories = list(vocabulary)
+    brands = sample_brands + [f"Brand{i:05d}" for i in range(max(0, size // 200))]
+    
+    products = []
+    for i in range(size):
+        category = rng.choice(categories)
+        entry = vocabulary[category]
+        subcategory = rng.choice(entry["subcategories"])
+        tags = rng.sample(entry["tags"], min(len(entry["tags"]), rng.randint(3, 5)))
+        features = rng.sample(entry["features"], min(len(entry["features"]), rng.randint(3, 4)))
+        name = f"{rng.choice(ADJECTIVES)} {subcategory} {i}"
+        products.append({
+            "id": f"syn{i:07d}",
+            "name": name,
+            "category": category,
+            "subcategory": subcategory,
+            "price": round(min(rng.lognormvariate(4.2, 0.8), 2000), 0) - 0.01,
+            "brand": rng.choice(brands),
+            "description": f"{name} with {', '.join(features).lower()}.",
+            "features": features,
+            "rating": round(rng.uniform(3.0, 5.0), 1),
+            "inventory": 0 if rng.random() < out_of_stock_fraction else rng.randint(1, 200),
+            "tags": tags
+        })
+    return products
+
+def write_catalog(products, path):
+    """
+    Write a generated catalog as JSON
+    """
+    with open(path, "w") as file:
+        json.dump(products, file)
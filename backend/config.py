@@ -11,5 +11,132 @@ config = {
     'MODEL_NAME': os.getenv('MODEL_NAME', 'gpt-3.5-turbo'),
     'MAX_TOKENS': int(os.getenv('MAX_TOKENS', 1000)),
     'TEMPERATURE': float(os.getenv('TEMPERATURE', 0.7)),
-    'DATA_PATH': os.getenv('DATA_PATH', 'data/products.json')
-}
\ No newline at end of file
+    # Request JSON schema output: auto (for models known to support it), on or off
+    'STRUCTURED_OUTPUT': os.getenv('STRUCTURED_OUTPUT', 'auto'),
+    # Prompt assembly: context window, explicit budget (0 = derive from context),
+    # tokens reserved for the system message, estimator scale and candidate cap
+    'MODEL_CONTEXT_TOKENS': int(os.getenv('MODEL_CONTEXT_TOKENS', 16385)),
+    'PROMPT_TOKEN_BUDGET': int(os.getenv('PROMPT_TOKEN_BUDGET', 0)),
+    'PROMPT_RESERVED_TOKENS': int(os.getenv('PROMPT_RESERVED_TOKENS', 100)),
+    'PROMPT_TOKEN_SCALE': float(os.getenv('PROMPT_TOKEN_SCALE', 1.0)),
+    'PROMPT_MAX_PRODUCTS': int(os.getenv('PROMPT_MAX_PRODUCTS', 30)),
+    'DATA_PATH': os.getenv('DATA_PATH', 'data/products.json'),
+    # Memory-mapped columnar catalog built with `python -m services.catalog_store`
+    # (used instead of DATA_PATH when set) and how many product dicts it keeps decoded
+    'CATALOG_STORE_PATH': os.getenv('CATALOG_STORE_PATH', ''),
+    'CATALOG_ROW_CACHE': int(os.getenv('CATALOG_ROW_CACHE', 4096)),
+    # Seconds between checks of the catalog file for changes (0 disables hot reload)
+    'CATALOG_RELOAD_INTERVAL': float(os.getenv('CATALOG_RELOAD_INTERVAL', 0)),
+    # /api/products paging and serialized page cache
+    'PRODUCTS_MAX_PAGE_SIZE': int(os.getenv('PRODUCTS_MAX_PAGE_SIZE', 500)),
+    'PRODUCTS_PAGE_CACHE_SIZE': int(os.getenv('PRODUCTS_PAGE_CACHE_SIZE', 256)),
+    # Async LLM path: cap on in-flight completions and per-call timeout (seconds)
+    'LLM_MAX_CONCURRENCY': int(os.getenv('LLM_MAX_CONCURRENCY', 8)),
+    'LLM_TIMEOUT': float(os.getenv('LLM_TIMEOUT', 20.0)),
+    # CPU-bound request stages (filtering, prompt building, parsing, fallback):
+    # inline, thread or process; workers per API worker process (0 = one per CPU)
+    # and stages submitted at once before requests are shed to the fallback
+    'CPU_POOL_MODE': os.getenv('CPU_POOL_MODE', 'inline'),
+    'CPU_POOL_WORKERS': int(os.getenv('CPU_POOL_WORKERS', 0)),
+    'CPU_POOL_MAX_PENDING': int(os.getenv('CPU_POOL_MAX_PENDING', 64)),
+    # LLM HTTP transport: connection pool and keep-alive limits, HTTP/2 (needs the
+    # h2 package), connect/read/pool timeouts (read 0 = LLM_TIMEOUT) and connections
+    # opened at startup (0 disables warm-up)
+    'LLM_POOL_MAX_CONNECTIONS': int(os.getenv('LLM_POOL_MAX_CONNECTIONS', 100)),
+    'LLM_POOL_MAX_KEEPALIVE': int(os.getenv('LLM_POOL_MAX_KEEPALIVE', 20)),
+    'LLM_KEEPALIVE_EXPIRY': float(os.getenv('LLM_KEEPALIVE_EXPIRY', 30.0)),
+    'LLM_HTTP2': os.getenv('LLM_HTTP2', 'false').lower() == 'true',
+    'LLM_CONNECT_TIMEOUT': float(os.getenv('LLM_CONNECT_TIMEOUT', 5.0)),
+    'LLM_READ_TIMEOUT': float(os.getenv('LLM_READ_TIMEOUT', 0)),
+    'LLM_POOL_TIMEOUT': float(os.getenv('LLM_POOL_TIMEOUT', 5.0)),
+    'LLM_WARMUP_CONNECTIONS': int(os.getenv('LLM_WARMUP_CONNECTIONS', 0)),
+    # LLM backends to route across: JSON list of {"name", "base_url", "model",
+    # "api_key" or "api_key_env"} (empty = the single OPENAI_BASE_URL endpoint)
+    'LLM_BACKENDS': os.getenv('LLM_BACKENDS', ''),
+    # Calls per backend kept for latency/error-rate routing, consecutive failures
+    # that open a backend's circuit breaker and seconds before it is probed again
+    'LLM_ROUTER_WINDOW': int(os.getenv('LLM_ROUTER_WINDOW', 50)),
+    'LLM_BREAKER_FAILURES': int(os.getenv('LLM_BREAKER_FAILURES', 5)),
+    'LLM_BREAKER_COOLDOWN': float(os.getenv('LLM_BREAKER_COOLDOWN', 30.0)),
+    # Hedged requests: send a second copy to the next backend when the first hasn't
+    # answered by its rolling latency percentile (default delay until it has samples)
+    'LLM_HEDGE': os.getenv('LLM_HEDGE', 'false').lower() == 'true',
+    'LLM_HEDGE_PERCENTILE': float(os.getenv('LLM_HEDGE_PERCENTILE', 95)),
+    'LLM_HEDGE_DEFAULT_DELAY': float(os.getenv('LLM_HEDGE_DEFAULT_DELAY', 2.0)),
+    'LLM_HEDGE_MIN_DELAY': float(os.getenv('LLM_HEDGE_MIN_DELAY', 0.2)),
+    # Seconds one backend gets to answer before the request fails over to the next
+    # (0 = no limit; the caller's LLM_TIMEOUT applies either way)
+    'LLM_ATTEMPT_TIMEOUT': float(os.getenv('LLM_ATTEMPT_TIMEOUT', 0)),
+    # Tiered recommendations: background LLM refinements kept for polling and reuse, and
+    # seconds before one that ended in the fallback is retried
+    'REFINEMENT_MAX_ENTRIES': int(os.getenv('REFINEMENT_MAX_ENTRIES', 1024)),
+    'REFINEMENT_TTL_SECONDS': float(os.getenv('REFINEMENT_TTL_SECONDS', 600)),
+    'REFINEMENT_RETRY_SECONDS': float(os.getenv('REFINEMENT_RETRY_SECONDS', 5)),
+    # Users packed into one prompt by the batch endpoint (1 disables packing)
+    'LLM_BATCH_USERS': int(os.getenv('LLM_BATCH_USERS', 4)),
+    # Recommendation result cache (set CACHE_DISK_PATH to persist across restarts)
+    'CACHE_ENABLED': os.getenv('CACHE_ENABLED', 'true').lower() == 'true',
+    'CACHE_MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 1024)),
+    'CACHE_TTL_SECONDS': float(os.getenv('CACHE_TTL_SECONDS', 600)),
+    'CACHE_HISTORY_WINDOW': int(os.getenv('CACHE_HISTORY_WINDOW', 5)),
+    'CACHE_DISK_PATH': os.getenv('CACHE_DISK_PATH', ''),
+    'CACHE_DISK_MAX_ENTRIES': int(os.getenv('CACHE_DISK_MAX_ENTRIES', 100000)),
+    # Semantic candidate retrieval (hashed TF-IDF embeddings + IVF index)
+    'RETRIEVAL_ENABLED': os.getenv('RETRIEVAL_ENABLED', 'false').lower() == 'true',
+    'RETRIEVAL_DIM': int(os.getenv('RETRIEVAL_DIM', 256)),
+    'RETRIEVAL_NPROBE': int(os.getenv('RETRIEVAL_NPROBE', 8)),
+    'RETRIEVAL_TOP_K': int(os.getenv('RETRIEVAL_TOP_K', 30)),
+    'RETRIEVAL_INDEX_PATH': os.getenv('RETRIEVAL_INDEX_PATH', ''),
+    # Precomputed item-to-item similarity table built with `python -m services.similarity_service`
+    # (neighbours kept per product and embedding dimensions when it is built or updated)
+    'SIMILARITY_ENABLED': os.getenv('SIMILARITY_ENABLED', 'false').lower() == 'true',
+    'SIMILARITY_TABLE_PATH': os.getenv('SIMILARITY_TABLE_PATH', 'data/similarity.tbl'),
+    'SIMILARITY_TOP_N': int(os.getenv('SIMILARITY_TOP_N', 20)),
+    'SIMILARITY_DIM': int(os.getenv('SIMILARITY_DIM', 64)),
+    # Per-stage latency histograms and counters served at /metrics, and a
+    # Server-Timing header with the stage breakdown of each request
+    'METRICS_ENABLED': os.getenv('METRICS_ENABLED', 'false').lower() == 'true',
+    'METRICS_TIMING_HEADER': os.getenv('METRICS_TIMING_HEADER', 'false').lower() == 'true',
+    # Response encoding: keep every product's JSON pre-encoded per catalog version,
+    # and gzip/brotli-compress JSON responses of at least COMPRESSION_MIN_BYTES (bodies of
+    # at least COMPRESSION_OFFLOAD_BYTES are compressed in a worker thread)
+    'PREENCODE_PRODUCTS': os.getenv('PREENCODE_PRODUCTS', 'true').lower() == 'true',
+    'COMPRESSION_ENABLED': os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true',
+    'COMPRESSION_MIN_BYTES': int(os.getenv('COMPRESSION_MIN_BYTES', 1024)),
+    'COMPRESSION_OFFLOAD_BYTES': int(os.getenv('COMPRESSION_OFFLOAD_BYTES', 65536)),
+    # Second-level cache reusing the LLM ranking of a near-duplicate request: one whose
+    # prompt candidates and browsing-history features are at least THRESHOLD similar (Jaccard)
+    'SEMANTIC_CACHE_ENABLED': os.getenv('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true',
+    'SEMANTIC_CACHE_THRESHOLD': float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8)),
+    'SEMANTIC_CACHE_MAX_ENTRIES': int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', 4096)),
+    'SEMANTIC_CACHE_TTL_SECONDS': float(os.getenv('SEMANTIC_CACHE_TTL_SECONDS', 600)),
+    # Record sanitized /api/products and /api/recommendations requests for
+    # benchmarks/replay.py (off when the path is empty; gzip-compressed for .gz)
+    'REQUEST_LOG_PATH': os.getenv('REQUEST_LOG_PATH', ''),
+    'REQUEST_LOG_SAMPLE_RATE': float(os.getenv('REQUEST_LOG_SAMPLE_RATE', 1.0)),
+    # Leave out-of-stock products (inventory 0) out of prompts and fallback answers, and
+    # rank products with at most LOW_STOCK_THRESHOLD units left PENALTY rating/score points lower
+    'AVAILABILITY_FILTER': os.getenv('AVAILABILITY_FILTER', 'true').lower() == 'true',
+    'AVAILABILITY_LOW_STOCK_THRESHOLD': int(os.getenv('AVAILABILITY_LOW_STOCK_THRESHOLD', 5)),
+    'AVAILABILITY_LOW_STOCK_PENALTY': float(os.getenv('AVAILABILITY_LOW_STOCK_PENALTY', 0.5)),
+    # Server-side browsing sessions: the last WINDOW viewed products and view counts of up to
+    # MAX_AFFINITIES categories and brands per session, the AFFINITY_TOP most viewed of which widen
+    # the candidate set (backend memory, or disk: a SQLite file shared by the workers of one host)
+    'SESSION_STORE_BACKEND': os.getenv('SESSION_STORE_BACKEND', 'memory'),
+    'SESSION_STORE_PATH': os.getenv('SESSION_STORE_PATH', 'data/sessions.db'),
+    'SESSION_WINDOW': int(os.getenv('SESSION_WINDOW', 10)),
+    'SESSION_MAX_AFFINITIES': int(os.getenv('SESSION_MAX_AFFINITIES', 8)),
+    'SESSION_AFFINITY_TOP': int(os.getenv('SESSION_AFFINITY_TOP', 3)),
+    'SESSION_TTL_SECONDS': float(os.getenv('SESSION_TTL_SECONDS', 1800)),
+    'SESSION_MAX_SESSIONS': int(os.getenv('SESSION_MAX_SESSIONS', 1000000)),
+    # Speculative precomputation of a session's next recommendations on each view event: at most
+    # CONCURRENCY background jobs, started only while more than RESERVED_SLOTS of the
+    # LLM_MAX_CONCURRENCY slots are free, at most BUDGET_PER_MINUTE a minute; queued jobs are
+    # replaced by newer views of the same session and dropped after MAX_AGE_SECONDS
+    'SPECULATION_ENABLED': os.getenv('SPECULATION_ENABLED', 'false').lower() == 'true',
+    'SPECULATION_CONCURRENCY': int(os.getenv('SPECULATION_CONCURRENCY', 2)),
+    'SPECULATION_RESERVED_SLOTS': int(os.getenv('SPECULATION_RESERVED_SLOTS', 4)),
+    'SPECULATION_BUDGET_PER_MINUTE': float(os.getenv('SPECULATION_BUDGET_PER_MINUTE', 60)),
+    'SPECULATION_MAX_AGE_SECONDS': float(os.getenv('SPECULATION_MAX_AGE_SECONDS', 10)),
+    'SPECULATION_MAX_QUEUED': int(os.getenv('SPECULATION_MAX_QUEUED', 1000))
+}
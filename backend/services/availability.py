@@ -0,0 +1,130 @@
+import numpy as np
+from config import config
+
+def inventory_level(product):
+    """
+    A product's stock level, or None when it isn't tracked
+    """
+    level = product.get('inventory')
+    if isinstance(level, bool) or not isinstance(level, (int, float)):
+        return None
+    return level
+
+class Availability:
+    """
+    Stock bitmaps of a catalog snapshot
+    
+    in_stock and low_stock are boolean arrays indexed by catalog position (the
+    rows of the fallback scorer's columns). A product is out of stock when
+    its inventory is 0 or less and low on stock when it has at most
+    low_stock_threshold units left; products without an inventory count are
+    treated as available. unavailable_ids and low_stock_ids hold the same
+    products as ID sets, so a candidate ID set is pruned with one set
+    difference.
+    
+    Built once per snapshot. A snapshot made from a delta copies the previous
+    snapshot's bitmaps and only looks at the changed products; a
+    memory-mapped catalog is read from its inventory column.
+    """
+    
+    def __init__(self, snapshot, low_stock_threshold=None):
+        """
+        Parameters:
+        - snapshot (CatalogSnapshot): Catalog the bitmaps describe
+        - low_stock_threshold (int): Units at or below which a product is low on
+          stock (AVAILABILITY_LOW_STOCK_THRESHOLD by default)
+        """
+        self.low_stock_threshold = (
+            config['AVAILABILITY_LOW_STOCK_THRESHOLD'] if low_stock_threshold is None else low_stock_threshold
+        )
+        self.positions = snapshot.positions
+        self.store = snapshot.store
+        if self.store is not None:
+            inventory = self.store.inventory
+            # -1 marks a missing inventory count in the store
+            self.in_stock = (inventory > 0) | (inventory == -1)
+            self.low_stock = (inventory > 0) & (inventory <= self.low_stock_threshold)
+            self.unavailable_ids = self.low_stock_ids = None
+            return
+        
+        size = len(snapshot.products)
+        self.in_stock = np.ones(size, dtype=bool)
+        self.low_stock = np.zeros(size, dtype=bool)
+        previous, changed_ids = snapshot.previous_derived('availability')
+        if (previous is not None and previous.low_stock_threshold == self.low_stock_threshold
+                and len(previous.in_stock) == len(previous.positions)):
+            # Kept products stay in order and new ones are appended, so dropping the
+            # deleted rows lines the previous bitmaps up with the new positions
+            deleted = sorted(previous.positions[pid] for pid in changed_ids if pid in previous.positions and pid not in self.positions)
+            kept = len(previous.in_stock) - len(deleted)
+            self.in_stock[:kept] = np.delete(previous.in_stock, deleted)
+            self.low_stock[:kept] = np.delete(previous.low_stock, deleted)
+            unavailable = set(previous.unavailable_ids - changed_ids)
+            low_stock = set(previous.low_stock_ids - changed_ids)
+            products = [snapshot.products_by_id[pid] for pid in changed_ids if pid in snapshot.products_by_id]
+        else:
+            unavailable = set()
+            low_stock = set()
+            products = snapshot.products_by_id.values()
+        
+        for product in products:
+            level = inventory_level(product)
+            position = self.positions[product['id']]
+            if level is None:
+                # A changed product may have dropped its count; untracked means available
+                self.in_stock[position] = True
+                self.low_stock[position] = False
+                continue
+            self.in_stock[position] = level > 0
+            self.low_stock[position] = 0 < level <= self.low_stock_threshold
+            if level <= 0:
+                unavailable.add(product['id'])
+            elif level <= self.low_stock_threshold:
+                low_stock.add(product['id'])
+        self.unavailable_ids = frozenset(unavailable)
+        self.low_stock_ids = frozenset(low_stock)
+    
+    @property
+    def demoted(self):
+        """
+        The low-stock products in the form CatalogSnapshot.top_rated_among takes:
+        a bitmap for a memory-mapped catalog, an ID set otherwise
+        """
+        return self.low_stock if self.store is not None else self.low_stock_ids
+    
+    @staticmethod
+    def is_available(product):
+        """
+        Check a product dict against the current stock level it carries
+        """
+        level = inventory_level(product)
+        return level is None or level > 0
+    
+    def prune(self, product_ids):
+        """
+        The in-stock subset of a set of product IDs
+        """
+        if self.store is None:
+            if not self.unavailable_ids:
+                return product_ids
+            return set(product_ids).difference(self.unavailable_ids)
+        ids = list(product_ids)
+        rows = self.store.rows_of(ids)
+        return {pid for pid, row in zip(ids, rows) if row < 0 or self.in_stock[row]}
+    
+    def available(self, products):
+        """
+        The in-stock products of a list, in order
+        """
+        return [product for product in products if self.is_available(product)]
+    
+    def stats(self):
+        """
+        Counts of out-of-stock and low-stock products
+        """
+        return {
+            "products": len(self.in_stock),
+            "out_of_stock": int(len(self.in_stock) - np.count_nonzero(self.in_stock)),
+            "low_stock": int(np.count_nonzero(self.low_stock)),
+            "low_stock_threshold": self.low_stock_threshold
+        }
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import config
+from services.session_store import history_affinity
+
+class RecommendationCache:
+    """
+    LRU + TTL cache for recommendation results
+    
+    Keys are canonical: category and brand preferences are sorted and deduped,
+    the price range is normalized, and browsing history keeps the order of the
+    last few products (the ones the prompt shows) while older products only count
+    as a set. The catalog version is part of the key so a new catalog never
+    serves stale products.
+    
+    Only successful LLM results are stored. Fallback and parse-error results are
+    skipped so an outage doesn't pin degraded answers for the whole TTL.
+    
+    When a disk path is configured, entries are written through to a local SQLite
+    file and read back on a memory miss, so the cache survives restarts.
+    """
+    
+    def __init__(self, max_entries=None, ttl_seconds=None, history_window=None,
+                 disk_path=None, disk_max_entries=None, enabled=None):
+        """
+        Initialize the cache, defaulting every setting to the config values
+        """
+        self.enabled = config['CACHE_ENABLED'] if enabled is None else enabled
+        self.max_entries = config['CACHE_MAX_ENTRIES'] if max_entries is None else max_entries
+        self.ttl_seconds = config['CACHE_TTL_SECONDS'] if ttl_seconds is None else ttl_seconds
+        self.history_window = config['CACHE_HISTORY_WINDOW'] if history_window is None else history_window
+        self.disk_path = config['CACHE_DISK_PATH'] if disk_path is None else disk_path
+        self.disk_max_entries = config['CACHE_DISK_MAX_ENTRIES'] if disk_max_entries is None else disk_max_entries
+        
+        self._entries = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._disk = self._open_disk_store() if self.enabled and self.disk_path else None
+        
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.skipped = 0
+    
+    def make_key(self, user_preferences, browsing_history, catalog_version):
+        """
+        Build a canonical cache key for a recommendation request
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed, or a
+          SessionHistory, whose most viewed categories and brands are keyed too
+        - catalog_version (str): Version of the catalog the result was built from
+        
+        Returns:
+        - str: Hex digest identifying the request
+        """
+        window = self.history_window
+        recent = list(browsing_history[-window:]) if window > 0 else []
+        earlier = sorted(set(browsing_history[:-window])) if window > 0 else sorted(set(browsing_history))
+        canonical = {
+            "price": user_preferences.get('priceRange') or 'all',
+            "categories": sorted(set(user_preferences.get('categories') or [])),
+            "brands": sorted(set(user_preferences.get('brands') or [])),
+            "recent": recent,
+            "earlier": earlier,
+            "catalog": catalog_version
+        }
+        affinity_categories, affinity_brands = history_affinity(browsing_history)
+        if affinity_categories or affinity_brands:
+            canonical["affinity"] = [sorted(affinity_categories), sorted(affinity_brands)]
+        encoded = json.dumps(canonical, separators=(',', ':'), sort_keys=True)
+        return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """
+        Return the cached result for a key, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            
+            if self._disk is not None:
+                value, stored_at = self._disk_get(key, now)
+                if value is not None:
+                    self._store(key, value, stored_at)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            
+            self.misses += 1
+            return None
+    
+    def contains(self, key):
+        """
+        Whether an unexpired result is cached for a key, without counting a lookup
+        """
+        if not self.enabled:
+            return False
+        
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                return True
+            return self._disk is not None and self._disk_get(key, now)[0] is not None
+    
+    def set(self, key, value):
+        """
+        Store a recommendation result if it is cacheable
+        """
+        if not self.enabled:
+            return
+        
+        # Don't pin degraded answers from an outage or a malformed response
+        if value.get('fallback') or value.get('error'):
+            with self._lock:
+                self.skipped += 1
+            return
+        
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now)
+            if self._disk is not None:
+                self._disk_set(key, value, now)
+    
+    def clear(self):
+        """
+        Drop every cached entry, in memory and on disk
+        """
+        with self._lock:
+            self._entries.clear()
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM recommendations")
+                self._disk.commit()
+    
+    def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "skipped": self.skipped,
+                "disk_path": self.disk_path or None
+            }
+    
+    def _store(self, key, value, stored_at):
+        """
+        Insert into the in-memory LRU, evicting the oldest entries over the limit
+        """
+        self._entries[key] = (stored_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def _open_disk_store(self):
+        """
+        Open (or create) the SQLite file backing the cache
+        """
+        try:
+            connection = sqlite3.connect(self.disk_path, check_same_thread=False)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS idx_stored_at ON recommendations (stored_at)")
+            connection.commit()
+            return connection
+        except sqlite3.Error as e:
+            print(f"Error opening recommendation cache at {self.disk_path}: {str(e)}")
+            return None
+    
+    def _disk_get(self, key, now):
+        """
+        Read an unexpired entry from the disk store
+        """
+        try:
+            row = self._disk.execute(
+                "SELECT value, stored_at FROM recommendations WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading recommendation cache: {str(e)}")
+            return None, None
+        
+        if row is None:
+            return None, None
+        value, stored_at = row
+        if now - stored_at > self.ttl_seconds:
+            self._disk.execute("DELETE FROM recommendations WHERE key = ?", (key,))
+            self._disk.commit()
+            self.expirations += 1
+            return None, None
+        return json.loads(value), stored_at
+    
+    def _disk_set(self, key, value, now):
+        """
+        Write an entry through to the disk store and trim it to its size limit
+        """
+        try:
+            self._disk.execute(
+                "INSERT OR REPLACE INTO recommendations (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now)
+            )
+            self._disk.execute(
+                "DELETE FROM recommendations WHERE key IN ("
+                "SELECT key FROM recommendations ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                (self.disk_max_entries,)
+            )
+            self._disk.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing recommendation cache: {str(e)}")
+
+class SerializedResponseCache:
+    """
+    Small LRU of already-encoded response bodies
+    
+    Used for /api/products pages so a repeated identical request costs a dict
+    lookup instead of filtering and JSON-encoding the catalog again. Keys
+    include the catalog version, so a new catalog never serves stale pages.
+    """
+    
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        """
+        Return the cached value for a key, or None on a miss
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entries over the limit
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,407 @@
+import functools
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+MAGIC = b"PRODCOL1"
+ALIGNMENT = 64
+
+# Fields held in columns; everything else lives in the per-row JSON record
+NUMERIC_COLUMNS = ('price', 'rating')
+STRING_COLUMNS = ('category', 'subcategory', 'brand')
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def write_catalog_store(products, store_path, catalog_version):
+    """
+    Write a product list as a columnar catalog file
+    
+    Layout: an 8-byte magic, the header length, a JSON header (row count,
+    catalog version, string tables, key layouts and column offsets), then
+    64-byte aligned column blobs. Price and rating are float64 columns and
+    inventory an int64 column; category, subcategory, brand and tags are
+    int32 codes into interned string tables. IDs are a fixed-width bytes
+    column plus a sort order for lookups. Remaining fields (name, description,
+    features, ...) are stored as one compact JSON record per row. Values a
+    column can't reproduce exactly (e.g. an integer price) stay in the record.
+    
+    The file is written to a temporary name and renamed into place, so
+    readers never see a partial file.
+    
+    Parameters:
+    - products (list): Product dicts; duplicate IDs keep their first occurrence
+    - store_path (str): Output file
+    - catalog_version (str): Version recorded in the header, normally the source file hash
+    
+    Returns:
+    - int: Number of products written
+    """
+    tables = {name: {} for name in STRING_COLUMNS + ('tag',)}
+    layouts = {}
+    seen = set()
+    ids, layout_codes, records = [], [], []
+    numeric = {name: [] for name in NUMERIC_COLUMNS}
+    inventory = []
+    codes = {name: [] for name in STRING_COLUMNS}
+    tag_offsets, tag_codes = [0], []
+    
+    intern = lambda name, value: tables[name].setdefault(value, len(tables[name]))
+    
+    for product in products:
+        product_id = product['id']
+        if not isinstance(product_id, str):
+            raise ValueError(f"Product ID must be a string, got {product_id!r}")
+        if product_id in seen:
+            continue
+        seen.add(product_id)
+        ids.append(product_id.encode('utf-8'))
+        layout_codes.append(layouts.setdefault(tuple(product), len(layouts)))
+        rest = {key: value for key, value in product.items()
+                if key not in ('id', 'inventory', 'tags') + NUMERIC_COLUMNS + STRING_COLUMNS}
+        
+        for name in NUMERIC_COLUMNS:
+            value = product.get(name)
+            default = math.nan if name == 'price' else 0.0
+            numeric[name].append(float(value) if _is_number(value) else default)
+            if name in product and type(value) is not float:
+                rest[name] = value
+        
+        value = product.get('inventory')
+        inventory.append(value if type(value) is int else -1)
+        if 'inventory' in product and type(value) is not int:
+            rest['inventory'] = value
+        
+        for name in STRING_COLUMNS:
+            value = product.get(name)
+            if value is None or isinstance(value, str):
+                codes[name].append(intern(name, value))
+            else:
+                codes[name].append(intern(name, None))
+                rest[name] = value
+        
+        tags = product.get('tags')
+        if isinstance(tags, list) and all(isinstance(tag, str) for tag in tags):
+            tag_codes.extend(intern('tag', tag) for tag in tags)
+        elif 'tags' in product:
+            rest['tags'] = tags
+        tag_offsets.append(len(tag_codes))
+        
+        records.append(json.dumps(rest, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+    
+    count = len(ids)
+    record_offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum([len(record) for record in records], out=record_offsets[1:])
+    id_column = np.array(ids, dtype=f"S{max((len(i) for i in ids), default=1)}")
+    id_order = np.argsort(id_column, kind='stable').astype(np.int64)
+    
+    columns = {
+        'ids': id_column,
+        'sorted_ids': id_column[id_order],
+        'id_order': id_order,
+        'layout': np.array(layout_codes, dtype=np.int32),
+        'price': np.array(numeric['price'], dtype=np.float64),
+        'rating': np.array(numeric['rating'], dtype=np.float64),
+        'inventory': np.array(inventory, dtype=np.int64),
+        'category': np.array(codes['category'], dtype=np.int32),
+        'subcategory': np.array(codes['subcategory'], dtype=np.int32),
+        'brand': np.array(codes['brand'], dtype=np.int32),
+        'tag_offsets': np.array(tag_offsets, dtype=np.int64),
+        'tag_codes': np.array(tag_codes, dtype=np.int32),
+        'record_offsets': record_offsets,
+        'records': np.frombuffer(b''.join(records), dtype=np.uint8)
+    }
+    
+    column_meta = {}
+    offset = 0
+    for name, array in columns.items():
+        column_meta[name] = {"dtype": array.dtype.str, "length": len(array), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({
+        "count": count,
+        "catalog_version": catalog_version,
+        "layouts": [list(layout) for layout in sorted(layouts, key=layouts.get)],
+        "strings": {name: list(table) for name, table in tables.items()},
+        "columns": column_meta
+    }, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+    temp_path = f"{store_path}.tmp{os.getpid()}"
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header)))
+        file.write(header)
+        for name, array in columns.items():
+            file.seek(data_start + column_meta[name]["offset"])
+            file.write(array.tobytes())
+        file.truncate(data_start + offset)
+    os.replace(temp_path, store_path)
+    return count
+
+def build_catalog_store(data_path, store_path):
+    """
+    Convert a products.json file into a columnar catalog file
+    
+    The catalog version is the same content hash ProductService computes for
+    the JSON file, so caches and saved indexes keyed on it stay valid.
+    
+    Returns:
+    - int: Number of products written
+    """
+    with open(data_path, 'rb') as file:
+        raw = file.read()
+    return write_catalog_store(json.loads(raw), store_path, hashlib.sha1(raw).hexdigest()[:12])
+
+class CatalogStore:
+    """
+    Read-only, memory-mapped view of a columnar catalog file
+    
+    Columns are NumPy arrays over the shared mapping, so every worker process
+    reading the same file shares its pages through the OS page cache instead
+    of holding a private copy. Product dicts are only built when a row is
+    actually requested, and the most recently used ones are kept in a small
+    LRU.
+    """
+    
+    def __init__(self, store_path, row_cache_size=4096):
+        """
+        Map a catalog file and set up its column views
+        
+        Parameters:
+        - store_path (str): File written by write_catalog_store
+        - row_cache_size (int): Materialized product dicts kept in the LRU
+        """
+        self.store_path = store_path
+        with open(store_path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f"{store_path} is not a columnar catalog file")
+        
+        header_length, = struct.unpack_from('<Q', self._map, len(MAGIC))
+        header_end = len(MAGIC) + 8 + header_length
+        header = json.loads(self._map[len(MAGIC) + 8:header_end])
+        data_start = _aligned(header_end)
+        
+        self.count = header["count"]
+        self.catalog_version = header["catalog_version"]
+        self.layouts = [tuple(layout) for layout in header["layouts"]]
+        self.strings = header["strings"]
+        self.codes = {name: {value: code for code, value in enumerate(table)} for name, table in self.strings.items()}
+        self._record_start = data_start + header["columns"]["records"]["offset"]
+        # Rows are decoded one at a time from random places; readahead would
+        # only pull in neighbouring records nobody asked for
+        if hasattr(mmap, 'MADV_RANDOM'):
+            page_start = self._record_start // mmap.PAGESIZE * mmap.PAGESIZE
+            self._map.madvise(mmap.MADV_RANDOM, page_start, len(self._map) - page_start)
+        columns = {
+            name: np.frombuffer(self._map, dtype=np.dtype(meta["dtype"]), count=meta["length"], offset=data_start + meta["offset"])
+            for name, meta in header["columns"].items()
+        }
+        self.ids = columns['ids']
+        self.id_order = columns['id_order']
+        self.layout = columns['layout']
+        self.prices = columns['price']
+        self.ratings = columns['rating']
+        self.inventory = columns['inventory']
+        self.categories = columns['category']
+        self.subcategories = columns['subcategory']
+        self.brands = columns['brand']
+        self.tag_offsets = columns['tag_offsets']
+        self.tag_codes = columns['tag_codes']
+        self.record_offsets = columns['record_offsets']
+        self._sorted_ids = columns['sorted_ids']
+        self._code_columns = {'category': self.categories, 'subcategory': self.subcategories, 'brand': self.brands}
+        self._id_width = self.ids.dtype.itemsize
+        
+        self.product = functools.lru_cache(maxsize=row_cache_size)(self._materialize)
+    
+    def __len__(self):
+        return self.count
+    
+    def product_id(self, row):
+        """
+        ID of the product stored at a row
+        """
+        return self.ids[row].decode('utf-8')
+    
+    def row_of(self, product_id):
+        """
+        Row number of a product ID, or -1 if it isn't in the catalog
+        """
+        key = product_id.encode('utf-8') if isinstance(product_id, str) else None
+        if not key or len(key) > self._id_width or key.endswith(b'\0'):
+            return -1
+        index = int(np.searchsorted(self._sorted_ids, key))
+        if index < self.count and self._sorted_ids[index] == key:
+            return int(self.id_order[index])
+        return -1
+    
+    def rows_of(self, product_ids):
+        """
+        Row numbers for many product IDs at once, -1 for IDs not in the catalog
+        """
+        encoded = [product_id.encode('utf-8') for product_id in product_ids]
+        if not encoded:
+            return np.empty(0, dtype=np.int64)
+        keys = np.array(encoded, dtype=self._sorted_ids.dtype)
+        index = np.minimum(np.searchsorted(self._sorted_ids, keys), self.count - 1)
+        found = (self._sorted_ids[index] == keys) & (np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)) <= self._id_width)
+        return np.where(found, self.id_order[index], -1)
+    
+    def rows_matching(self, column, value):
+        """
+        Rows whose string column (category, subcategory, brand or tag) equals a value
+        """
+        code = self.codes[column].get(value)
+        if code is None:
+            return np.empty(0, dtype=np.int64)
+        if column == 'tag':
+            hits = np.flatnonzero(self.tag_codes == code)
+            return np.unique(np.searchsorted(self.tag_offsets, hits, side='right') - 1)
+        return np.flatnonzero(self._code_columns[column] == code)
+    
+    def _materialize(self, row):
+        """
+        Build the product dict for a row, with keys in their original order
+        """
+        start = self._record_start + int(self.record_offsets[row])
+        end = self._record_start + int(self.record_offsets[row + 1])
+        rest = json.loads(self._map[start:end])
+        product = {}
+        for key in self.layouts[self.layout[row]]:
+            if key in rest:
+                product[key] = rest[key]
+            elif key == 'id':
+                product[key] = self.product_id(row)
+            elif key == 'price':
+                product[key] = float(self.prices[row])
+            elif key == 'rating':
+                product[key] = float(self.ratings[row])
+            elif key == 'inventory':
+                product[key] = int(self.inventory[row])
+            elif key == 'tags':
+                tags = self.strings['tag']
+                product[key] = [tags[code] for code in self.tag_codes[self.tag_offsets[row]:self.tag_offsets[row + 1]]]
+            else:
+                product[key] = self.strings[key][self._code_columns[key][row]]
+        return product
+
+class StoreProducts(Sequence):
+    """
+    The catalog as a list-like sequence of lazily materialized product dicts
+    """
+    
+    def __init__(self, store):
+        self.store = store
+    
+    def __len__(self):
+        return len(self.store)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.product(row) for row in range(*index.indices(len(self.store)))]
+        if index < 0:
+            index += len(self.store)
+        if not 0 <= index < len(self.store):
+            raise IndexError("product index out of range")
+        return self.store.product(index)
+    
+    def __iter__(self):
+        for row in range(len(self.store)):
+            yield self.store.product(row)
+
+class StoreIds(Sequence):
+    """
+    Product IDs for an array of rows, decoded on access
+    """
+    
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+    
+    def __len__(self):
+        return len(self.rows)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [value.decode('utf-8') for value in self.store.ids[self.rows[index]]]
+        return self.store.product_id(self.rows[index])
+    
+    def __iter__(self):
+        for value in self.store.ids[self.rows]:
+            yield value.decode('utf-8')
+
+class StorePositions(Mapping):
+    """
+    Product ID -> row number, answered by binary search over the sorted ID column
+    """
+    
+    def __init__(self, store):
+        self.store = store
+    
+    def __getitem__(self, product_id):
+        row = self.store.row_of(product_id)
+        if row < 0:
+            raise KeyError(product_id)
+        return row
+    
+    def __contains__(self, product_id):
+        return self.store.row_of(product_id) >= 0
+    
+    def __iter__(self):
+        return iter(StoreIds(self.store, np.arange(len(self.store))))
+    
+    def __len__(self):
+        return len(self.store)
+
+class StoreProductsById(StorePositions):
+    """
+    Product ID -> product dict, materialized on lookup
+    """
+    
+    def __getitem__(self, product_id):
+        return self.store.product(super().__getitem__(product_id))
+
+class StoreIndex(Mapping):
+    """
+    Attribute value -> frozenset of product IDs, built per value on first use
+    
+    The frozensets match the ones ProductService builds for a JSON catalog,
+    but only the values that are actually looked up pay for decoding IDs.
+    """
+    
+    def __init__(self, keys, rows_for):
+        self._keys = dict.fromkeys(keys)
+        self._rows_for = rows_for
+        self._cache = {}
+    
+    def __getitem__(self, key):
+        if key not in self._cache:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._cache[key] = frozenset(self._rows_for(key))
+        return self._cache[key]
+    
+    def __iter__(self):
+        return iter(self._keys)
+    
+    def __len__(self):
+        return len(self._keys)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m services.catalog_store <products.json> <output file>")
+        sys.exit(2)
+    written = build_catalog_store(sys.argv[1], sys.argv[2])
+    print(f"Wrote {written} products to {sys.argv[2]}")
@@ -0,0 +1,48 @@
+import asyncio
+
+class RequestCoalescer:
+    """
+    Coalesce concurrent identical requests into a single in-flight computation
+    
+    The first caller for a key starts the work; callers arriving with the same
+    key while it runs await the same result instead of starting their own LLM
+    call. The shared task is shielded, so one caller disconnecting doesn't
+    cancel it for the others.
+    """
+    
+    def __init__(self):
+        self._inflight = {}
+        self.leaders = 0
+        self.coalesced = 0
+    
+    async def run(self, key, factory):
+        """
+        Run factory() for a key, or join the run already in flight
+        
+        Parameters:
+        - key (str): Identity of the request, e.g. a cache key
+        - factory (callable): Returns the coroutine to run when no run is in flight
+        
+        Returns:
+        - The coroutine's result
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+        
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        self.leaders += 1
+        return await asyncio.shield(task)
+    
+    def stats(self):
+        """
+        Return coalescing counters
+        """
+        return {
+            "in_flight": len(self._inflight),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced
+        }
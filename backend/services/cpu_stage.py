@@ -0,0 +1,154 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import config
+
+# Service whose methods process workers call, inherited through fork
+_worker_service = None
+
+def _call_in_worker(method, args):
+    """
+    Run one stage in a process worker, against the worker's copy of the catalog
+    """
+    service = _worker_service
+    return getattr(service, method)(*args, service.product_service.get_all_products())
+
+class CPUStage:
+    """
+    Runs the CPU-bound steps of a request (candidate filtering and prompt
+    building, response parsing, fallback scoring) off the event loop
+    
+    Stages are LLMService methods whose last argument is the product catalog.
+    Modes:
+    - inline: called directly on the event loop, as before
+    - thread: a thread pool; keeps the event loop responsive, and runs stages
+      in parallel only on free-threaded Python builds
+    - process: forked worker processes that inherit the current catalog
+      snapshot read-only; the pool is re-forked after a catalog reload. A
+      memory-mapped catalog (CATALOG_STORE_PATH) is shared between workers,
+      a JSON one is gradually copied into each by reference counting
+    
+    At most max_pending stages are submitted at once. Callers check
+    saturated() before starting new work and shed to the fallback, the same
+    way LLM_MAX_CONCURRENCY is enforced, rather than queueing without bound.
+    """
+    
+    def __init__(self, service, mode=None, workers=None, max_pending=None):
+        """
+        Parameters:
+        - service (LLMService): Object whose methods are the stages
+        - mode (str): inline, thread or process (CPU_POOL_MODE by default)
+        - workers (int): Pool size, 0 for one per CPU (CPU_POOL_WORKERS by default)
+        - max_pending (int): Stages submitted at once before the pool counts as saturated
+        """
+        self.service = service
+        self.mode = (mode or config['CPU_POOL_MODE']).lower()
+        if self.mode not in ('inline', 'thread', 'process'):
+            print(f"Unknown CPU_POOL_MODE {self.mode!r}, running CPU stages inline")
+            self.mode = 'inline'
+        if self.mode == 'process' and 'fork' not in multiprocessing.get_all_start_methods():
+            print("Process CPU stage needs fork, using a thread pool instead")
+            self.mode = 'thread'
+        self.workers = (workers if workers is not None else config['CPU_POOL_WORKERS']) or os.cpu_count() or 1
+        self.max_pending = max(1, max_pending if max_pending is not None else config['CPU_POOL_MAX_PENDING'])
+        self._pool = None
+        self._pool_version = None
+        self.pending = 0
+        self.peak_pending = 0
+        self.completed = 0
+        self.overflow_inline = 0
+        self.pool_starts = 0
+    
+    def saturated(self):
+        """
+        Whether max_pending stages are already submitted
+        """
+        return self.mode != 'inline' and self.pending >= self.max_pending
+    
+    async def run(self, method, args, all_products):
+        """
+        Run a stage and return its result
+        
+        A saturated pool runs the stage inline instead of queueing it, so work
+        that was already paid for (e.g. parsing a completed LLM answer) isn't lost.
+        
+        Parameters:
+        - method (str): Name of the service method
+        - args (tuple): Arguments before the catalog
+        - all_products (list): Catalog passed inline and to thread workers;
+          process workers use their own copy of the same snapshot
+        """
+        if self.mode == 'inline' or self.pending >= self.max_pending:
+            if self.mode != 'inline':
+                self.overflow_inline += 1
+            return getattr(self.service, method)(*args, all_products)
+        
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            if self.mode == 'thread':
+                return await loop.run_in_executor(self._executor(), lambda: getattr(self.service, method)(*args, all_products))
+            return await loop.run_in_executor(self._executor(), _call_in_worker, method, args)
+        except BrokenProcessPool as e:
+            print(f"CPU stage worker died, restarting the pool: {str(e)}")
+            self._discard_pool()
+            return getattr(self.service, method)(*args, all_products)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+    
+    def _executor(self):
+        """
+        The pool for the current catalog snapshot, created on first use
+        
+        Process workers hold the snapshot they were forked with, so a reload
+        retires the pool (running stages finish) and forks a new one.
+        """
+        if self.mode == 'thread':
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cpu-stage')
+            return self._pool
+        
+        global _worker_service
+        version = self.service.product_service.snapshot.catalog_version
+        if self._pool is not None and self._pool_version != version:
+            self._discard_pool()
+        if self._pool is None:
+            _worker_service = self.service
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+            self._pool_version = version
+            self.pool_starts += 1
+        return self._pool
+    
+    def _discard_pool(self):
+        """
+        Retire the current pool without waiting for running stages
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+    
+    def shutdown(self):
+        """
+        Stop the pool's workers
+        """
+        self._discard_pool()
+    
+    def stats(self):
+        """
+        Return pool configuration and counters
+        """
+        return {
+            "mode": self.mode,
+            "workers": self.workers if self.mode != 'inline' else 0,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "peak_pending": self.peak_pending,
+            "completed": self.completed,
+            "overflow_inline": self.overflow_inline,
+            "pool_starts": self.pool_starts
+        }
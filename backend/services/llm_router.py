@@ -0,0 +1,405 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+import openai
+from config import config
+from services.llm_transport import LLMTransport
+from services.response_parser import supports_structured_output
+
+# Static headers set once as client defaults (OpenRouter attribution)
+EXTRA_HEADERS = {
+    "HTTP-Referer": "http://localhost:3000",
+    "X-Title": "i95dev Product Recommendations"
+}
+
+# Samples a backend needs before its own p95 sets the hedge delay
+MIN_HEDGE_SAMPLES = 10
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile of a non-empty sequence
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100.0 * len(ordered)))]
+
+class LLMBackend:
+    """
+    One provider endpoint and model, with rolling latency/error stats and a circuit breaker
+    
+    The breaker opens after LLM_BREAKER_FAILURES consecutive failures (at once
+    for a 402 / out of credits) and stays open for LLM_BREAKER_COOLDOWN
+    seconds. It then lets a single probe request through: success closes it,
+    failure opens it again.
+    """
+    
+    def __init__(self, name, base_url, api_key, model, max_retries=openai.DEFAULT_MAX_RETRIES):
+        """
+        Parameters:
+        - name (str): Label used in logs and stats
+        - base_url (str): OpenAI-compatible API root
+        - api_key (str): Key for this endpoint
+        - model (str): Model requested from this endpoint
+        - max_retries (int): Client retries before a call counts as failed
+        """
+        self.name = name
+        self.model = model
+        self.structured_output = supports_structured_output(model)
+        # Pooled, keep-alive transport shared by the sync and async clients (LLM_POOL_* settings)
+        self.transport = LLMTransport(base_url)
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.transport.http_client,
+            timeout=self.transport.timeout,
+            max_retries=max_retries,
+            default_headers=EXTRA_HEADERS
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.transport.async_http_client,
+            timeout=self.transport.timeout,
+            max_retries=max_retries,
+            default_headers=EXTRA_HEADERS
+        )
+        self.latencies = deque(maxlen=config['LLM_ROUTER_WINDOW'])  # seconds, successful and timed-out calls
+        self.outcomes = deque(maxlen=config['LLM_ROUTER_WINDOW'])  # True for a failed call
+        self.failure_threshold = config['LLM_BREAKER_FAILURES']
+        self.cooldown = config['LLM_BREAKER_COOLDOWN']
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.breaker_trips = 0
+    
+    def state(self):
+        """
+        Circuit breaker state: closed, open or half_open
+        """
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+    
+    def available(self):
+        """
+        Whether a request may be sent: breaker closed, or half open with no probe in flight
+        """
+        state = self.state()
+        return state == 'closed' or (state == 'half_open' and self.in_flight == 0)
+    
+    def error_rate(self):
+        """
+        Share of failed calls in the rolling window
+        """
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+    
+    def score(self):
+        """
+        Routing cost: median latency, inflated by the error rate
+        
+        Backends without samples score 0, so each gets tried early on.
+        """
+        if not self.latencies:
+            return 0.0
+        return percentile(self.latencies, 50) * (1 + 4 * self.error_rate())
+    
+    def hedge_delay(self, pct, default, minimum):
+        """
+        Seconds to wait on this backend before hedging: its rolling latency percentile
+        """
+        if len(self.latencies) < MIN_HEDGE_SAMPLES:
+            return default
+        return max(minimum, percentile(self.latencies, pct))
+    
+    def record_success(self, latency):
+        """
+        Record a successful call and close the breaker
+        """
+        self.latencies.append(latency)
+        self.outcomes.append(False)
+        self.consecutive_failures = 0
+        self.opened_at = None
+    
+    def record_failure(self, error, latency=None):
+        """
+        Record a failed call, opening the breaker if it crossed the threshold
+        
+        A call that was given up on passes the seconds it was given as its
+        latency, so a backend that hangs also routes as slow.
+        """
+        self.failures += 1
+        if latency is not None:
+            self.latencies.append(latency)
+        self.outcomes.append(True)
+        self.consecutive_failures += 1
+        out_of_credits = getattr(error, 'status_code', None) == 402 or "credits" in str(error).lower()
+        if self.state() == 'half_open' or self.consecutive_failures >= self.failure_threshold or out_of_credits:
+            if self.opened_at is None or self.state() == 'half_open':
+                self.breaker_trips += 1
+                print(f"Opening circuit breaker for LLM backend {self.name}: {str(error)}")
+            self.opened_at = time.monotonic()
+    
+    def stats(self):
+        """
+        Return this backend's routing stats and connection pool counters
+        """
+        return {
+            "name": self.name,
+            "model": self.model,
+            "state": self.state(),
+            "calls": self.calls,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate(), 3),
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 1) if self.latencies else None,
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 1) if self.latencies else None,
+            "in_flight": self.in_flight,
+            "breaker_trips": self.breaker_trips,
+            "transport": self.transport.stats()
+        }
+
+class LLMRouter:
+    """
+    Routes completions across the configured LLM backends
+    
+    Each request goes to the available backend with the lowest score (rolling
+    median latency inflated by error rate). If it fails, or hasn't answered
+    within LLM_ATTEMPT_TIMEOUT, the next backend is tried. With LLM_HEDGE,
+    when the first backend hasn't answered by its rolling p95 latency
+    (LLM_HEDGE_PERCENTILE), the same request is sent to the next backend as
+    well; the first answer wins and the other call is cancelled. Calls the
+    caller gives up on count as failures of their backend.
+    
+    Backends come from LLM_BACKENDS, a JSON list of {"name", "base_url",
+    "model", "api_key" or "api_key_env"} objects; without it the single
+    OPENAI_BASE_URL / MODEL_NAME / OPENAI_API_KEY endpoint is used.
+    """
+    
+    def __init__(self, backends=None):
+        """
+        Parameters:
+        - backends (list): LLMBackend objects, read from config when omitted
+        """
+        self.backends = backends or self.backends_from_config()
+        self.hedge = config['LLM_HEDGE']
+        self.hedge_percentile = config['LLM_HEDGE_PERCENTILE']
+        self.hedge_default_delay = config['LLM_HEDGE_DEFAULT_DELAY']
+        self.hedge_min_delay = config['LLM_HEDGE_MIN_DELAY']
+        self.attempt_timeout = config['LLM_ATTEMPT_TIMEOUT']
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+        self.rejected = 0
+    
+    @staticmethod
+    def backends_from_config():
+        """
+        Build backends from LLM_BACKENDS, or the single default endpoint
+        
+        With several backends, clients don't retry by default (an entry may set
+        "max_retries"): failing over to the next backend replaces the retry.
+        """
+        if not config['LLM_BACKENDS']:
+            return [LLMBackend('default', config['OPENAI_BASE_URL'], config['OPENAI_API_KEY'], config['MODEL_NAME'])]
+        entries = json.loads(config['LLM_BACKENDS'])
+        backends = []
+        for i, entry in enumerate(entries):
+            api_key = entry.get('api_key') or os.getenv(entry.get('api_key_env', ''), '') or config['OPENAI_API_KEY']
+            backends.append(LLMBackend(
+                entry.get('name') or f"backend{i + 1}",
+                entry.get('base_url') or config['OPENAI_BASE_URL'],
+                api_key,
+                entry.get('model') or config['MODEL_NAME'],
+                entry.get('max_retries', 0 if len(entries) > 1 else openai.DEFAULT_MAX_RETRIES)
+            ))
+        return backends
+    
+    def candidates(self):
+        """
+        Available backends, cheapest first (ties keep configuration order)
+        """
+        return sorted((backend for backend in self.backends if backend.available()), key=lambda backend: backend.score())
+    
+    def _request_options(self, backend, options):
+        """
+        Completion arguments for a backend: its model, and response_format only if it supports it
+        """
+        options = dict(options, model=backend.model)
+        if not backend.structured_output:
+            options.pop('response_format', None)
+        return options
+    
+    def _no_backend(self):
+        """
+        Count a request rejected because every breaker is open and return its error
+        """
+        self.rejected += 1
+        return RuntimeError("No LLM backend available: every circuit breaker is open")
+    
+    def _record_timeout(self, backend, started):
+        """
+        Record a call that was given up on as a failure of its backend and return its error
+        """
+        elapsed = time.monotonic() - started
+        error = asyncio.TimeoutError(f"no answer after {elapsed:.2f}s")
+        print(f"LLM backend {backend.name} failed: {str(error)}")
+        backend.record_failure(error, latency=elapsed)
+        return error
+    
+    async def _acall(self, backend, options):
+        """
+        One completion on one backend, recording its latency or failure
+        
+        A cancelled call is recorded by acomplete, which knows whether it lost
+        a hedge or was given up on.
+        """
+        backend.calls += 1
+        backend.in_flight += 1
+        start = time.monotonic()
+        try:
+            response = await backend.async_client.chat.completions.create(**self._request_options(backend, options))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            backend.record_failure(e)
+            raise
+        finally:
+            backend.in_flight -= 1
+        backend.record_success(time.monotonic() - start)
+        return response
+    
+    async def acomplete(self, hedge=None, **options):
+        """
+        Run a chat completion on the best backend, failing over and hedging as configured
+        
+        Parameters:
+        - hedge (bool): Override LLM_HEDGE; streaming calls pass False
+        - options: chat.completions.create arguments other than model
+        
+        Returns:
+        - tuple: (completion or stream, name of the backend that answered)
+        """
+        queue = self.candidates()
+        if not queue:
+            raise self._no_backend()
+        hedge = self.hedge if hedge is None else hedge
+        pending = {}
+        started = {}
+        hedge_task = None
+        last_error = None
+        
+        def launch(backend):
+            task = asyncio.ensure_future(self._acall(backend, options))
+            pending[task] = backend
+            started[task] = time.monotonic()
+            return task
+        
+        launch(queue.pop(0))
+        try:
+            while pending:
+                hedge_delay = attempt_delay = None
+                if hedge and hedge_task is None and queue:
+                    primary = next(iter(pending.values()))
+                    hedge_delay = primary.hedge_delay(self.hedge_percentile, self.hedge_default_delay, self.hedge_min_delay)
+                if self.attempt_timeout and queue:
+                    oldest = min(pending, key=started.get)
+                    attempt_delay = max(0.0, started[oldest] + self.attempt_timeout - time.monotonic())
+                delays = [delay for delay in (hedge_delay, attempt_delay) if delay is not None]
+                done, _ = await asyncio.wait(pending, timeout=min(delays) if delays else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if attempt_delay is not None and (hedge_delay is None or attempt_delay <= hedge_delay):
+                        # Give up on the oldest call and fail over
+                        last_error = self._record_timeout(pending.pop(oldest), started[oldest])
+                        oldest.cancel()
+                        self.failovers += 1
+                        launch(queue.pop(0))
+                    else:
+                        self.hedges += 1
+                        hedge_task = launch(queue.pop(0))
+                    continue
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        if task is hedge_task:
+                            self.hedge_wins += 1
+                        return task.result(), backend.name
+                    last_error = task.exception()
+                    print(f"LLM backend {backend.name} failed: {str(last_error)}")
+                if not pending and queue:
+                    self.failovers += 1
+                    launch(queue.pop(0))
+            raise last_error
+        except asyncio.CancelledError:
+            # The caller gave up (its LLM_TIMEOUT passed): the calls still
+            # running count as failed, so a backend that hangs opens its breaker
+            for task, backend in pending.items():
+                self._record_timeout(backend, started[task])
+            raise
+        finally:
+            # Cancel the loser of a hedge, or everything if the caller gave up
+            for task in pending:
+                task.cancel()
+    
+    def complete(self, **options):
+        """
+        Blocking chat completion on the best backend, failing over in order
+        
+        Returns:
+        - tuple: (completion, name of the backend that answered)
+        """
+        queue = self.candidates()
+        if not queue:
+            raise self._no_backend()
+        last_error = None
+        for i, backend in enumerate(queue):
+            if i:
+                self.failovers += 1
+            backend.calls += 1
+            backend.in_flight += 1
+            start = time.monotonic()
+            try:
+                response = backend.client.chat.completions.create(**self._request_options(backend, options))
+            except Exception as e:
+                backend.record_failure(e)
+                last_error = e
+                print(f"LLM backend {backend.name} failed: {str(e)}")
+                continue
+            finally:
+                backend.in_flight -= 1
+            backend.record_success(time.monotonic() - start)
+            return response, backend.name
+        raise last_error
+    
+    async def warm_up(self, connections=None):
+        """
+        Open pooled connections to every backend
+        
+        Returns:
+        - dict: backend name -> warm-up summary
+        """
+        results = await asyncio.gather(*[backend.transport.warm_up(connections) for backend in self.backends])
+        return {backend.name: result for backend, result in zip(self.backends, results)}
+    
+    async def aclose(self):
+        """
+        Close every backend's connections
+        """
+        for backend in self.backends:
+            await backend.transport.aclose()
+    
+    def stats(self):
+        """
+        Return router counters and per-backend stats
+        """
+        return {
+            "hedging": self.hedge,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "failovers": self.failovers,
+            "rejected": self.rejected,
+            "backends": [backend.stats() for backend in self.backends]
+        }
@@ -1,5 +1,22 @@
-import openai
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from config import config
+from services.metrics import metrics
+from services.product_service import ProductService, matches_preferences
+from services.scoring_service import FallbackScorer
+from services.availability import Availability
+from services.retrieval_service import CandidateRetriever
+from services.similarity_service import load_similarity_table
+from services.semantic_cache import SemanticCache
+from services.session_store import SessionHistory, history_affinity
+from services.stream_parser import IncrementalArrayParser
+from services.cpu_stage import CPUStage
+from services.llm_router import LLMRouter
+from services.response_parser import BATCH_RESPONSE_FORMAT, RECOMMENDATION_SCHEMA, parse_batch_items, parse_recommendation_items
+from services.prompt_builder import PromptBuilder, render_browsing_history, render_preferences
+
+SYSTEM_PROMPT = "You are a helpful and insightful AI shopping assistant for a modern e-commerce store. Your goal is to provide personalized product recommendations that genuinely match the user's needs."
 
 class LLMService:
     """
@@ -10,19 +27,121 @@ class LLMService:
     the format and including examples in the prompt.
     """
     
-    def __init__(self):
+    def __init__(self, product_service=None):
         """
         Initialize the LLM service with configuration
+        
+        Parameters:
+        - product_service (ProductService): Catalog whose indexes back filtering and ID lookups
         """
+        self.product_service = product_service or ProductService()
+        self.prompt_builder = PromptBuilder(self.product_service)
+        # LLM rankings reused by near-duplicate requests (SEMANTIC_CACHE_ENABLED)
+        self.semantic_cache = SemanticCache(self.product_service)
+        self.retrieval_enabled = config['RETRIEVAL_ENABLED']
+        self.similarity_enabled = config['SIMILARITY_ENABLED']
+        self.availability_enabled = config['AVAILABILITY_FILTER']
+        self.low_stock_penalty = config['AVAILABILITY_LOW_STOCK_PENALTY']
+        # Stock bitmaps, scorer columns, prompt fragments and the retrieval index are built per
+        # catalog snapshot, now and before every catalog reload is swapped in
+        self._prepare_snapshot(self.product_service.snapshot)
+        self.product_service.on_reload(self._prepare_snapshot)
         # Using OpenRouter for better model access and pricing
         # Spent some time debugging API endpoint issues before settling on this approach
-        self.client = openai.OpenAI(
-            api_key=config['OPENAI_API_KEY'],
-            base_url=config.get('OPENAI_BASE_URL', 'https://api.openai.com/v1')
-        )
+        # Completions are routed across LLM_BACKENDS (or the single OPENAI_BASE_URL
+        # endpoint), each with its own pooled sync and async clients
+        self.router = LLMRouter()
         self.model_name = config['MODEL_NAME']
         self.max_tokens = config['MAX_TOKENS']
         self.temperature = config['TEMPERATURE']
+        self.timeout = config['LLM_TIMEOUT']
+        self.max_concurrency = config['LLM_MAX_CONCURRENCY']
+        self._llm_slots = asyncio.Semaphore(self.max_concurrency)
+        # LLM calls holding or waiting for a slot (see _llm_slot)
+        self._llm_in_flight = 0
+        self.batch_users = max(1, config['LLM_BATCH_USERS'])
+        self.max_prompt_products = config['PROMPT_MAX_PRODUCTS']
+        # Filtering, prompt building, parsing and fallback scoring on the async path
+        self.cpu_stage = CPUStage(self)
+    
+    @property
+    def fallback_scorer(self):
+        """
+        FallbackScorer for the current catalog snapshot
+        """
+        return self.product_service.snapshot.derived('fallback_scorer', FallbackScorer)
+    
+    @property
+    def availability(self):
+        """
+        Availability bitmaps for the current catalog snapshot, or None when stock isn't filtered
+        """
+        if not self.availability_enabled:
+            return None
+        return self.product_service.snapshot.derived('availability', Availability)
+    
+    @property
+    def retriever(self):
+        """
+        CandidateRetriever for the current catalog snapshot, or None when retrieval is disabled
+        """
+        if not self.retrieval_enabled:
+            return None
+        return self.product_service.snapshot.derived('retriever', CandidateRetriever.for_snapshot)
+    
+    @property
+    def similarity_table(self):
+        """
+        SimilarityTable for the current catalog snapshot, or None when disabled
+        """
+        if not self.similarity_enabled:
+            return None
+        return self.product_service.snapshot.derived('similarity_table', load_similarity_table)
+    
+    def spare_llm_slots(self):
+        """
+        LLM calls that could start now without being shed to the fallback (none
+        while the CPU stage is saturated)
+        """
+        if self.cpu_stage.saturated():
+            return 0
+        return max(0, self.max_concurrency - self._llm_in_flight)
+    
+    def _shed_llm_call(self):
+        """
+        Whether every LLM slot is taken, so the call should be shed to the
+        fallback instead of waiting for one (counted as an llm_overload fallback)
+        """
+        if not self._llm_slots.locked():
+            return False
+        print(f"LLM concurrency limit ({self.max_concurrency}) reached, using fallback recommendations")
+        metrics.count_fallback("llm_overload")
+        return True
+    
+    @asynccontextmanager
+    async def _llm_slot(self):
+        """
+        Hold one of the LLM_MAX_CONCURRENCY slots, counted while held or awaited
+        """
+        self._llm_in_flight += 1
+        try:
+            async with self._llm_slots:
+                yield
+        finally:
+            self._llm_in_flight -= 1
+    
+    def _prepare_snapshot(self, snapshot):
+        """
+        Build the per-snapshot state used on the request path
+        """
+        if self.availability_enabled:
+            snapshot.derived('availability', Availability)
+        snapshot.derived('fallback_scorer', FallbackScorer)
+        self.prompt_builder.fragments(snapshot)
+        if self.retrieval_enabled:
+            snapshot.derived('retriever', CandidateRetriever.for_snapshot)
+        if self.similarity_enabled:
+            snapshot.derived('similarity_table', load_similarity_table)
     
     def generate_recommendations(self, user_preferences, browsing_history, all_products):
         """
@@ -36,54 +155,440 @@ class LLMService:
         Returns:
         - dict: Recommended products with explanations
         """
-        # TODO: Implement LLM-based recommendation logic
-        # This is where your prompt engineering expertise will be evaluated
-        
         # Get browsed products details
-        browsed_products = []
-        for product_id in browsing_history:
-            for product in all_products:
-                if product["id"] == product_id:
-                    browsed_products.append(product)
-                    break
+        browsed_products = self._resolve_browsed_products(browsing_history, all_products)
         
         # Create a prompt for the LLM
-        # IMPLEMENT YOUR PROMPT ENGINEERING HERE
-        prompt = self._create_recommendation_prompt(user_preferences, browsed_products, all_products)
+        prompt_result = self._build_recommendation_prompt(user_preferences, browsed_products, all_products)
+        prompt = prompt_result.prompt
+        
+        self._observe_prompt(prompt_result)
+        
+        signature, reused = self._semantic_lookup(prompt_result, browsed_products)
+        if reused is not None:
+            return reused
         
         # Call the LLM API
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {"role": "system", "content": "You are a helpful and insightful AI shopping assistant for a modern e-commerce store. Your goal is to provide personalized product recommendations that genuinely match the user's needs."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature,
-                extra_headers={
-                    "HTTP-Referer": "http://localhost:3000",
-                    "X-Title": "i95dev Product Recommendations"
-                }
-            )
+            with metrics.stage('llm'):
+                response, backend = self.router.complete(
+                    messages=self._build_messages(prompt),
+                    max_tokens=self.max_tokens,
+                    temperature=self.temperature,
+                    response_format=RECOMMENDATION_SCHEMA
+                )
+            metrics.count_tokens(response.usage)
             
             # Parse the LLM response to extract recommendations
-            # IMPLEMENT YOUR RESPONSE PARSING LOGIC HERE
-            recommendations = self._parse_recommendation_response(response.choices[0].message.content, all_products)
-            
-            return recommendations
+            with metrics.stage('parse'):
+                recommendations = self._parse_recommendation_response(response.choices[0].message.content, all_products)
+            self._count_parse_error(recommendations)
+            self._semantic_store(signature, recommendations)
             
+            return self._with_prompt_metrics(recommendations, prompt_result, backend)
+        
         except Exception as e:
-            # Handle credit/payment errors specifically
-            if "402" in str(e) or "credits" in str(e).lower():
-                print(f"Credits insufficient, using fallback recommendations: {str(e)}")
+            return self._handle_llm_error(e, user_preferences, browsed_products, all_products)
+    
+    async def agenerate_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Async variant of generate_recommendations used by the API
+        
+        At most LLM_MAX_CONCURRENCY completions are in flight at once. When every
+        slot is taken, the CPU stage pool is saturated, or a completion exceeds
+        LLM_TIMEOUT, the rule-based fallback is returned instead of queueing the
+        request. Prompt building and parsing run in the CPU stage (CPU_POOL_MODE).
+        With SEMANTIC_CACHE_ENABLED, a near-duplicate of an earlier request
+        reuses its LLM ranking instead of calling the LLM (see SemanticCache).
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+        
+        Returns:
+        - dict: Recommended products with explanations
+        """
+        browsed_products = self._resolve_browsed_products(browsing_history, all_products)
+        
+        # Shed load instead of piling up requests behind a slow provider or a busy CPU stage
+        if self._shed_llm_call():
+            with metrics.stage('fallback'):
                 return self._generate_fallback_recommendations(user_preferences, browsed_products, all_products)
-            else:
-                # Handle any other errors from the LLM API
-                print(f"Error calling LLM API: {str(e)}")
+        if self.cpu_stage.saturated():
+            print(f"CPU stage queue limit ({self.cpu_stage.max_pending}) reached, using fallback recommendations")
+            metrics.count_fallback("cpu_overload")
+            with metrics.stage('fallback'):
                 return self._generate_fallback_recommendations(user_preferences, browsed_products, all_products)
+        
+        prompt_result = await self.cpu_stage.run('_build_recommendation_prompt', (user_preferences, browsed_products), all_products)
+        self._observe_prompt(prompt_result)
+        prompt = prompt_result.prompt
+        
+        signature, reused = self._semantic_lookup(prompt_result, browsed_products)
+        if reused is not None:
+            return reused
+        
+        # Check again: the slots may have filled up while the prompt was built
+        # in the CPU stage, and the wait for a slot isn't bounded by LLM_TIMEOUT
+        if self._shed_llm_call():
+            with metrics.stage('fallback'):
+                return self._generate_fallback_recommendations(user_preferences, browsed_products, all_products)
+        
+        try:
+            async with self._llm_slot():
+                with metrics.stage('llm'):
+                    response, backend = await asyncio.wait_for(
+                        self.router.acomplete(
+                            messages=self._build_messages(prompt),
+                            max_tokens=self.max_tokens,
+                            temperature=self.temperature,
+                            response_format=RECOMMENDATION_SCHEMA
+                        ),
+                        timeout=self.timeout
+                    )
+            metrics.count_tokens(response.usage)
+            
+            with metrics.stage('parse'):
+                recommendations = await self.cpu_stage.run('_parse_recommendation_response', (response.choices[0].message.content,), all_products)
+            self._count_parse_error(recommendations)
+            self._semantic_store(signature, recommendations)
+            return self._with_prompt_metrics(recommendations, prompt_result, backend)
+        
+        except asyncio.TimeoutError:
+            print(f"LLM call exceeded {self.timeout}s timeout, using fallback recommendations")
+            metrics.count_fallback("timeout")
+            return await self._agenerate_fallback_recommendations(user_preferences, browsed_products, all_products)
+        except Exception as e:
+            self._log_llm_error(e)
+            return await self._agenerate_fallback_recommendations(user_preferences, browsed_products, all_products)
+    
+    async def agenerate_heuristic_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Rule-based recommendations for the first tier of a tiered response
+        
+        Same scoring as the fallback, without an LLM call, so the answer is
+        ready in well under a millisecond on the indexed catalog.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+        
+        Returns:
+        - dict: Recommended products with explanations
+        """
+        browsed_products = self._resolve_browsed_products(browsing_history, all_products)
+        recommendations = await self._agenerate_fallback_recommendations(user_preferences, browsed_products, all_products)
+        recommendations["message"] = "Instant recommendations; AI-refined recommendations will follow"
+        return recommendations
+    
+    async def astream_recommendations(self, user_preferences, browsing_history, all_products):
+        """
+        Stream recommendations as the LLM generates them
+        
+        Uses a streaming chat completion and parses the JSON array incrementally,
+        so each recommendation is yielded as soon as its object closes. If the
+        call is shed, times out or fails, the remaining slots are filled from the
+        rule-based fallback.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - all_products (list): Full product catalog
+        
+        Yields:
+        - tuple: ("recommendation", item) per recommendation, then ("summary", dict)
+          with the final result in the same shape as generate_recommendations
+        """
+        browsed_products = self._resolve_browsed_products(browsing_history, all_products)
+        emitted = []
+        seen_ids = set()
+        error = None
+        prompt_result = None
+        
+        if self._shed_llm_call():
+            error = "LLM concurrency limit reached"
+        elif self.cpu_stage.saturated():
+            print(f"CPU stage queue limit ({self.cpu_stage.max_pending}) reached, using fallback recommendations")
+            metrics.count_fallback("cpu_overload")
+            error = "CPU stage queue limit reached"
+        else:
+            prompt_result = await self.cpu_stage.run('_build_recommendation_prompt', (user_preferences, browsed_products), all_products)
+            self._observe_prompt(prompt_result)
+            prompt = prompt_result.prompt
+            stream = None
+            # Check again: the slots may have filled up while the prompt was built
+            if self._shed_llm_call():
+                error = "LLM concurrency limit reached"
+            else:
+                try:
+                    async with self._llm_slot():
+                        loop = asyncio.get_running_loop()
+                        deadline = loop.time() + self.timeout
+                        # No hedging: the stream is consumed as it arrives. The llm
+                        # stage here is the time until the stream has started
+                        with metrics.stage('llm'):
+                            stream, backend = await asyncio.wait_for(
+                                self.router.acomplete(
+                                    hedge=False,
+                                    messages=self._build_messages(prompt),
+                                    max_tokens=self.max_tokens,
+                                    temperature=self.temperature,
+                                    stream=True,
+                                    response_format=RECOMMENDATION_SCHEMA
+                                ),
+                                timeout=self.timeout
+                            )
+                        parser = IncrementalArrayParser()
+                        chunks = stream.__aiter__()
+                        while len(emitted) < 5 and not parser.finished:
+                            try:
+                                chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - loop.time()))
+                            except StopAsyncIteration:
+                                break
+                            if not chunk.choices or not chunk.choices[0].delta.content:
+                                continue
+                            for item in parser.feed(chunk.choices[0].delta.content):
+                                recs = self._build_recommendations([item], all_products)["recommendations"]
+                                if not recs or recs[0]["product"]["id"] in seen_ids or len(emitted) >= 5:
+                                    continue
+                                seen_ids.add(recs[0]["product"]["id"])
+                                emitted.append(recs[0])
+                                yield "recommendation", recs[0]
+                except asyncio.TimeoutError:
+                    print(f"LLM stream exceeded {self.timeout}s timeout, using fallback recommendations")
+                    metrics.count_fallback("timeout")
+                    error = "LLM stream timed out"
+                except Exception as e:
+                    self._log_llm_error(e)
+                    error = f"LLM API error: {str(e)}"
+                finally:
+                    if stream is not None:
+                        await stream.close()
+        
+        if error is None and emitted:
+            emitted.sort(key=lambda x: x['confidence_score'], reverse=True)
+            yield "summary", self._with_prompt_metrics({"recommendations": emitted, "count": len(emitted)}, prompt_result, backend)
+            return
+        
+        if error is None:
+            metrics.count_fallback("parse_error")
+        
+        # Top up from the rule-based fallback, skipping anything already sent
+        fallback = await self._agenerate_fallback_recommendations(user_preferences, browsed_products, all_products)
+        for rec in fallback["recommendations"]:
+            if len(emitted) >= 5:
+                break
+            if rec["product"]["id"] not in seen_ids:
+                seen_ids.add(rec["product"]["id"])
+                emitted.append(rec)
+                yield "recommendation", rec
+        emitted.sort(key=lambda x: x['confidence_score'], reverse=True)
+        yield "summary", {
+            "recommendations": emitted,
+            "count": len(emitted),
+            "fallback": True,
+            "message": fallback.get("message", "Generated using fallback algorithm"),
+            "error": error or "No recommendations parsed from LLM stream"
+        }
+    
+    async def agenerate_batch_recommendations(self, batch, all_products):
+        """
+        Generate recommendations for many users, yielding each result as it completes
+        
+        Candidate filtering for the stated preferences runs once per distinct
+        preference profile. Users are packed LLM_BATCH_USERS at a time into a
+        single prompt and the answer is split back per user; users the model
+        skipped or garbled get the rule-based fallback. Unlike the interactive
+        path, packs wait for a free LLM slot rather than being shed.
+        
+        Parameters:
+        - batch (list): (user_preferences, browsing_history) pairs, already deduplicated
+        - all_products (list): Full product catalog
+        
+        Yields:
+        - tuple: (position in batch, recommendations dict)
+        """
+        profile_candidates = {}
+        users = []
+        for position, (user_preferences, browsing_history) in enumerate(batch):
+            browsed_products = self._resolve_browsed_products(browsing_history, all_products)
+            profile = self._preference_profile_key(user_preferences)
+            if profile not in profile_candidates:
+                profile_candidates[profile] = self._preference_candidate_ids(user_preferences)
+            users.append({
+                "position": position,
+                "preferences": user_preferences,
+                "browsed": browsed_products,
+                "candidates": self._filter_relevant_products(
+                    user_preferences, browsed_products, all_products, preference_ids=profile_candidates[profile]
+                )
+            })
+        
+        packs = [users[i:i + self.batch_users] for i in range(0, len(users), self.batch_users)]
+        tasks = [asyncio.ensure_future(self._arun_batch_pack(pack, all_products)) for pack in packs]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for position, recommendations in await finished:
+                    yield position, recommendations
+        finally:
+            # Stop outstanding LLM calls if the consumer goes away
+            for task in tasks:
+                task.cancel()
+    
+    async def _arun_batch_pack(self, pack, all_products):
+        """
+        Run one LLM call for a pack of users and split the result per user
+        
+        Returns:
+        - list: (position, recommendations dict) for every user in the pack
+        """
+        if len(pack) == 1:
+            user = pack[0]
+            prompt = self._create_recommendation_prompt(user["preferences"], user["browsed"], all_products, user["candidates"])
+        else:
+            prompt = self._create_batch_prompt(pack)
+        
+        try:
+            async with self._llm_slot():
+                with metrics.stage('llm'):
+                    response, _ = await asyncio.wait_for(
+                        self.router.acomplete(
+                            messages=self._build_messages(prompt),
+                            max_tokens=self.max_tokens * len(pack),
+                            temperature=self.temperature,
+                            response_format=RECOMMENDATION_SCHEMA if len(pack) == 1 else BATCH_RESPONSE_FORMAT
+                        ),
+                        timeout=self.timeout
+                    )
+        except asyncio.TimeoutError:
+            print(f"Batch LLM call exceeded {self.timeout}s timeout, using fallback recommendations")
+            metrics.count_fallback("timeout", len(pack))
+            return [
+                (user["position"], await self._agenerate_fallback_recommendations(user["preferences"], user["browsed"], all_products))
+                for user in pack
+            ]
+        except Exception as e:
+            self._log_llm_error(e, len(pack))
+            return [
+                (user["position"], await self._agenerate_fallback_recommendations(user["preferences"], user["browsed"], all_products))
+                for user in pack
+            ]
+        
+        metrics.count_tokens(response.usage)
+        content = response.choices[0].message.content
+        if len(pack) == 1:
+            with metrics.stage('parse'):
+                recommendations = await self.cpu_stage.run('_parse_recommendation_response', (content,), all_products)
+            self._count_parse_error(recommendations)
+            return [(pack[0]["position"], recommendations)]
+        
+        with metrics.stage('parse'):
+            per_user = await self.cpu_stage.run('_parse_batch_response', (content, [f"user_{i + 1}" for i in range(len(pack))]), all_products)
+        results = []
+        for i, user in enumerate(pack):
+            recommendations = per_user.get(f"user_{i + 1}")
+            if recommendations is None or not recommendations["recommendations"]:
+                print(f"No usable batch answer for user_{i + 1}, using fallback recommendations")
+                metrics.count_fallback("parse_error")
+                recommendations = await self._agenerate_fallback_recommendations(user["preferences"], user["browsed"], all_products)
+            results.append((user["position"], recommendations))
+        return results
+    
+    def _resolve_browsed_products(self, browsing_history, all_products):
+        """
+        Resolve browsing history IDs to product dicts, preserving history order
+        """
+        with metrics.stage('history'):
+            products_by_id = self.product_service.products_by_id
+            browsed_products = [products_by_id[product_id] for product_id in browsing_history if product_id in products_by_id]
+            if isinstance(browsing_history, SessionHistory):
+                return SessionHistory(browsed_products, browsing_history.categories, browsing_history.brands)
+            return browsed_products
+    
+    def _build_messages(self, prompt):
+        """
+        Wrap a recommendation prompt in the chat message format
+        """
+        return [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+    
+    def _with_prompt_metrics(self, recommendations, prompt_result, backend=None):
+        """
+        Attach the prompt size, build time and answering LLM backend to an LLM-generated result
+        """
+        recommendations["metrics"] = {
+            "prompt_tokens": prompt_result.tokens,
+            "prompt_products": prompt_result.products,
+            "prompt_candidates": prompt_result.candidates,
+            "prompt_build_ms": round(prompt_result.build_ms, 3),
+            "llm_backend": backend
+        }
+        return recommendations
+    
+    def _observe_prompt(self, prompt_result):
+        """
+        Record the filter and prompt stages of a prompt built here or in a CPU stage worker
+        """
+        metrics.observe('filter', prompt_result.filter_ms / 1000)
+        metrics.observe('prompt', prompt_result.build_ms / 1000)
+    
+    def _semantic_lookup(self, prompt_result, browsed_products):
+        """
+        Signature of a request and the ranking reused from a near-duplicate one, if any
+        
+        Returns:
+        - tuple: (RequestSignature or None when the cache is off, recommendations or None)
+        """
+        if not self.semantic_cache.enabled:
+            return None, None
+        with metrics.stage('semantic_cache'):
+            signature = self.semantic_cache.signature(prompt_result.product_ids, browsed_products)
+            return signature, self.semantic_cache.lookup(signature, browsed_products)
+    
+    def _semantic_store(self, signature, recommendations):
+        """
+        Keep an LLM ranking for near-duplicate requests
+        """
+        if signature is not None:
+            self.semantic_cache.store(signature, recommendations)
+    
+    def _count_parse_error(self, recommendations):
+        """
+        Count a parsed LLM answer that fell back because it couldn't be used
+        """
+        if "error" in recommendations:
+            metrics.count_fallback("parse_error")
     
-    def _create_recommendation_prompt(self, user_preferences, browsed_products, all_products):
+    def _handle_llm_error(self, e, user_preferences, browsed_products, all_products):
+        """
+        Log an LLM API error and return the rule-based fallback
+        """
+        self._log_llm_error(e)
+        with metrics.stage('fallback'):
+            return self._generate_fallback_recommendations(user_preferences, browsed_products, all_products)
+    
+    def _log_llm_error(self, e, users=1):
+        """
+        Log and count an LLM API error, calling out credit/payment failures
+        
+        Parameters:
+        - e (Exception): Error raised by the call
+        - users (int): Recommendations that fall back because of it
+        """
+        # Handle credit/payment errors specifically
+        if "402" in str(e) or "credits" in str(e).lower():
+            print(f"Credits insufficient, using fallback recommendations: {str(e)}")
+            metrics.count_fallback("credits", users)
+        else:
+            # Handle any other errors from the LLM API
+            print(f"Error calling LLM API: {str(e)}")
+            metrics.count_fallback("api_error", users)
+    
+    def _create_recommendation_prompt(self, user_preferences, browsed_products, all_products, relevant_products=None):
         """
         Create a prompt for the LLM to generate recommendations
         
@@ -93,132 +598,222 @@ class LLMService:
         - user_preferences (dict): User's stated preferences
         - browsed_products (list): Products the user has viewed
         - all_products (list): Full product catalog
+        - relevant_products (list): Already-filtered candidates, filtered here when omitted
         
         Returns:
         - str: Prompt for the LLM
         """
+        return self._build_recommendation_prompt(user_preferences, browsed_products, all_products, relevant_products).prompt
+    
+    def _build_recommendation_prompt(self, user_preferences, browsed_products, all_products, relevant_products=None):
+        """
+        Build a recommendation prompt and its size metrics
+        
+        Catalog lines come pre-rendered from the PromptBuilder and are added in
+        relevance order until the prompt token budget is reached.
+        
+        Returns:
+        - PromptResult: Prompt text, token count, products included, candidates and build time
+        """
         # Filter products based on preferences to reduce token usage
-        relevant_products = self._filter_relevant_products(user_preferences, browsed_products, all_products)
+        if relevant_products is None:
+            start = time.perf_counter()
+            relevant_products = self._filter_relevant_products(user_preferences, browsed_products, all_products)
+            filter_ms = (time.perf_counter() - start) * 1000
+            return self.prompt_builder.build(user_preferences, browsed_products, relevant_products)._replace(filter_ms=filter_ms)
+        return self.prompt_builder.build(user_preferences, browsed_products, relevant_products)
+    
+    def _create_batch_prompt(self, pack):
+        """
+        Create one prompt asking for recommendations for several users
+        
+        The union of every user's candidates is listed once; each user section
+        names the candidate IDs that user may be recommended.
+        
+        Parameters:
+        - pack (list): User dicts with preferences, browsed and candidates
+        
+        Returns:
+        - str: Prompt for the LLM
+        """
+        catalog = {}
+        for user in pack:
+            for product in user["candidates"]:
+                catalog.setdefault(product['id'], product)
         
-        prompt = """You are an expert e-commerce product recommendation assistant. Your task is to analyze user preferences and browsing history to recommend the best 5 products from our catalog.
+        prompt = f"""You are an expert e-commerce product recommendation assistant. Recommend the best 5 products for EACH of the {len(pack)} users below, choosing only from that user's candidate product IDs.
 
-IMPORTANT: Respond with valid JSON only, no other text. Use this exact format:
-[
-  {
-    "product_id": "prod001",
-    "explanation": "This product matches your preferences because...",
-    "score": 8.5
-  }
-]
+IMPORTANT: Respond with valid JSON only, no other text. Use this exact format, with one key per user:
+{{
+  "user_1": [
+    {{
+      "product_id": "prod001",
+      "explanation": "This product matches your preferences because...",
+      "score": 8.5
+    }}
+  ]
+}}
 
 **CRITICAL INSTRUCTIONS:**
-1.  Respond ONLY with a valid JSON object in the specified format. Do not include any other text or explanations outside the JSON structure.
-2.  Provide a unique, insightful reason for each recommendation.
-3.  DO NOT recommend any products that are already in the user's browsing history.
+1.  Respond ONLY with a valid JSON object in the specified format.
+2.  Provide a unique, insightful reason for each recommendation, written to that user.
+3.  DO NOT recommend any products that are already in that user's browsing history.
 
-USER PREFERENCES:"""
+PRODUCT CATALOG ({len(catalog)} products):"""
+        for product in catalog.values():
+            prompt += self._format_product_line(product)
         
-        # Add user preferences
-        if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
-            price_labels = {
-                'under-50': 'Under $50',
-                '50-100': '$50-$100',
-                '100-200': '$100-$200',
-                'over-200': 'Over $200'
-            }
-            prompt += f"\n- Budget: {price_labels.get(user_preferences['priceRange'], 'Any')}"
-        
-        if user_preferences.get('categories'):
-            prompt += f"\n- Preferred Categories: {', '.join(user_preferences['categories'])}"
-        
-        if user_preferences.get('brands'):
-            prompt += f"\n- Preferred Brands: {', '.join(user_preferences['brands'])}"
-        
-        # Add browsing history
-        prompt += "\n\nBROWSING HISTORY (products they showed interest in):"
-        if browsed_products:
-            for product in browsed_products[-5:]:  # Last 5 browsed products
-                prompt += f"\n- {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')}"
-        else:
-            prompt += "\n- No browsing history yet"
-        
-        # Add product catalog (filtered)
-        prompt += f"\n\nAVAILABLE PRODUCTS ({len(relevant_products)} products):"
-        for product in relevant_products:
-            features_str = ', '.join(product.get('features', [])[:3])
-            prompt += f"\n- ID: {product['id']} | {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')} | Features: {features_str}"
+        for i, user in enumerate(pack):
+            prompt += f"\n\nUSER user_{i + 1}\nPREFERENCES:"
+            prompt += self._format_preferences(user["preferences"]) or "\n- No stated preferences"
+            prompt += "\nBROWSING HISTORY:"
+            prompt += self._format_browsing_history(user["browsed"])
+            prompt += f"\nCANDIDATES: {', '.join(p['id'] for p in user['candidates'])}"
         
         prompt += """\n\nTASK:
-1. Analyze the user's preferences and browsing patterns
-2. Recommend exactly 5 products that best match their interests
-3. For each recommendation, explain WHY it fits their preferences/behavior
-4. Rate each recommendation 1-10 based on relevance
-5. Consider variety - don't recommend only from one category unless they specifically prefer it
+For every user, recommend exactly 5 of their candidates, explain WHY each fits, and rate each 1-10 based on relevance.
 
-Return valid JSON array with product_id, explanation, and score fields."""
+Return a valid JSON object keyed by user with arrays of product_id, explanation, and score fields."""
         
         return prompt
     
-    def _filter_relevant_products(self, user_preferences, browsed_products, all_products):
+    def _format_preferences(self, user_preferences):
+        """
+        Render the user preference lines of a prompt
+        """
+        return render_preferences(user_preferences)
+    
+    def _format_browsing_history(self, browsed_products):
+        """
+        Render the browsing history lines of a prompt (last 5 products)
+        """
+        return render_browsing_history(browsed_products)
+    
+    def _format_product_line(self, product):
+        """
+        Render one catalog line of a prompt, from the pre-rendered fragment cache
+        """
+        return self.prompt_builder.fragment(product)[0]
+    
+    def _preference_profile_key(self, user_preferences):
+        """
+        Order-insensitive identity of a preference profile
+        """
+        return (
+            user_preferences.get('priceRange') or 'all',
+            tuple(sorted(set(user_preferences.get('categories') or []))),
+            tuple(sorted(set(user_preferences.get('brands') or [])))
+        )
+    
+    def _preference_candidate_ids(self, user_preferences):
+        """
+        IDs of products matching the stated category, brand or price preferences
+        
+        This part of the filter depends only on the preference profile, so
+        batch requests compute it once per distinct profile.
+        """
+        catalog = self.product_service.snapshot
+        candidate_ids = set()
+        for category in user_preferences.get('categories') or []:
+            candidate_ids.update(catalog.category_index.get(category, ()))
+        for brand in user_preferences.get('brands') or []:
+            candidate_ids.update(catalog.brand_index.get(brand, ()))
+        if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
+            candidate_ids.update(catalog.price_range_index.get(user_preferences['priceRange'], ()))
+        return frozenset(candidate_ids)
+    
+    def _filter_relevant_products(self, user_preferences, browsed_products, all_products, preference_ids=None):
         """Filter products to reduce token usage while keeping relevant ones"""
-        relevant_products = []
+        # One snapshot for the whole filter, even if the catalog is reloaded meanwhile
+        catalog = self.product_service.snapshot
         
-        # Always include products from browsed categories/brands
-        browsed_categories = set(p.get('category') for p in browsed_products)
-        browsed_brands = set(p.get('brand') for p in browsed_products)
+        # Out-of-stock products are never offered; this is the first and cheapest cut
+        availability = catalog.derived('availability', Availability) if self.availability_enabled else None
         
-        for product in all_products:
-            include = False
-            
-            # Include if matches user preferences
-            if user_preferences.get('categories') and product['category'] in user_preferences['categories']:
-                include = True
-            if user_preferences.get('brands') and product.get('brand') in user_preferences['brands']:
-                include = True
-            
-            # Include if from browsed categories/brands
-            if product['category'] in browsed_categories or product.get('brand') in browsed_brands:
-                include = True
-            
-            # Include if matches price range
-            if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
-                price = product['price']
-                price_match = False
-                if user_preferences['priceRange'] == 'under-50' and price < 50:
-                    price_match = True
-                elif user_preferences['priceRange'] == '50-100' and 50 <= price <= 100:
-                    price_match = True
-                elif user_preferences['priceRange'] == '100-200' and 100 <= price <= 200:
-                    price_match = True
-                elif user_preferences['priceRange'] == 'over-200' and price > 200:
-                    price_match = True
-                
-                if price_match:
-                    include = True
-            
-            # If no preferences set, include top-rated products
-            if not user_preferences.get('categories') and not user_preferences.get('brands') and not browsed_products:
-                if product.get('rating', 0) > 4.0:
-                    include = True
-            
-            if include:
-                relevant_products.append(product)
+        # Precomputed neighbours of the browsing history come first when the table is enabled
+        if self.similarity_table is not None and browsed_products:
+            relevant_products = [product for product, _, _ in self._similar_products(user_preferences, browsed_products, self.max_prompt_products)]
+            if len(relevant_products) >= 10:
+                return relevant_products
+        
+        # Prefer semantic neighbours of the browsing history when retrieval is enabled
+        if self.retriever is not None and browsed_products:
+            relevant_products = self.retriever.retrieve(
+                user_preferences, browsed_products, k=config['RETRIEVAL_TOP_K'],
+                available=availability.is_available if availability is not None else None
+            )
+            if len(relevant_products) >= 10:
+                return relevant_products
+        
+        # Include if matches user preferences (category, brand or price range)
+        if preference_ids is None:
+            preference_ids = self._preference_candidate_ids(user_preferences)
+        relevant_ids = set(preference_ids)
         
-        # If we have too many, prioritize by rating and limit to 30 products
-        if len(relevant_products) > 30:
-            relevant_products.sort(key=lambda x: x.get('rating', 0), reverse=True)
-            relevant_products = relevant_products[:30]
+        # Always include products from browsed categories/brands, and a session's most viewed ones
+        affinity_categories, affinity_brands = history_affinity(browsed_products)
+        for category in set(p.get('category') for p in browsed_products).union(affinity_categories):
+            relevant_ids.update(catalog.category_index.get(category, ()))
+        for brand in set(p.get('brand') for p in browsed_products).union(affinity_brands):
+            relevant_ids.update(catalog.brand_index.get(brand, ()))
+        
+        # If no preferences set, include top-rated products
+        if not user_preferences.get('categories') and not user_preferences.get('brands') and not browsed_products:
+            relevant_ids.update(catalog.top_rated_ids)
+        
+        demoted = None
+        if availability is not None:
+            relevant_ids = availability.prune(relevant_ids)
+            demoted = availability.demoted
+        
+        # If we have too many, prioritize by rating (ties in catalog order, low-stock products
+        # AVAILABILITY_LOW_STOCK_PENALTY lower) and limit to PROMPT_MAX_PRODUCTS (30 by
+        # default); the prompt token budget may trim further
+        products_by_id = catalog.products_by_id
+        if len(relevant_ids) > self.max_prompt_products:
+            top_ids = catalog.top_rated_among(relevant_ids, self.max_prompt_products, demoted, self.low_stock_penalty)
+            relevant_products = [products_by_id[pid] for pid in top_ids]
+        else:
+            relevant_products = catalog.get_products_by_ids(relevant_ids)
         
         # If we have too few, add some popular products
         if len(relevant_products) < 10:
-            for product in all_products:
-                if product not in relevant_products and product.get('rating', 0) > 4.0:
+            for product_id in catalog.top_rated_ids:
+                if product_id not in relevant_ids:
+                    product = products_by_id[product_id]
+                    if availability is not None and not availability.is_available(product):
+                        continue
                     relevant_products.append(product)
                     if len(relevant_products) >= 20:
                         break
         
         return relevant_products
     
+    def _similar_products(self, user_preferences, browsed_products, k):
+        """
+        Products most similar to the browsing history, from the similarity table
+        
+        Neighbours matching the preference filters come first; the remaining
+        slots are filled with the closest unfiltered neighbours.
+        
+        Returns:
+        - list: (product, merged similarity score, browsed product it is closest to)
+        """
+        products_by_id = self.product_service.products_by_id
+        availability = self.availability
+        neighbours = [
+            (products_by_id[product_id], score, browsed_products[source])
+            for product_id, score, source in self.similarity_table.similar([p['id'] for p in browsed_products], k * 4)
+            if product_id in products_by_id
+        ]
+        if availability is not None:
+            neighbours = [entry for entry in neighbours if availability.is_available(entry[0])]
+        matching = [entry for entry in neighbours if matches_preferences(entry[0], user_preferences)]
+        if len(matching) < k:
+            matching_ids = {entry[0]['id'] for entry in matching}
+            matching.extend(entry for entry in neighbours if entry[0]['id'] not in matching_ids)
+        return matching[:k]
+    
     def _parse_recommendation_response(self, llm_response, all_products):
         """
         Parse the LLM response to extract product recommendations
@@ -231,97 +826,18 @@ Return valid JSON array with product_id, explanation, and score fields."""
         - dict: Structured recommendations
         """
         try:
-            import json
-            import re
-            
-            # Clean the response - sometimes LLM adds extra text
-            llm_response = llm_response.strip()
-            
-            # Find JSON content in the response
-            json_match = re.search(r'\[.*\]', llm_response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-            else:
-                # Try to find JSON object array
-                start_idx = llm_response.find('[')
-                end_idx = llm_response.rfind(']') + 1
-                
-                if start_idx == -1 or end_idx == 0:
-                    return {
-                        "recommendations": [],
-                        "count": 0,
-                        "error": "No valid JSON found in LLM response"
-                    }
-                
-                json_str = llm_response[start_idx:end_idx]
-            
-            # Parse JSON
-            try:
-                rec_data = json.loads(json_str)
-            except json.JSONDecodeError as e:
-                # Try to fix common JSON issues
-                json_str = json_str.replace("'", '"')  # Single quotes to double quotes
-                json_str = re.sub(r',\s*}', '}', json_str)  # Remove trailing commas
-                json_str = re.sub(r',\s*]', ']', json_str)  # Remove trailing commas
-                try:
-                    rec_data = json.loads(json_str)
-                except json.JSONDecodeError:
-                    return {
-                        "recommendations": [],
-                        "count": 0,
-                        "error": f"Failed to parse JSON: {str(e)}"
-                    }
-            
-            if not isinstance(rec_data, list):
+            # Structured output or a clean array parses directly; otherwise the
+            # array is scanned out of the text, and repaired only if that fails
+            parsed = parse_recommendation_items(llm_response)
+            if parsed.items is None:
                 return {
                     "recommendations": [],
                     "count": 0,
-                    "error": "LLM response is not a JSON array"
+                    "error": parsed.error
                 }
             
-            # Process recommendations
-            recommendations = []
-            product_lookup = {p['id']: p for p in all_products}
-            
-            for rec in rec_data:
-                if not isinstance(rec, dict):
-                    continue
-                product_id = rec.get('product_id')
-                explanation = rec.get('explanation', 'No explanation provided')
-                score = rec.get('score', 5.0)
-                
-                # Validate score
-                try:
-                    score = float(score)
-                    if score < 1:
-                        score = 1
-                    elif score > 10:
-                        score = 10
-                except (ValueError, TypeError):
-                    score = 5.0
-                
-                # Find the full product details
-                product_details = product_lookup.get(product_id)
-                
-                if product_details:
-                    recommendations.append({
-                        "product": product_details,
-                        "explanation": explanation,
-                        "confidence_score": score
-                    })
-                else:
-                    # Log missing product but don't fail
-                    print(f"Warning: Product ID {product_id} not found in catalog")
-            
-            # Limit to 5 recommendations and sort by confidence
-            recommendations.sort(key=lambda x: x['confidence_score'], reverse=True)
-            recommendations = recommendations[:5]
-            
-            return {
-                "recommendations": recommendations,
-                "count": len(recommendations)
-            }
-            
+            return self._build_recommendations(parsed.items, all_products)
+        
         except Exception as e:
             print(f"Error parsing LLM response: {str(e)}")
             print(f"Raw response: {llm_response[:500]}...")  # Log first 500 chars for debugging
@@ -343,81 +859,132 @@ Return valid JSON array with product_id, explanation, and score fields."""
                 "error": f"Used fallback recommendations due to parsing error: {str(e)}"
             }
     
+    def _parse_batch_response(self, llm_response, user_keys, all_products):
+        """
+        Parse a batch LLM response into per-user recommendations
+        
+        Parameters:
+        - llm_response (str): Raw response from the LLM
+        - user_keys (list): Keys the prompt asked the model to answer under
+        - all_products (list): Full product catalog to match IDs with full product info
+        
+        Returns:
+        - dict: user key -> structured recommendations, for users with a usable answer
+        """
+        # Same stages as the single-user parser, salvaging the users answered
+        # before a truncation
+        parsed = parse_batch_items(llm_response, user_keys)
+        if parsed.items is None:
+            print(parsed.error)
+            return {}
+        return {key: self._build_recommendations(items, all_products) for key, items in parsed.items.items()}
+    
+    def _build_recommendations(self, rec_data, all_products):
+        """
+        Turn a parsed list of {product_id, explanation, score} items into the response
+        
+        Parameters:
+        - rec_data (list): Items parsed from the LLM response
+        - all_products (list): Full product catalog to match IDs with full product info
+        
+        Returns:
+        - dict: Structured recommendations
+        """
+        # Process recommendations, resolving IDs through the catalog's persistent index
+        recommendations = []
+        product_lookup = self.product_service.products_by_id
+        availability = self.availability
+        
+        for rec in rec_data:
+            if not isinstance(rec, dict):
+                continue
+            product_id = rec.get('product_id')
+            explanation = rec.get('explanation', 'No explanation provided')
+            score = rec.get('score', 5.0)
+            
+            # Validate score
+            try:
+                score = float(score)
+                if score < 1:
+                    score = 1
+                elif score > 10:
+                    score = 10
+            except (ValueError, TypeError):
+                score = 5.0
+            
+            # Find the full product details
+            product_details = product_lookup.get(product_id)
+            
+            if product_details and availability is not None and not availability.is_available(product_details):
+                print(f"Warning: Product ID {product_id} is out of stock")
+            elif product_details:
+                recommendations.append({
+                    "product": product_details,
+                    "explanation": explanation,
+                    "confidence_score": score
+                })
+            else:
+                # Log missing product but don't fail
+                print(f"Warning: Product ID {product_id} not found in catalog")
+        
+        # Limit to 5 recommendations and sort by confidence
+        recommendations.sort(key=lambda x: x['confidence_score'], reverse=True)
+        recommendations = recommendations[:5]
+        
+        return {
+            "recommendations": recommendations,
+            "count": len(recommendations)
+        }
+    
+    async def _agenerate_fallback_recommendations(self, user_preferences, browsed_products, all_products):
+        """
+        Rule-based fallback scored in the CPU stage
+        """
+        with metrics.stage('fallback'):
+            return await self.cpu_stage.run('_generate_fallback_recommendations', (user_preferences, browsed_products), all_products)
+    
     def _generate_fallback_recommendations(self, user_preferences, browsed_products, all_products):
         """
         Generate recommendations using rule-based logic when LLM API is unavailable
+        
+        With a similarity table and a browsing history, the closest neighbours
+        of the browsed products are returned directly.
         """
         try:
+            if self.similarity_table is not None and browsed_products:
+                similar = self._similar_products(user_preferences, browsed_products, 5)
+                if len(similar) == 5:
+                    return {
+                        "recommendations": [
+                            {
+                                "product": product,
+                                "explanation": f"Recommended because it is similar to {source['name']}, which you viewed",
+                                "confidence_score": round(min(9.5, 5.0 + 5.0 * score), 1)
+                            }
+                            for product, score, source in similar
+                        ],
+                        "count": 5,
+                        "fallback": True,
+                        "message": "Generated from products similar to your browsing history (LLM unavailable)"
+                    }
+            
             # Get relevant products based on preferences
             relevant_products = self._filter_relevant_products(user_preferences, browsed_products, all_products)
             
             # If no relevant products, use top-rated products
+            snapshot = self.product_service.snapshot
+            availability = snapshot.derived('availability', Availability) if self.availability_enabled else None
             if not relevant_products:
-                relevant_products = sorted(all_products, key=lambda x: x.get('rating', 0), reverse=True)[:10]
-            
-            # Score products based on preferences and browsing history
-            scored_products = []
-            
-            for product in relevant_products:
-                score = 5.0  # Base score
-                explanation_parts = []
-                
-                # Score based on user preferences
-                if user_preferences.get('categories') and product['category'] in user_preferences['categories']:
-                    score += 2.0
-                    explanation_parts.append(f"matches your preferred {product['category']} category")
-                
-                if user_preferences.get('brands') and product.get('brand') in user_preferences['brands']:
-                    score += 1.5
-                    explanation_parts.append(f"from your preferred brand {product.get('brand')}")
-                
-                # Price preference matching
-                if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
-                    price = product['price']
-                    price_match = False
-                    if user_preferences['priceRange'] == 'under-50' and price < 50:
-                        price_match = True
-                    elif user_preferences['priceRange'] == '50-100' and 50 <= price <= 100:
-                        price_match = True
-                    elif user_preferences['priceRange'] == '100-200' and 100 <= price <= 200:
-                        price_match = True
-                    elif user_preferences['priceRange'] == 'over-200' and price > 200:
-                        price_match = True
-                    
-                    if price_match:
-                        score += 1.0
-                        explanation_parts.append("fits your budget range")
-                
-                # Boost score for similar products to browsed ones
-                browsed_categories = [p['category'] for p in browsed_products]
-                if product['category'] in browsed_categories:
-                    score += 1.5
-                    explanation_parts.append("similar to products you've browsed")
-                
-                # Boost high-rated products
-                rating = product.get('rating', 0)
-                if rating > 4.5:
-                    score += 1.0
-                    explanation_parts.append(f"highly rated ({rating}/5)")
-                elif rating > 4.0:
-                    score += 0.5
-                    explanation_parts.append(f"well-rated ({rating}/5)")
-                
-                # Create explanation
-                if explanation_parts:
-                    explanation = f"Recommended because it {', '.join(explanation_parts)}"
-                else:
-                    explanation = f"Popular {product['category']} product with good ratings"
-                
-                scored_products.append({
-                    "product": product,
-                    "score": min(score, 10.0),  # Cap at 10
-                    "explanation": explanation
-                })
+                in_stock = availability.available(all_products) if availability is not None else all_products
+                relevant_products = sorted(in_stock, key=lambda x: x.get('rating', 0), reverse=True)[:10]
             
-            # Sort by score and take top 5
-            scored_products.sort(key=lambda x: x['score'], reverse=True)
-            top_recommendations = scored_products[:5]
+            # Score products based on preferences and browsing history (low-stock products
+            # AVAILABILITY_LOW_STOCK_PENALTY lower) and take top 5
+            top_recommendations = snapshot.derived('fallback_scorer', FallbackScorer).top_k(
+                user_preferences, browsed_products, relevant_products, k=5,
+                demoted=availability.low_stock if availability is not None else None,
+                penalty=self.low_stock_penalty
+            )
             
             # Format for return
             recommendations = []
@@ -434,10 +1001,10 @@ Return valid JSON array with product_id, explanation, and score fields."""
                 "fallback": True,
                 "message": "Generated using intelligent fallback algorithm (LLM unavailable)"
             }
-            
+        
         except Exception as e:
-            # Ultimate fallback - just return top-rated products
-            top_products = sorted(all_products, key=lambda x: x.get('rating', 0), reverse=True)[:5]
+            # Ultimate fallback - just return top-rated products, in stock if that is known
+            top_products = sorted(all_products, key=lambda x: (Availability.is_available(x), x.get('rating', 0)), reverse=True)[:5]
             fallback_recommendations = []
             
             for i, product in enumerate(top_products):
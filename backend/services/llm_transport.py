@@ -0,0 +1,301 @@
+import asyncio
+import time
+import weakref
+from collections import Counter
+from config import config
+
+try:
+    import httpx
+except ImportError:  # openai builds that bundle the httpx2 fork instead
+    import httpx2 as httpx
+
+try:
+    import h2  # optional dependency; HTTP/2 needs it (pip install httpx[http2])
+except ImportError:
+    h2 = None
+
+class TransportStats:
+    """
+    Connection reuse and pool utilization counters shared by the sync and async transports
+    
+    A response's network stream identifies the connection it came over, so a
+    stream not seen before means a new connection was opened.
+    """
+    
+    def __init__(self, max_connections):
+        self.max_connections = max_connections
+        self.requests = 0
+        self.new_connections = 0
+        self.reused_connections = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.active = 0
+        self.peak_active = 0
+        self.http_versions = Counter()
+        self._streams = weakref.WeakSet()
+    
+    def started(self):
+        """
+        Count a request going out
+        """
+        self.requests += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+    
+    def finished(self):
+        """
+        Count a request whose response was closed, that failed or that was cancelled
+        """
+        self.active -= 1
+    
+    def record_response(self, response):
+        """
+        Count the response's connection as new or reused and note its HTTP version
+        """
+        self.http_versions[response.extensions.get('http_version', b'').decode() or 'unknown'] += 1
+        stream = response.extensions.get('network_stream')
+        if stream is None:
+            return
+        if stream in self._streams:
+            self.reused_connections += 1
+        else:
+            self._streams.add(stream)
+            self.new_connections += 1
+    
+    def snapshot(self):
+        """
+        Return the counters as a dict
+        """
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "reuse_ratio": round(self.reused_connections / self.requests, 3) if self.requests else None,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "active": self.active,
+            "peak_active": self.peak_active,
+            "pool_utilization": round(self.active / self.max_connections, 3),
+            "peak_pool_utilization": round(self.peak_active / self.max_connections, 3),
+            "http_versions": dict(self.http_versions)
+        }
+
+class CountingStream(httpx.SyncByteStream):
+    """
+    Response body that marks the request finished when it is closed
+    """
+    
+    def __init__(self, stream, stats):
+        self._stream = stream
+        self._stats = stats
+        self._closed = False
+    
+    def __iter__(self):
+        """
+        Yield the wrapped body's chunks
+        """
+        yield from self._stream
+    
+    def close(self):
+        """
+        Close the wrapped body and mark the request finished
+        """
+        try:
+            self._stream.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._stats.finished()
+
+class AsyncCountingStream(httpx.AsyncByteStream):
+    """
+    Async response body that marks the request finished when it is closed
+    """
+    
+    def __init__(self, stream, stats):
+        self._stream = stream
+        self._stats = stats
+        self._closed = False
+    
+    async def __aiter__(self):
+        """
+        Yield the wrapped body's chunks
+        """
+        async for chunk in self._stream:
+            yield chunk
+    
+    async def aclose(self):
+        """
+        Close the wrapped body and mark the request finished
+        """
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._stats.finished()
+
+class CountingTransport(httpx.BaseTransport):
+    """
+    HTTPTransport wrapper that feeds TransportStats
+    """
+    
+    def __init__(self, transport, stats):
+        self._transport = transport
+        self._stats = stats
+    
+    def handle_request(self, request):
+        """
+        Send a request through the wrapped transport, counting it
+        """
+        self._stats.started()
+        try:
+            response = self._transport.handle_request(request)
+        except Exception:
+            self._stats.errors += 1
+            self._stats.finished()
+            raise
+        except BaseException:
+            # Cancelled before the response arrived (the caller's timeout)
+            self._stats.cancelled += 1
+            self._stats.finished()
+            raise
+        self._stats.record_response(response)
+        response.stream = CountingStream(response.stream, self._stats)
+        return response
+    
+    def close(self):
+        """
+        Close the wrapped transport
+        """
+        self._transport.close()
+
+class AsyncCountingTransport(httpx.AsyncBaseTransport):
+    """
+    AsyncHTTPTransport wrapper that feeds TransportStats
+    """
+    
+    def __init__(self, transport, stats):
+        self._transport = transport
+        self._stats = stats
+    
+    async def handle_async_request(self, request):
+        """
+        Send a request through the wrapped transport, counting it
+        """
+        self._stats.started()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            self._stats.errors += 1
+            self._stats.finished()
+            raise
+        except BaseException:
+            # Cancelled before the response arrived (the caller's timeout)
+            self._stats.cancelled += 1
+            self._stats.finished()
+            raise
+        self._stats.record_response(response)
+        response.stream = AsyncCountingStream(response.stream, self._stats)
+        return response
+    
+    async def aclose(self):
+        """
+        Close the wrapped transport
+        """
+        await self._transport.aclose()
+
+class LLMTransport:
+    """
+    Pooled HTTP clients for the LLM provider
+    
+    Both OpenAI clients share one configuration: pool size and keep-alive
+    limits, HTTP/2 when the h2 package is installed, and separate connect,
+    read and pool timeouts. warm_up() opens connections before the first
+    request so its latency doesn't include TCP and TLS setup.
+    """
+    
+    def __init__(self, base_url=None):
+        """
+        Parameters:
+        - base_url (str): Provider API root (OPENAI_BASE_URL by default)
+        """
+        self.base_url = (base_url or config['OPENAI_BASE_URL']).rstrip('/')
+        self.limits = httpx.Limits(
+            max_connections=config['LLM_POOL_MAX_CONNECTIONS'],
+            max_keepalive_connections=config['LLM_POOL_MAX_KEEPALIVE'],
+            keepalive_expiry=config['LLM_KEEPALIVE_EXPIRY']
+        )
+        self.http2 = config['LLM_HTTP2']
+        if self.http2 and h2 is None:
+            print("LLM_HTTP2 is set but the h2 package isn't installed, using HTTP/1.1")
+            self.http2 = False
+        self.timeout = httpx.Timeout(
+            config['LLM_TIMEOUT'],
+            connect=config['LLM_CONNECT_TIMEOUT'],
+            read=config['LLM_READ_TIMEOUT'] or config['LLM_TIMEOUT'],
+            pool=config['LLM_POOL_TIMEOUT']
+        )
+        self.counters = TransportStats(config['LLM_POOL_MAX_CONNECTIONS'])
+        self.warmup = None
+        self.http_client = httpx.Client(
+            transport=CountingTransport(httpx.HTTPTransport(limits=self.limits, http2=self.http2), self.counters),
+            timeout=self.timeout
+        )
+        self.async_http_client = httpx.AsyncClient(
+            transport=AsyncCountingTransport(httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2), self.counters),
+            timeout=self.timeout
+        )
+    
+    async def warm_up(self, connections=None):
+        """
+        Open connections to the provider ahead of traffic
+        
+        Sends concurrent GET {base_url}/models requests, so each one opens its
+        own connection (a single one with HTTP/2), which then stays in the
+        keep-alive pool. Any HTTP status counts; only connection errors fail.
+        
+        Parameters:
+        - connections (int): Connections to open (LLM_WARMUP_CONNECTIONS by default)
+        
+        Returns:
+        - dict: Connections requested and opened, errors and elapsed time
+        """
+        connections = min(connections or config['LLM_WARMUP_CONNECTIONS'], self.limits.max_keepalive_connections or 0)
+        opened_before = self.counters.new_connections
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *[self.async_http_client.get(f"{self.base_url}/models") for _ in range(connections)],
+            return_exceptions=True
+        )
+        errors = [str(result) for result in results if isinstance(result, Exception)]
+        if errors:
+            print(f"LLM connection warm-up: {len(errors)} of {connections} failed: {errors[0]}")
+        self.warmup = {
+            "requested": connections,
+            "opened": self.counters.new_connections - opened_before,
+            "errors": len(errors),
+            "ms": round((time.perf_counter() - start) * 1000, 1)
+        }
+        return self.warmup
+    
+    async def aclose(self):
+        """
+        Close pooled connections
+        """
+        await self.async_http_client.aclose()
+        self.http_client.close()
+    
+    def stats(self):
+        """
+        Return the pool configuration, connection counters and last warm-up
+        """
+        stats = self.counters.snapshot()
+        stats.update({
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+            "keepalive_expiry": self.limits.keepalive_expiry,
+            "http2": self.http2,
+            "warmup": self.warmup
+        })
+        return stats
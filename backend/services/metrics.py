@@ -0,0 +1,241 @@
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from starlette.datastructures import MutableHeaders
+from config import config
+
+# Histogram buckets in seconds, from sub-millisecond CPU stages to slow LLM calls
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage milliseconds of the current request, set by the Server-Timing middleware
+request_timings = contextvars.ContextVar('request_timings', default=None)
+
+# Returned by stage() when nothing is recorded, so timing costs one attribute check
+NULL_TIMER = nullcontext()
+
+def format_labels(labels):
+    """
+    Render a label dict in Prometheus text format, e.g. {stage="llm"}
+    """
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"'
+        for key, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+def server_timing_header(timings):
+    """
+    Render stage milliseconds as a Server-Timing header value
+    """
+    return ', '.join(f"{name};dur={ms:.1f}" for name, ms in timings.items())
+
+class ServerTimingMiddleware:
+    """
+    Add each response's stage breakdown as a Server-Timing header
+    
+    A plain ASGI middleware, registered only with METRICS_TIMING_HEADER:
+    it collects the request's stage times in request_timings and adds them
+    to the response start message. Streamed responses only report the
+    stages finished before the headers were sent.
+    """
+    
+    def __init__(self, app):
+        """
+        Parameters:
+        - app (ASGI app): Wrapped application
+        """
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timings = {}
+        
+        async def timing_send(message):
+            if message["type"] == "http.response.start" and timings:
+                MutableHeaders(scope=message)["Server-Timing"] = server_timing_header(timings)
+            await send(message)
+        
+        token = request_timings.set(timings)
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            request_timings.reset(token)
+
+class StageTimer:
+    """
+    Context manager that records the time spent in one request stage
+    """
+    
+    __slots__ = ('metrics', 'name', 'start')
+    
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """
+    Request-stage histograms and counters, exposed in Prometheus text format
+    
+    With METRICS_ENABLED, stage() times a block into the
+    recommendation_stage_seconds histogram, and count() and count_tokens()
+    update counters. Gauges read from other services (cache hit ratios,
+    catalog size) come from collectors registered with add_collector(), which
+    only run when /metrics is scraped. With METRICS_TIMING_HEADER, stage
+    times of the current request are also collected for the Server-Timing
+    response header.
+    
+    When both are off, stage() returns a shared no-op context manager and the
+    counters return at once. Each API worker process keeps its own registry.
+    """
+    
+    def __init__(self, enabled=None, timing_header=None):
+        """
+        Parameters:
+        - enabled (bool): Record histograms and counters (METRICS_ENABLED by default)
+        - timing_header (bool): Collect per-request stage times (METRICS_TIMING_HEADER by default)
+        """
+        self.enabled = config['METRICS_ENABLED'] if enabled is None else enabled
+        self.timing_header = config['METRICS_TIMING_HEADER'] if timing_header is None else timing_header
+        self.active = self.enabled or self.timing_header
+        self._lock = threading.Lock()
+        self._stages = {}  # stage -> [bucket counts..., +Inf count, sum]
+        self._counters = {}  # (name, sorted label items) -> value
+        self._help = {
+            "recommendation_fallbacks_total": "Recommendations answered by the rule-based fallback, by cause",
+            "llm_tokens_total": "Tokens reported by the LLM provider, by kind"
+        }
+        self._collectors = []
+    
+    def stage(self, name):
+        """
+        Time a block as one request stage
+        
+        Parameters:
+        - name (str): Stage label, e.g. llm or parse
+        
+        Returns:
+        - context manager
+        """
+        if not self.active:
+            return NULL_TIMER
+        return StageTimer(self, name)
+    
+    def observe(self, name, seconds):
+        """
+        Record a stage duration measured elsewhere, e.g. in a CPU stage worker
+        """
+        if not self.active:
+            return
+        if self.enabled:
+            index = bisect_left(STAGE_BUCKETS, seconds)
+            with self._lock:
+                buckets = self._stages.get(name)
+                if buckets is None:
+                    buckets = self._stages[name] = [0] * (len(STAGE_BUCKETS) + 1) + [0.0]
+                buckets[index] += 1
+                buckets[-1] += seconds
+        timings = request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + seconds * 1000
+    
+    def count(self, name, amount=1, **labels):
+        """
+        Increment a counter
+        
+        Parameters:
+        - name (str): Counter name, ending in _total
+        - amount (float): Increment
+        - labels: Label values
+        """
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def count_fallback(self, cause, amount=1):
+        """
+        Count recommendations answered by the fallback
+        
+        Parameters:
+        - cause (str): credits, api_error, parse_error, timeout, llm_overload or cpu_overload
+        - amount (int): Recommendations affected, e.g. the users of a failed batch pack
+        """
+        self.count("recommendation_fallbacks_total", amount, cause=cause)
+    
+    def count_tokens(self, usage):
+        """
+        Count the prompt and completion tokens of a completion's usage, when reported
+        """
+        if not self.enabled or usage is None:
+            return
+        self.count("llm_tokens_total", getattr(usage, 'prompt_tokens', 0) or 0, kind="prompt")
+        self.count("llm_tokens_total", getattr(usage, 'completion_tokens', 0) or 0, kind="completion")
+    
+    def add_collector(self, collector):
+        """
+        Register a callable run at scrape time
+        
+        Parameters:
+        - collector (callable): Returns a list of (name, type, help, samples)
+          where samples is a list of (labels dict, value)
+        """
+        self._collectors.append(collector)
+    
+    def render(self):
+        """
+        Render every metric in Prometheus text exposition format
+        
+        Returns:
+        - str: Exposition text
+        """
+        lines = []
+        with self._lock:
+            stages = {name: list(buckets) for name, buckets in self._stages.items()}
+            counters = dict(self._counters)
+        
+        if stages:
+            lines.append("# HELP recommendation_stage_seconds Time spent in each recommendation request stage")
+            lines.append("# TYPE recommendation_stage_seconds histogram")
+            for name in sorted(stages):
+                buckets = stages[name]
+                cumulative = 0
+                for bound, count in zip(STAGE_BUCKETS + ('+Inf',), buckets):
+                    cumulative += count
+                    lines.append(f"recommendation_stage_seconds_bucket{format_labels({'stage': name, 'le': bound})} {cumulative}")
+                lines.append(f"recommendation_stage_seconds_sum{format_labels({'stage': name})} {buckets[-1]:.6f}")
+                lines.append(f"recommendation_stage_seconds_count{format_labels({'stage': name})} {cumulative}")
+        
+        by_name = {}
+        for (name, labels), value in counters.items():
+            by_name.setdefault(name, []).append((dict(labels), value))
+        for name in sorted(by_name):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(by_name[name], key=lambda sample: sorted(sample[0].items())):
+                lines.append(f"{name}{format_labels(labels)} {value}")
+        
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+# Shared by the services and the API
+metrics = Metrics()
@@ -1,28 +1,405 @@
+import bisect
+import hashlib
+import heapq
 import json
+import math
+import os
+import re
+import threading
+import time
+import weakref
+from types import MappingProxyType
+import numpy as np
 from config import config
+from services.catalog_store import (
+    CatalogStore, StoreIds, StoreIndex, StorePositions, StoreProducts, StoreProductsById
+)
 
-class ProductService:
+# Price range filters offered by the UI. Bounds are inclusive on both ends
+# for the middle ranges, so a $100 product sits in both 50-100 and 100-200.
+PRICE_RANGES = ('under-50', '50-100', '100-200', 'over-200')
+
+def price_in_range(price, price_range):
     """
-    Service to handle product data operations
+    Check whether a price falls inside one of the PRICE_RANGES
+    """
+    if price_range == 'under-50':
+        return price < 50
+    if price_range == '50-100':
+        return 50 <= price <= 100
+    if price_range == '100-200':
+        return 100 <= price <= 200
+    if price_range == 'over-200':
+        return price > 200
+    return False
+
+def price_range_mask(prices, price_range):
+    """
+    Vectorized price_in_range over a price column (missing prices are NaN)
+    """
+    if price_range == 'under-50':
+        return prices < 50
+    if price_range == '50-100':
+        return (prices >= 50) & (prices <= 100)
+    if price_range == '100-200':
+        return (prices >= 100) & (prices <= 200)
+    if price_range == 'over-200':
+        return prices > 200
+    return np.zeros(len(prices), dtype=bool)
+
+def matches_preferences(product, user_preferences):
+    """
+    Check a product against the category/brand and price preference filters
+    """
+    categories = user_preferences.get('categories')
+    brands = user_preferences.get('brands')
+    if categories or brands:
+        if product.get('category') not in (categories or ()) and product.get('brand') not in (brands or ()):
+            return False
+    price_range = user_preferences.get('priceRange')
+    if price_range and price_range != 'all':
+        return price_in_range(product['price'], price_range)
+    return True
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+def iter_json_array(text):
+    """
+    Decode a JSON array one element at a time
+    
+    json.loads holds the GIL for the whole document, which stalls request
+    threads for seconds on a large catalog. Decoding element by element is a
+    little slower overall but lets other threads run in between.
     """
+    decoder = json.JSONDecoder()
+    index = JSON_WHITESPACE.match(text, 0).end()
+    if text[index:index + 1] != '[':
+        raise ValueError("Catalog file must contain a JSON array")
+    index = JSON_WHITESPACE.match(text, index + 1).end()
+    if text[index:index + 1] == ']':
+        return
+    while True:
+        item, index = decoder.raw_decode(text, index)
+        yield item
+        index = JSON_WHITESPACE.match(text, index).end()
+        separator = text[index:index + 1]
+        if separator == ']':
+            if text[JSON_WHITESPACE.match(text, index + 1).end():]:
+                raise ValueError("Unexpected data after the catalog array")
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or ']' at character {index} of the catalog file")
+        index = JSON_WHITESPACE.match(text, index + 1).end()
+
+# Attribute indexes every snapshot exposes as <name>_index
+INDEX_NAMES = ('category', 'brand', 'subcategory', 'tag', 'price_range')
+
+# Fields every upserted product must carry; prompts and scoring rely on them
+REQUIRED_FIELDS = ('id', 'name', 'category', 'price')
+# Types an upserted product's fields must have when present
+STRING_FIELDS = ('id', 'name', 'category')
+NUMBER_FIELDS = ('price', 'rating')
+
+def invalid_fields(product):
+    """
+    Names of the fields an upserted product lacks or carries with the wrong type:
+    missing required fields, non-string IDs, names and categories, and prices
+    or ratings that aren't finite real numbers
+    """
+    invalid = [field for field in REQUIRED_FIELDS if field not in product]
+    invalid.extend(
+        field for field in STRING_FIELDS
+        if field in product and not isinstance(product[field], str)
+    )
+    invalid.extend(
+        field for field in NUMBER_FIELDS
+        if field in product and (
+            isinstance(product[field], bool) or not isinstance(product[field], (int, float))
+            or not math.isfinite(product[field])
+        )
+    )
+    return invalid
+
+def index_keys(product):
+    """
+    (index name, key) pairs a product is listed under in the attribute indexes
+    """
+    yield 'category', product.get('category')
+    yield 'brand', product.get('brand')
+    yield 'subcategory', product.get('subcategory')
+    for tag in product.get('tags', []):
+        yield 'tag', tag
+    price = product.get('price')
+    if price is not None:
+        for price_range in PRICE_RANGES:
+            if price_in_range(price, price_range):
+                yield 'price_range', price_range
+
+class CatalogSnapshot:
+    """
+    One immutable version of the product catalog and its lookup indexes
+    
+    Lookup indexes are built once when the catalog is loaded and exposed as
+    read-only mappings of attribute value -> frozenset of product IDs.
+    
+    When the catalog comes from a columnar catalog file (see
+    services/catalog_store.py) the same attributes are backed by the mapped
+    columns instead: product dicts are materialized on lookup and each index
+    value is built the first time it is used.
     
-    def __init__(self):
+    State derived from a catalog version (scorer columns, prompt fragments,
+    retrieval index) is attached with derived(), so it is swapped together
+    with the catalog it was built from.
+    """
+    
+    def __init__(self, products, catalog_version, store=None, base=None):
         """
-        Initialize the product service with data path from config
+        Build the indexes for a catalog
+        
+        Parameters:
+        - products (list): Product dicts, ignored when a store is given
+        - catalog_version (str): Version downstream caches key on
+        - store (CatalogStore): Memory-mapped columnar catalog
+        - base (tuple): (previous snapshot, replaced products, new products) to
+          update the previous snapshot's indexes instead of rebuilding them
         """
-        self.data_path = config['DATA_PATH']
-        self.products = self._load_products()
+        self.catalog_version = catalog_version
+        # Memory-mapped columnar catalog, when one is in use
+        self.store = store
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+        # (weak reference to the previous snapshot, IDs changed since it) for
+        # snapshots built from a delta, so derived state can be updated in place
+        self.delta_base = None
+        if base is not None:
+            previous, replaced, added = base
+            self.delta_base = (weakref.ref(previous), frozenset(p['id'] for p in replaced + added))
+        if store is not None:
+            self._build_store_indexes()
+        else:
+            self.products = products
+            self._build_indexes(base)
     
-    def _load_products(self):
+    def _build_indexes(self, base=None):
         """
-        Load products from the JSON data file
+        Build immutable lookup indexes over the loaded catalog
+        
+        With a base snapshot only the index entries of replaced and new
+        products are recomputed; frozensets of untouched keys are shared with
+        the previous snapshot and new entries are merged into the sorted columns.
         """
-        try:
-            with open(self.data_path, 'r') as file:
-                return json.load(file)
-        except Exception as e:
-            print(f"Error loading product data: {str(e)}")
-            return []
+        products_by_id = {}
+        positions = {}
+        by_key = {name: {} for name in INDEX_NAMES}
+        by_key['price_range'] = {price_range: [] for price_range in PRICE_RANGES}
+        top_rated = []
+        
+        for position, product in enumerate(self.products):
+            product_id = product['id']
+            if product_id in products_by_id:
+                continue  # first occurrence wins, as with the old linear scan
+            products_by_id[product_id] = product
+            positions[product_id] = position
+            
+            if base is None:
+                for name, key in index_keys(product):
+                    by_key[name].setdefault(key, []).append(product_id)
+            
+            if product.get('rating', 0) > 4.0:
+                top_rated.append(product_id)
+        
+        self.products_by_id = MappingProxyType(products_by_id)
+        self.positions = MappingProxyType(positions)
+        if base is None:
+            indexes = {name: {key: frozenset(ids) for key, ids in index.items()} for name, index in by_key.items()}
+        else:
+            indexes = self._updated_indexes(*base)
+        self.category_index = MappingProxyType(indexes['category'])
+        self.brand_index = MappingProxyType(indexes['brand'])
+        self.subcategory_index = MappingProxyType(indexes['subcategory'])
+        self.tag_index = MappingProxyType(indexes['tag'])
+        self.price_range_index = MappingProxyType(indexes['price_range'])
+        # Products rated above 4.0, in catalog order
+        self.top_rated_ids = tuple(top_rated)
+        # Every product ID in catalog order
+        self.ordered_ids = tuple(products_by_id)
+        
+        # Sorted (value, id) columns for range queries on price and rating
+        if base is None:
+            by_price = sorted((p['price'], p['id']) for p in products_by_id.values() if p.get('price') is not None)
+            by_rating = sorted((p.get('rating', 0), p['id']) for p in products_by_id.values())
+        else:
+            previous, replaced, added = base
+            gone = {p['id'] for p in replaced}
+            # The kept pairs are one sorted run, so this sort is a linear merge
+            by_price = [(price, pid) for price, pid in zip(previous._price_values, previous._price_ids) if pid not in gone]
+            by_price.extend(sorted((p['price'], p['id']) for p in added if p.get('price') is not None))
+            by_price.sort()
+            by_rating = [(rating, pid) for rating, pid in zip(previous._rating_values, previous._rating_ids) if pid not in gone]
+            by_rating.extend(sorted((p.get('rating', 0), p['id']) for p in added))
+            by_rating.sort()
+        self._price_values = [price for price, _ in by_price]
+        self._price_ids = [product_id for _, product_id in by_price]
+        self._rating_values = [rating for rating, _ in by_rating]
+        self._rating_ids = [product_id for _, product_id in by_rating]
+    
+    def _updated_indexes(self, previous, replaced, added):
+        """
+        Copy the previous snapshot's attribute indexes, recomputing only touched keys
+        """
+        indexes = {name: dict(getattr(previous, f"{name}_index")) for name in INDEX_NAMES}
+        changes = {}  # (index name, key) -> (IDs leaving, IDs joining)
+        for product in replaced:
+            for name, key in index_keys(product):
+                changes.setdefault((name, key), (set(), set()))[0].add(product['id'])
+        for product in added:
+            for name, key in index_keys(product):
+                changes.setdefault((name, key), (set(), set()))[1].add(product['id'])
+        
+        for (name, key), (leaving, joining) in changes.items():
+            ids = (indexes[name].get(key, frozenset()) - leaving) | joining
+            if ids or name == 'price_range':
+                indexes[name][key] = frozenset(ids)
+            else:
+                indexes[name].pop(key, None)
+        return indexes
+    
+    def _build_store_indexes(self):
+        """
+        Expose the memory-mapped columns through the same index attributes
+        """
+        store = self.store
+        self.products = StoreProducts(store)
+        self.products_by_id = StoreProductsById(store)
+        self.positions = StorePositions(store)
+        
+        rows_index = lambda column: StoreIndex(
+            store.strings[column],
+            lambda value: StoreIds(store, store.rows_matching(column, value))
+        )
+        self.category_index = rows_index('category')
+        self.brand_index = rows_index('brand')
+        self.subcategory_index = rows_index('subcategory')
+        self.tag_index = rows_index('tag')
+        self.price_range_index = StoreIndex(
+            PRICE_RANGES,
+            lambda price_range: StoreIds(store, np.flatnonzero(price_range_mask(store.prices, price_range)))
+        )
+        self.top_rated_ids = StoreIds(store, np.flatnonzero(store.ratings > 4.0))
+        self.ordered_ids = StoreIds(store, np.arange(len(store)))
+        
+        by_price = np.lexsort((store.ids, store.prices))
+        by_price = by_price[~np.isnan(store.prices[by_price])]
+        self._price_values = store.prices[by_price]
+        self._price_ids = StoreIds(store, by_price)
+        by_rating = np.lexsort((store.ids, store.ratings))
+        self._rating_values = store.ratings[by_rating]
+        self._rating_ids = StoreIds(store, by_rating)
+    
+    def apply_delta(self, upserts=(), deletes=()):
+        """
+        Build the next snapshot with products upserted and deleted
+        
+        Updated products keep their catalog position and new ones are appended.
+        A product both upserted and deleted is deleted. The new version is
+        derived from this version and the delta.
+        
+        Parameters:
+        - upserts (list): Full product dicts to add or replace
+        - deletes (list): Product IDs to remove
+        
+        Returns:
+        - CatalogSnapshot: The new snapshot; this one is left unchanged
+        """
+        if self.store is not None:
+            raise ValueError("Deltas can't be applied to a memory-mapped catalog; rebuild the catalog store instead")
+        upserts_by_id = {}
+        for product in upserts:
+            invalid = invalid_fields(product)
+            if invalid:
+                raise ValueError(f"Upserted product {product.get('id')!r} is missing or has invalid fields: {', '.join(invalid)}")
+            upserts_by_id[product['id']] = product
+        deleted = set(deletes)
+        
+        products = [
+            upserts_by_id.get(product_id, self.products_by_id[product_id])
+            for product_id in self.ordered_ids if product_id not in deleted
+        ]
+        products.extend(
+            product for product_id, product in upserts_by_id.items()
+            if product_id not in self.positions and product_id not in deleted
+        )
+        replaced = [self.products_by_id[pid] for pid in deleted | set(upserts_by_id) if pid in self.products_by_id]
+        added = [product for product_id, product in upserts_by_id.items() if product_id not in deleted]
+        
+        delta = json.dumps({"upserts": added, "deletes": sorted(deleted)}, sort_keys=True)
+        catalog_version = hashlib.sha1(f"{self.catalog_version}:{delta}".encode('utf-8')).hexdigest()[:12]
+        return CatalogSnapshot(products, catalog_version, base=(self, replaced, added))
+    
+    def derived(self, key, factory):
+        """
+        State built from this snapshot, created by factory(snapshot) on first use
+        
+        Parameters:
+        - key (hashable): Identifies the state, e.g. a name or the owning object
+        - factory (callable): Builds the state from the snapshot
+        """
+        value = self._derived.get(key)
+        if value is None:
+            with self._derived_lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = factory(self)
+                    self._derived[key] = value
+        return value
+    
+    def previous_derived(self, key):
+        """
+        The previous snapshot's state for key and the IDs changed since, if this
+        snapshot came from a delta and that state still exists; else (None, None)
+        """
+        if self.delta_base is None:
+            return None, None
+        previous_ref, changed_ids = self.delta_base
+        previous = previous_ref()
+        if previous is None or key not in previous._derived:
+            return None, None
+        return previous._derived[key], changed_ids
+    
+    def query_products(self, categories=None, brands=None, min_price=None, max_price=None, min_rating=None):
+        """
+        Find products matching catalog filters using the indexes
+        
+        Filters of different kinds are combined with AND; several categories or
+        brands match any of them.
+        
+        Parameters:
+        - categories (list): Allowed categories
+        - brands (list): Allowed brands
+        - min_price (float): Inclusive lower price bound
+        - max_price (float): Inclusive upper price bound
+        - min_rating (float): Inclusive lower rating bound
+        
+        Returns:
+        - list: Matching product IDs in catalog order
+        """
+        selections = []
+        if categories:
+            selections.append(set().union(*(self.category_index.get(c, ()) for c in categories)))
+        if brands:
+            selections.append(set().union(*(self.brand_index.get(b, ()) for b in brands)))
+        if min_price is not None or max_price is not None:
+            low = bisect.bisect_left(self._price_values, min_price) if min_price is not None else 0
+            high = bisect.bisect_right(self._price_values, max_price) if max_price is not None else len(self._price_values)
+            selections.append(set(self._price_ids[low:high]))
+        if min_rating is not None:
+            selections.append(set(self._rating_ids[bisect.bisect_left(self._rating_values, min_rating):]))
+        
+        if not selections:
+            return list(self.ordered_ids)
+        selections.sort(key=len)
+        matching = selections[0].intersection(*selections[1:])
+        return sorted(matching, key=self.positions.__getitem__)
     
     def get_all_products(self):
         """
@@ -34,13 +411,258 @@ class ProductService:
         """
         Get a specific product by ID
         """
-        for product in self.products:
-            if product['id'] == product_id:
-                return product
-        return None
+        return self.products_by_id.get(product_id)
+    
+    def top_rated_among(self, product_ids, k, demoted=None, penalty=0.0):
+        """
+        The k highest-rated of a set of product IDs, ties in catalog order
+        
+        Parameters:
+        - product_ids (iterable): Candidate product IDs, all in the catalog
+        - k (int): Number of IDs to return
+        - demoted (set or np.ndarray): Products ranked as if rated penalty lower,
+          e.g. low-stock products; IDs, or a boolean mask by row for a
+          memory-mapped catalog (see Availability.demoted)
+        - penalty (float): Rating points taken off demoted products
+        
+        Returns:
+        - list: Product IDs, best first
+        """
+        if self.store is not None:
+            rows = self.store.rows_of(list(product_ids))
+            rows = rows[rows >= 0]
+            ratings = self.store.ratings[rows]
+            if demoted is not None and penalty:
+                ratings = ratings - penalty * demoted[rows]
+            best = rows[np.lexsort((rows, -ratings))[:k]]
+            return [self.store.product_id(row) for row in best]
+        products_by_id = self.products_by_id
+        positions = self.positions
+        key = lambda pid: (-products_by_id[pid].get('rating', 0), positions[pid])
+        if not demoted or not penalty:
+            return heapq.nsmallest(k, product_ids, key=key)
+        # The best k overall are among the best k of either group, so only those
+        # are ranked again with the penalty
+        candidates = product_ids if isinstance(product_ids, (set, frozenset)) else set(product_ids)
+        demoted = demoted & candidates
+        if not demoted:
+            return heapq.nsmallest(k, candidates, key=key)
+        best = heapq.nsmallest(k, candidates - demoted, key=key) + heapq.nsmallest(k, demoted, key=key)
+        return heapq.nsmallest(k, best, key=lambda pid: (
+            (penalty if pid in demoted else 0) - products_by_id[pid].get('rating', 0), positions[pid]
+        ))
+    
+    def get_products_by_ids(self, product_ids):
+        """
+        Get products for a set of IDs, in catalog order
+        """
+        if self.store is not None:
+            rows = np.sort(self.store.rows_of(list(product_ids)))
+            return [self.store.product(row) for row in rows[rows >= 0]]
+        positions = self.positions
+        ordered = sorted((pid for pid in product_ids if pid in positions), key=positions.__getitem__)
+        return [self.products_by_id[pid] for pid in ordered]
     
     def get_products_by_category(self, category):
         """
         Get products filtered by category
         """
-        return [p for p in self.products if p['category'] == category]
+        return self.get_products_by_ids(self.category_index.get(category, ()))
+
+class ProductService:
+    """
+    Service to handle product data operations
+    
+    The catalog lives in an immutable CatalogSnapshot. A reload builds a whole
+    new snapshot (and any state registered with on_reload) off the request
+    path, then swaps it in with a single reference assignment, so readers see
+    either the old catalog or the new one, never a half-built mix. Attributes
+    and methods not defined here (indexes, query_products, get_product_by_id,
+    ...) are read from the current snapshot; code making several lookups for
+    one request should take `snapshot` once and use it throughout.
+    
+    The catalog is read from DATA_PATH, or memory-mapped from
+    CATALOG_STORE_PATH when that is set.
+    """
+    
+    def __init__(self, data_path=None, products=None, store_path=None):
+        """
+        Initialize the product service with data path from config
+        
+        Parameters:
+        - data_path (str): Catalog file to load, defaults to DATA_PATH
+        - products (list): Already-loaded catalog, used instead of reading a file
+        - store_path (str): Columnar catalog file, defaults to CATALOG_STORE_PATH
+        """
+        self.data_path = data_path or config['DATA_PATH']
+        self.store_path = config['CATALOG_STORE_PATH'] if store_path is None else store_path
+        self.last_reload = None
+        self._reload_lock = threading.Lock()
+        self._reload_hooks = []
+        self._watcher = None
+        self._watch_stop = threading.Event()
+        
+        if products is not None:
+            # Content hash of the catalog; downstream caches key on it
+            catalog_version = hashlib.sha1(json.dumps(products, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+            self.snapshot = CatalogSnapshot(products, catalog_version)
+        else:
+            self.snapshot = self._read_snapshot(reload=False)
+        self._source_signature = self._stat_source()
+    
+    def __getattr__(self, name):
+        # Only reached for names not set on the service itself
+        if name == 'snapshot':
+            raise AttributeError(name)
+        return getattr(self.snapshot, name)
+    
+    def _read_snapshot(self, reload):
+        """
+        Load the catalog source into a new snapshot
+        
+        At startup a broken source logs an error and yields an empty catalog,
+        or DATA_PATH when the store can't be opened. On reload the error is
+        raised so the current snapshot stays in place, and the JSON is decoded
+        incrementally so requests keep being served meanwhile.
+        """
+        if self.store_path:
+            try:
+                store = CatalogStore(self.store_path, row_cache_size=config['CATALOG_ROW_CACHE'])
+                return CatalogSnapshot(None, store.catalog_version, store=store)
+            except (OSError, ValueError) as e:
+                if reload:
+                    raise
+                print(f"Error opening catalog store {self.store_path}, loading {self.data_path} instead: {str(e)}")
+        
+        try:
+            with open(self.data_path, 'rb') as file:
+                raw = file.read()
+            products = list(iter_json_array(raw.decode('utf-8'))) if reload else json.loads(raw)
+            # Content hash of the catalog file; downstream caches key on it
+            return CatalogSnapshot(products, hashlib.sha1(raw).hexdigest()[:12])
+        except Exception as e:
+            if reload:
+                raise
+            print(f"Error loading product data: {str(e)}")
+            return CatalogSnapshot([], "empty")
+    
+    def on_reload(self, hook):
+        """
+        Register hook(snapshot), run on every new snapshot before it is swapped in
+        
+        Hooks build per-version state (see CatalogSnapshot.derived) so requests
+        never pay for it; a hook that raises aborts the reload.
+        """
+        self._reload_hooks.append(hook)
+    
+    def reload(self):
+        """
+        Re-read the catalog source and swap in the new snapshot if its version changed
+        
+        Returns:
+        - dict: Reload summary (versions, product count, duration, whether it changed)
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            self._source_signature = self._stat_source()
+            snapshot = self._read_snapshot(reload=True)
+            if snapshot.catalog_version == self.snapshot.catalog_version:
+                return self._reload_summary(self.snapshot, self.snapshot, start, changed=False)
+            return self._swap(snapshot, start)
+    
+    def apply_delta(self, upserts=(), deletes=()):
+        """
+        Apply upserts and deletes to the current catalog and swap in the result
+        
+        The delta only changes this process's in-memory catalog; the next
+        change to the source file replaces it.
+        
+        Returns:
+        - dict: Reload summary (versions, product count, duration)
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            return self._swap(self.snapshot.apply_delta(upserts, deletes), start)
+    
+    def update_inventory(self, levels):
+        """
+        Set the stock level of products, as a delta of the current catalog
+        
+        Parameters:
+        - levels (dict): Product ID -> units in stock
+        
+        Returns:
+        - dict: Reload summary (versions, product count, duration)
+        """
+        with self._reload_lock:
+            start = time.perf_counter()
+            snapshot = self.snapshot
+            unknown = [product_id for product_id in levels if product_id not in snapshot.products_by_id]
+            if unknown:
+                raise ValueError(f"Unknown product IDs: {', '.join(map(str, unknown[:10]))}")
+            upserts = [dict(snapshot.products_by_id[product_id], inventory=int(level)) for product_id, level in levels.items()]
+            return self._swap(snapshot.apply_delta(upserts), start)
+    
+    def start_watcher(self, interval):
+        """
+        Poll the catalog source every interval seconds and reload it when it changes
+        """
+        if self._watcher is not None:
+            return
+        self._watch_stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="catalog-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watcher(self):
+        """
+        Stop the polling thread started by start_watcher
+        """
+        if self._watcher is None:
+            return
+        self._watch_stop.set()
+        self._watcher.join()
+        self._watcher = None
+    
+    def _watch(self, interval):
+        while not self._watch_stop.wait(interval):
+            if self._stat_source() == self._source_signature:
+                continue
+            try:
+                self.reload()
+            except Exception as e:
+                # Typically a file caught mid-write; the next change retries
+                print(f"Error reloading catalog: {str(e)}")
+    
+    def _stat_source(self):
+        """
+        (mtime, size, inode) of the catalog source, or None if it can't be read
+        """
+        try:
+            stat = os.stat(self.store_path or self.data_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _swap(self, snapshot, start):
+        """
+        Prepare per-version state for a snapshot and make it the current one
+        """
+        for hook in self._reload_hooks:
+            hook(snapshot)
+        previous = self.snapshot
+        self.snapshot = snapshot
+        summary = self._reload_summary(previous, snapshot, start, changed=True)
+        self.last_reload = summary
+        print(f"Catalog reloaded: {previous.catalog_version} -> {snapshot.catalog_version} "
+              f"({summary['products']} products, {summary['reload_ms']} ms)")
+        return summary
+    
+    def _reload_summary(self, previous, snapshot, start, changed):
+        return {
+            "catalog_version": snapshot.catalog_version,
+            "previous_version": previous.catalog_version,
+            "products": len(snapshot.ordered_ids),
+            "changed": changed,
+            "reload_ms": round((time.perf_counter() - start) * 1000, 1),
+            "reloaded_at": time.time()
+        }
@@ -0,0 +1,237 @@
+import math
+import re
+import time
+from collections import namedtuple
+from config import config
+
+try:
+    import tiktoken
+except ImportError:  # optional dependency; fall back to the estimator
+    tiktoken = None
+
+RECOMMENDATION_PROMPT_HEADER = """You are an expert e-commerce product recommendation assistant. Your task is to analyze user preferences and browsing history to recommend the best 5 products from our catalog.
+
+IMPORTANT: Respond with valid JSON only, no other text. Use this exact format:
+[
+  {
+    "product_id": "prod001",
+    "explanation": "This product matches your preferences because...",
+    "score": 8.5
+  }
+]
+
+**CRITICAL INSTRUCTIONS:**
+1.  Respond ONLY with a valid JSON object in the specified format. Do not include any other text or explanations outside the JSON structure.
+2.  Provide a unique, insightful reason for each recommendation.
+3.  DO NOT recommend any products that are already in the user's browsing history.
+
+USER PREFERENCES:"""
+
+RECOMMENDATION_PROMPT_TASK = """\n\nTASK:
+1. Analyze the user's preferences and browsing patterns
+2. Recommend exactly 5 products that best match their interests
+3. For each recommendation, explain WHY it fits their preferences/behavior
+4. Rate each recommendation 1-10 based on relevance
+5. Consider variety - don't recommend only from one category unless they specifically prefer it
+
+Return valid JSON array with product_id, explanation, and score fields."""
+
+PRICE_LABELS = {
+    'under-50': 'Under $50',
+    '50-100': '$50-$100',
+    '100-200': '$100-$200',
+    'over-200': 'Over $200'
+}
+
+# Rough BPE approximation: short letter runs, digit groups and single symbols
+ESTIMATE_PATTERN = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]")
+
+# filter_ms is the candidate filtering time, filled in by LLMService when it filters;
+# product_ids are the IDs of the products included, in prompt order
+PromptResult = namedtuple(
+    'PromptResult',
+    ['prompt', 'tokens', 'products', 'candidates', 'build_ms', 'filter_ms', 'product_ids'],
+    defaults=(0.0, ())
+)
+
+def render_product_line(product):
+    """
+    Render one catalog line of a prompt
+    """
+    features_str = ', '.join(product.get('features', [])[:3])
+    return f"\n- ID: {product['id']} | {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')} | Features: {features_str}"
+
+def render_preferences(user_preferences):
+    """
+    Render the user preference lines of a prompt
+    """
+    lines = []
+    if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
+        lines.append(f"\n- Budget: {PRICE_LABELS.get(user_preferences['priceRange'], 'Any')}")
+    if user_preferences.get('categories'):
+        lines.append(f"\n- Preferred Categories: {', '.join(user_preferences['categories'])}")
+    if user_preferences.get('brands'):
+        lines.append(f"\n- Preferred Brands: {', '.join(user_preferences['brands'])}")
+    return ''.join(lines)
+
+def render_browsing_history(browsed_products):
+    """
+    Render the browsing history lines of a prompt (last 5 products)
+    """
+    if not browsed_products:
+        return "\n- No browsing history yet"
+    return ''.join(
+        f"\n- {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')}"
+        for product in browsed_products[-5:]  # Last 5 browsed products
+    )
+
+class TokenCounter:
+    """
+    Counts prompt tokens with tiktoken when installed, else a calibrated estimate
+    
+    The estimator splits text into short letter runs, digit groups and
+    symbols, which tracks BPE token counts for catalog-style text closely;
+    PROMPT_TOKEN_SCALE corrects any remaining bias for a given model.
+    """
+    
+    def __init__(self, model_name=None, scale=None):
+        self.scale = config['PROMPT_TOKEN_SCALE'] if scale is None else scale
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model_name or config['MODEL_NAME'])
+            except KeyError:
+                self.encoding = tiktoken.get_encoding('cl100k_base')
+    
+    def count(self, text):
+        """
+        Number of tokens in a piece of text
+        """
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return int(math.ceil(len(ESTIMATE_PATTERN.findall(text)) * self.scale))
+
+class PromptBuilder:
+    """
+    Token-budgeted prompt assembly from pre-rendered fragments
+    
+    Every product's catalog line is rendered once per catalog snapshot and
+    cached with its token count. A prompt is assembled by joining cached
+    fragments until the token budget, derived from the model's context size
+    minus MAX_TOKENS for the completion, is used up.
+    """
+    
+    def __init__(self, product_service, token_counter=None, token_budget=None):
+        """
+        Parameters:
+        - product_service (ProductService): Catalog whose lines are pre-rendered
+        - token_counter (TokenCounter): Token counter, defaults to one for MODEL_NAME
+        - token_budget (int): Prompt token budget, defaults to the configured budget
+        """
+        self.product_service = product_service
+        self.counter = token_counter or TokenCounter()
+        self.token_budget = token_budget or self.default_budget()
+        self._static_tokens = self.counter.count(RECOMMENDATION_PROMPT_HEADER) + self.counter.count(RECOMMENDATION_PROMPT_TASK)
+        self.fragments()
+    
+    @staticmethod
+    def default_budget():
+        """
+        Prompt token budget: PROMPT_TOKEN_BUDGET if set, else the context window
+        minus the completion tokens and a reserve for the system message
+        """
+        derived = config['MODEL_CONTEXT_TOKENS'] - config['MAX_TOKENS'] - config['PROMPT_RESERVED_TOKENS']
+        if config['PROMPT_TOKEN_BUDGET']:
+            return min(config['PROMPT_TOKEN_BUDGET'], derived)
+        return derived
+    
+    def fragments(self, snapshot=None):
+        """
+        Fragment cache (product ID -> (line, tokens)) for a catalog snapshot
+        
+        Built once per snapshot, defaulting to the current one, and swapped
+        together with it on a catalog reload.
+        """
+        snapshot = snapshot or self.product_service.snapshot
+        return snapshot.derived(self, self._render_fragments)
+    
+    def _render_fragments(self, snapshot):
+        """
+        Pre-render every product line of a snapshot
+        
+        A memory-mapped catalog is not pre-rendered, since that would decode
+        every product at startup; its lines are rendered and cached on first use.
+        A snapshot built from a delta reuses the previous snapshot's lines.
+        """
+        if snapshot.store is not None:
+            return {}
+        
+        # After a delta only the changed products need rendering
+        previous, changed_ids = snapshot.previous_derived(self)
+        if previous is not None:
+            fragments = {pid: fragment for pid, fragment in previous.items() if pid not in changed_ids}
+            products = [snapshot.products_by_id[pid] for pid in changed_ids if pid in snapshot.products_by_id]
+        else:
+            fragments = {}
+            products = snapshot.products_by_id.values()
+        for product in products:
+            line = render_product_line(product)
+            fragments[product['id']] = (line, self.counter.count(line))
+        return fragments
+    
+    def fragment(self, product, fragments=None):
+        """
+        Cached (line, tokens) for a product, rendering it on a miss
+        """
+        if fragments is None:
+            fragments = self.fragments()
+        cached = fragments.get(product['id'])
+        if cached is None:
+            line = render_product_line(product)
+            cached = (line, self.counter.count(line))
+            if self.product_service.store is not None:
+                fragments[product['id']] = cached
+        return cached
+    
+    def build(self, user_preferences, browsed_products, relevant_products):
+        """
+        Assemble a recommendation prompt within the token budget
+        
+        Candidates are taken in order until the next one would exceed the budget.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - relevant_products (list): Ranked candidate products
+        
+        Returns:
+        - PromptResult: Prompt text, its token count, products included,
+          candidates offered, build time in milliseconds and the included IDs
+        """
+        start = time.perf_counter()
+        fragments = self.fragments()
+        
+        preferences = render_preferences(user_preferences)
+        history = "\n\nBROWSING HISTORY (products they showed interest in):" + render_browsing_history(browsed_products)
+        catalog_header = f"\n\nAVAILABLE PRODUCTS ({len(relevant_products)} products):"
+        used = (self._static_tokens + self.counter.count(preferences)
+                + self.counter.count(history) + self.counter.count(catalog_header))
+        
+        lines = []
+        product_ids = []
+        for product in relevant_products:
+            line, tokens = self.fragment(product, fragments)
+            if used + tokens > self.token_budget:
+                break
+            lines.append(line)
+            product_ids.append(product['id'])
+            used += tokens
+        
+        if len(lines) < len(relevant_products):
+            catalog_header = f"\n\nAVAILABLE PRODUCTS ({len(lines)} products):"
+        
+        prompt = ''.join([RECOMMENDATION_PROMPT_HEADER, preferences, history, catalog_header] + lines + [RECOMMENDATION_PROMPT_TASK])
+        return PromptResult(
+            prompt, used, len(lines), len(relevant_products), (time.perf_counter() - start) * 1000,
+            product_ids=tuple(product_ids)
+        )
@@ -0,0 +1,158 @@
+import asyncio
+import time
+from collections import OrderedDict
+from config import config
+
+def ended_in_fallback(result):
+    """
+    Whether a refined result is no better than the fallback: marked as the
+    fallback, carrying an error (such as a parse error) or without
+    recommendations
+    """
+    return bool(result.get("fallback") or result.get("error") or not result.get("recommendations"))
+
+class RefinementStore:
+    """
+    Background LLM refinements of tiered recommendation responses
+    
+    A tiered response answers at once from the heuristic scorer and names a
+    refinement token; the LLM result for the same request is computed in the
+    background and kept here under that token. Tokens are the request's cache
+    key, so identical profiles share one refinement (and one LLM call) for as
+    long as it is kept.
+    
+    A refinement that ended in the fallback (the LLM failed, the request was
+    shed under load or the answer couldn't be parsed) is not a refined result: it is reported as status
+    fallback and started again once retry_seconds have passed since it
+    finished, like a failed one is started again at once.
+    
+    Entries are kept for ttl_seconds after they are started, at most
+    max_entries of them; the oldest are dropped first. A dropped refinement
+    that is still running finishes, it just can't be looked up anymore.
+    """
+    
+    def __init__(self, max_entries=None, ttl_seconds=None, retry_seconds=None):
+        """
+        Parameters:
+        - max_entries (int): Refinements kept (REFINEMENT_MAX_ENTRIES by default)
+        - ttl_seconds (float): Seconds a refinement is kept (REFINEMENT_TTL_SECONDS by default)
+        - retry_seconds (float): Seconds before a refinement that ended in the fallback is
+          started again (REFINEMENT_RETRY_SECONDS by default)
+        """
+        self.max_entries = config['REFINEMENT_MAX_ENTRIES'] if max_entries is None else max_entries
+        self.ttl_seconds = config['REFINEMENT_TTL_SECONDS'] if ttl_seconds is None else ttl_seconds
+        self.retry_seconds = config['REFINEMENT_RETRY_SECONDS'] if retry_seconds is None else retry_seconds
+        self._entries = OrderedDict()  # token -> [started_at, task, finished_at]
+        self.started = 0
+        self.reused = 0
+        self.failed = 0
+        self.fallbacks = 0
+        self.retries = 0
+        self.evictions = 0
+    
+    def start(self, token, factory):
+        """
+        Start the refinement for a token unless one is already kept (a failed
+        one is restarted, and one that ended in the fallback once retry_after()
+        is 0)
+        
+        Parameters:
+        - token (str): Refinement token
+        - factory (callable): Returns the coroutine computing the refined result
+        
+        Returns:
+        - bool: True if a new refinement was started
+        """
+        status = self.result(token)[0]
+        if status == "pending" or status == "done" or (status == "fallback" and self.retry_after(token) > 0):
+            self.reused += 1
+            return False
+        if status != "unknown":
+            self.retries += 1
+        entry = [time.monotonic(), asyncio.ensure_future(factory()), None]
+        entry[1].add_done_callback(lambda task: self._finished(entry))
+        self._entries.pop(token, None)
+        self._entries[token] = entry
+        self.started += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return True
+    
+    def result(self, token):
+        """
+        The refined result of a finished refinement
+        
+        Returns:
+        - tuple: (status, result) where status is pending, done, fallback,
+          failed or unknown, and result is the recommendations dict when done
+          or fallback
+        """
+        entry = self._get(token)
+        if entry is None:
+            return "unknown", None
+        task = entry[1]
+        if not task.done():
+            return "pending", None
+        if task.cancelled() or task.exception() is not None:
+            return "failed", None
+        if ended_in_fallback(task.result()):
+            return "fallback", task.result()
+        return "done", task.result()
+    
+    def retry_after(self, token):
+        """
+        Seconds until a refinement that ended in the fallback may be started again
+        """
+        entry = self._get(token)
+        if entry is None or entry[2] is None:
+            return 0.0
+        return max(0.0, entry[2] + self.retry_seconds - time.monotonic())
+    
+    async def wait(self, token, timeout):
+        """
+        Wait up to timeout seconds for a refinement, then return result(token)
+        """
+        entry = self._get(token)
+        task = None if entry is None else entry[1]
+        if task is not None and not task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout)
+            except Exception:
+                pass
+        return self.result(token)
+    
+    def _get(self, token):
+        """
+        The entry of a kept refinement, dropping it if it has expired
+        """
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl_seconds:
+            del self._entries[token]
+            return None
+        return entry
+    
+    def _finished(self, entry):
+        task = entry[1]
+        if task.cancelled() or task.exception() is not None:
+            self.failed += 1
+        elif ended_in_fallback(task.result()):
+            entry[2] = time.monotonic()
+            self.fallbacks += 1
+    
+    def stats(self):
+        """
+        Return refinement counters
+        """
+        return {
+            "entries": len(self._entries),
+            "pending": sum(1 for _, task, _ in self._entries.values() if not task.done()),
+            "started": self.started,
+            "reused": self.reused,
+            "failed": self.failed,
+            "fallbacks": self.fallbacks,
+            "retries": self.retries,
+            "evictions": self.evictions
+        }
@@ -0,0 +1,172 @@
+import gzip
+import json
+import random
+import threading
+import time
+from config import config
+
+# Query parameters kept per endpoint; anything else (and every header) is dropped
+PRODUCTS_PARAMS = ('category', 'brand', 'min_price', 'max_price', 'min_rating', 'fields', 'limit', 'offset', 'cursor')
+RECOMMENDATION_PARAMS = ('tiered', 'compact')
+PREFERENCE_FIELDS = ('priceRange', 'categories', 'brands')
+
+def open_log(path, mode):
+    """
+    Open a request log, gzip-compressed when the path ends in .gz
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+def read_request_log(path):
+    """
+    Read the entries of a request log
+    
+    Returns:
+    - list: Entries in recorded order, each {"t", "e", "q"} plus "p", "h" (and
+      "s") for recommendation and stream requests, or "r" for batch requests
+    """
+    with open_log(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+class RequestRecorder:
+    """
+    Records sanitized /api/products and recommendation requests to a log
+    
+    Each request becomes one compact JSON line:
+    - t: arrival time (epoch seconds)
+    - e: endpoint, "products", "recommendations" (/api/recommendations),
+      "stream" (/api/recommendations/stream) or "batch"
+      (/api/recommendations/batch)
+    - q: the endpoint's known query parameters that were set
+    - p, h: preferences and browsing history of a recommendation request
+    - s: 1 when the request sent a session_id; h is then the session's recent
+      window the server resolved, not something the client sent (the session
+      ID itself is not kept)
+    - r: the {"p", "h", "s"} of each request in a batch
+    
+    Nothing else is kept: no headers, client addresses or unknown fields, and
+    only the preference fields the API reads. Lines are buffered and appended
+    to the file in batches of flush_every (gzip-compressed for a .gz path).
+    benchmarks/replay.py replays the log against a local server.
+    """
+    
+    def __init__(self, path=None, sample_rate=None, flush_every=100):
+        """
+        Parameters:
+        - path (str): Log file, recording is off when empty (REQUEST_LOG_PATH by default)
+        - sample_rate (float): Share of requests recorded (REQUEST_LOG_SAMPLE_RATE by default)
+        - flush_every (int): Buffered lines written at once
+        """
+        self.path = config['REQUEST_LOG_PATH'] if path is None else path
+        self.sample_rate = config['REQUEST_LOG_SAMPLE_RATE'] if sample_rate is None else sample_rate
+        self.flush_every = flush_every
+        self.enabled = bool(self.path) and self.sample_rate > 0
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.recorded = 0
+        self.written = 0
+        self.errors = 0
+    
+    def record_products(self, query_params):
+        """
+        Record a products request from its query parameters
+        """
+        if not self._sampled():
+            return
+        self._record({"e": "products", "q": self._known(query_params, PRODUCTS_PARAMS)})
+    
+    def record_recommendations(self, user_preferences, browsing_history, query_params=None,
+                               endpoint="recommendations", session=False):
+        """
+        Record a recommendation request
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsing_history (list): List of product IDs the user has viewed
+        - query_params (mapping): Request query parameters
+        - endpoint (str): "recommendations" or "stream"
+        - session (bool): Whether the history came from a session
+        """
+        if not self._sampled():
+            return
+        entry = {"e": endpoint, "q": self._known(query_params or {}, RECOMMENDATION_PARAMS)}
+        entry.update(self._recommendation(user_preferences, browsing_history, session))
+        self._record(entry)
+    
+    def record_batch(self, items):
+        """
+        Record a batch recommendation request
+        
+        Parameters:
+        - items (list): (user_preferences, browsing_history, session) of each request
+        """
+        if not self._sampled():
+            return
+        self._record({
+            "e": "batch",
+            "q": {},
+            "r": [self._recommendation(*item) for item in items]
+        })
+    
+    def flush(self):
+        """
+        Append the buffered lines to the log
+        """
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if not lines:
+            return
+        with self._write_lock:
+            try:
+                with open_log(self.path, 'a') as file:
+                    file.write(''.join(lines))
+                self.written += len(lines)
+            except OSError as e:
+                self.errors += 1
+                print(f"Error writing request log {self.path}: {str(e)}")
+    
+    def stats(self):
+        """
+        Return recording counters
+        """
+        return {
+            "enabled": self.enabled,
+            "path": self.path or None,
+            "sample_rate": self.sample_rate,
+            "recorded": self.recorded,
+            "written": self.written,
+            "buffered": len(self._buffer),
+            "errors": self.errors
+        }
+    
+    def _sampled(self):
+        return self.enabled and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+    
+    def _recommendation(self, user_preferences, browsing_history, session):
+        fields = {
+            "p": {field: user_preferences.get(field) for field in PREFERENCE_FIELDS if user_preferences.get(field)},
+            "h": [str(product_id) for product_id in browsing_history]
+        }
+        if session:
+            fields["s"] = 1
+        return fields
+    
+    def _known(self, query_params, names):
+        known = {}
+        for name in names:
+            value = query_params.get(name)
+            if value not in (None, '', False):
+                known[name] = 'true' if value is True else str(value)
+        return known
+    
+    def _record(self, entry):
+        entry["t"] = round(time.time(), 3)
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._buffer.append(line)
+            self.recorded += 1
+            full = len(self._buffer) >= self.flush_every
+        if full:
+            self.flush()
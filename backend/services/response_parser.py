@@ -0,0 +1,258 @@
+import json
+import re
+from collections import namedtuple
+from config import config
+from services.stream_parser import IncrementalArrayParser
+
+# Model families that accept a JSON schema response_format (provider prefixes
+# such as "openai/" are ignored)
+STRUCTURED_OUTPUT_MODELS = ('gpt-4o', 'gpt-4.1', 'gpt-5', 'o1', 'o3', 'o4')
+
+RECOMMENDATION_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "recommendations",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "recommendations": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "product_id": {"type": "string"},
+                            "explanation": {"type": "string"},
+                            "score": {"type": "number"}
+                        },
+                        "required": ["product_id", "explanation", "score"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["recommendations"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Batch answers are an object keyed by user, so plain JSON mode is enough
+BATCH_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Balanced arrays tried before falling back to the repair heuristics
+MAX_ARRAY_CANDIDATES = 8
+
+ParseResult = namedtuple('ParseResult', ['items', 'path', 'error'])
+
+def supports_structured_output(model_name, setting=None):
+    """
+    Whether completions for model_name should request structured output
+    
+    Parameters:
+    - model_name (str): Configured MODEL_NAME
+    - setting (str): auto, on or off (STRUCTURED_OUTPUT by default)
+    """
+    setting = (setting or config['STRUCTURED_OUTPUT']).lower()
+    if setting in ('on', 'true'):
+        return True
+    if setting != 'auto':
+        return False
+    return model_name.rsplit('/', 1)[-1].startswith(STRUCTURED_OUTPUT_MODELS)
+
+# Only brackets, quotes and backslashes affect array boundaries
+SCAN_PATTERN = re.compile(r'[\[\]"\\]')
+# Only braces, quotes and backslashes affect object boundaries
+OBJECT_SCAN_PATTERN = re.compile(r'[{}"\\]')
+
+def iter_array_spans(text, limit=MAX_ARRAY_CANDIDATES):
+    """
+    Yield (start, end) of top-level balanced [...] spans in a single pass
+    
+    String and escape state is tracked inside an array, so brackets within
+    explanations don't end it; prose outside arrays is skipped without
+    interpreting quotes. Only structural characters are visited, and work is
+    linear in the length of the text.
+    """
+    return iter_spans(text, SCAN_PATTERN, '[', ']', limit)
+
+def iter_object_spans(text, limit=MAX_ARRAY_CANDIDATES):
+    """
+    Yield (start, end) of top-level balanced {...} spans, like iter_array_spans
+    """
+    return iter_spans(text, OBJECT_SCAN_PATTERN, '{', '}', limit)
+
+def iter_spans(text, pattern, opening, closing, limit):
+    """
+    Yield (start, end) of top-level balanced spans between opening and closing
+    characters; pattern matches those two, quotes and backslashes
+    """
+    depth = 0
+    start = 0
+    in_string = False
+    skip_to = 0  # index after an escaped character
+    found = 0
+    for match in pattern.finditer(text):
+        index = match.start()
+        if index < skip_to:
+            continue
+        char = match.group()
+        if depth == 0:
+            if char == opening:
+                depth = 1
+                start = index
+        elif in_string:
+            if char == '\\':
+                skip_to = index + 2
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == opening:
+            depth += 1
+        elif char == closing:
+            depth -= 1
+            if depth == 0:
+                yield start, index + 1
+                found += 1
+                if found >= limit:
+                    return
+
+def repair_json(json_str):
+    """
+    Swap single quotes for double quotes and drop trailing commas
+    """
+    json_str = json_str.replace("'", '"')
+    json_str = re.sub(r',\s*}', '}', json_str)
+    return re.sub(r',\s*]', ']', json_str)
+
+def parse_recommendation_items(llm_response):
+    """
+    Extract the list of recommendation items from an LLM response
+    
+    Tries, in order:
+    - structured: the whole response is JSON, an array or a structured-output
+      object with a "recommendations" array
+    - scan: the first balanced array in the text that decodes to a list of objects
+    - repair: the span from the first '[' to the last ']' after quote and
+      trailing-comma fixes
+    - salvage: the complete objects of a truncated array
+    
+    Parameters:
+    - llm_response (str): Raw response from the LLM
+    
+    Returns:
+    - ParseResult: items (list, or None if nothing usable), the path that
+      succeeded, and an error message when items is None
+    """
+    text = (llm_response or '').strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        data = None
+    if isinstance(data, dict) and isinstance(data.get('recommendations'), list):
+        return ParseResult(data['recommendations'], 'structured', None)
+    if isinstance(data, list):
+        return ParseResult(data, 'structured', None)
+    
+    # Arrays of objects win over citation-like lists such as "[1]" in prose
+    first_list = None
+    for start, end in iter_array_spans(text):
+        try:
+            data = json.loads(text[start:end])
+        except ValueError:
+            continue
+        if isinstance(data, list):
+            if any(isinstance(item, dict) for item in data):
+                return ParseResult(data, 'scan', None)
+            if first_list is None:
+                first_list = data
+    if first_list is not None:
+        return ParseResult(first_list, 'scan', None)
+    
+    start_idx = text.find('[')
+    end_idx = text.rfind(']') + 1
+    error = "No valid JSON found in LLM response"
+    if start_idx != -1 and end_idx > start_idx:
+        try:
+            data = json.loads(repair_json(text[start_idx:end_idx]))
+            if isinstance(data, list):
+                return ParseResult(data, 'repair', None)
+            error = "LLM response is not a JSON array"
+        except ValueError as e:
+            error = f"Failed to parse JSON: {str(e)}"
+    
+    parser = IncrementalArrayParser()
+    items = parser.feed(text)
+    if items:
+        return ParseResult(items, 'salvage', None)
+    return ParseResult(None, 'failed', error)
+
+def parse_batch_items(llm_response, user_keys):
+    """
+    Extract each user's recommendation items from a batch LLM response
+    
+    A batch answer is an object keyed by user ("user_1", ...), each holding
+    an array of items. Tries, in order, like parse_recommendation_items:
+    - structured: the whole response is that object
+    - scan: the first balanced object in the text that holds a user key
+    - repair: the span from the first '{' to the last '}' after quote and
+      trailing-comma fixes
+    - salvage: for each user key found in the text, the complete objects of
+      its array, so a truncated answer keeps every user answered before the
+      cut (and the complete items of the user it cut off)
+    
+    Parameters:
+    - llm_response (str): Raw response from the LLM
+    - user_keys (list): Keys the prompt asked the model to answer under
+    
+    Returns:
+    - ParseResult: items (dict of user key -> list, only users with an
+      array, or None if nothing usable), the path that succeeded, and an
+      error message when items is None
+    """
+    text = (llm_response or '').strip()
+    
+    def answers(data):
+        if not isinstance(data, dict):
+            return None
+        found = {key: data[key] for key in user_keys if isinstance(data.get(key), list)}
+        return found or None
+    
+    try:
+        found = answers(json.loads(text))
+    except ValueError:
+        found = None
+    if found:
+        return ParseResult(found, 'structured', None)
+    
+    for start, end in iter_object_spans(text):
+        try:
+            found = answers(json.loads(text[start:end]))
+        except ValueError:
+            continue
+        if found:
+            return ParseResult(found, 'scan', None)
+    
+    start_idx = text.find('{')
+    end_idx = text.rfind('}') + 1
+    error = "No valid JSON object found in batch LLM response"
+    if start_idx != -1 and end_idx > start_idx:
+        try:
+            found = answers(json.loads(repair_json(text[start_idx:end_idx])))
+            if found:
+                return ParseResult(found, 'repair', None)
+            error = "Batch LLM response has no user answers"
+        except ValueError as e:
+            error = f"Failed to parse batch JSON: {str(e)}"
+    
+    found = {}
+    for key in user_keys:
+        match = re.search(r'["\']' + re.escape(key) + r'["\']\s*:\s*\[', text)
+        if match is None:
+            continue
+        items = IncrementalArrayParser().feed(text[match.end() - 1:])
+        if items:
+            found[key] = items
+    if found:
+        return ParseResult(found, 'salvage', None)
+    return ParseResult(None, 'failed', error)
@@ -0,0 +1,453 @@
+import copy
+import json
+import os
+import re
+import zlib
+import numpy as np
+from config import config
+from services.product_service import matches_preferences
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Share of the catalog a delta may change before the retriever is rebuilt
+# (new embeddings and retrained centroids) instead of updated
+REBUILD_FRACTION = 0.3
+
+class HashingEmbedder:
+    """
+    Hashed TF-IDF embedder for product text
+    
+    Words from name, description, features and tags (plus whole tags and the
+    subcategory as single tokens) are hashed into a fixed number of signed
+    buckets, weighted by inverse document frequency and L2-normalized. No model
+    download or vocabulary file is needed, so it works offline.
+    """
+    
+    def __init__(self, dim=256, idf=None):
+        """
+        Parameters:
+        - dim (int): Number of hash buckets / vector dimensions
+        - idf (np.ndarray): Per-bucket IDF weights from a previous fit
+        """
+        self.dim = dim
+        self.idf = idf
+    
+    def tokens(self, product):
+        """
+        Extract the text tokens of a product
+        """
+        text = ' '.join([
+            product.get('name', ''),
+            product.get('description', ''),
+            ' '.join(product.get('features', [])),
+            ' '.join(product.get('tags', []))
+        ]).lower()
+        tokens = TOKEN_PATTERN.findall(text)
+        tokens.extend(f"tag:{tag.lower()}" for tag in product.get('tags', []))
+        if product.get('subcategory'):
+            tokens.append(f"sub:{product['subcategory'].lower()}")
+        return tokens
+    
+    def _hash(self, token):
+        """
+        Map a token to a (bucket, sign) pair with a stable hash
+        """
+        h = zlib.crc32(token.encode('utf-8'))
+        return h % self.dim, 1.0 if (h >> 31) & 1 else -1.0
+    
+    def term_counts(self, products):
+        """
+        Hashed term-frequency matrix for a list of products
+        """
+        rows, cols, vals = [], [], []
+        for row, product in enumerate(products):
+            for token in self.tokens(product):
+                bucket, sign = self._hash(token)
+                rows.append(row)
+                cols.append(bucket)
+                vals.append(sign)
+        counts = np.zeros((len(products), self.dim), dtype=np.float32)
+        if rows:
+            np.add.at(counts, (np.asarray(rows), np.asarray(cols)), np.asarray(vals, dtype=np.float32))
+        return counts
+    
+    def fit_transform(self, products):
+        """
+        Fit IDF weights on a catalog and return its embeddings
+        """
+        counts = self.term_counts(products)
+        doc_freq = np.count_nonzero(counts, axis=0)
+        self.idf = (np.log((1 + len(products)) / (1 + doc_freq)) + 1).astype(np.float32)
+        return self._weight(counts)
+    
+    def transform(self, products):
+        """
+        Embed products with previously fitted IDF weights
+        """
+        return self._weight(self.term_counts(products))
+    
+    def _weight(self, counts):
+        """
+        Apply IDF weights and L2-normalize rows
+        """
+        vectors = counts * self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+class IVFIndex:
+    """
+    Approximate nearest-neighbour index using an inverted file (IVF)
+    
+    Vectors are clustered with spherical k-means; a query scans only the
+    nprobe clusters whose centroids are closest to it. Scores are inner
+    products, which equal cosine similarity for normalized vectors.
+    """
+    
+    def __init__(self, nprobe=8):
+        """
+        Parameters:
+        - nprobe (int): Number of clusters scanned per query
+        """
+        self.nprobe = nprobe
+        self.centroids = None
+        self.vectors = None
+        self.lists = []  # cluster -> array of row numbers
+    
+    def build(self, vectors, nlist=None, iterations=10, sample_size=20000, seed=0):
+        """
+        Train centroids and assign every vector to its cluster
+        
+        Parameters:
+        - vectors (np.ndarray): Normalized row vectors
+        - nlist (int): Number of clusters, defaults to sqrt(n)
+        - iterations (int): k-means iterations
+        - sample_size (int): Vectors sampled for training
+        - seed (int): Random seed
+        """
+        count = len(vectors)
+        self.vectors = vectors
+        if count == 0:
+            self.centroids = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+            self.lists = []
+            return self
+        
+        nlist = nlist or int(min(1024, max(1, np.sqrt(count))))
+        nlist = min(nlist, count)
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(count, size=min(sample_size, count), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = sample[assignment == cluster]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    norm = np.linalg.norm(centroid)
+                    centroids[cluster] = centroid / norm if norm else centroid
+        
+        self.centroids = centroids
+        self.lists = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._assign(np.arange(count))
+        return self
+    
+    def add(self, vectors):
+        """
+        Append vectors to the index without retraining centroids
+        
+        Returns:
+        - np.ndarray: Row numbers assigned to the new vectors
+        """
+        start = len(self.vectors)
+        self.vectors = np.vstack([self.vectors, vectors.astype(np.float32)])
+        rows = np.arange(start, len(self.vectors))
+        self._assign(rows)
+        return rows
+    
+    def search(self, query, k, exclude=()):
+        """
+        Return (rows, scores) of the approximate top-k neighbours of a query
+        """
+        if self.centroids is None or not len(self.centroids):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        candidates = np.concatenate([self.lists[cluster] for cluster in probe])
+        if len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        return self._top(candidates, self.vectors[candidates] @ query, k)
+    
+    def exact_search(self, query, k, exclude=()):
+        """
+        Brute-force top-k over every vector, used as ground truth
+        """
+        candidates = np.arange(len(self.vectors))
+        if len(exclude):
+            candidates = candidates[~np.isin(candidates, exclude)]
+        return self._top(candidates, self.vectors[candidates] @ query, k)
+    
+    def save(self, path, product_ids, idf, meta=None):
+        """
+        Persist centroids, vectors, inverted lists and IDF weights to an .npz file
+        """
+        offsets = np.cumsum([0] + [len(members) for members in self.lists])
+        np.savez(
+            path,
+            centroids=self.centroids,
+            vectors=self.vectors,
+            list_rows=np.concatenate(self.lists) if self.lists else np.empty(0, dtype=np.int64),
+            list_offsets=offsets,
+            product_ids=np.asarray(product_ids),
+            idf=idf,
+            meta=np.asarray(json.dumps(meta or {}))
+        )
+    
+    @classmethod
+    def load(cls, path, nprobe=8):
+        """
+        Load an index saved with save()
+        
+        Returns:
+        - tuple: (index, product_ids, idf, meta)
+        """
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(nprobe=nprobe)
+            index.centroids = data['centroids']
+            index.vectors = data['vectors']
+            offsets = data['list_offsets']
+            rows = data['list_rows']
+            index.lists = [rows[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+            return index, data['product_ids'].tolist(), data['idf'], json.loads(str(data['meta']))
+    
+    def _assign(self, rows):
+        """
+        Assign rows to their nearest centroid's list, in chunks to bound memory
+        """
+        assignments = []
+        for start in range(0, len(rows), 50000):
+            chunk = rows[start:start + 50000]
+            assignments.append(np.argmax(self.vectors[chunk] @ self.centroids.T, axis=1))
+        assignment = np.concatenate(assignments) if assignments else np.empty(0, dtype=np.int64)
+        order = np.argsort(assignment, kind='stable')
+        boundaries = np.searchsorted(assignment[order], np.arange(len(self.centroids) + 1))
+        for cluster in range(len(self.centroids)):
+            new_rows = rows[order[boundaries[cluster]:boundaries[cluster + 1]]]
+            if len(new_rows):
+                self.lists[cluster] = np.concatenate([self.lists[cluster], new_rows])
+    
+    def _top(self, candidates, scores, k):
+        """
+        Highest-scoring k candidates, best first
+        """
+        if len(candidates) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.argsort(-scores, kind='stable')
+        return candidates[order], scores[order]
+
+class CandidateRetriever:
+    """
+    Semantic candidate retrieval for the recommendation prompt
+    
+    Embeds every product once at startup (or loads a persisted index built
+    for the same catalog version) and returns the nearest neighbours of the
+    centroid of the user's browsed products, filtered by their preferences.
+    
+    A snapshot made from a delta gets a copy of the previous retriever with
+    only the products whose text changed re-embedded (see for_snapshot).
+    """
+    
+    def __init__(self, product_service, dim=None, nprobe=None, index_path=None):
+        """
+        Build or load the index for the given catalog
+        
+        Parameters:
+        - product_service (ProductService or CatalogSnapshot): Catalog to index
+        - dim (int): Embedding dimensions, defaults to RETRIEVAL_DIM
+        - nprobe (int): Clusters scanned per query, defaults to RETRIEVAL_NPROBE
+        - index_path (str): .npz file to load from / persist to, defaults to RETRIEVAL_INDEX_PATH
+          (.npz is appended when missing)
+        """
+        self.product_service = product_service
+        self.dim = dim or config['RETRIEVAL_DIM']
+        self.nprobe = nprobe or config['RETRIEVAL_NPROBE']
+        self.index_path = config['RETRIEVAL_INDEX_PATH'] if index_path is None else index_path
+        if self.index_path and not self.index_path.endswith('.npz'):
+            # np.savez appends the suffix, so load from the name it actually writes
+            self.index_path += '.npz'
+        self.embedder = HashingEmbedder(self.dim)
+        self.index = None
+        self.product_ids = []
+        self.rows_by_id = {}
+        
+        if not (self.index_path and self._load()):
+            self._build()
+            if self.index_path:
+                self.save()
+    
+    @classmethod
+    def for_snapshot(cls, snapshot):
+        """
+        The retriever of a catalog snapshot, used as its derived-state factory
+        
+        After a delta, the previous snapshot's retriever is updated (see
+        updated()) unless more than REBUILD_FRACTION of the catalog changed;
+        otherwise the index is loaded or built.
+        """
+        previous, changed_ids = snapshot.previous_derived('retriever')
+        if previous is None or len(changed_ids) > REBUILD_FRACTION * max(1, len(previous.rows_by_id)):
+            return cls(snapshot)
+        return previous.updated(snapshot, changed_ids)
+    
+    def updated(self, snapshot, changed_ids):
+        """
+        A retriever for a snapshot derived from this one's catalog by a delta
+        
+        Products whose embedded text is unchanged (e.g. stock updates) keep
+        their vectors, so such a delta only shares the index with the new
+        snapshot. Deleted products and products whose text changed leave
+        their clusters; the changed and new ones are embedded with the
+        existing IDF weights and added with add_products(). Centroids aren't
+        retrained, and the index isn't written: the persisted file keeps
+        matching the catalog source.
+        
+        Parameters:
+        - snapshot (CatalogSnapshot): The new catalog
+        - changed_ids (set): IDs upserted or deleted by the delta
+        
+        Returns:
+        - CandidateRetriever: A new retriever; this one is left unchanged
+        """
+        old_products = self.product_service.products_by_id
+        new_products = snapshot.products_by_id
+        removed = []
+        embed = []
+        for product_id in changed_ids:
+            product = new_products.get(product_id)
+            old = old_products.get(product_id)
+            if product is None:
+                removed.append(product_id)
+            elif old is None or self.embedder.tokens(old) != self.embedder.tokens(product):
+                removed.append(product_id)
+                embed.append(product)
+        
+        retriever = copy.copy(self)
+        retriever.product_service = snapshot
+        rows = [self.rows_by_id[product_id] for product_id in removed if product_id in self.rows_by_id]
+        if not rows and not embed:
+            return retriever
+        
+        retriever.index = copy.copy(self.index)
+        retriever.index.lists = list(self.index.lists)
+        retriever.product_ids = list(self.product_ids)
+        retriever.rows_by_id = dict(self.rows_by_id)
+        if rows:
+            rows = np.asarray(rows)
+            clusters = np.argmax(self.index.vectors[rows] @ self.index.centroids.T, axis=1)
+            for cluster in np.unique(clusters):
+                members = retriever.index.lists[cluster]
+                retriever.index.lists[cluster] = members[~np.isin(members, rows[clusters == cluster])]
+            for row in rows:
+                # The row's vector stays in the array but no cluster lists it anymore
+                del retriever.rows_by_id[retriever.product_ids[row]]
+                retriever.product_ids[row] = ''
+        retriever.add_products(embed)
+        return retriever
+    
+    def _build(self):
+        """
+        Embed the whole catalog and train the index
+        """
+        products = list(self.product_service.products_by_id.values())
+        vectors = self.embedder.fit_transform(products)
+        self.index = IVFIndex(nprobe=self.nprobe).build(vectors)
+        self.product_ids = [p['id'] for p in products]
+        self.rows_by_id = {product_id: row for row, product_id in enumerate(self.product_ids)}
+    
+    def _load(self):
+        """
+        Load a persisted index if it exists and matches the current catalog
+        """
+        if not os.path.exists(self.index_path):
+            return False
+        try:
+            index, product_ids, idf, meta = IVFIndex.load(self.index_path, nprobe=self.nprobe)
+        except Exception as e:
+            print(f"Error loading retrieval index: {str(e)}")
+            return False
+        if meta.get('catalog_version') != self.product_service.catalog_version or len(idf) != self.dim:
+            print("Retrieval index is stale, rebuilding")
+            return False
+        self.index = index
+        self.embedder.idf = idf
+        self.product_ids = product_ids
+        self.rows_by_id = {product_id: row for row, product_id in enumerate(product_ids)}
+        return True
+    
+    def save(self, path=None):
+        """
+        Persist the index next to the catalog version it was built from
+        """
+        self.index.save(
+            path or self.index_path,
+            self.product_ids,
+            self.embedder.idf,
+            meta={"catalog_version": self.product_service.catalog_version, "dim": self.dim}
+        )
+    
+    def add_products(self, products):
+        """
+        Incrementally index new products using the existing IDF weights and centroids
+        """
+        new_products = [p for p in products if p['id'] not in self.rows_by_id]
+        if not new_products:
+            return
+        rows = self.index.add(self.embedder.transform(new_products))
+        for row, product in zip(rows, new_products):
+            self.product_ids.append(product['id'])
+            self.rows_by_id[product['id']] = int(row)
+    
+    def query_vector(self, browsed_products):
+        """
+        Normalized centroid of the browsed products' embeddings, or None
+        """
+        rows = [self.rows_by_id[p['id']] for p in browsed_products if p['id'] in self.rows_by_id]
+        if not rows:
+            return None
+        centroid = self.index.vectors[rows].mean(axis=0)
+        norm = np.linalg.norm(centroid)
+        return centroid / norm if norm else None
+    
+    def retrieve(self, user_preferences, browsed_products, k=30, available=None):
+        """
+        Retrieve up to k candidate products similar to the browsing history
+        
+        Neighbours matching the preference filters (any preferred category or
+        brand, and the price range) come first; the remaining slots are filled
+        with the closest unfiltered neighbours.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - k (int): Number of candidates
+        - available (callable): Keeps only neighbours it returns True for, e.g. in-stock products
+        
+        Returns:
+        - list: Candidate product dicts, most similar first (empty without history)
+        """
+        query = self.query_vector(browsed_products)
+        if query is None:
+            return []
+        exclude = np.asarray([self.rows_by_id[p['id']] for p in browsed_products if p['id'] in self.rows_by_id])
+        rows, _ = self.index.search(query, k * 4, exclude=exclude)
+        
+        products_by_id = self.product_service.products_by_id
+        neighbours = [products_by_id[self.product_ids[row]] for row in rows if self.product_ids[row] in products_by_id]
+        if available is not None:
+            neighbours = [p for p in neighbours if available(p)]
+        matching = [p for p in neighbours if matches_preferences(p, user_preferences)]
+        if len(matching) < k:
+            matching_ids = {p['id'] for p in matching}
+            matching.extend(p for p in neighbours if p['id'] not in matching_ids)
+        return matching[:k]
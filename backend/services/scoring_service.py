@@ -0,0 +1,209 @@
+import numpy as np
+from services.session_store import history_affinity
+
+# Fallback scoring weights, shared by the vectorized scorer and its explanations
+BASE_SCORE = 5.0
+CATEGORY_BOOST = 2.0
+BRAND_BOOST = 1.5
+BUDGET_BOOST = 1.0
+BROWSED_BOOST = 1.5
+HIGH_RATING_BOOST = 1.0
+GOOD_RATING_BOOST = 0.5
+MAX_SCORE = 10.0
+
+# (low, high, low_inclusive, high_inclusive) per UI price range, matching price_in_range
+PRICE_BOUNDS = {
+    'under-50': (-np.inf, 50.0, True, False),
+    '50-100': (50.0, 100.0, True, True),
+    '100-200': (100.0, 200.0, True, True),
+    'over-200': (200.0, np.inf, False, True)
+}
+
+class FallbackScorer:
+    """
+    Columnar scoring engine for rule-based fallback recommendations
+    
+    Price, rating, category and brand are held in NumPy arrays built once from
+    the ProductService, with categories and brands dictionary-encoded to integer
+    codes. Each preference, budget, history and rating boost is a boolean mask,
+    so scoring a candidate set is a handful of array operations. The top-k is
+    picked with argpartition, and explanations are only built for the winners.
+    """
+    
+    def __init__(self, product_service):
+        """
+        Build the column arrays from the loaded catalog
+        
+        Parameters:
+        - product_service (ProductService or CatalogSnapshot): Catalog to score; rows follow its product order
+        """
+        self.product_service = product_service
+        store = product_service.store
+        if store is not None:
+            # Memory-mapped catalog: the columns are already encoded, share them as-is
+            self.category_codes = dict(store.codes['category'])
+            self.brand_codes = dict(store.codes['brand'])
+            self.prices = store.prices
+            self.ratings = store.ratings
+            self.categories = store.categories
+            self.brands = store.brands
+            return
+        products = product_service.get_all_products()
+        
+        self.category_codes = {}
+        self.brand_codes = {}
+        count = len(products)
+        self.prices = np.empty(count, dtype=np.float64)
+        self.ratings = np.empty(count, dtype=np.float64)
+        self.categories = np.empty(count, dtype=np.int32)
+        self.brands = np.empty(count, dtype=np.int32)
+        
+        for row, product in enumerate(products):
+            self.prices[row] = product['price']
+            self.ratings[row] = product.get('rating', 0)
+            self.categories[row] = self.category_codes.setdefault(product['category'], len(self.category_codes))
+            self.brands[row] = self.brand_codes.setdefault(product.get('brand'), len(self.brand_codes))
+    
+    def rows_for(self, products):
+        """
+        Map product dicts to their row numbers in the column arrays
+        """
+        positions = self.product_service.positions
+        return np.fromiter((positions[p['id']] for p in products), dtype=np.int64, count=len(products))
+    
+    def score(self, user_preferences, browsed_products, rows, demoted=None, penalty=0.0):
+        """
+        Score candidate rows and return the boost masks used
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - rows (np.ndarray): Candidate row numbers
+        - demoted (np.ndarray): Boolean mask by row of products scored penalty
+          lower, e.g. low-stock products
+        - penalty (float): Points taken off demoted products
+        
+        Returns:
+        - tuple: (scores, masks) where masks maps boost name -> boolean array
+        """
+        categories = self.categories[rows]
+        ratings = self.ratings[rows]
+        masks = {}
+        
+        preferred_categories = user_preferences.get('categories')
+        masks['category'] = self._code_mask(categories, self.category_codes, preferred_categories or ())
+        
+        preferred_brands = user_preferences.get('brands')
+        masks['brand'] = self._code_mask(self.brands[rows], self.brand_codes, preferred_brands or ())
+        
+        price_range = user_preferences.get('priceRange')
+        if price_range and price_range != 'all' and price_range in PRICE_BOUNDS:
+            prices = self.prices[rows]
+            low, high, low_inclusive, high_inclusive = PRICE_BOUNDS[price_range]
+            above = prices >= low if low_inclusive else prices > low
+            below = prices <= high if high_inclusive else prices < high
+            masks['budget'] = above & below
+        else:
+            masks['budget'] = np.zeros(len(rows), dtype=bool)
+        
+        # A session's history also carries the categories it viewed most
+        browsed_categories = {p['category'] for p in browsed_products}
+        browsed_categories.update(history_affinity(browsed_products)[0])
+        masks['browsed'] = self._code_mask(categories, self.category_codes, browsed_categories)
+        
+        masks['high_rating'] = ratings > 4.5
+        masks['good_rating'] = (ratings > 4.0) & ~masks['high_rating']
+        
+        scores = np.full(len(rows), BASE_SCORE)
+        scores += CATEGORY_BOOST * masks['category']
+        scores += BRAND_BOOST * masks['brand']
+        scores += BUDGET_BOOST * masks['budget']
+        scores += BROWSED_BOOST * masks['browsed']
+        scores += HIGH_RATING_BOOST * masks['high_rating']
+        scores += GOOD_RATING_BOOST * masks['good_rating']
+        np.minimum(scores, MAX_SCORE, out=scores)
+        if demoted is not None and penalty:
+            scores -= penalty * demoted[rows]
+        return scores, masks
+    
+    def top_k(self, user_preferences, browsed_products, candidates, k=5, rows=None, demoted=None, penalty=0.0):
+        """
+        Score candidate products and return the best k with explanations
+        
+        Ties keep candidate order, matching a stable descending sort.
+        
+        Parameters:
+        - user_preferences (dict): User's stated preferences
+        - browsed_products (list): Products the user has viewed
+        - candidates (list): Candidate product dicts
+        - k (int): Number of recommendations to return
+        - rows (np.ndarray): Precomputed row numbers of the candidates, e.g. np.arange
+          over the whole catalog; looked up from the candidates when omitted
+        - demoted, penalty: Products to score lower and by how much (see score)
+        
+        Returns:
+        - list: Dicts with product, score and explanation, best first
+        """
+        if not candidates:
+            return []
+        if rows is None:
+            rows = self.rows_for(candidates)
+        scores, masks = self.score(user_preferences, browsed_products, rows, demoted, penalty)
+        order = self._top_k_indices(scores, k)
+        
+        results = []
+        for i in order:
+            product = candidates[i]
+            results.append({
+                "product": product,
+                "score": float(scores[i]),
+                "explanation": self._explain(product, {name: mask[i] for name, mask in masks.items()})
+            })
+        return results
+    
+    def _code_mask(self, codes, code_table, values):
+        """
+        Boolean mask of codes that belong to any of the given values
+        """
+        wanted = [code_table[value] for value in values if value in code_table]
+        if not wanted:
+            return np.zeros(len(codes), dtype=bool)
+        return np.isin(codes, wanted)
+    
+    def _top_k_indices(self, scores, k):
+        """
+        Indices of the k highest scores, ties broken by position
+        """
+        count = len(scores)
+        if count > k:
+            # Everything scoring at least the k-th best is a contender; ties at the
+            # boundary are resolved by position below
+            kth = scores[np.argpartition(scores, count - k)[count - k:]].min()
+            contenders = np.flatnonzero(scores >= kth)
+        else:
+            contenders = np.arange(count)
+        ranked = contenders[np.lexsort((contenders, -scores[contenders]))]
+        return ranked[:k]
+    
+    def _explain(self, product, matched):
+        """
+        Build the fallback explanation for a product from its matched boosts
+        """
+        explanation_parts = []
+        if matched['category']:
+            explanation_parts.append(f"matches your preferred {product['category']} category")
+        if matched['brand']:
+            explanation_parts.append(f"from your preferred brand {product.get('brand')}")
+        if matched['budget']:
+            explanation_parts.append("fits your budget range")
+        if matched['browsed']:
+            explanation_parts.append("similar to products you've browsed")
+        rating = product.get('rating', 0)
+        if matched['high_rating']:
+            explanation_parts.append(f"highly rated ({rating}/5)")
+        elif matched['good_rating']:
+            explanation_parts.append(f"well-rated ({rating}/5)")
+        
+        if explanation_parts:
+            return f"Recommended because it {', '.join(explanation_parts)}"
+        return f"Popular {product['category']} product with good ratings"
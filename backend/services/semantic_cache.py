@@ -0,0 +1,250 @@
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from config import config
+
+# MinHash permutations h(x) = (a * x + b) mod MERSENNE_PRIME, split into LSH
+# bands of BAND_ROWS rows; two candidate sets with Jaccard 0.8 share a band
+# with probability 1 - (1 - 0.8 ** 4) ** 8, about 0.98
+NUM_PERM = 32
+BAND_ROWS = 4
+MERSENNE_PRIME = (1 << 31) - 1
+HASH_SEED = 7
+
+# A reused ranking needs this many products left after re-validation
+MIN_REUSED = 3
+
+_rng = np.random.default_rng(HASH_SEED)
+_PERM_A = _rng.integers(1, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, MERSENNE_PRIME, size=NUM_PERM, dtype=np.uint64)
+_EMPTY = np.full(NUM_PERM, MERSENNE_PRIME, dtype=np.uint64)
+
+# candidates: IDs of the products in the prompt; history: MinHash of the
+# browsing-history features; bands: LSH bucket keys of the candidate set
+RequestSignature = namedtuple('RequestSignature', ['candidates', 'history', 'bands'])
+
+def minhash(tokens):
+    """
+    MinHash signature (NUM_PERM uint64 values) of a set of string tokens
+    """
+    if not tokens:
+        return _EMPTY
+    hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in tokens), dtype=np.uint64, count=len(tokens))
+    hashes %= MERSENNE_PRIME
+    return ((_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+def history_features(browsed_products):
+    """
+    Feature tokens of a browsing history: categories, subcategories, brands and tags
+    """
+    features = set()
+    for product in browsed_products:
+        features.add(f"category:{product.get('category')}")
+        features.add(f"subcategory:{product.get('subcategory')}")
+        features.add(f"brand:{product.get('brand')}")
+        features.update(f"tag:{tag}" for tag in product.get('tags') or ())
+    return features
+
+def history_similarity(left, right):
+    """
+    Estimated Jaccard similarity of two history signatures (1.0 for two empty histories)
+    """
+    return float(np.count_nonzero(left == right)) / NUM_PERM
+
+def candidate_similarity(left, right):
+    """
+    Jaccard similarity of two candidate ID sets
+    """
+    if not left and not right:
+        return 1.0
+    return len(left & right) / len(left | right)
+
+class SemanticCache:
+    """
+    Second-level cache of LLM rankings for near-duplicate requests
+    
+    The exact result cache misses requests whose histories differ by one
+    product or whose preferences differ only in ways that don't change the
+    prompt. This cache is keyed on what the LLM actually sees instead: the set
+    of candidate products in the prompt, and a MinHash of the browsing
+    history's categories, brands and tags. A request whose candidate set and
+    history both have at least `threshold` (Jaccard) similarity to a stored
+    request reuses that request's ranking.
+    
+    A reused ranking is re-validated before it is returned: products that are
+    gone from the catalog, aren't among this request's candidates or were
+    browsed by this user are dropped, product details come from the current
+    catalog, and fewer than MIN_REUSED remaining products count as a miss.
+    
+    Stored requests are found through LSH buckets over a MinHash of the
+    candidate set, so a lookup compares against a handful of entries rather
+    than the whole cache. Entries expire after ttl_seconds; at most
+    max_entries are kept, the least recently used dropped first.
+    """
+    
+    def __init__(self, product_service, threshold=None, max_entries=None, ttl_seconds=None, enabled=None):
+        """
+        Initialize the cache, defaulting every setting to the config values
+        
+        Parameters:
+        - product_service (ProductService): Catalog reused rankings are validated against
+        - threshold (float): Minimum candidate and history similarity of a hit (SEMANTIC_CACHE_THRESHOLD)
+        - max_entries (int): Rankings kept (SEMANTIC_CACHE_MAX_ENTRIES)
+        - ttl_seconds (float): Seconds a ranking is kept (SEMANTIC_CACHE_TTL_SECONDS)
+        - enabled (bool): SEMANTIC_CACHE_ENABLED by default
+        """
+        self.product_service = product_service
+        self.enabled = config['SEMANTIC_CACHE_ENABLED'] if enabled is None else enabled
+        self.threshold = config['SEMANTIC_CACHE_THRESHOLD'] if threshold is None else threshold
+        self.max_entries = config['SEMANTIC_CACHE_MAX_ENTRIES'] if max_entries is None else max_entries
+        self.ttl_seconds = config['SEMANTIC_CACHE_TTL_SECONDS'] if ttl_seconds is None else ttl_seconds
+        
+        self._entries = OrderedDict()  # entry id -> (stored_at, signature, ranking)
+        self._buckets = {}  # LSH bucket key -> entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.evictions = 0
+    
+    def signature(self, candidate_ids, browsed_products):
+        """
+        Similarity signature of a request
+        
+        Parameters:
+        - candidate_ids (iterable): IDs of the products offered in the prompt
+        - browsed_products (list): Products the user has viewed
+        
+        Returns:
+        - RequestSignature
+        """
+        candidates = frozenset(candidate_ids)
+        candidate_hash = minhash(candidates)
+        bands = tuple(
+            (band, candidate_hash[start:start + BAND_ROWS].tobytes())
+            for band, start in enumerate(range(0, NUM_PERM, BAND_ROWS))
+        )
+        return RequestSignature(candidates, minhash(history_features(browsed_products)), bands)
+    
+    def lookup(self, signature, browsed_products):
+        """
+        Reuse the ranking of the most similar stored request, if it is close enough
+        
+        Parameters:
+        - signature (RequestSignature): Signature of this request
+        - browsed_products (list): Products the user has viewed, excluded from the result
+        
+        Returns:
+        - dict: Re-validated recommendations, or None on a miss
+        """
+        if not self.enabled:
+            return None
+        
+        now = time.time()
+        with self._lock:
+            best_id, best_similarity = None, 0.0
+            for entry_id in set().union(*(self._buckets.get(key, ()) for key in signature.bands)):
+                stored_at, stored, _ = self._entries[entry_id]
+                if now - stored_at > self.ttl_seconds:
+                    self._drop(entry_id)
+                    continue
+                similarity = min(
+                    candidate_similarity(signature.candidates, stored.candidates),
+                    history_similarity(signature.history, stored.history)
+                )
+                if similarity >= self.threshold and similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            ranking = self._entries[best_id][2]
+        
+        browsed_ids = {product['id'] for product in browsed_products}
+        products_by_id = self.product_service.products_by_id
+        recommendations = []
+        for product_id, explanation, score in ranking:
+            if product_id in browsed_ids or product_id not in signature.candidates:
+                continue
+            product = products_by_id.get(product_id)
+            if product is not None:
+                recommendations.append({"product": product, "explanation": explanation, "confidence_score": score})
+        
+        with self._lock:
+            if len(recommendations) < MIN_REUSED:
+                self.rejected += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {
+            "recommendations": recommendations,
+            "count": len(recommendations),
+            "semantic_cache": {"similarity": round(best_similarity, 3)}
+        }
+    
+    def store(self, signature, recommendations):
+        """
+        Keep the ranking of an LLM-generated result; fallback and error results are skipped
+        """
+        if not self.enabled or recommendations.get('fallback') or recommendations.get('error'):
+            return
+        ranking = tuple(
+            (item["product"]["id"], item["explanation"], item["confidence_score"])
+            for item in recommendations.get("recommendations", [])
+        )
+        if len(ranking) < MIN_REUSED:
+            return
+        
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (time.time(), signature, ranking)
+            for key in signature.bands:
+                self._buckets.setdefault(key, set()).add(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def clear(self):
+        """
+        Drop every stored ranking
+        """
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+    
+    def stats(self):
+        """
+        Return hit/miss counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions
+            }
+    
+    def _drop(self, entry_id):
+        """
+        Remove an entry and its LSH bucket memberships
+        """
+        _, signature, _ = self._entries.pop(entry_id)
+        for key in signature.bands:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[key]
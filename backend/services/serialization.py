@@ -0,0 +1,215 @@
+import asyncio
+import gzip
+import json
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import config
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+# Product fields the recommendation cards use; compact responses carry only these
+COMPACT_FIELDS = ('id', 'name', 'category', 'price', 'features')
+
+# Response types worth compressing; streamed responses are never compressed
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/plain')
+
+def dumps(value):
+    """
+    Encode a value as compact JSON bytes, with orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+else:
+    FastJSONResponse = JSONResponse
+
+class ProductEncoder:
+    """
+    Pre-encoded JSON of each product, full and compact, per catalog snapshot
+    
+    Encodings are built when a snapshot is prepared (only the changed products
+    after a delta), so responses splice cached bytes instead of encoding
+    product dicts on every request. A memory-mapped catalog is encoded on
+    first use instead, like the prompt fragments.
+    """
+    
+    def __init__(self, product_service):
+        """
+        Parameters:
+        - product_service (ProductService): Catalog whose snapshots are encoded
+        """
+        self.product_service = product_service
+    
+    def encodings(self, snapshot=None):
+        """
+        Encoding cache (product ID -> (full bytes, compact bytes)) for a snapshot
+        """
+        snapshot = snapshot or self.product_service.snapshot
+        return snapshot.derived(self, self._encode_snapshot)
+    
+    def _encode_snapshot(self, snapshot):
+        if snapshot.store is not None:
+            return {}
+        previous, changed_ids = snapshot.previous_derived(self)
+        if previous is not None:
+            encodings = {pid: encoded for pid, encoded in previous.items() if pid not in changed_ids}
+            products = [snapshot.products_by_id[pid] for pid in changed_ids if pid in snapshot.products_by_id]
+        else:
+            encodings = {}
+            products = snapshot.products_by_id.values()
+        for product in products:
+            encodings[product['id']] = self._encode(product)
+        return encodings
+    
+    def _encode(self, product):
+        return dumps(product), dumps({field: product[field] for field in COMPACT_FIELDS if field in product})
+    
+    def encode(self, product, compact=False, encodings=None):
+        """
+        JSON bytes of a product, from the cache when it holds this exact product
+        """
+        if encodings is None:
+            encodings = self.encodings()
+        cached = encodings.get(product['id'])
+        if cached is None:
+            cached = self._encode(product)
+            if self.product_service.store is not None:
+                encodings[product['id']] = cached
+        return cached[1] if compact else cached[0]
+    
+    def encode_list(self, products, snapshot=None, compact=False):
+        """
+        JSON array bytes of a list of products from a snapshot (the current one by default)
+        """
+        encodings = self.encodings(snapshot)
+        return b'[' + b','.join(self.encode(product, compact, encodings) for product in products) + b']'
+    
+    def encode_item(self, item, compact=False, encodings=None):
+        """
+        JSON bytes of one recommendation ({"product", ...}), splicing in the encoded product
+        """
+        if encodings is None:
+            encodings = self.encodings()
+        rest = {key: value for key, value in item.items() if key != "product"}
+        product = self.encode(item["product"], compact, encodings) if "product" in item else b'null'
+        return b'{"product":' + product + (b',' + dumps(rest)[1:] if rest else b'}')
+    
+    def encode_recommendations(self, result, compact=False):
+        """
+        JSON bytes of a recommendations result, splicing in the encoded products
+        
+        Parameters:
+        - result (dict): Result with a "recommendations" list of {"product", ...} items
+        - compact (bool): Encode products with COMPACT_FIELDS only
+        
+        Returns:
+        - bytes: The same JSON as encoding the result directly (products compacted if asked)
+        """
+        encodings = self.encodings()
+        items = [self.encode_item(item, compact, encodings) for item in result.get("recommendations", [])]
+        rest = {key: value for key, value in result.items() if key != "recommendations"}
+        return b'{"recommendations":[' + b','.join(items) + b']' + (b',' + dumps(rest)[1:] if rest else b'}')
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick br or gzip from an Accept-Encoding header, or None
+    """
+    accepted = set()
+    for part in accept_encoding.lower().split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+def compress(body, encoding, gzip_level=6, brotli_quality=4):
+    """
+    Compress a body with br or gzip
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level)
+
+async def acompress(body, encoding, gzip_level=6, brotli_quality=4):
+    """
+    compress() in a worker thread for bodies of at least COMPRESSION_OFFLOAD_BYTES,
+    so a large response doesn't stall the event loop
+    """
+    if len(body) < config['COMPRESSION_OFFLOAD_BYTES']:
+        return compress(body, encoding, gzip_level, brotli_quality)
+    return await asyncio.get_running_loop().run_in_executor(None, compress, body, encoding, gzip_level, brotli_quality)
+
+class CompressionMiddleware:
+    """
+    Compress complete JSON responses of at least minimum_size bytes with
+    brotli (when installed and accepted) or gzip
+    
+    Responses sent in several chunks (SSE, NDJSON batches) pass through
+    untouched so events aren't held back by the compressor, as do responses
+    that are already encoded (/api/products caches its compressed pages).
+    """
+    
+    def __init__(self, app, minimum_size=None, gzip_level=6, brotli_quality=4):
+        """
+        Parameters:
+        - app (ASGI app): Wrapped application
+        - minimum_size (int): Smallest body compressed (COMPRESSION_MIN_BYTES by default)
+        - gzip_level (int): gzip compression level
+        - brotli_quality (int): brotli quality; low levels keep the CPU cost near gzip's
+        """
+        self.app = app
+        self.minimum_size = config['COMPRESSION_MIN_BYTES'] if minimum_size is None else minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        
+        start_message = None
+        
+        async def compressing_send(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                return await send(message)
+            
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if (message.get("more_body", False) or len(body) < self.minimum_size
+                    or "content-encoding" in headers
+                    or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)):
+                await send(start)
+                return await send(message)
+            
+            body = await acompress(body, encoding, self.gzip_level, self.brotli_quality)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+        
+        await self.app(scope, receive, compressing_send)
@@ -0,0 +1,415 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import config
+
+# Seconds between sweeps of expired sessions, done on the write path
+SWEEP_INTERVAL = 30.0
+
+class SessionHistory(list):
+    """
+    Browsing history taken from a session: the recent window, oldest first
+    
+    Holds product IDs, or product dicts once resolved against the catalog,
+    like a plain browsing_history list. categories and brands are the
+    session's most viewed categories and brands over its whole history, which
+    the candidate filter and fallback scorer treat like the categories of
+    browsed products.
+    """
+    
+    def __init__(self, items=(), categories=(), brands=()):
+        super().__init__(items)
+        self.categories = tuple(categories)
+        self.brands = tuple(brands)
+
+def history_affinity(browsing_history):
+    """
+    (categories, brands) a history carries besides its products; empty for a plain list
+    """
+    if isinstance(browsing_history, SessionHistory):
+        return browsing_history.categories, browsing_history.brands
+    return (), ()
+
+def _count(names, counts, name, max_keys):
+    """
+    Count one view of name in parallel tuples of names and counts, most viewed first
+    
+    A viewed name moves ahead of names with as many views, so past max_keys
+    names the least viewed and, among those, least recently viewed is dropped.
+    
+    Returns:
+    - tuple: (names, counts)
+    """
+    if name is None:
+        return names, counts
+    count = 1
+    if name in names:
+        index = names.index(name)
+        count += counts[index]
+        names = names[:index] + names[index + 1:]
+        counts = counts[:index] + counts[index + 1:]
+    index = 0
+    while index < len(counts) and counts[index] > count:
+        index += 1
+    names = (names[:index] + (name,) + names[index:])[:max_keys]
+    counts = (counts[:index] + (count,) + counts[index:])[:max_keys]
+    return names, counts
+
+class SessionState:
+    """
+    Browsing state of one session
+    
+    recent holds the IDs of the last viewed products, oldest first and each
+    once. Views per category and brand over the whole session are kept as
+    parallel tuples of names and counts, most viewed first, which is about
+    half the memory of a dict and makes the top names a slice. Everything is
+    bounded, so a session costs the same whatever its history length.
+    """
+    
+    __slots__ = ('recent', 'categories', 'category_counts', 'brands', 'brand_counts', 'events', 'updated_at')
+    
+    def __init__(self, recent=(), categories=None, brands=None, events=0, updated_at=0.0):
+        """
+        Parameters:
+        - recent (iterable): Recent product IDs, oldest first
+        - categories, brands (dict): Views per name, most viewed first
+        - events (int): Views recorded
+        - updated_at (float): Time of the last view
+        """
+        self.recent = tuple(recent)
+        self.categories = tuple(categories or ())
+        self.category_counts = tuple((categories or {}).values())
+        self.brands = tuple(brands or ())
+        self.brand_counts = tuple((brands or {}).values())
+        self.events = events
+        self.updated_at = updated_at
+    
+    def record_view(self, product, window, max_affinities):
+        """
+        Add one product view
+        
+        Parameters:
+        - product (dict): Viewed product
+        - window (int): Recent products kept
+        - max_affinities (int): Categories and brands counted
+        """
+        product_id = product['id']
+        if product_id in self.recent:
+            self.recent = tuple(pid for pid in self.recent if pid != product_id)
+        self.recent = (self.recent + (product_id,))[-window:]
+        self.categories, self.category_counts = _count(self.categories, self.category_counts, product.get('category'), max_affinities)
+        self.brands, self.brand_counts = _count(self.brands, self.brand_counts, product.get('brand'), max_affinities)
+        self.events += 1
+    
+    def to_dict(self):
+        return {
+            "recent": list(self.recent),
+            "categories": dict(zip(self.categories, self.category_counts)),
+            "brands": dict(zip(self.brands, self.brand_counts)),
+            "events": self.events,
+            "updated_at": self.updated_at
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["recent"], data["categories"], data["brands"], data["events"], data["updated_at"])
+
+class MemorySessionBackend:
+    """
+    Sessions held by this process, least recently updated first
+    
+    Keeping update order makes expiry a pop from the front and the size limit
+    an LRU eviction. Each uvicorn worker has its own sessions; use the disk
+    backend to share them between workers.
+    """
+    
+    def __init__(self, max_sessions):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session id -> SessionState
+    
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+    
+    def put(self, session_id, state):
+        """
+        Store a session, returning the number of sessions evicted to make room
+        """
+        self._sessions[session_id] = state
+        self._sessions.move_to_end(session_id)
+        evicted = 0
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            evicted += 1
+        return evicted
+    
+    def delete(self, session_id):
+        return self._sessions.pop(session_id, None) is not None
+    
+    def expire(self, cutoff):
+        """
+        Drop sessions last updated before cutoff, returning how many
+        """
+        expired = 0
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if state.updated_at >= cutoff:
+                break
+            del self._sessions[session_id]
+            expired += 1
+        return expired
+    
+    def __len__(self):
+        return len(self._sessions)
+
+class DiskSessionBackend:
+    """
+    Sessions in a local SQLite file, shared by the worker processes of a host
+    
+    States are stored as JSON. Concurrent views of the same session from two
+    workers can lose one of the updates; a user's views are sequential in
+    practice.
+    """
+    
+    def __init__(self, path, max_sessions):
+        self.path = path
+        self.max_sessions = max_sessions
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions "
+            "(id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)")
+        self._connection.commit()
+    
+    def get(self, session_id):
+        row = self._connection.execute("SELECT state FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return SessionState.from_dict(json.loads(row[0])) if row is not None else None
+    
+    def put(self, session_id, state):
+        """
+        Store a session; the size limit is enforced by expire()
+        """
+        self._connection.execute(
+            "INSERT OR REPLACE INTO sessions (id, state, updated_at) VALUES (?, ?, ?)",
+            (session_id, json.dumps(state.to_dict(), separators=(',', ':')), state.updated_at)
+        )
+        self._connection.commit()
+        return 0
+    
+    def delete(self, session_id):
+        deleted = self._connection.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+        self._connection.commit()
+        return deleted > 0
+    
+    def expire(self, cutoff):
+        """
+        Drop sessions last updated before cutoff, and the least recently
+        updated ones over max_sessions, returning how many
+        """
+        expired = self._connection.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+        expired += self._connection.execute(
+            "DELETE FROM sessions WHERE id IN ("
+            "SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,)
+        ).rowcount
+        self._connection.commit()
+        return expired
+    
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+class SessionStore:
+    """
+    Server-side browsing sessions
+    
+    Clients post view events to a session as they happen instead of sending
+    the whole browsing history with every recommendation request. Each event
+    is resolved against the catalog once, when it arrives (unknown IDs are
+    ignored), and folded into the session's bounded state: the last `window`
+    viewed products and view counts per category and brand. A recommendation
+    request then reads that state in constant time whatever the history
+    length.
+    
+    Sessions expire ttl_seconds after their last event. Backends:
+    - memory: a per-process LRU of at most max_sessions sessions
+    - disk: a SQLite file (path) shared by the workers of one host
+    
+    Async callers use the a-prefixed methods, which run disk sessions in the
+    default executor: a SQLite read or commit can wait on the file or on
+    another worker's write lock (up to its 5 second timeout), which must not
+    stall the event loop. Memory sessions are handled inline.
+    """
+    
+    def __init__(self, product_service, backend=None, path=None, window=None, max_affinities=None,
+                 affinity_top=None, ttl_seconds=None, max_sessions=None):
+        """
+        Initialize the store, defaulting every setting to the config values
+        
+        Parameters:
+        - product_service (ProductService): Catalog view events are resolved against
+        - backend (str): memory or disk (SESSION_STORE_BACKEND)
+        - path (str): SQLite file of the disk backend (SESSION_STORE_PATH)
+        - window (int): Recent products kept per session (SESSION_WINDOW)
+        - max_affinities (int): Categories and brands counted per session (SESSION_MAX_AFFINITIES)
+        - affinity_top (int): Most viewed categories and brands passed on with the history (SESSION_AFFINITY_TOP)
+        - ttl_seconds (float): Idle seconds before a session expires (SESSION_TTL_SECONDS)
+        - max_sessions (int): Sessions kept before the least recently updated are evicted (SESSION_MAX_SESSIONS)
+        """
+        self.product_service = product_service
+        self.backend_name = (backend or config['SESSION_STORE_BACKEND']).lower()
+        self.path = config['SESSION_STORE_PATH'] if path is None else path
+        self.window = config['SESSION_WINDOW'] if window is None else window
+        self.max_affinities = config['SESSION_MAX_AFFINITIES'] if max_affinities is None else max_affinities
+        self.affinity_top = config['SESSION_AFFINITY_TOP'] if affinity_top is None else affinity_top
+        self.ttl_seconds = config['SESSION_TTL_SECONDS'] if ttl_seconds is None else ttl_seconds
+        self.max_sessions = config['SESSION_MAX_SESSIONS'] if max_sessions is None else max_sessions
+        
+        self._backend = self._open_backend()
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        
+        self.events = 0
+        self.ignored = 0
+        self.evictions = 0
+        self.expirations = 0
+    
+    def record_views(self, session_id, product_ids):
+        """
+        Append view events to a session, creating it if needed
+        
+        Parameters:
+        - session_id (str): Session identifier chosen by the client
+        - product_ids (list): Viewed product IDs, oldest first
+        
+        Returns:
+        - SessionState: The updated session
+        """
+        products_by_id = self.product_service.products_by_id
+        now = time.time()
+        with self._lock:
+            state = self._live(session_id, now) or SessionState()
+            for product_id in product_ids:
+                product = products_by_id.get(product_id)
+                if product is None:
+                    self.ignored += 1
+                    continue
+                state.record_view(product, self.window, self.max_affinities)
+                self.events += 1
+            state.updated_at = now
+            self.evictions += self._backend.put(session_id, state)
+            if now - self._last_sweep >= SWEEP_INTERVAL:
+                self._last_sweep = now
+                self.expirations += self._backend.expire(now - self.ttl_seconds)
+            return state
+    
+    def get(self, session_id):
+        """
+        Return a session's state, or None if it is unknown or expired
+        """
+        with self._lock:
+            return self._live(session_id, time.time())
+    
+    def delete(self, session_id):
+        """
+        Forget a session, returning whether it existed
+        """
+        with self._lock:
+            return self._backend.delete(session_id)
+    
+    async def arecord_views(self, session_id, product_ids):
+        """
+        record_views() without blocking the event loop
+        """
+        return await self._offload(self.record_views, session_id, product_ids)
+    
+    async def aget(self, session_id):
+        """
+        get() without blocking the event loop
+        """
+        return await self._offload(self.get, session_id)
+    
+    async def adelete(self, session_id):
+        """
+        delete() without blocking the event loop
+        """
+        return await self._offload(self.delete, session_id)
+    
+    async def astats(self):
+        """
+        stats() without blocking the event loop
+        """
+        return await self._offload(self.stats)
+    
+    def history(self, state):
+        """
+        The browsing history a session stands for in a recommendation request
+        
+        Parameters:
+        - state (SessionState): Session, or None for an empty history
+        
+        Returns:
+        - SessionHistory: Recent product IDs with the most viewed categories and brands
+        """
+        if state is None:
+            return SessionHistory()
+        return SessionHistory(state.recent, state.categories[:self.affinity_top], state.brands[:self.affinity_top])
+    
+    def summary(self, session_id, state):
+        """
+        JSON-ready view of a session
+        """
+        return {"session_id": session_id, **state.to_dict()}
+    
+    def stats(self):
+        """
+        Return session counters and current size
+        """
+        with self._lock:
+            return {
+                "backend": self.backend_name,
+                "sessions": len(self._backend),
+                "max_sessions": self.max_sessions,
+                "window": self.window,
+                "ttl_seconds": self.ttl_seconds,
+                "events": self.events,
+                "ignored": self.ignored,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+    
+    def _live(self, session_id, now):
+        """
+        A session's state unless it has expired, in which case it is dropped
+        """
+        state = self._backend.get(session_id)
+        if state is not None and now - state.updated_at > self.ttl_seconds:
+            self._backend.delete(session_id)
+            self.expirations += 1
+            return None
+        return state
+    
+    async def _offload(self, method, *args):
+        """
+        Call a store method, in the default executor when sessions are on disk
+        """
+        if self.backend_name == 'memory':
+            return method(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+    
+    def _open_backend(self):
+        """
+        Create the configured backend, falling back to memory
+        """
+        if self.backend_name == 'disk':
+            try:
+                return DiskSessionBackend(self.path, self.max_sessions)
+            except sqlite3.Error as e:
+                print(f"Error opening session store at {self.path}: {str(e)}, keeping sessions in memory")
+        elif self.backend_name != 'memory':
+            print(f"Unknown SESSION_STORE_BACKEND {self.backend_name!r}, keeping sessions in memory")
+        self.backend_name = 'memory'
+        return MemorySessionBackend(self.max_sessions)
@@ -0,0 +1,469 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+import numpy as np
+
+from config import config
+from services.catalog_store import _aligned
+from services.retrieval_service import HashingEmbedder, IVFIndex
+
+MAGIC = b"SIMTAB01"
+
+# Weights of the attribute similarity (tags, features, subcategory), price
+# proximity and the neighbour's rating in a pair's score
+TEXT_WEIGHT = 0.7
+PRICE_WEIGHT = 0.2
+RATING_WEIGHT = 0.1
+# Price ratio at which price proximity falls to 1/e, in natural-log units
+PRICE_BANDWIDTH = 0.5
+# Catalogs up to this size are compared exhaustively instead of through IVF clusters
+EXACT_LIMIT = 5000
+# Clusters compared with each cluster's members when building through IVF
+CLUSTER_PROBES = 8
+# Query and candidate rows scored at once, to bound the size of the score matrix
+QUERY_CHUNK = 512
+CANDIDATE_CHUNK = 32768
+# Weight of each browsed product when merging neighbour lists, most recent first
+RECENCY_DECAY = 0.8
+# Share of changed products above which an update rebuilds the whole table
+REBUILD_FRACTION = 0.3
+# Product fields the pair score reads; changes to any other field (inventory,
+# descriptions) leave a product's embedding and neighbours as they are
+SCORED_FIELDS = ('tags', 'features', 'subcategory', 'price', 'rating')
+
+class AttributeEmbedder(HashingEmbedder):
+    """
+    Hashed TF-IDF embedder over the attributes that describe what a product is:
+    tags, features and subcategory (names and descriptions are left out)
+    """
+    
+    def tokens(self, product):
+        tokens = [f"tag:{tag.lower()}" for tag in product.get('tags', [])]
+        tokens.extend(f"feature:{feature.lower()}" for feature in product.get('features', []))
+        if product.get('subcategory'):
+            tokens.append(f"sub:{product['subcategory'].lower()}")
+        return tokens
+
+def product_hash(product):
+    """
+    Stable fingerprint of the fields of a product the score uses, used to find
+    the products that changed
+    """
+    scored = {field: product.get(field) for field in SCORED_FIELDS}
+    return zlib.crc32(json.dumps(scored, sort_keys=True).encode('utf-8'))
+
+def product_columns(products):
+    """
+    Log price and rating columns used by the pair score
+    """
+    prices = np.array([float(p.get('price') or 0.0) for p in products], dtype=np.float32)
+    ratings = np.array([float(p.get('rating') or 0.0) for p in products], dtype=np.float32)
+    return np.log1p(np.maximum(prices, 0.0)), ratings
+
+def pair_scores(vectors, log_prices, ratings, query_rows, candidate_rows):
+    """
+    Scores of every (query, candidate) pair, higher is more similar
+    
+    Returns:
+    - np.ndarray: len(query_rows) x len(candidate_rows) float32 scores
+    """
+    scores = TEXT_WEIGHT * (vectors[query_rows] @ vectors[candidate_rows].T)
+    price_gap = np.abs(log_prices[query_rows][:, None] - log_prices[candidate_rows][None, :])
+    scores += PRICE_WEIGHT * np.exp(-price_gap / PRICE_BANDWIDTH)
+    scores += RATING_WEIGHT * (ratings[candidate_rows] / 5.0)[None, :]
+    return scores.astype(np.float32, copy=False)
+
+def merge_top(neighbours, scores, candidate_rows, candidate_scores, top_n):
+    """
+    Merge new candidates into per-row neighbour lists, keeping the best top_n
+    
+    Parameters:
+    - neighbours (np.ndarray): rows x top_n neighbour rows, -1 for empty slots
+    - scores (np.ndarray): rows x top_n scores, -inf for empty slots
+    - candidate_rows (np.ndarray): Candidate rows (same for every row)
+    - candidate_scores (np.ndarray): rows x len(candidate_rows) scores, -inf to skip
+    
+    Returns:
+    - tuple: (neighbours, scores), best first
+    """
+    all_rows = np.concatenate([neighbours, np.broadcast_to(candidate_rows, candidate_scores.shape)], axis=1)
+    all_scores = np.concatenate([scores, candidate_scores], axis=1)
+    if all_scores.shape[1] > top_n:
+        keep = np.argpartition(-all_scores, top_n - 1, axis=1)[:, :top_n]
+        all_rows = np.take_along_axis(all_rows, keep, axis=1)
+        all_scores = np.take_along_axis(all_scores, keep, axis=1)
+    order = np.argsort(-all_scores, axis=1, kind='stable')
+    all_rows = np.take_along_axis(all_rows, order, axis=1)
+    all_scores = np.take_along_axis(all_scores, order, axis=1)
+    all_rows[~np.isfinite(all_scores)] = -1
+    return all_rows, all_scores
+
+def nearest_neighbours(vectors, log_prices, ratings, query_rows, candidate_rows, top_n, current=None, floor=None):
+    """
+    Exact top_n neighbours of the query rows among the candidate rows, in chunks
+    
+    Parameters:
+    - current (tuple): Existing (neighbours, scores) of the query rows to merge into
+    - floor (np.ndarray): Per query row, the score a candidate must reach to be merged
+    
+    Returns:
+    - tuple: (neighbours, scores) arrays of shape len(query_rows) x top_n
+    """
+    if current is None:
+        neighbours = np.full((len(query_rows), top_n), -1, dtype=np.int64)
+        scores = np.full((len(query_rows), top_n), -np.inf, dtype=np.float32)
+    else:
+        neighbours, scores = current
+    for start in range(0, len(query_rows), QUERY_CHUNK):
+        chunk = query_rows[start:start + QUERY_CHUNK]
+        rows = slice(start, start + len(chunk))
+        for candidate_start in range(0, len(candidate_rows), CANDIDATE_CHUNK):
+            candidates = candidate_rows[candidate_start:candidate_start + CANDIDATE_CHUNK]
+            chunk_scores = pair_scores(vectors, log_prices, ratings, chunk, candidates)
+            chunk_scores[chunk[:, None] == candidates[None, :]] = -np.inf
+            if floor is not None:
+                chunk_scores[chunk_scores < floor[rows][:, None]] = -np.inf
+            neighbours[rows], scores[rows] = merge_top(neighbours[rows], scores[rows], candidates, chunk_scores, top_n)
+    return neighbours, scores
+
+def build_similarity_table(products, table_path, catalog_version, top_n=None, dim=None):
+    """
+    Compute every product's top_n most similar products and write the table
+    
+    Small catalogs are compared exhaustively. Larger ones are clustered with
+    an IVF index over the attribute embeddings, and each cluster's members
+    are compared with the members of its CLUSTER_PROBES closest clusters.
+    
+    Parameters:
+    - products (list): Product dicts
+    - table_path (str): Output file
+    - catalog_version (str): Version recorded with the table
+    - top_n (int): Neighbours kept per product (SIMILARITY_TOP_N by default)
+    - dim (int): Embedding dimensions (SIMILARITY_DIM by default)
+    
+    Returns:
+    - int: Number of products written
+    """
+    top_n = top_n or config['SIMILARITY_TOP_N']
+    embedder = AttributeEmbedder(dim or config['SIMILARITY_DIM'])
+    vectors = embedder.fit_transform(products).astype(np.float32)
+    log_prices, ratings = product_columns(products)
+    count = len(products)
+    
+    if count <= EXACT_LIMIT:
+        rows = np.arange(count)
+        neighbours, scores = nearest_neighbours(vectors, log_prices, ratings, rows, rows, top_n)
+    else:
+        index = IVFIndex().build(vectors)
+        neighbours = np.full((count, top_n), -1, dtype=np.int64)
+        scores = np.full((count, top_n), -np.inf, dtype=np.float32)
+        probes = min(CLUSTER_PROBES, len(index.centroids))
+        closest = np.argpartition(-(index.centroids @ index.centroids.T), probes - 1, axis=1)[:, :probes]
+        for cluster, members in enumerate(index.lists):
+            if not len(members):
+                continue
+            candidates = np.concatenate([index.lists[other] for other in closest[cluster]])
+            neighbours[members], scores[members] = nearest_neighbours(
+                vectors, log_prices, ratings, members, candidates, top_n
+            )
+    
+    write_similarity_table(
+        table_path, catalog_version, [p['id'] for p in products], [product_hash(p) for p in products],
+        neighbours, scores, vectors, log_prices, ratings, embedder.idf
+    )
+    return count
+
+def update_similarity_table(table, products, table_path, catalog_version):
+    """
+    Write the table for a new catalog, recomputing only what changed
+    
+    Products whose fingerprint is new or different are embedded with the
+    table's IDF weights and compared with the whole catalog. Every other
+    product keeps its list, minus changed and deleted products, merged with
+    the changed products that score at least the old list's last entry: a
+    product the old list left out may outscore one below that, so the list
+    is shorter rather than filled out of order. When more than
+    REBUILD_FRACTION of the catalog changed, the table is rebuilt instead.
+    When no scored field changed and the products are in the same order, the
+    table's own file is still valid and isn't rewritten.
+    
+    Parameters:
+    - table (SimilarityTable): Table of an earlier catalog version
+    - products (list): The new catalog
+    - table_path (str): Output file (may be the table's own file)
+    - catalog_version (str): Version recorded with the new table
+    
+    Returns:
+    - dict: Products written, changed and deleted, whether it was a full
+      rebuild and whether the table was left as it was (unchanged)
+    """
+    hashes = [product_hash(p) for p in products]
+    old_rows = table.rows_of([p['id'] for p in products])
+    unchanged = (old_rows >= 0)
+    unchanged[unchanged] = table.hashes[old_rows[unchanged]] == np.asarray(hashes, dtype=np.uint32)[unchanged]
+    changed_rows = np.flatnonzero(~unchanged)
+    deleted = len(table) - int((old_rows >= 0).sum())
+    summary = {"products": len(products), "changed": len(changed_rows), "deleted": deleted, "rebuilt": False, "unchanged": False}
+    
+    if (not len(changed_rows) and not deleted and os.path.abspath(table_path) == os.path.abspath(table.table_path)
+            and np.array_equal(old_rows, np.arange(len(products)))):
+        summary["unchanged"] = True
+        return summary
+    
+    if len(changed_rows) + deleted > REBUILD_FRACTION * max(1, len(products)):
+        build_similarity_table(products, table_path, catalog_version, table.top_n, table.dim)
+        summary["rebuilt"] = True
+        return summary
+    
+    embedder = AttributeEmbedder(table.dim, idf=np.array(table.idf))
+    vectors = np.empty((len(products), table.dim), dtype=np.float32)
+    vectors[unchanged] = table.vectors[old_rows[unchanged]]
+    if len(changed_rows):
+        vectors[changed_rows] = embedder.transform([products[row] for row in changed_rows])
+    log_prices, ratings = product_columns(products)
+    
+    # Old row -> new row for products kept as they were; changed and deleted map to -1
+    old_to_new = np.full(len(table), -1, dtype=np.int64)
+    old_to_new[old_rows[unchanged]] = np.flatnonzero(unchanged)
+    neighbours = np.full((len(products), table.top_n), -1, dtype=np.int64)
+    scores = np.full((len(products), table.top_n), -np.inf, dtype=np.float32)
+    kept_rows = np.flatnonzero(unchanged)
+    old_lists = np.array(table.neighbours[old_rows[kept_rows]])
+    remapped = np.where(old_lists >= 0, old_to_new[np.maximum(old_lists, 0)], -1)
+    neighbours[kept_rows] = remapped
+    scores[kept_rows] = np.where(remapped >= 0, table.scores[old_rows[kept_rows]], -np.inf)
+    
+    if len(changed_rows):
+        all_rows = np.arange(len(products))
+        neighbours[changed_rows], scores[changed_rows] = nearest_neighbours(
+            vectors, log_prices, ratings, changed_rows, all_rows, table.top_n
+        )
+        # Products missing from a full old list scored at most its last entry
+        full = table.neighbours[old_rows[kept_rows], -1] >= 0
+        floor = np.where(full, table.scores[old_rows[kept_rows], -1].astype(np.float32), -np.inf)
+        neighbours[kept_rows], scores[kept_rows] = nearest_neighbours(
+            vectors, log_prices, ratings, kept_rows, changed_rows, table.top_n,
+            current=(neighbours[kept_rows], scores[kept_rows]), floor=floor
+        )
+    
+    write_similarity_table(
+        table_path, catalog_version, [p['id'] for p in products], hashes,
+        neighbours, scores, vectors, log_prices, ratings, table.idf
+    )
+    return summary
+
+def write_similarity_table(table_path, catalog_version, product_ids, hashes, neighbours, scores, vectors, log_prices, ratings, idf):
+    """
+    Write a similarity table file
+    
+    Layout: an 8-byte magic, the header length, a JSON header (row count,
+    catalog version, neighbours per product, embedding dimensions and column
+    offsets), then 64-byte aligned columns, like the columnar catalog file.
+    Neighbours are int32 rows into the table's own ID column and scores
+    float16; the embeddings, price and rating columns and per-product
+    fingerprints are kept so the next catalog version can be updated
+    incrementally. Written to a temporary name and renamed into place.
+    """
+    count = len(product_ids)
+    id_column = np.array([pid.encode('utf-8') for pid in product_ids], dtype=f"S{max((len(pid.encode('utf-8')) for pid in product_ids), default=1)}")
+    id_order = np.argsort(id_column, kind='stable').astype(np.int64)
+    columns = {
+        'ids': id_column,
+        'sorted_ids': id_column[id_order],
+        'id_order': id_order,
+        'hashes': np.asarray(hashes, dtype=np.uint32),
+        'neighbours': np.asarray(neighbours, dtype=np.int32).reshape(-1),
+        'scores': np.where(np.isfinite(scores), scores, 0.0).astype(np.float16).reshape(-1),
+        'vectors': np.asarray(vectors, dtype=np.float16).reshape(-1),
+        'log_prices': np.asarray(log_prices, dtype=np.float32),
+        'ratings': np.asarray(ratings, dtype=np.float32),
+        'idf': np.asarray(idf, dtype=np.float32)
+    }
+    column_meta = {}
+    offset = 0
+    for name, array in columns.items():
+        column_meta[name] = {"dtype": array.dtype.str, "length": len(array), "offset": offset}
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({
+        "count": count,
+        "catalog_version": catalog_version,
+        "top_n": int(np.shape(neighbours)[1]) if count else 0,
+        "dim": len(columns['idf']),
+        "columns": column_meta
+    }, separators=(',', ':')).encode('utf-8')
+    
+    data_start = _aligned(len(MAGIC) + 8 + len(header))
+    temp_path = f"{table_path}.tmp{os.getpid()}"
+    with open(temp_path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(struct.pack('<Q', len(header)))
+        file.write(header)
+        for name, array in columns.items():
+            file.seek(data_start + column_meta[name]["offset"])
+            file.write(array.tobytes())
+        file.truncate(data_start + offset)
+    os.replace(temp_path, table_path)
+
+class SimilarityTable:
+    """
+    Read-only, memory-mapped table of each product's most similar products
+    
+    Built offline with `python -m services.similarity_service`. Looking up a
+    browsing history reads a few rows of the neighbour columns, so it costs
+    the same for any catalog size, and worker processes share the pages.
+    """
+    
+    def __init__(self, table_path):
+        """
+        Map a table file written by write_similarity_table
+        """
+        self.table_path = table_path
+        with open(table_path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map.close()
+            raise ValueError(f"{table_path} is not a similarity table file")
+        
+        header_length, = struct.unpack_from('<Q', self._map, len(MAGIC))
+        header_end = len(MAGIC) + 8 + header_length
+        header = json.loads(self._map[len(MAGIC) + 8:header_end])
+        data_start = _aligned(header_end)
+        columns = {
+            name: np.frombuffer(self._map, dtype=np.dtype(meta["dtype"]), count=meta["length"], offset=data_start + meta["offset"])
+            for name, meta in header["columns"].items()
+        }
+        self.count = header["count"]
+        self.catalog_version = header["catalog_version"]
+        self.top_n = header["top_n"]
+        self.dim = header["dim"]
+        self.ids = columns['ids']
+        self.hashes = columns['hashes']
+        self.neighbours = columns['neighbours'].reshape(self.count, self.top_n)
+        self.scores = columns['scores'].reshape(self.count, self.top_n)
+        self.vectors = columns['vectors'].reshape(self.count, self.dim)
+        self.log_prices = columns['log_prices']
+        self.ratings = columns['ratings']
+        self.idf = columns['idf']
+        self._sorted_ids = columns['sorted_ids']
+        self._id_order = columns['id_order']
+    
+    def __len__(self):
+        return self.count
+    
+    def rows_of(self, product_ids):
+        """
+        Table rows for product IDs, -1 for IDs not in the table
+        """
+        encoded = [product_id.encode('utf-8') for product_id in product_ids]
+        if not encoded or not self.count:
+            return np.full(len(encoded), -1, dtype=np.int64)
+        keys = np.array(encoded, dtype=self._sorted_ids.dtype)
+        index = np.minimum(np.searchsorted(self._sorted_ids, keys), self.count - 1)
+        found = (self._sorted_ids[index] == keys) & (np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)) <= self._sorted_ids.dtype.itemsize)
+        return np.where(found, self._id_order[index], -1)
+    
+    def similar(self, product_ids, k):
+        """
+        Merge the neighbour lists of a browsing history
+        
+        Each browsed product's list is weighted by recency (the last one
+        weighs most) and a neighbour's scores are summed over the lists it
+        appears in. Browsed products are excluded.
+        
+        Parameters:
+        - product_ids (list): Browsed product IDs, oldest first
+        - k (int): Number of products to return
+        
+        Returns:
+        - list: (product ID, merged score, index in product_ids of the browsed
+          product it is most similar to), best first
+        """
+        rows = self.rows_of(product_ids)
+        known = np.flatnonzero(rows >= 0)
+        if not len(known):
+            return []
+        weights = RECENCY_DECAY ** (len(product_ids) - 1 - known).astype(np.float32)
+        lists = self.neighbours[rows[known]]
+        weighted = self.scores[rows[known]].astype(np.float32) * weights[:, None]
+        valid = (lists >= 0) & ~np.isin(lists, rows[known])
+        flat_rows = lists[valid]
+        flat_scores = weighted[valid]
+        sources = np.broadcast_to(known[:, None], lists.shape)[valid]
+        
+        unique_rows, inverse = np.unique(flat_rows, return_inverse=True)
+        totals = np.bincount(inverse, weights=flat_scores, minlength=len(unique_rows))
+        # Source of each neighbour: the browsed product with its highest weighted score
+        best = np.full(len(unique_rows), -np.inf)
+        np.maximum.at(best, inverse, flat_scores)
+        source_of = np.empty(len(unique_rows), dtype=np.int64)
+        is_best = flat_scores == best[inverse]
+        source_of[inverse[is_best]] = sources[is_best]
+        
+        order = np.argsort(-totals, kind='stable')[:k]
+        return [
+            (self.ids[unique_rows[i]].decode('utf-8'), float(totals[i]), int(source_of[i]))
+            for i in order
+        ]
+
+def load_similarity_table(snapshot, table_path=None):
+    """
+    The similarity table for a catalog snapshot, built or updated if needed
+    
+    A table on disk for the same catalog version is mapped as is. One for an
+    earlier version is updated incrementally and written back; without one,
+    the table is built. For large catalogs, run the offline job before
+    starting the API so this only maps the file.
+    
+    Parameters:
+    - snapshot (CatalogSnapshot): Catalog the table must match
+    - table_path (str): Table file, defaults to SIMILARITY_TABLE_PATH
+    
+    Returns:
+    - SimilarityTable or None when there's no usable table
+    """
+    table_path = table_path or config['SIMILARITY_TABLE_PATH']
+    if not table_path:
+        return None
+    table = None
+    if os.path.exists(table_path):
+        try:
+            table = SimilarityTable(table_path)
+        except Exception as e:
+            print(f"Error loading similarity table: {str(e)}")
+        if table is not None and table.catalog_version == snapshot.catalog_version:
+            return table
+    
+    products = [snapshot.products_by_id[product_id] for product_id in snapshot.ordered_ids]
+    if table is not None:
+        summary = update_similarity_table(table, products, table_path, snapshot.catalog_version)
+        if summary['unchanged']:
+            # Only unscored fields (e.g. inventory) changed: the mapped table still fits
+            return table
+        print(f"Similarity table updated: {summary['changed']} changed, {summary['deleted']} deleted"
+              f"{' (full rebuild)' if summary['rebuilt'] else ''}")
+    else:
+        build_similarity_table(products, table_path, snapshot.catalog_version)
+    return SimilarityTable(table_path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m services.similarity_service <products.json or catalog store> <table file>")
+        print("An existing table file is updated incrementally for the changed products.")
+        sys.exit(2)
+    from services.product_service import ProductService
+    source, output = sys.argv[1], sys.argv[2]
+    with open(source, 'rb') as file:
+        is_store = file.read(8) == b"PRODCOL1"
+    service = ProductService(store_path=source) if is_store else ProductService(data_path=source, store_path='')
+    snapshot = service.snapshot
+    products = [snapshot.products_by_id[product_id] for product_id in snapshot.ordered_ids]
+    if os.path.exists(output):
+        summary = update_similarity_table(SimilarityTable(output), products, output, snapshot.catalog_version)
+        print(f"Updated {output}: {summary}")
+    else:
+        written = build_similarity_table(products, output, snapshot.catalog_version)
+        print(f"Wrote neighbours of {written} products to {output}")
@@ -0,0 +1,230 @@
+import asyncio
+import time
+from collections import OrderedDict, namedtuple
+from config import config
+
+# Seconds between dispatch attempts while queued jobs wait for LLM headroom or budget
+POLL_INTERVAL = 0.05
+
+# Speculative results remembered for hit accounting, per allowed running job
+COMPLETED_PER_SLOT = 1024
+
+SpeculativeJob = namedtuple('SpeculativeJob', ['queued_at', 'cache_key', 'factory'])
+
+class SpeculativeScheduler:
+    """
+    Low-priority precomputation of the recommendations a user is about to request
+    
+    A product view makes a recommendation request for the updated history
+    likely, so schedule() queues a background job computing that request's
+    result into the result cache ahead of time. The real request is then a
+    cache hit, or joins the still-running LLM call through the coalescer.
+    
+    Background jobs must never cost foreground requests anything, and their
+    spend is capped:
+    - one queued job per session: a newer view replaces the session's queued
+      job, whose history is stale. A job already running is left to finish,
+      because its call is paid for and its result stays cacheable
+    - a queued job older than max_age_seconds is dropped when its turn comes
+    - at most `concurrency` jobs run at once, and a job only starts while more
+      than reserved_slots LLM slots are free. Foreground requests shed to the
+      fallback when no slot is free, so they keep that headroom
+    - at most budget_per_minute jobs start per minute (a token bucket)
+    
+    Every real request is reported through record_request(), which counts
+    how many were answered by a speculative result (used) or joined a running
+    job that then completed (joined).
+    """
+    
+    def __init__(self, spare_slots, is_cached, enabled=None, concurrency=None, reserved_slots=None,
+                 budget_per_minute=None, max_age_seconds=None, max_queued=None):
+        """
+        Initialize the scheduler, defaulting every setting to the config values
+        
+        Parameters:
+        - spare_slots (callable): Returns the LLM calls that could start now without shedding
+        - is_cached (callable): Whether the result for a cache key is already cached
+        - enabled (bool): SPECULATION_ENABLED by default
+        - concurrency (int): Jobs running at once (SPECULATION_CONCURRENCY)
+        - reserved_slots (int): Free LLM slots left to foreground requests (SPECULATION_RESERVED_SLOTS)
+        - budget_per_minute (float): Jobs started per minute (SPECULATION_BUDGET_PER_MINUTE)
+        - max_age_seconds (float): Seconds a job may wait in the queue (SPECULATION_MAX_AGE_SECONDS)
+        - max_queued (int): Queued jobs kept, the oldest dropped first (SPECULATION_MAX_QUEUED)
+        """
+        self.spare_slots = spare_slots
+        self.is_cached = is_cached
+        self.enabled = config['SPECULATION_ENABLED'] if enabled is None else enabled
+        self.concurrency = config['SPECULATION_CONCURRENCY'] if concurrency is None else concurrency
+        self.reserved_slots = config['SPECULATION_RESERVED_SLOTS'] if reserved_slots is None else reserved_slots
+        self.budget_per_minute = config['SPECULATION_BUDGET_PER_MINUTE'] if budget_per_minute is None else budget_per_minute
+        self.max_age_seconds = config['SPECULATION_MAX_AGE_SECONDS'] if max_age_seconds is None else max_age_seconds
+        self.max_queued = config['SPECULATION_MAX_QUEUED'] if max_queued is None else max_queued
+        
+        self._queued = OrderedDict()  # session id -> SpeculativeJob, oldest first
+        self._running = {}  # cache key -> task
+        self._completed = OrderedDict()  # cache key -> finished at, for hit accounting
+        self._joined = set()  # running cache keys a real request already joined
+        self._budget = self.budget_per_minute
+        self._refilled_at = time.monotonic()
+        self._wakeup = None
+        self._dispatcher = None
+        
+        self.scheduled = 0
+        self.superseded = 0
+        self.expired = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.fallbacks = 0
+        self.requests = 0
+        self.used = 0
+        self.joined = 0
+    
+    def schedule(self, session_id, cache_key, factory):
+        """
+        Queue the precomputation of a session's next request
+        
+        Parameters:
+        - session_id (str): Session the view belongs to
+        - cache_key (str): Result cache key of the request being anticipated
+        - factory (callable): Returns the coroutine computing and caching the result
+        
+        Returns:
+        - bool: True if a job was queued (False when disabled, cached or already running)
+        """
+        if not self.enabled:
+            return False
+        if cache_key in self._running or self.is_cached(cache_key):
+            self.skipped += 1
+            return False
+        if self._queued.pop(session_id, None) is not None:
+            self.superseded += 1
+        self._queued[session_id] = SpeculativeJob(time.monotonic(), cache_key, factory)
+        while len(self._queued) > self.max_queued:
+            self._queued.popitem(last=False)
+            self.dropped += 1
+        self.scheduled += 1
+        self._ensure_dispatcher()
+        self._wakeup.set()
+        return True
+    
+    def record_request(self, cache_key, cached):
+        """
+        Account a real recommendation request against speculative results
+        
+        Parameters:
+        - cache_key (str): The request's cache key
+        - cached (bool): Whether it was answered from the result cache
+        """
+        if not self.enabled:
+            return
+        self.requests += 1
+        if self._completed.pop(cache_key, None) is not None and cached:
+            self.used += 1
+        elif cache_key in self._running:
+            # Counted as joined once the job completes; a failed or fallback job answered nothing
+            self._joined.add(cache_key)
+    
+    def stop(self):
+        """
+        Drop queued jobs and stop dispatching; running jobs are cancelled
+        """
+        self._queued.clear()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for task in list(self._running.values()):
+            task.cancel()
+    
+    def stats(self):
+        """
+        Return scheduling counters, the share of completed jobs a real request
+        used (hit_ratio) and of real requests a job answered (request_hit_ratio)
+        """
+        return {
+            "enabled": self.enabled,
+            "queued": len(self._queued),
+            "running": len(self._running),
+            "budget_per_minute": self.budget_per_minute,
+            "budget_left": round(self._budget, 2),
+            "scheduled": self.scheduled,
+            "superseded": self.superseded,
+            "expired": self.expired,
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "started": self.started,
+            "completed": self.completed,
+            "failed": self.failed,
+            "fallbacks": self.fallbacks,
+            "requests": self.requests,
+            "used": self.used,
+            "joined": self.joined,
+            "hit_ratio": round((self.used + self.joined) / self.completed, 4) if self.completed else 0.0,
+            "request_hit_ratio": round((self.used + self.joined) / self.requests, 4) if self.requests else 0.0
+        }
+    
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.ensure_future(self._dispatch())
+    
+    async def _dispatch(self):
+        """
+        Start queued jobs whenever a view, a finished job or the poll interval allows
+        """
+        while True:
+            self._wakeup.clear()
+            self._start_ready()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL if self._queued else None)
+            except asyncio.TimeoutError:
+                pass
+    
+    def _start_ready(self):
+        """
+        Start queued jobs, oldest first, while concurrency, LLM headroom and budget allow
+        """
+        now = time.monotonic()
+        self._budget = min(self.budget_per_minute, self._budget + (now - self._refilled_at) * self.budget_per_minute / 60.0)
+        self._refilled_at = now
+        while self._queued and len(self._running) < self.concurrency:
+            session_id, job = next(iter(self._queued.items()))
+            if now - job.queued_at > self.max_age_seconds:
+                del self._queued[session_id]
+                self.expired += 1
+                continue
+            if job.cache_key in self._running or self.is_cached(job.cache_key):
+                del self._queued[session_id]
+                self.skipped += 1
+                continue
+            if self.spare_slots() <= self.reserved_slots or self._budget < 1:
+                return
+            del self._queued[session_id]
+            self._budget -= 1
+            self.started += 1
+            task = asyncio.ensure_future(job.factory())
+            self._running[job.cache_key] = task
+            task.add_done_callback(lambda task, cache_key=job.cache_key: self._finished(cache_key, task))
+    
+    def _finished(self, cache_key, task):
+        self._running.pop(cache_key, None)
+        joined = cache_key in self._joined
+        self._joined.discard(cache_key)
+        if task.cancelled() or task.exception() is not None:
+            self.failed += 1
+        elif task.result().get('fallback'):
+            # Shed or failed LLM calls aren't cached, so there is nothing to reuse
+            self.fallbacks += 1
+        else:
+            self.completed += 1
+            # A joined result was already used; others wait for their request
+            if joined:
+                self.joined += 1
+            else:
+                self._completed[cache_key] = time.monotonic()
+                while len(self._completed) > COMPLETED_PER_SLOT * max(1, self.concurrency):
+                    self._completed.popitem(last=False)
+        if self._wakeup is not None:
+            self._wakeup.set()
@@ -0,0 +1,95 @@
+import json
+import re
+
+class IncrementalArrayParser:
+    """
+    Incremental parser for a streamed JSON array of objects
+    
+    Text is fed in arbitrary chunks as it arrives from the LLM. The parser
+    tracks string/escape state and nesting depth in a single pass and returns
+    each top-level object as soon as its closing brace arrives, so callers can
+    act on the first recommendation before the array is complete. Anything
+    before the opening '[' (e.g. a ```json fence) is skipped, and so is an
+    array whose first element isn't an object, such as a "[5]" citation in
+    prose before the real one.
+    """
+    
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._first = False  # inside the array, before its first element
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._buffer = []
+    
+    def feed(self, chunk):
+        """
+        Consume a chunk of text and return the objects it completed
+        
+        Parameters:
+        - chunk (str): Next piece of the streamed response
+        
+        Returns:
+        - list: Parsed dicts whose closing brace was in this chunk
+        """
+        completed = []
+        for char in chunk:
+            if self.finished:
+                break
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                    self._first = True
+                continue
+            if self._first:
+                if char.isspace():
+                    continue
+                self._first = False
+                if char != '{':
+                    # Not an array of objects: look for the next '[' (this one may be it)
+                    self.started = char == '['
+                    self._first = self.started
+                    continue
+            
+            if self._depth > 0:
+                self._buffer.append(char)
+            
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            
+            if char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._buffer = [char]
+                self._depth += 1
+            elif char == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    obj = self._decode(''.join(self._buffer))
+                    if obj is not None:
+                        completed.append(obj)
+                    self._buffer = []
+            elif char == ']' and self._depth == 0:
+                self.finished = True
+        return completed
+    
+    def _decode(self, text):
+        """
+        Decode one object, repairing trailing commas if needed
+        """
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            try:
+                obj = json.loads(re.sub(r',\s*}', '}', text))
+            except json.JSONDecodeError:
+                return None
+        return obj if isinstance(obj, dict) else None
@@ -0,0 +1,216 @@
+"""
+Reference copies of the code the new services replaced
+
+Taken from the original LLMService, with comments trimmed; the equivalence
+tests compare the new services against them.
+"""
+
+import json
+import re
+
+def baseline_prompt(user_preferences, browsed_products, relevant_products):
+    """
+    Prompt text of the original _create_recommendation_prompt for the given candidates
+    """
+    prompt = """You are an expert e-commerce product recommendation assistant. Your task is to analyze user preferences and browsing history to recommend the best 5 products from our catalog.
+
+IMPORTANT: Respond with valid JSON only, no other text. Use this exact format:
+[
+  {
+    "product_id": "prod001",
+    "explanation": "This product matches your preferences because...",
+    "score": 8.5
+  }
+]
+
+**CRITICAL INSTRUCTIONS:**
+1.  Respond ONLY with a valid JSON object in the specified format. Do not include any other text or explanations outside the JSON structure.
+2.  Provide a unique, insightful reason for each recommendation.
+3.  DO NOT recommend any products that are already in the user's browsing history.
+
+USER PREFERENCES:"""
+    if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
+        price_labels = {
+            'under-50': 'Under $50',
+            '50-100': '$50-$100',
+            '100-200': '$100-$200',
+            'over-200': 'Over $200'
+        }
+        prompt += f"\n- Budget: {price_labels.get(user_preferences['priceRange'], 'Any')}"
+    if user_preferences.get('categories'):
+        prompt += f"\n- Preferred Categories: {', '.join(user_preferences['categories'])}"
+    if user_preferences.get('brands'):
+        prompt += f"\n- Preferred Brands: {', '.join(user_preferences['brands'])}"
+    prompt += "\n\nBROWSING HISTORY (products they showed interest in):"
+    if browsed_products:
+        for product in browsed_products[-5:]:
+            prompt += f"\n- {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')}"
+    else:
+        prompt += "\n- No browsing history yet"
+    prompt += f"\n\nAVAILABLE PRODUCTS ({len(relevant_products)} products):"
+    for product in relevant_products:
+        features_str = ', '.join(product.get('features', [])[:3])
+        prompt += f"\n- ID: {product['id']} | {product['name']} | {product['category']} | ${product['price']} | {product.get('brand', 'N/A')} | Features: {features_str}"
+    prompt += """\n\nTASK:
+1. Analyze the user's preferences and browsing patterns
+2. Recommend exactly 5 products that best match their interests
+3. For each recommendation, explain WHY it fits their preferences/behavior
+4. Rate each recommendation 1-10 based on relevance
+5. Consider variety - don't recommend only from one category unless they specifically prefer it
+
+Return valid JSON array with product_id, explanation, and score fields."""
+    return prompt
+
+def baseline_filter(user_preferences, browsed_products, all_products):
+    """
+    Candidate filter of the original LLMService._filter_relevant_products
+    """
+    relevant_products = []
+    
+    # Always include products from browsed categories/brands
+    browsed_categories = set(p.get('category') for p in browsed_products)
+    browsed_brands = set(p.get('brand') for p in browsed_products)
+    
+    for product in all_products:
+        include = False
+        
+        # Include if matches user preferences
+        if user_preferences.get('categories') and product['category'] in user_preferences['categories']:
+            include = True
+        if user_preferences.get('brands') and product.get('brand') in user_preferences['brands']:
+            include = True
+        
+        # Include if from browsed categories/brands
+        if product['category'] in browsed_categories or product.get('brand') in browsed_brands:
+            include = True
+        
+        # Include if matches price range
+        if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
+            price = product['price']
+            price_match = False
+            if user_preferences['priceRange'] == 'under-50' and price < 50:
+                price_match = True
+            elif user_preferences['priceRange'] == '50-100' and 50 <= price <= 100:
+                price_match = True
+            elif user_preferences['priceRange'] == '100-200' and 100 <= price <= 200:
+                price_match = True
+            elif user_preferences['priceRange'] == 'over-200' and price > 200:
+                price_match = True
+            
+            if price_match:
+                include = True
+        
+        # If no preferences set, include top-rated products
+        if not user_preferences.get('categories') and not user_preferences.get('brands') and not browsed_products:
+            if product.get('rating', 0) > 4.0:
+                include = True
+        
+        if include:
+            relevant_products.append(product)
+    
+    # If we have too many, prioritize by rating and limit to 30 products
+    if len(relevant_products) > 30:
+        relevant_products.sort(key=lambda x: x.get('rating', 0), reverse=True)
+        relevant_products = relevant_products[:30]
+    
+    # If we have too few, add some popular products
+    if len(relevant_products) < 10:
+        for product in all_products:
+            if product not in relevant_products and product.get('rating', 0) > 4.0:
+                relevant_products.append(product)
+                if len(relevant_products) >= 20:
+                    break
+    
+    return relevant_products
+
+def baseline_scores(user_preferences, browsed_products, candidates):
+    """
+    Scoring loop of the original _generate_fallback_recommendations, best first
+    """
+    scored_products = []
+    for product in candidates:
+        score = 5.0
+        explanation_parts = []
+        if user_preferences.get('categories') and product['category'] in user_preferences['categories']:
+            score += 2.0
+            explanation_parts.append(f"matches your preferred {product['category']} category")
+        if user_preferences.get('brands') and product.get('brand') in user_preferences['brands']:
+            score += 1.5
+            explanation_parts.append(f"from your preferred brand {product.get('brand')}")
+        if user_preferences.get('priceRange') and user_preferences['priceRange'] != 'all':
+            price = product['price']
+            price_match = False
+            if user_preferences['priceRange'] == 'under-50' and price < 50:
+                price_match = True
+            elif user_preferences['priceRange'] == '50-100' and 50 <= price <= 100:
+                price_match = True
+            elif user_preferences['priceRange'] == '100-200' and 100 <= price <= 200:
+                price_match = True
+            elif user_preferences['priceRange'] == 'over-200' and price > 200:
+                price_match = True
+            if price_match:
+                score += 1.0
+                explanation_parts.append("fits your budget range")
+        browsed_categories = [p['category'] for p in browsed_products]
+        if product['category'] in browsed_categories:
+            score += 1.5
+            explanation_parts.append("similar to products you've browsed")
+        rating = product.get('rating', 0)
+        if rating > 4.5:
+            score += 1.0
+            explanation_parts.append(f"highly rated ({rating}/5)")
+        elif rating > 4.0:
+            score += 0.5
+            explanation_parts.append(f"well-rated ({rating}/5)")
+        if explanation_parts:
+            explanation = f"Recommended because it {', '.join(explanation_parts)}"
+        else:
+            explanation = f"Popular {product['category']} product with good ratings"
+        scored_products.append({"product": product, "score": min(score, 10.0), "explanation": explanation})
+    scored_products.sort(key=lambda x: x['score'], reverse=True)
+    return scored_products
+
+def baseline_fallback(user_preferences, browsed_products, all_products):
+    """
+    Result of the original LLMService._generate_fallback_recommendations
+    """
+    relevant_products = baseline_filter(user_preferences, browsed_products, all_products)
+    if not relevant_products:
+        relevant_products = sorted(all_products, key=lambda x: x.get('rating', 0), reverse=True)[:10]
+    recommendations = [
+        {"product": rec["product"], "explanation": rec["explanation"], "confidence_score": rec["score"]}
+        for rec in baseline_scores(user_preferences, browsed_products, relevant_products)[:5]
+    ]
+    return {
+        "recommendations": recommendations,
+        "count": len(recommendations),
+        "fallback": True,
+        "message": "Generated using intelligent fallback algorithm (LLM unavailable)"
+    }
+
+def baseline_items(llm_response):
+    """
+    The items the original _parse_recommendation_response found, or None when
+    it reported an error
+    """
+    llm_response = llm_response.strip()
+    json_match = re.search(r'\[.*\]', llm_response, re.DOTALL)
+    if json_match:
+        json_str = json_match.group()
+    else:
+        start_idx = llm_response.find('[')
+        end_idx = llm_response.rfind(']') + 1
+        if start_idx == -1 or end_idx == 0:
+            return None
+        json_str = llm_response[start_idx:end_idx]
+    try:
+        rec_data = json.loads(json_str)
+    except json.JSONDecodeError:
+        json_str = json_str.replace("'", '"')
+        json_str = re.sub(r',\s*}', '}', json_str)
+        json_str = re.sub(r',\s*]', ']', json_str)
+        try:
+            rec_data = json.loads(json_str)
+        except json.JSONDecodeError:
+            return None
+    return rec_data if isinstance(rec_data, list) else None
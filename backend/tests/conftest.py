@@ -0,0 +1,59 @@
+"""
+Shared fixtures for the backend unit tests
+
+Run from backend/ with `python -m pytest -q`. The tests need no LLM
+provider: services are built from small generated catalogs and LLM calls are
+replaced with stubs.
+"""
+
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# The OpenAI client refuses to start without a key; no test reaches the provider
+os.environ.setdefault('OPENAI_API_KEY', 'test-key')
+
+from benchmarks.synthetic import generate_catalog
+
+class Clock:
+    """
+    Stand-in for a module's time import that tests move forward by hand
+    
+    Patch it over one module (monkeypatch.setattr(module, 'time', clock)) so
+    the event loop's own clock keeps running.
+    """
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def time(self):
+        return self.now
+    
+    def monotonic(self):
+        return self.now
+    
+    def perf_counter(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def products():
+    """
+    A 300-product generated catalog
+    """
+    return generate_catalog(300, seed=1)
+
+@pytest.fixture
+def make_products():
+    """
+    Factory for generated catalogs of a given size and seed
+    """
+    return lambda size, seed=0: generate_catalog(size, seed=seed)
@@ -0,0 +1,102 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import app
+from app import etag_matches, render_products_page
+from services.cache_service import SerializedResponseCache
+from services.product_service import CatalogSnapshot, ProductService
+from services.serialization import COMPACT_FIELDS, ProductEncoder, dumps
+
+def query(categories=None, brands=None, min_price=None, max_price=None, min_rating=None,
+          fields=None, limit=None, offset=0, cursor=None):
+    return categories, brands, min_price, max_price, min_rating, fields, limit, offset, cursor
+
+@pytest.mark.parametrize("header, expected", [
+    (None, False),
+    ('', False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", W/"abc"', True),
+    ('"other" , "more"', False),
+    ('*', True),
+    ('"ab"', False)
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, '"abc"') is expected
+    assert etag_matches(header, 'W/"abc"') is expected
+
+def test_unfiltered_page_is_the_whole_catalog(products):
+    catalog = CatalogSnapshot(products, "v1")
+    body, total, next_cursor = render_products_page(catalog, query())
+    # The same bytes as encoding the catalog, which /api/products used to return
+    assert body == dumps(products)
+    assert (total, next_cursor) == (len(products), None)
+
+def test_cursor_pages_cover_the_matches_once(products):
+    catalog = CatalogSnapshot(products, "v1")
+    expected = [p for p in products if p['category'] in ("Home", "Books") and p['price'] <= 100]
+    pages, cursor = [], None
+    while True:
+        body, total, cursor = render_products_page(
+            catalog, query(categories=["Home", "Books"], max_price=100, limit=7, cursor=cursor)
+        )
+        pages.extend(json.loads(body))
+        assert total == len(expected)
+        if cursor is None:
+            break
+    assert pages == expected
+
+def test_offset_and_fields(products):
+    catalog = CatalogSnapshot(products, "v1")
+    body, total, next_cursor = render_products_page(catalog, query(fields=("id", "price", "nope"), limit=3, offset=5))
+    assert json.loads(body) == [{"id": p['id'], "price": p['price']} for p in products[5:8]]
+    assert next_cursor == "7"
+
+def test_invalid_cursor(products):
+    with pytest.raises(HTTPException) as error:
+        render_products_page(CatalogSnapshot(products, "v1"), query(cursor="abc"))
+    assert error.value.status_code == 400
+
+def test_pages_are_compressed_once_per_encoding(products, monkeypatch):
+    monkeypatch.setattr(app, 'product_service', ProductService(products=products, store_path=''))
+    monkeypatch.setattr(app, 'products_page_cache', SerializedResponseCache())
+    compressed = []
+    
+    async def acompress(body, encoding):
+        compressed.append(encoding)
+        return gzip.compress(body)
+    monkeypatch.setattr(app, 'acompress', acompress)
+    
+    def get(accept_encoding):
+        scope = {"type": "http", "method": "GET", "path": "/api/products", "query_string": b"",
+                 "headers": [(b"accept-encoding", accept_encoding.encode())]}
+        return asyncio.run(app.get_products(Request(scope), offset=0))
+    
+    responses = [get("gzip, deflate") for _ in range(3)]
+    assert compressed == ["gzip"]
+    for response in responses:
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert gzip.decompress(response.body) == dumps(products)
+    plain = get("identity")
+    assert "content-encoding" not in plain.headers and plain.body == dumps(products)
+    assert compressed == ["gzip"]
+
+def test_stream_events_can_be_compact(products, monkeypatch):
+    monkeypatch.setattr(app, 'product_encoder', ProductEncoder(ProductService(products=products, store_path='')))
+    item = {"product": products[0], "explanation": "fits", "confidence_score": 8}
+    summary = {"recommendations": [item], "count": 1}
+    assert app.format_recommendation_sse("recommendation", item) == app.format_sse("recommendation", item)
+    assert app.format_recommendation_sse("summary", summary) == app.format_sse("summary", summary)
+    
+    compact_product = {field: products[0][field] for field in COMPACT_FIELDS if field in products[0]}
+    event = app.format_recommendation_sse("recommendation", item, compact=True)
+    assert event.startswith("event: recommendation\ndata: ") and event.endswith("\n\n")
+    assert json.loads(event.split("data: ", 1)[1]) == dict(item, product=compact_product)
+    event = app.format_recommendation_sse("summary", summary, compact=True)
+    assert json.loads(event.split("data: ", 1)[1]) == {"recommendations": [dict(item, product=compact_product)], "count": 1}
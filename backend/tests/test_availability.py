@@ -0,0 +1,81 @@
+import numpy as np
+
+from services.availability import Availability, inventory_level
+from services.product_service import CatalogSnapshot
+
+def bitmaps(availability):
+    return (
+        availability.in_stock.tolist(), availability.low_stock.tolist(),
+        availability.unavailable_ids, availability.low_stock_ids
+    )
+
+def expected_bitmaps(snapshot, threshold):
+    """
+    Stock state of every product, computed directly from the product dicts
+    """
+    products = [snapshot.products_by_id[pid] for pid in snapshot.ordered_ids]
+    levels = [p.get('inventory') for p in products]
+    tracked = [isinstance(level, (int, float)) and not isinstance(level, bool) for level in levels]
+    in_stock = [not known or level > 0 for known, level in zip(tracked, levels)]
+    low_stock = [known and 0 < level <= threshold for known, level in zip(tracked, levels)]
+    return (
+        in_stock, low_stock,
+        frozenset(p['id'] for p, known, level in zip(products, tracked, levels) if known and level <= 0),
+        frozenset(p['id'] for p, low in zip(products, low_stock) if low)
+    )
+
+def test_inventory_level():
+    assert inventory_level({"inventory": 3}) == 3
+    assert inventory_level({"inventory": -2}) == -2
+    assert inventory_level({}) is None
+    assert inventory_level({"inventory": "3"}) is None
+    assert inventory_level({"inventory": True}) is None
+
+def test_full_build_matches_product_dicts(products):
+    products[0]['inventory'] = -3
+    del products[1]['inventory']
+    snapshot = CatalogSnapshot(products, "v1")
+    assert bitmaps(Availability(snapshot, 5)) == expected_bitmaps(snapshot, 5)
+
+def test_delta_matches_full_build(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    availability = snapshot.derived('availability', lambda s: Availability(s, 5))
+    upserts = [
+        dict(products[0], inventory=0),
+        dict(products[1], inventory=2),
+        dict(products[2], inventory=-1),
+        {key: value for key, value in products[3].items() if key != 'inventory'},
+        dict(products[4], id="new0001", inventory=0)
+    ]
+    # A product that was out of stock and lost its count is available again
+    out_of_stock = next(p for p in products if p['inventory'] == 0)
+    upserts.append({key: value for key, value in out_of_stock.items() if key != 'inventory'})
+    deletes = [products[5]['id'], next(p['id'] for p in products[6:] if p['inventory'] == 0)]
+    
+    updated = snapshot.apply_delta(upserts, deletes)
+    incremental = updated.derived('availability', lambda s: Availability(s, 5))
+    assert updated.previous_derived('availability')[0] is availability
+    assert bitmaps(incremental) == bitmaps(Availability(CatalogSnapshot(updated.products, "rebuilt"), 5))
+    assert bitmaps(incremental) == expected_bitmaps(updated, 5)
+    assert out_of_stock['id'] not in incremental.unavailable_ids
+
+def test_threshold_change_rebuilds(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    snapshot.derived('availability', lambda s: Availability(s, 5))
+    updated = snapshot.apply_delta([dict(products[0], inventory=20)])
+    assert bitmaps(updated.derived('availability', lambda s: Availability(s, 50))) == expected_bitmaps(updated, 50)
+
+def test_prune_available_and_stats(products):
+    products[0]['inventory'] = 0
+    products[1]['inventory'] = -4
+    products[2]['inventory'] = 1
+    del products[3]['inventory']
+    snapshot = CatalogSnapshot(products, "v1")
+    availability = Availability(snapshot, 5)
+    ids = {p['id'] for p in products[:4]}
+    assert availability.prune(ids) == {products[2]['id'], products[3]['id']}
+    assert availability.available(products[:4]) == [products[2], products[3]]
+    assert products[2]['id'] in availability.demoted
+    stats = availability.stats()
+    assert stats["out_of_stock"] == int(np.count_nonzero(~availability.in_stock))
+    assert stats["products"] == len(products)
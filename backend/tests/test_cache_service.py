@@ -0,0 +1,128 @@
+import pytest
+
+from services import cache_service
+from services.cache_service import RecommendationCache, SerializedResponseCache
+from services.session_store import SessionHistory
+
+RESULT = {"recommendations": [{"product": {"id": "p1"}, "explanation": "x", "confidence_score": 8.0}], "count": 1}
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(cache_service, 'time', clock)
+    return clock
+
+def make_cache(**options):
+    settings = dict(max_entries=100, ttl_seconds=60, history_window=3, disk_path='', disk_max_entries=100, enabled=True)
+    settings.update(options)
+    return RecommendationCache(**settings)
+
+def test_key_ignores_preference_order_and_duplicates():
+    cache = make_cache()
+    key = cache.make_key({"priceRange": "all", "categories": ["Home", "Sports"], "brands": ["B", "A"]}, ["p1"], "v1")
+    assert key == cache.make_key({"categories": ["Sports", "Home", "Home"], "brands": ["A", "B"]}, ["p1"], "v1")
+    # An empty price range means "all", like the prompt and the scorer treat it
+    assert key == cache.make_key({"priceRange": "", "categories": ["Home", "Sports"], "brands": ["A", "B"]}, ["p1"], "v1")
+
+def test_key_keeps_order_of_recent_history_only():
+    cache = make_cache(history_window=2)
+    preferences = {"categories": ["Home"]}
+    key = cache.make_key(preferences, ["a", "b", "c", "d"], "v1")
+    # Products before the window only count as a set
+    assert key == cache.make_key(preferences, ["b", "a", "c", "d"], "v1")
+    assert key == cache.make_key(preferences, ["a", "b", "a", "c", "d"], "v1")
+    # The products the prompt shows keep their order
+    assert key != cache.make_key(preferences, ["a", "b", "d", "c"], "v1")
+
+@pytest.mark.parametrize("other", [
+    ({"categories": ["Home"], "priceRange": "under-50"}, ["a"], "v1"),
+    ({"categories": ["Sports"]}, ["a"], "v1"),
+    ({"categories": ["Home"], "brands": ["B"]}, ["a"], "v1"),
+    ({"categories": ["Home"]}, ["b"], "v1"),
+    ({"categories": ["Home"]}, ["a"], "v2"),
+    ({"categories": ["Home"]}, SessionHistory(["a"], categories=["Home"]), "v1")
+])
+def test_key_distinguishes_requests_with_different_answers(other):
+    cache = make_cache()
+    assert cache.make_key({"categories": ["Home"]}, ["a"], "v1") != cache.make_key(*other)
+
+def test_session_history_keys_like_a_list_without_affinities():
+    cache = make_cache()
+    assert cache.make_key({}, SessionHistory(["a", "b"]), "v1") == cache.make_key({}, ["a", "b"], "v1")
+
+def test_get_set_and_ttl(clock):
+    cache = make_cache()
+    cache.set("k", RESULT)
+    assert cache.get("k") == RESULT
+    clock.now += 60
+    assert cache.contains("k")
+    clock.now += 1
+    assert not cache.contains("k")
+    assert cache.get("k") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["entries"]) == (1, 1, 1, 0)
+
+def test_contains_does_not_count_a_lookup():
+    cache = make_cache()
+    cache.set("k", RESULT)
+    assert cache.contains("k") and not cache.contains("other")
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+
+def test_degraded_results_are_not_cached():
+    cache = make_cache()
+    cache.set("fallback", dict(RESULT, fallback=True))
+    cache.set("error", dict(RESULT, error="Failed to parse JSON"))
+    assert cache.get("fallback") is None and cache.get("error") is None
+    assert cache.stats()["skipped"] == 2
+
+def test_lru_eviction():
+    cache = make_cache(max_entries=2)
+    cache.set("a", RESULT)
+    cache.set("b", RESULT)
+    cache.get("a")
+    cache.set("c", RESULT)
+    assert cache.get("b") is None
+    assert cache.get("a") == RESULT and cache.get("c") == RESULT
+    assert cache.stats()["evictions"] == 1
+
+def test_disabled_cache_stores_nothing():
+    cache = make_cache(enabled=False)
+    cache.set("k", RESULT)
+    assert cache.get("k") is None and not cache.contains("k")
+
+def test_disk_store_survives_restart(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    make_cache(disk_path=path).set("k", RESULT)
+    restarted = make_cache(disk_path=path)
+    assert restarted.contains("k")
+    assert restarted.get("k") == RESULT
+    assert restarted.stats()["disk_hits"] == 1
+    
+    clock.now += 61
+    assert make_cache(disk_path=path).get("k") is None
+
+def test_disk_store_is_trimmed(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cache = make_cache(disk_path=path, disk_max_entries=2)
+    for key in ("a", "b", "c"):
+        clock.now += 1
+        cache.set(key, RESULT)
+    restarted = make_cache(disk_path=path)
+    assert restarted.get("a") is None
+    assert restarted.get("b") == RESULT and restarted.get("c") == RESULT
+
+def test_clear_empties_memory_and_disk(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = make_cache(disk_path=path)
+    cache.set("k", RESULT)
+    cache.clear()
+    assert cache.get("k") is None
+    assert make_cache(disk_path=path).get("k") is None
+
+def test_serialized_response_cache_lru():
+    cache = SerializedResponseCache(max_entries=2)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1"
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.stats() == {"entries": 2, "max_entries": 2, "hits": 1, "misses": 1}
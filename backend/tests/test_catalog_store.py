@@ -0,0 +1,122 @@
+import json
+
+import numpy as np
+import pytest
+
+from services.availability import Availability
+from services.catalog_store import CatalogStore, build_catalog_store, write_catalog_store
+from services.product_service import PRICE_RANGES, CatalogSnapshot, ProductService
+from services.prompt_builder import PromptBuilder, TokenCounter
+from services.scoring_service import FallbackScorer
+
+@pytest.fixture
+def catalog(products):
+    """
+    A generated catalog plus products with values the columns can't hold exactly
+    """
+    products[0]['price'] = 25
+    del products[1]['brand']
+    products[2]['inventory'] = -3
+    products[3]['tags'] = []
+    del products[4]['rating']
+    products[5]['subcategory'] = "Ünïcode"
+    products[6]['extra'] = {"nested": [1, 2]}
+    return products + [{"id": "z-last", "name": "Minimal", "category": "Home", "price": 9.5}]
+
+@pytest.fixture
+def snapshots(catalog, tmp_path):
+    path = str(tmp_path / "catalog.col")
+    assert write_catalog_store(catalog, path, "v1") == len(catalog)
+    store = CatalogStore(path, row_cache_size=16)
+    return CatalogSnapshot(catalog, "v1"), CatalogSnapshot(None, "v1", store=store)
+
+def test_products_round_trip_exactly(catalog, snapshots):
+    _, stored = snapshots
+    store = stored.store
+    assert (len(store), store.catalog_version) == (len(catalog), "v1")
+    for row, product in enumerate(catalog):
+        materialized = store.product(row)
+        assert list(materialized.items()) == list(product.items())
+        assert json.dumps(materialized) == json.dumps(product)
+
+def test_duplicate_ids_keep_the_first(products, tmp_path):
+    path = str(tmp_path / "catalog.col")
+    assert write_catalog_store(products + [dict(products[3], name="Shadowed")], path, "v1") == len(products)
+    store = CatalogStore(path)
+    assert store.product(store.row_of(products[3]['id'])) == products[3]
+
+def test_row_lookups(catalog, snapshots):
+    store = snapshots[1].store
+    ids = [p['id'] for p in catalog]
+    assert [store.row_of(pid) for pid in ids[:5]] == [0, 1, 2, 3, 4]
+    assert store.row_of("missing") == -1 and store.row_of("") == -1 and store.row_of(ids[0] + "x" * 50) == -1
+    assert store.rows_of(ids[::7] + ["missing"]).tolist() == list(range(0, len(ids), 7)) + [-1]
+    for column, field in (('category', 'category'), ('brand', 'brand'), ('subcategory', 'subcategory')):
+        value = catalog[10][field]
+        assert store.rows_matching(column, value).tolist() == [i for i, p in enumerate(catalog) if p.get(field) == value]
+    tag = catalog[10]['tags'][0]
+    assert store.rows_matching('tag', tag).tolist() == [i for i, p in enumerate(catalog) if tag in p.get('tags', [])]
+    assert store.rows_matching('brand', "missing").tolist() == []
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"categories": ["Electronics", "Home"]},
+    {"brands": ["AromaPure", "BrewMaster"], "min_rating": 4.0},
+    {"min_price": 20, "max_price": 100},
+    {"categories": ["Home"], "max_price": 9.5},
+    {"categories": ["Nope"]}
+])
+def test_store_snapshot_queries_match_memory(snapshots, filters):
+    memory, stored = snapshots
+    assert stored.query_products(**filters) == memory.query_products(**filters)
+
+def test_store_snapshot_lookups_match_memory(catalog, snapshots):
+    memory, stored = snapshots
+    assert list(stored.ordered_ids) == list(memory.ordered_ids)
+    for product in catalog[::25]:
+        assert stored.get_product_by_id(product['id']) == product
+    assert stored.get_product_by_id("missing") is None
+    for category in {p['category'] for p in catalog}:
+        assert stored.get_products_by_category(category) == memory.get_products_by_category(category)
+    for price_range in PRICE_RANGES:
+        assert set(stored.price_range_index[price_range]) == set(memory.price_range_index[price_range])
+    ids = [p['id'] for p in catalog[::3]]
+    assert stored.top_rated_among(ids, 7) == memory.top_rated_among(ids, 7)
+
+def test_derived_state_matches_memory(catalog, snapshots):
+    memory, stored = snapshots
+    memory_availability, stored_availability = Availability(memory, 5), Availability(stored, 5)
+    assert np.array_equal(stored_availability.in_stock, memory_availability.in_stock)
+    assert np.array_equal(stored_availability.low_stock, memory_availability.low_stock)
+    
+    preferences = {"categories": ["Home"], "brands": ["AromaPure"], "priceRange": "under-50"}
+    candidates = [p for p in catalog if p['category'] in ("Home", "Books")]
+    browsed = catalog[20:22]
+    assert FallbackScorer(stored).top_k(preferences, browsed, candidates, 10) == \
+        FallbackScorer(memory).top_k(preferences, browsed, candidates, 10)
+    
+    counter = TokenCounter(scale=1.0)
+    counter.encoding = None
+    prompts = [
+        PromptBuilder(ProductService(products=catalog, store_path=''), counter, 10 ** 9).build(preferences, browsed, candidates),
+        PromptBuilder(ProductService(store_path=stored.store.store_path), counter, 10 ** 9).build(preferences, browsed, candidates)
+    ]
+    assert prompts[0].prompt == prompts[1].prompt
+
+def test_service_maps_the_store_and_falls_back_to_json(catalog, tmp_path):
+    data_path = str(tmp_path / "products.json")
+    with open(data_path, 'w') as file:
+        json.dump(catalog, file)
+    store_path = str(tmp_path / "catalog.col")
+    build_catalog_store(data_path, store_path)
+    
+    json_service = ProductService(data_path=data_path, store_path='')
+    store_service = ProductService(data_path=data_path, store_path=store_path)
+    assert store_service.store is not None
+    assert store_service.catalog_version == json_service.catalog_version
+    assert store_service.query_products(categories=["Home"]) == json_service.query_products(categories=["Home"])
+    
+    with open(store_path, 'wb') as file:
+        file.write(b"not a catalog")
+    fallback = ProductService(data_path=data_path, store_path=store_path)
+    assert fallback.store is None and len(fallback.get_all_products()) == len(catalog)
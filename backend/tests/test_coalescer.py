@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from services.coalescer import RequestCoalescer
+
+def test_concurrent_identical_requests_share_one_run():
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"count": len(calls)}
+    
+    async def scenario():
+        coalescer = RequestCoalescer()
+        results = await asyncio.gather(*[coalescer.run("k", compute) for _ in range(5)])
+        return coalescer, results
+    coalescer, results = asyncio.run(scenario())
+    assert calls == [1]
+    assert results == [{"count": 1}] * 5
+    assert coalescer.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+def test_different_keys_and_later_requests_run_again():
+    calls = []
+    
+    async def compute():
+        calls.append(1)
+        return len(calls)
+    
+    async def scenario():
+        coalescer = RequestCoalescer()
+        first = await asyncio.gather(coalescer.run("a", compute), coalescer.run("b", compute))
+        return first, await coalescer.run("a", compute)
+    first, later = asyncio.run(scenario())
+    assert sorted(first) == [1, 2] and later == 3
+
+def test_errors_reach_every_caller():
+    async def compute():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+    
+    async def scenario():
+        coalescer = RequestCoalescer()
+        results = await asyncio.gather(*[coalescer.run("k", compute) for _ in range(3)], return_exceptions=True)
+        return coalescer, results
+    coalescer, results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert coalescer.stats()["in_flight"] == 0
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def compute():
+        await asyncio.sleep(0.05)
+        return "done"
+    
+    async def scenario():
+        coalescer = RequestCoalescer()
+        leader = asyncio.ensure_future(coalescer.run("k", compute))
+        follower = asyncio.ensure_future(coalescer.run("k", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower
+    assert asyncio.run(scenario()) == "done"
@@ -0,0 +1,76 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from services.cpu_stage import CPUStage
+from services.product_service import ProductService
+
+class Stages:
+    """
+    Stand-in for LLMService: stage methods take the catalog as their last argument
+    """
+    
+    def __init__(self, products, release=None):
+        self.product_service = ProductService(products=products, store_path='')
+        self.release = release
+    
+    def summarize(self, category, all_products):
+        return os.getpid(), sum(1 for p in all_products if p['category'] == category)
+    
+    def wait(self, all_products):
+        self.release.wait(5)
+        return threading.current_thread().name
+
+@pytest.mark.parametrize("mode", ["inline", "thread", "process"])
+def test_every_mode_returns_the_inline_result(products, mode):
+    service = Stages(products)
+    stage = CPUStage(service, mode=mode, workers=2, max_pending=4)
+    try:
+        _, expected = service.summarize("Home", products)
+        pid, count = asyncio.run(stage.run('summarize', ("Home",), products))
+    finally:
+        stage.shutdown()
+    assert count == expected
+    assert (pid != os.getpid()) == (mode == 'process')
+    assert stage.stats()["completed"] == (0 if mode == 'inline' else 1)
+
+def test_unknown_mode_runs_inline(products):
+    stage = CPUStage(Stages(products), mode='gpu', workers=1, max_pending=1)
+    assert stage.mode == 'inline'
+    assert not stage.saturated()
+
+def test_saturated_pool_runs_stages_inline(products):
+    release = threading.Event()
+    service = Stages(products, release)
+    stage = CPUStage(service, mode='thread', workers=2, max_pending=1)
+    
+    async def scenario():
+        first = asyncio.ensure_future(stage.run('wait', (), products))
+        await asyncio.sleep(0.05)
+        assert stage.saturated()
+        release.set()
+        overflow = await stage.run('wait', (), products)
+        return await first, overflow
+    try:
+        pooled, overflow = asyncio.run(scenario())
+    finally:
+        stage.shutdown()
+    assert pooled.startswith('cpu-stage') and not overflow.startswith('cpu-stage')
+    stats = stage.stats()
+    assert (stats["overflow_inline"], stats["peak_pending"], stats["pending"]) == (1, 1, 0)
+
+def test_process_pool_is_reforked_after_a_catalog_change(products):
+    service = Stages(products)
+    stage = CPUStage(service, mode='process', workers=1, max_pending=2)
+    try:
+        _, before = asyncio.run(stage.run('summarize', ("Home",), products))
+        added = [dict(products[0], id=f"new{i}", category="Home") for i in range(3)]
+        service.product_service.apply_delta(added)
+        # Workers read their own copy of the catalog, not the argument
+        _, after = asyncio.run(stage.run('summarize', ("Home",), []))
+    finally:
+        stage.shutdown()
+    assert after == before + 3
+    assert stage.stats()["pool_starts"] == 2
@@ -0,0 +1,206 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from config import config
+from services import llm_router
+from services.llm_router import LLMBackend, LLMRouter, percentile
+
+class FakeCompletions:
+    """
+    chat.completions stand-in answering after a delay, or failing with an error
+    """
+    
+    def __init__(self, name, delay=0.0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        self.calls = []
+        self.cancelled = 0
+    
+    async def create(self, **options):
+        self.calls.append(options)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return f"answer from {self.name}"
+    
+    def create_sync(self, **options):
+        self.calls.append(options)
+        if self.error is not None:
+            raise self.error
+        return f"answer from {self.name}"
+
+@pytest.fixture(autouse=True)
+def router_config(monkeypatch):
+    monkeypatch.setitem(config, 'LLM_BREAKER_FAILURES', 3)
+    monkeypatch.setitem(config, 'LLM_BREAKER_COOLDOWN', 30.0)
+    monkeypatch.setitem(config, 'LLM_ROUTER_WINDOW', 50)
+    monkeypatch.setitem(config, 'LLM_HEDGE', False)
+    monkeypatch.setitem(config, 'LLM_HEDGE_DEFAULT_DELAY', 0.05)
+    monkeypatch.setitem(config, 'LLM_ATTEMPT_TIMEOUT', 0)
+
+def make_backend(name, model="gpt-3.5-turbo", delay=0.0, error=None):
+    backend = LLMBackend(name, "http://127.0.0.1:9/v1", "test-key", model)
+    completions = FakeCompletions(name, delay, error)
+    backend.async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    backend.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=completions.create_sync)))
+    backend.fake = completions
+    return backend
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 51
+    assert percentile(values, 95) == 96
+    assert percentile([3.0], 95) == 3.0
+
+def test_candidates_prefer_low_latency_and_errors():
+    fast, slow, untried = make_backend("fast"), make_backend("slow"), make_backend("untried")
+    for _ in range(5):
+        fast.record_success(0.1)
+        slow.record_success(0.25)
+    router = LLMRouter([slow, fast, untried])
+    assert [b.name for b in router.candidates()] == ["untried", "fast", "slow"]
+    # Errors inflate the cost: 0.1 * (1 + 4 * 0.5) = 0.3 > 0.25
+    fast.outcomes.extend([True] * 5)
+    assert [b.name for b in router.candidates()] == ["untried", "slow", "fast"]
+
+def test_breaker_opens_half_opens_and_closes(clock, monkeypatch):
+    monkeypatch.setattr(llm_router, 'time', clock)
+    backend = make_backend("a")
+    for _ in range(2):
+        backend.record_failure(RuntimeError("boom"))
+    assert backend.state() == 'closed'
+    backend.record_failure(RuntimeError("boom"))
+    assert backend.state() == 'open' and not backend.available()
+    
+    clock.now += 30
+    assert backend.state() == 'half_open' and backend.available()
+    backend.in_flight = 1
+    assert not backend.available()  # one probe at a time
+    backend.in_flight = 0
+    # A failed probe opens the breaker again for a full cooldown
+    backend.record_failure(RuntimeError("boom"))
+    assert backend.state() == 'open'
+    clock.now += 30
+    backend.record_success(0.2)
+    assert backend.state() == 'closed'
+    assert backend.breaker_trips == 2
+
+def test_out_of_credits_opens_the_breaker_at_once():
+    backend = make_backend("a")
+    backend.record_failure(SimpleNamespace(status_code=402))
+    assert backend.state() == 'open'
+    other = make_backend("b")
+    other.record_failure(RuntimeError("Insufficient credits"))
+    assert other.state() == 'open'
+
+def test_acomplete_fails_over_to_the_next_backend():
+    broken = make_backend("broken", error=RuntimeError("boom"))
+    healthy = make_backend("healthy")
+    router = LLMRouter([broken, healthy])
+    assert asyncio.run(router.acomplete(messages=[])) == ("answer from healthy", "healthy")
+    assert router.failovers == 1
+    assert broken.failures == 1 and healthy.calls == 1
+
+def test_acomplete_raises_the_last_error_when_every_backend_fails():
+    router = LLMRouter([make_backend("a", error=RuntimeError("a failed")), make_backend("b", error=RuntimeError("b failed"))])
+    with pytest.raises(RuntimeError, match="b failed"):
+        asyncio.run(router.acomplete(messages=[]))
+
+def test_rejects_when_every_breaker_is_open():
+    backend = make_backend("a")
+    backend.record_failure(SimpleNamespace(status_code=402))
+    router = LLMRouter([backend])
+    with pytest.raises(RuntimeError, match="No LLM backend available"):
+        asyncio.run(router.acomplete(messages=[]))
+    with pytest.raises(RuntimeError, match="No LLM backend available"):
+        router.complete(messages=[])
+    assert router.rejected == 2
+
+def test_hedge_wins_and_cancels_the_slow_call():
+    slow = make_backend("slow", delay=1.0)
+    fast = make_backend("fast", delay=0.0)
+    router = LLMRouter([slow, fast])
+    result = asyncio.run(router.acomplete(hedge=True, messages=[]))
+    assert result == ("answer from fast", "fast")
+    assert (router.hedges, router.hedge_wins) == (1, 1)
+    assert slow.fake.cancelled == 1 and slow.in_flight == 0
+
+def test_no_hedge_waits_for_the_first_backend():
+    slow = make_backend("slow", delay=0.1)
+    fast = make_backend("fast")
+    router = LLMRouter([slow, fast])
+    assert asyncio.run(router.acomplete(hedge=False, messages=[])) == ("answer from slow", "slow")
+    assert router.hedges == 0 and not fast.fake.calls
+
+def test_calls_the_caller_gives_up_on_count_as_failures():
+    hanging = make_backend("hanging", delay=10.0)
+    router = LLMRouter([hanging])
+    
+    async def call():
+        return await asyncio.wait_for(router.acomplete(messages=[]), timeout=0.02)
+    for _ in range(3):
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(call())
+    assert hanging.failures == 3 and hanging.state() == 'open'
+    assert len(hanging.latencies) == 3 and min(hanging.latencies) >= 0.02
+    assert hanging.in_flight == 0 and hanging.fake.cancelled == 3
+
+def test_a_hanging_backend_loses_its_traffic():
+    hanging = make_backend("hanging", delay=10.0)
+    healthy = make_backend("healthy")
+    router = LLMRouter([hanging, healthy])
+    
+    async def call():
+        try:
+            return await asyncio.wait_for(router.acomplete(messages=[]), timeout=0.02)
+        except asyncio.TimeoutError:
+            return None
+    results = [asyncio.run(call()) for _ in range(10)]
+    assert results.count(None) == 1 and len(hanging.fake.calls) == 1
+    assert len(healthy.fake.calls) == 9
+
+def test_attempt_timeout_fails_over_within_the_request():
+    hanging = make_backend("hanging", delay=10.0)
+    healthy = make_backend("healthy")
+    router = LLMRouter([hanging, healthy])
+    router.attempt_timeout = 0.02
+    result = asyncio.run(asyncio.wait_for(router.acomplete(messages=[]), timeout=1.0))
+    assert result == ("answer from healthy", "healthy")
+    assert router.failovers == 1 and router.hedges == 0
+    assert hanging.failures == 1 and hanging.fake.cancelled == 1 and hanging.in_flight == 0
+
+def test_hedge_loser_is_not_a_failure():
+    slow = make_backend("slow", delay=1.0)
+    fast = make_backend("fast")
+    router = LLMRouter([slow, fast])
+    asyncio.run(router.acomplete(hedge=True, messages=[]))
+    assert slow.failures == 0 and not slow.latencies
+
+def test_request_options_follow_the_backend_model():
+    structured = make_backend("structured", model="gpt-4o-mini")
+    plain = make_backend("plain", model="gpt-3.5-turbo")
+    router = LLMRouter([structured])
+    options = {"messages": [], "response_format": {"type": "json_object"}}
+    assert router._request_options(structured, options) == dict(options, model="gpt-4o-mini")
+    assert router._request_options(plain, options) == {"messages": [], "model": "gpt-3.5-turbo"}
+
+def test_complete_fails_over_in_order():
+    router = LLMRouter([make_backend("a", error=RuntimeError("boom")), make_backend("b")])
+    assert router.complete(messages=[]) == ("answer from b", "b")
+    assert router.failovers == 1
+
+def test_backends_from_config(monkeypatch):
+    monkeypatch.setitem(config, 'LLM_BACKENDS', '[{"name": "one", "model": "m1", "api_key": "k1"}, {"base_url": "http://127.0.0.1:9/v1", "api_key_env": "LLM_TEST_KEY"}]')
+    monkeypatch.setenv('LLM_TEST_KEY', 'k2')
+    backends = LLMRouter.backends_from_config()
+    assert [(b.name, b.model) for b in backends] == [("one", "m1"), ("backend2", config['MODEL_NAME'])]
+    assert backends[1].client.api_key == 'k2'
+    # With several backends, failing over replaces the client's own retries
+    assert backends[0].client.max_retries == 0
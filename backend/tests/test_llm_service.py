@@ -0,0 +1,140 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from services.cpu_stage import CPUStage
+from services.llm_service import LLMService
+from services.product_service import ProductService
+
+from baseline import baseline_fallback, baseline_filter, baseline_prompt
+
+PREFERENCES = [
+    {},
+    {"priceRange": "all"},
+    {"categories": ["Home"]},
+    {"categories": ["Home", "Sports"], "brands": ["AromaPure"]},
+    {"brands": ["ArtisanCraft"]},
+    {"brands": ["NoSuchBrand"]},
+    {"priceRange": "under-50"},
+    {"categories": ["Books"], "priceRange": "over-200"}
+]
+
+class StubCompletions:
+    """
+    Stand-in for a backend's chat.completions: answers with the first
+    catalog products after `delay` seconds and counts the calls
+    """
+    
+    def __init__(self, products, delay=0.0):
+        self.answer = json.dumps([
+            {"product_id": p['id'], "explanation": "fits", "score": 8} for p in products[:5]
+        ])
+        self.delay = delay
+        self.calls = 0
+    
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.answer))], usage=None)
+
+@pytest.fixture
+def catalog(products):
+    # Every product in stock, so the availability filter changes nothing
+    for product in products:
+        product['inventory'] = max(product['inventory'], 20)
+    return products
+
+@pytest.fixture
+def service(catalog):
+    return LLMService(ProductService(products=catalog, store_path=''))
+
+def stub_llm(service, products, delay=0.0):
+    completions = StubCompletions(products, delay)
+    for backend in service.router.backends:
+        backend.async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return completions
+
+def test_async_path_parses_the_completion(service, products):
+    stub_llm(service, products)
+    result = asyncio.run(service.agenerate_recommendations({}, [], products))
+    assert [item["product"] for item in result["recommendations"]] == products[:5]
+    assert "fallback" not in result
+
+def test_slow_completion_falls_back(service, products):
+    stub_llm(service, products, delay=1.0)
+    service.timeout = 0.05
+    preferences = {"categories": ["Electronics"]}
+    result = asyncio.run(service.agenerate_recommendations(preferences, [], products))
+    assert result == service._generate_fallback_recommendations(preferences, [], products)
+
+def test_requests_beyond_the_slots_are_shed(service, products):
+    completions = stub_llm(service, products, delay=0.1)
+    
+    async def burst():
+        service._llm_slots = asyncio.Semaphore(2)
+        return await asyncio.gather(*(service.agenerate_recommendations({}, [], products) for _ in range(5)))
+    results = asyncio.run(burst())
+    assert completions.calls == 2
+    assert [bool(result.get("fallback")) for result in results] == [False, False, True, True, True]
+
+@pytest.mark.parametrize("preferences", PREFERENCES)
+@pytest.mark.parametrize("browsed", [(), (0,), (3, 40, 41)])
+@pytest.mark.parametrize("availability", [False, True])
+def test_candidates_prompt_and_fallback_match_baseline(service, catalog, preferences, browsed, availability):
+    service.availability_enabled = availability
+    browsed_products = [catalog[i] for i in browsed]
+    candidates = baseline_filter(preferences, browsed_products, catalog)
+    assert service._filter_relevant_products(preferences, browsed_products, catalog) == candidates
+    assert service._create_recommendation_prompt(preferences, browsed_products, catalog) == \
+        baseline_prompt(preferences, browsed_products, candidates)
+    assert service._generate_fallback_recommendations(preferences, browsed_products, catalog) == \
+        baseline_fallback(preferences, browsed_products, catalog)
+
+def test_out_of_stock_products_are_never_offered(service, catalog):
+    sold_out = [dict(p, inventory=0) for p in catalog if p['category'] == "Home"][:5]
+    service.product_service.update_inventory({p['id']: 0 for p in sold_out})
+    current = service.product_service.get_all_products()
+    sold_out_ids = {p['id'] for p in sold_out}
+    preferences = {"categories": ["Home"]}
+    candidates = service._filter_relevant_products(preferences, [], current)
+    assert candidates and not sold_out_ids & {p['id'] for p in candidates}
+    fallback = service._generate_fallback_recommendations(preferences, [], current)
+    assert not sold_out_ids & {item["product"]["id"] for item in fallback["recommendations"]}
+    
+    # Without the filter the baseline candidates come back
+    service.availability_enabled = False
+    assert service._filter_relevant_products(preferences, [], current) == baseline_filter(preferences, [], current)
+
+def test_requests_admitted_during_the_cpu_stage_are_shed(service, products):
+    completions = stub_llm(service, products, delay=0.2)
+    service.cpu_stage = CPUStage(service, mode='thread', workers=4, max_pending=32)
+    
+    async def burst():
+        service._llm_slots = asyncio.Semaphore(2)
+        return await asyncio.gather(*(service.agenerate_recommendations({}, [], products) for _ in range(10)))
+    try:
+        results = asyncio.run(burst())
+    finally:
+        service.cpu_stage.shutdown()
+    # Every request passes the first check while the prompts are built off the loop
+    assert completions.calls == 2
+    assert sum(bool(result.get("fallback")) for result in results) == 8
+
+def test_spare_slots_count_calls_holding_a_slot(service, products):
+    stub_llm(service, products, delay=0.1)
+    
+    async def scenario():
+        assert service.spare_llm_slots() == service.max_concurrency
+        call = asyncio.ensure_future(service.agenerate_recommendations({}, [], products))
+        await asyncio.sleep(0.05)
+        during = service.spare_llm_slots()
+        await call
+        return during
+    assert asyncio.run(scenario()) == service.max_concurrency - 1
+    assert service.spare_llm_slots() == service.max_concurrency
+
+def test_browsing_history_resolves_in_history_order(service, catalog):
+    history = [catalog[5]['id'], "missing", catalog[2]['id']]
+    assert service._resolve_browsed_products(history, catalog) == [catalog[5], catalog[2]]
@@ -0,0 +1,85 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from services.llm_transport import AsyncCountingTransport, CountingTransport, TransportStats, httpx
+
+# Bodies are streamed like a real connection's; in-memory content is closed
+# before the transport sees it
+BODY = b'{"ok": true}'
+
+def handler(request):
+    if request.url.path == "/fail":
+        raise httpx.ConnectError("refused", request=request)
+    return httpx.Response(200, content=iter([BODY]))
+
+async def async_handler(request):
+    if request.url.path == "/fail":
+        raise httpx.ConnectError("refused", request=request)
+    if request.url.path == "/hang":
+        await asyncio.sleep(10)
+    
+    async def body():
+        yield BODY
+    return httpx.Response(200, content=body())
+
+class Stream:
+    """
+    Stand-in for a connection's network stream; weak-referenceable like the real ones
+    """
+
+def test_new_and_reused_connections():
+    stats = TransportStats(max_connections=4)
+    first, second = Stream(), Stream()
+    for stream, version in ((first, b"HTTP/1.1"), (first, b"HTTP/1.1"), (second, b"HTTP/2"), (None, b"")):
+        stats.started()
+        stats.record_response(SimpleNamespace(extensions={"network_stream": stream, "http_version": version}))
+    snapshot = stats.snapshot()
+    assert (snapshot["new_connections"], snapshot["reused_connections"]) == (2, 1)
+    assert snapshot["reuse_ratio"] == 0.25
+    assert snapshot["http_versions"] == {"HTTP/1.1": 2, "HTTP/2": 1, "unknown": 1}
+    assert (snapshot["active"], snapshot["pool_utilization"]) == (4, 1.0)
+
+def test_sync_transport_counts_requests_until_closed():
+    stats = TransportStats(max_connections=2)
+    client = httpx.Client(transport=CountingTransport(httpx.MockTransport(handler), stats))
+    with client.stream("GET", "http://llm.test/models"):
+        assert stats.active == 1
+    assert stats.active == 0
+    assert client.get("http://llm.test/models").json() == {"ok": True}
+    with pytest.raises(httpx.ConnectError):
+        client.get("http://llm.test/fail")
+    snapshot = stats.snapshot()
+    assert (snapshot["requests"], snapshot["errors"], snapshot["active"], snapshot["peak_active"]) == (3, 1, 0, 1)
+
+def test_async_transport_counts_concurrent_requests():
+    stats = TransportStats(max_connections=4)
+    
+    async def scenario():
+        async with httpx.AsyncClient(transport=AsyncCountingTransport(httpx.MockTransport(async_handler), stats)) as client:
+            streams = [client.stream("GET", "http://llm.test/models") for _ in range(3)]
+            responses = [await stream.__aenter__() for stream in streams]
+            assert stats.active == 3
+            for stream in streams:
+                await stream.__aexit__(None, None, None)
+            with pytest.raises(httpx.ConnectError):
+                await client.get("http://llm.test/fail")
+            return responses
+    asyncio.run(scenario())
+    snapshot = stats.snapshot()
+    assert (snapshot["requests"], snapshot["errors"], snapshot["active"], snapshot["peak_active"]) == (4, 1, 0, 3)
+    assert snapshot["peak_pool_utilization"] == 0.75
+
+def test_cancelled_requests_are_finished():
+    stats = TransportStats(max_connections=4)
+    
+    async def scenario():
+        async with httpx.AsyncClient(transport=AsyncCountingTransport(httpx.MockTransport(async_handler), stats)) as client:
+            for _ in range(3):
+                with pytest.raises(asyncio.TimeoutError):
+                    await asyncio.wait_for(client.get("http://llm.test/hang"), timeout=0.01)
+    asyncio.run(scenario())
+    snapshot = stats.snapshot()
+    assert (snapshot["requests"], snapshot["errors"], snapshot["cancelled"], snapshot["active"]) == (3, 0, 3, 0)
+    assert snapshot["pool_utilization"] == 0.0
@@ -0,0 +1,96 @@
+import asyncio
+from types import SimpleNamespace
+
+from services.metrics import (
+    NULL_TIMER, Metrics, ServerTimingMiddleware, format_labels, request_timings, server_timing_header
+)
+
+def samples(text):
+    """
+    Sample lines of an exposition as {name with labels: value}
+    """
+    return {
+        line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+        for line in text.splitlines() if line and not line.startswith('#')
+    }
+
+def test_format_labels_escapes_values():
+    assert format_labels({}) == ''
+    assert format_labels({"stage": "llm", "le": 0.5}) == '{stage="llm",le="0.5"}'
+    assert format_labels({"path": 'a"b\\c\nd'}) == '{path="a\\"b\\\\c\\nd"}'
+
+def test_server_timing_header():
+    assert server_timing_header({"parse": 1.234, "llm": 250.0}) == "parse;dur=1.2, llm;dur=250.0"
+
+def test_histogram_is_cumulative():
+    metrics = Metrics(enabled=True, timing_header=False)
+    for seconds in (0.0004, 0.003, 0.003, 45.0):
+        metrics.observe("llm", seconds)
+    rendered = samples(metrics.render())
+    assert rendered['recommendation_stage_seconds_bucket{stage="llm",le="0.0005"}'] == 1
+    assert rendered['recommendation_stage_seconds_bucket{stage="llm",le="0.0025"}'] == 1
+    assert rendered['recommendation_stage_seconds_bucket{stage="llm",le="0.005"}'] == 3
+    assert rendered['recommendation_stage_seconds_bucket{stage="llm",le="30.0"}'] == 3
+    assert rendered['recommendation_stage_seconds_bucket{stage="llm",le="+Inf"}'] == 4
+    assert rendered['recommendation_stage_seconds_count{stage="llm"}'] == 4
+    assert rendered['recommendation_stage_seconds_sum{stage="llm"}'] == 45.0064
+
+def test_counters_and_collectors():
+    metrics = Metrics(enabled=True, timing_header=False)
+    metrics.count_fallback("timeout")
+    metrics.count_fallback("timeout", 3)
+    metrics.count_fallback("credits")
+    metrics.count_tokens(SimpleNamespace(prompt_tokens=120, completion_tokens=None))
+    metrics.count_tokens(None)
+    metrics.add_collector(lambda: [("cache_entries", "gauge", "Cached results", [({"cache": "exact"}, 7)])])
+    text = metrics.render()
+    rendered = samples(text)
+    assert rendered['recommendation_fallbacks_total{cause="timeout"}'] == 4
+    assert rendered['recommendation_fallbacks_total{cause="credits"}'] == 1
+    assert rendered['llm_tokens_total{kind="prompt"}'] == 120
+    assert rendered['llm_tokens_total{kind="completion"}'] == 0
+    assert rendered['cache_entries{cache="exact"}'] == 7
+    assert "# TYPE recommendation_fallbacks_total counter" in text
+    assert "# TYPE cache_entries gauge" in text
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False, timing_header=False)
+    assert metrics.stage("llm") is NULL_TIMER
+    metrics.observe("llm", 1.0)
+    metrics.count("requests_total")
+    assert metrics.render() == "\n"
+
+def test_timing_header_only_collects_request_timings():
+    metrics = Metrics(enabled=False, timing_header=True)
+    timings = {}
+    token = request_timings.set(timings)
+    try:
+        metrics.observe("parse", 0.002)
+        metrics.observe("parse", 0.001)
+        with metrics.stage("llm"):
+            pass
+    finally:
+        request_timings.reset(token)
+    assert round(timings["parse"], 6) == 3.0
+    assert "llm" in timings
+    assert samples(metrics.render()) == {}
+
+def test_server_timing_middleware_adds_the_header():
+    metrics = Metrics(enabled=False, timing_header=True)
+    
+    async def app(scope, receive, send):
+        metrics.observe("parse", 0.0015)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+    
+    messages = []
+    
+    async def send(message):
+        messages.append(message)
+    
+    async def receive():
+        return {"type": "http.request"}
+    
+    asyncio.run(ServerTimingMiddleware(app)({"type": "http", "headers": []}, receive, send))
+    assert (b"server-timing", b"parse;dur=1.5") in messages[0]["headers"]
+    assert request_timings.get() is None
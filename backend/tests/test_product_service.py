@@ -0,0 +1,160 @@
+import json
+import math
+
+import pytest
+
+from services.product_service import (
+    INDEX_NAMES, PRICE_RANGES, CatalogSnapshot, ProductService, invalid_fields, iter_json_array, price_in_range
+)
+
+def linear_query(products, categories=None, brands=None, min_price=None, max_price=None, min_rating=None):
+    """
+    The linear scan query_products replaced
+    """
+    matching = []
+    for product in products:
+        if categories and product['category'] not in categories:
+            continue
+        if brands and product.get('brand') not in brands:
+            continue
+        if min_price is not None and product['price'] < min_price:
+            continue
+        if max_price is not None and product['price'] > max_price:
+            continue
+        if min_rating is not None and product.get('rating', 0) < min_rating:
+            continue
+        matching.append(product['id'])
+    return matching
+
+def index_state(snapshot):
+    """
+    Everything a snapshot builds from its products, for comparing two snapshots
+    """
+    state = {name: dict(getattr(snapshot, f"{name}_index")) for name in INDEX_NAMES}
+    state['products_by_id'] = dict(snapshot.products_by_id)
+    state['positions'] = dict(snapshot.positions)
+    state['ordered_ids'] = snapshot.ordered_ids
+    state['top_rated_ids'] = snapshot.top_rated_ids
+    state['price'] = (snapshot._price_values, snapshot._price_ids)
+    state['rating'] = (snapshot._rating_values, snapshot._rating_ids)
+    return state
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"categories": ["Electronics"]},
+    {"categories": ["Electronics", "Home"], "min_rating": 4.0},
+    {"min_price": 50, "max_price": 100},
+    {"max_price": 49.99},
+    {"min_rating": 4.5, "min_price": 200},
+    {"categories": ["Nope"]}
+])
+def test_query_products_matches_linear_scan(products, filters):
+    snapshot = CatalogSnapshot(products, "v1")
+    assert snapshot.query_products(**filters) == linear_query(products, **filters)
+
+def test_query_products_by_brand(products):
+    brands = sorted({p['brand'] for p in products})[:3]
+    snapshot = CatalogSnapshot(products, "v1")
+    assert snapshot.query_products(brands=brands) == linear_query(products, brands=brands)
+
+def test_lookups_match_linear_scan(products):
+    duplicate = dict(products[10], name="Shadowed duplicate")
+    catalog = products + [duplicate]
+    snapshot = CatalogSnapshot(catalog, "v1")
+    # The first occurrence wins, as with the old linear scan
+    assert snapshot.get_product_by_id(duplicate['id']) is products[10]
+    assert snapshot.get_product_by_id("missing") is None
+    for category in {p['category'] for p in products}:
+        assert snapshot.get_products_by_category(category) == [p for p in products if p['category'] == category]
+    for price_range in PRICE_RANGES:
+        assert snapshot.price_range_index[price_range] == {p['id'] for p in products if price_in_range(p['price'], price_range)}
+
+def test_top_rated_among_matches_sort(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    ids = [p['id'] for p in products[::3]]
+    position = {p['id']: i for i, p in enumerate(products)}
+    rating = {p['id']: p.get('rating', 0) for p in products}
+    assert snapshot.top_rated_among(ids, 7) == sorted(ids, key=lambda pid: (-rating[pid], position[pid]))[:7]
+    
+    demoted = set(ids[::2])
+    expected = sorted(ids, key=lambda pid: ((1.0 if pid in demoted else 0) - rating[pid], position[pid]))[:7]
+    assert snapshot.top_rated_among(set(ids), 7, demoted=demoted, penalty=1.0) == expected
+
+def test_delta_indexes_equal_full_rebuild(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    changed = dict(products[5], category="Home", brand="NewBrand", tags=["fresh"], price=250.0, rating=4.9)
+    repriced = dict(products[6], price=99.0)
+    new = dict(products[7], id="new0001", price=45.0, rating=4.2)
+    deleted = [products[8]['id'], products[9]['id']]
+    
+    updated = snapshot.apply_delta(upserts=[changed, repriced, new], deletes=deleted)
+    
+    expected_products = [
+        {5: changed, 6: repriced}.get(i, product) for i, product in enumerate(products) if product['id'] not in deleted
+    ] + [new]
+    assert updated.products == expected_products
+    assert index_state(updated) == index_state(CatalogSnapshot(expected_products, "rebuilt"))
+    # Keys the delta emptied are dropped, not kept as empty sets
+    assert all(ids for name in ('category', 'brand', 'tag') for ids in getattr(updated, f"{name}_index").values())
+    # The previous snapshot is left as it was
+    assert index_state(snapshot) == index_state(CatalogSnapshot(products, "v1"))
+
+def test_delta_upsert_and_delete_of_same_product_deletes(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    updated = snapshot.apply_delta(upserts=[dict(products[0], name="x")], deletes=[products[0]['id']])
+    assert updated.get_product_by_id(products[0]['id']) is None
+    assert len(updated.ordered_ids) == len(products) - 1
+
+def test_delta_version_and_previous_derived(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    snapshot.derived('state', lambda s: "built")
+    updated = snapshot.apply_delta(upserts=[dict(products[0], price=1.0)])
+    assert updated.catalog_version != snapshot.catalog_version
+    assert updated.catalog_version == snapshot.apply_delta(upserts=[dict(products[0], price=1.0)]).catalog_version
+    assert updated.previous_derived('state') == ("built", frozenset([products[0]['id']]))
+    assert updated.previous_derived('other') == (None, None)
+    assert snapshot.previous_derived('state') == (None, None)
+
+@pytest.mark.parametrize("product, fields", [
+    ({"id": "a", "name": "n", "category": "c", "price": 1.5}, []),
+    ({"id": "a", "name": "n", "category": "c", "price": 2, "rating": 4}, []),
+    ({"name": "n", "category": "c"}, ['id', 'price']),
+    ({"id": 7, "name": "n", "category": "c", "price": 1.0}, ['id']),
+    ({"id": "a", "name": None, "category": "c", "price": 1.0}, ['name']),
+    ({"id": "a", "name": "n", "category": "c", "price": "9.99"}, ['price']),
+    ({"id": "a", "name": "n", "category": "c", "price": True}, ['price']),
+    ({"id": "a", "name": "n", "category": "c", "price": math.nan}, ['price']),
+    ({"id": "a", "name": "n", "category": "c", "price": 1.0, "rating": math.inf}, ['rating'])
+])
+def test_invalid_fields(product, fields):
+    assert invalid_fields(product) == fields
+
+def test_delta_rejects_invalid_products(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    with pytest.raises(ValueError, match="price"):
+        snapshot.apply_delta(upserts=[dict(products[0], price="cheap")])
+
+def test_iter_json_array_matches_json_loads(products):
+    text = json.dumps(products, indent=2)
+    assert list(iter_json_array(text)) == json.loads(text)
+    assert list(iter_json_array("[]")) == []
+
+def test_service_update_inventory(products):
+    service = ProductService(products=products, store_path='')
+    previous = service.snapshot
+    summary = service.update_inventory({products[0]['id']: 3})
+    assert summary['previous_version'] == previous.catalog_version
+    assert service.get_product_by_id(products[0]['id'])['inventory'] == 3
+    assert previous.get_product_by_id(products[0]['id']) is products[0]
+    with pytest.raises(ValueError, match="Unknown product IDs"):
+        service.update_inventory({"missing": 1})
+
+def test_service_reload_swaps_changed_file(tmp_path, products):
+    path = tmp_path / "products.json"
+    path.write_text(json.dumps(products))
+    service = ProductService(data_path=str(path), store_path='')
+    assert service.reload()['changed'] is False
+    path.write_text(json.dumps(products[:100]))
+    summary = service.reload()
+    assert summary['changed'] is True and summary['products'] == 100
+    assert len(service.get_all_products()) == 100
@@ -0,0 +1,64 @@
+import pytest
+
+from services.product_service import ProductService
+from services.prompt_builder import PromptBuilder, TokenCounter
+
+from baseline import baseline_prompt
+
+@pytest.fixture
+def counter():
+    counter = TokenCounter(scale=1.0)
+    counter.encoding = None
+    return counter
+
+@pytest.fixture
+def service(products):
+    return ProductService(products=products, store_path='')
+
+@pytest.mark.parametrize("preferences", [
+    {},
+    {"priceRange": "all"},
+    {"priceRange": "under-50", "categories": ["Home", "Sports"]},
+    {"priceRange": "unknown", "brands": ["AromaPure"]},
+    {"priceRange": "over-200", "categories": ["Books"], "brands": ["AromaPure", "BrewMaster"]}
+])
+@pytest.mark.parametrize("browsed", [0, 2, 7])
+def test_prompt_matches_baseline_within_budget(service, products, counter, preferences, browsed):
+    builder = PromptBuilder(service, counter, token_budget=10 ** 9)
+    browsed_products = products[:browsed]
+    relevant = products[10:40]
+    result = builder.build(preferences, browsed_products, relevant)
+    assert result.prompt == baseline_prompt(preferences, browsed_products, relevant)
+    assert result.tokens == counter.count(result.prompt)
+    assert (result.products, result.candidates) == (30, 30)
+    assert result.product_ids == tuple(p['id'] for p in relevant)
+
+def test_budget_keeps_a_prefix_of_the_candidates(service, products, counter):
+    unbounded = PromptBuilder(service, counter, token_budget=10 ** 9).build({}, [], products[:40])
+    budget = unbounded.tokens - 200
+    result = PromptBuilder(service, counter, token_budget=budget).build({}, [], products[:40])
+    assert 0 < result.products < 40 and result.candidates == 40
+    assert result.tokens <= budget
+    included = products[:result.products]
+    assert result.prompt == baseline_prompt({}, [], included)
+    assert result.product_ids == tuple(p['id'] for p in included)
+
+def test_delta_rerenders_only_changed_products(service, products, counter):
+    builder = PromptBuilder(service, counter, token_budget=10 ** 9)
+    old = service.snapshot
+    before = builder.fragments(old)
+    service.apply_delta([dict(products[0], name="Renamed"), dict(products[1], id="added01")], [products[2]['id']])
+    after = builder.fragments()
+    assert "Renamed" in after[products[0]['id']][0]
+    assert "added01" in after and products[2]['id'] not in after
+    assert after[products[3]['id']] is before[products[3]['id']]
+    
+    current = [service.get_product_by_id(pid) for pid in service.ordered_ids]
+    assert builder.build({}, [], current).prompt == baseline_prompt({}, [], current)
+
+def test_estimator_counts_words_numbers_and_symbols(counter):
+    assert counter.count("") == 0
+    assert counter.count("ID: prod001 | $49.99") == len(["ID", ":", "prod", "001", "|", "$", "49", ".", "99"])
+    scaled = TokenCounter(scale=1.5)
+    scaled.encoding = None
+    assert scaled.count("abc def") == 3
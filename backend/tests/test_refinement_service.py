@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from services import refinement_service
+from services.refinement_service import RefinementStore, ended_in_fallback
+
+REFINED = {"recommendations": [{"product": {"id": "p1"}, "explanation": "fits", "confidence_score": 8}], "count": 1}
+FALLBACK = {"recommendations": [], "count": 0, "fallback": True}
+
+def factory(result=REFINED, delay=0.0, error=None, calls=None):
+    async def refine():
+        if calls is not None:
+            calls.append(1)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return result
+    return refine
+
+def make_store(**options):
+    settings = dict(max_entries=10, ttl_seconds=60, retry_seconds=5)
+    settings.update(options)
+    return RefinementStore(**settings)
+
+def test_identical_requests_share_one_refinement():
+    async def scenario():
+        store = make_store()
+        calls = []
+        assert store.start("t", factory(delay=0.05, calls=calls))
+        assert not store.start("t", factory(calls=calls))
+        assert store.result("t") == ("pending", None)
+        assert await store.wait("t", 1.0) == ("done", REFINED)
+        assert not store.start("t", factory(calls=calls))
+        return store, calls
+    store, calls = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert (store.started, store.reused) == (1, 2)
+
+def test_wait_times_out_without_cancelling():
+    async def scenario():
+        store = make_store()
+        store.start("t", factory(delay=0.1))
+        assert await store.wait("t", 0.01) == ("pending", None)
+        assert await store.wait("t", 1.0) == ("done", REFINED)
+    asyncio.run(scenario())
+
+def test_failed_refinement_is_restarted_at_once():
+    async def scenario():
+        store = make_store()
+        store.start("t", factory(error=RuntimeError("boom")))
+        assert await store.wait("t", 1.0) == ("failed", None)
+        assert store.start("t", factory())
+        assert await store.wait("t", 1.0) == ("done", REFINED)
+        return store
+    store = asyncio.run(scenario())
+    assert (store.failed, store.retries, store.started) == (1, 1, 2)
+
+def test_fallback_refinement_is_retried_after_retry_seconds(clock, monkeypatch):
+    monkeypatch.setattr(refinement_service, 'time', clock)
+    
+    async def scenario():
+        store = make_store()
+        store.start("t", factory(FALLBACK))
+        assert await store.wait("t", 1.0) == ("fallback", FALLBACK)
+        assert store.retry_after("t") == 5
+        clock.now += 3
+        assert store.retry_after("t") == 2
+        assert not store.start("t", factory())
+        clock.now += 2
+        assert store.retry_after("t") == 0
+        assert store.start("t", factory())
+        assert await store.wait("t", 1.0) == ("done", REFINED)
+        return store
+    store = asyncio.run(scenario())
+    assert (store.fallbacks, store.retries, store.reused) == (1, 1, 1)
+
+@pytest.mark.parametrize("result, expected", [
+    (REFINED, False),
+    (FALLBACK, True),
+    (dict(REFINED, error="Used fallback recommendations due to parsing error"), True),
+    ({"recommendations": [], "count": 0}, True),
+    ({"count": 0}, True)
+])
+def test_ended_in_fallback(result, expected):
+    assert ended_in_fallback(result) is expected
+
+def test_empty_refinement_is_retried_like_a_fallback(clock, monkeypatch):
+    monkeypatch.setattr(refinement_service, 'time', clock)
+    
+    async def scenario():
+        store = make_store()
+        empty = {"recommendations": [], "count": 0, "error": "No recommendations parsed"}
+        store.start("t", factory(empty))
+        assert await store.wait("t", 1.0) == ("fallback", empty)
+        assert store.retry_after("t") == 5
+        clock.now += 5
+        assert store.start("t", factory())
+        assert await store.wait("t", 1.0) == ("done", REFINED)
+        return store
+    store = asyncio.run(scenario())
+    assert (store.fallbacks, store.retries) == (1, 1)
+
+def test_entries_expire_and_are_bounded(clock, monkeypatch):
+    monkeypatch.setattr(refinement_service, 'time', clock)
+    
+    async def scenario():
+        store = make_store(max_entries=2)
+        for token in ("a", "b", "c"):
+            store.start(token, factory())
+        assert store.result("a") == ("unknown", None)
+        assert await store.wait("c", 1.0) == ("done", REFINED)
+        clock.now += 61
+        assert store.result("c") == ("unknown", None)
+        return store
+    store = asyncio.run(scenario())
+    assert store.evictions == 1
+    assert store.stats()["entries"] == 1
@@ -0,0 +1,64 @@
+import pytest
+
+from services import request_log
+from services.request_log import RequestRecorder, read_request_log
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(request_log, 'time', clock)
+    return clock
+
+@pytest.mark.parametrize("name", ["requests.jsonl", "requests.jsonl.gz"])
+def test_entries_are_sanitized_and_read_back(tmp_path, clock, name):
+    path = str(tmp_path / name)
+    recorder = RequestRecorder(path, sample_rate=1.0, flush_every=100)
+    recorder.record_products({"category": "Home", "limit": 20, "min_price": "", "api_key": "secret"})
+    recorder.record_recommendations(
+        {"priceRange": "under-50", "categories": [], "brands": ["A"], "email": "x@example.com"},
+        ["p1", 2], {"tiered": True, "compact": False, "debug": "1"}, endpoint="stream", session=True
+    )
+    recorder.record_batch([({"categories": ["Home"]}, ["p1"], False), ({}, [], True)])
+    recorder.flush()
+    
+    assert read_request_log(path) == [
+        {"e": "products", "q": {"category": "Home", "limit": "20"}, "t": 1000.0},
+        {"e": "stream", "q": {"tiered": "true"}, "p": {"priceRange": "under-50", "brands": ["A"]}, "h": ["p1", "2"], "s": 1, "t": 1000.0},
+        {"e": "batch", "q": {}, "r": [{"p": {"categories": ["Home"]}, "h": ["p1"]}, {"p": {}, "h": [], "s": 1}], "t": 1000.0}
+    ]
+    assert recorder.stats()["written"] == 3
+
+def test_lines_are_appended_in_batches(tmp_path):
+    path = str(tmp_path / "requests.jsonl")
+    recorder = RequestRecorder(path, sample_rate=1.0, flush_every=2)
+    recorder.record_products({})
+    assert recorder.stats()["buffered"] == 1
+    recorder.record_products({})
+    assert recorder.stats()["buffered"] == 0
+    assert len(read_request_log(path)) == 2
+    
+    # A second recorder appends to the same log
+    other = RequestRecorder(path, sample_rate=1.0, flush_every=1)
+    other.record_products({"brand": "A"})
+    assert len(read_request_log(path)) == 3
+
+@pytest.mark.parametrize("path, sample_rate", [("", 1.0), ("requests.jsonl", 0.0)])
+def test_disabled_recorder_records_nothing(tmp_path, path, sample_rate):
+    recorder = RequestRecorder(str(tmp_path / path) if path else "", sample_rate=sample_rate)
+    recorder.record_products({"category": "Home"})
+    recorder.flush()
+    assert not recorder.enabled
+    assert recorder.stats()["recorded"] == 0
+
+def test_sampling(tmp_path, monkeypatch):
+    draws = iter([0.1, 0.9, 0.2, 0.6])
+    monkeypatch.setattr(request_log.random, 'random', lambda: next(draws))
+    recorder = RequestRecorder(str(tmp_path / "requests.jsonl"), sample_rate=0.5)
+    for _ in range(4):
+        recorder.record_products({})
+    assert recorder.stats()["recorded"] == 2
+
+def test_write_errors_are_counted(tmp_path):
+    recorder = RequestRecorder(str(tmp_path / "missing" / "requests.jsonl"), sample_rate=1.0)
+    recorder.record_products({})
+    recorder.flush()
+    assert recorder.stats()["errors"] == 1
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from services.response_parser import (
+    iter_array_spans, iter_object_spans, parse_batch_items, parse_recommendation_items, supports_structured_output
+)
+
+from baseline import baseline_items
+
+ITEMS = [
+    {"product_id": "prod001", "explanation": "Fits your [running] plans, \"really\"", "score": 9},
+    {"product_id": "prod002", "explanation": "Same brand", "score": 7.5}
+]
+
+BASELINE_RESPONSES = [
+    json.dumps(ITEMS),
+    json.dumps(ITEMS, indent=2),
+    "```json\n" + json.dumps(ITEMS, indent=2) + "\n```",
+    "Here are my picks:\n" + json.dumps(ITEMS) + "\nEnjoy!",
+    json.dumps(ITEMS).replace('"', "'").replace("\\'", "").replace("'really'", "really"),
+    json.dumps(ITEMS)[:-1] + ",]",
+    '[{"product_id": "prod001", "explanation": "ok", "score": 8,}]',
+    "[]",
+    '["prod001", "prod002"]'
+]
+
+@pytest.mark.parametrize("response", BASELINE_RESPONSES)
+def test_matches_baseline_where_it_succeeded(response):
+    expected = baseline_items(response)
+    assert expected is not None
+    result = parse_recommendation_items(response)
+    assert result.items == expected
+    assert result.error is None
+
+@pytest.mark.parametrize("response", ["", "Sorry, I can't help with that.", "{\"a\": 1}", "[not json at all"])
+def test_reports_an_error_where_baseline_failed(response):
+    assert baseline_items(response) is None
+    result = parse_recommendation_items(response)
+    assert result.items is None and result.path == 'failed' and result.error
+
+def test_paths():
+    assert parse_recommendation_items(json.dumps(ITEMS)).path == 'structured'
+    assert parse_recommendation_items(json.dumps({"recommendations": ITEMS})) == (ITEMS, 'structured', None)
+    assert parse_recommendation_items("Sure:\n" + json.dumps(ITEMS)).path == 'scan'
+    assert parse_recommendation_items("[{'product_id': 'prod001', 'score': 8}]").path == 'repair'
+
+def test_skips_citation_lists_before_the_answer():
+    response = "Based on reviews [1] and [2]:\n" + json.dumps(ITEMS) + "\nSources: [3]"
+    # The old greedy match spanned from "[1]" to "[3]" and failed
+    assert baseline_items(response) is None
+    assert parse_recommendation_items(response) == (ITEMS, 'scan', None)
+
+def test_salvages_a_truncated_array():
+    response = json.dumps(ITEMS)[:-20]
+    assert baseline_items(response) is None
+    assert parse_recommendation_items(response) == (ITEMS[:1], 'salvage', None)
+
+def test_array_spans_ignore_brackets_in_strings():
+    text = 'a [1, "]"] b [{"x": "[\\"]"}] c ['
+    assert [text[start:end] for start, end in iter_array_spans(text)] == ['[1, "]"]', '[{"x": "[\\"]"}]']
+    assert [text[start:end] for start, end in iter_object_spans(text)] == ['{"x": "[\\"]"}']
+    assert len(list(iter_array_spans("[] " * 20, limit=3))) == 3
+
+def test_supports_structured_output():
+    assert supports_structured_output("gpt-4o-mini", "auto")
+    assert supports_structured_output("openai/gpt-4.1", "auto")
+    assert not supports_structured_output("gpt-3.5-turbo", "auto")
+    assert supports_structured_output("gpt-3.5-turbo", "on")
+    assert not supports_structured_output("gpt-4o", "off")
+
+BATCH = {"user_1": ITEMS, "user_2": ITEMS[1:]}
+
+def test_batch_structured_and_scan():
+    keys = ["user_1", "user_2"]
+    assert parse_batch_items(json.dumps(BATCH), keys) == (BATCH, 'structured', None)
+    assert parse_batch_items("```json\n" + json.dumps(BATCH) + "\n```", keys) == (BATCH, 'scan', None)
+    # Unknown keys and non-array answers are left out
+    response = json.dumps({"user_1": ITEMS, "user_2": "none", "user_9": ITEMS})
+    assert parse_batch_items(response, keys).items == {"user_1": ITEMS}
+
+def test_batch_repair():
+    response = json.dumps(BATCH).replace('"', "'").replace("\\'", "").replace("'really'", "really")
+    result = parse_batch_items(response, ["user_1", "user_2"])
+    assert result.path == 'repair'
+    assert result.items["user_2"] == ITEMS[1:]
+
+def test_batch_salvages_users_answered_before_the_cut():
+    response = json.dumps(BATCH)
+    response = response[:response.index('"user_2"') + 30]
+    result = parse_batch_items(response, ["user_1", "user_2"])
+    assert result == ({"user_1": ITEMS}, 'salvage', None)
+
+def test_batch_failure():
+    result = parse_batch_items("no idea", ["user_1"])
+    assert result.items is None and result.path == 'failed' and result.error
+    assert parse_batch_items(json.dumps({"other": ITEMS}), ["user_1"]).items is None
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from services.product_service import CatalogSnapshot, matches_preferences
+from services.retrieval_service import CandidateRetriever, HashingEmbedder, IVFIndex
+
+def make_retriever(snapshot, **options):
+    settings = dict(dim=64, nprobe=4, index_path='')
+    settings.update(options)
+    return CandidateRetriever(snapshot, **settings)
+
+def live_rows(retriever):
+    return np.asarray(sorted(retriever.rows_by_id.values()))
+
+def test_transform_matches_fit_transform(products):
+    embedder = HashingEmbedder(64)
+    fitted = embedder.fit_transform(products)
+    assert np.allclose(embedder.transform(products[:20]), fitted[:20])
+    assert np.allclose(np.linalg.norm(fitted, axis=1), 1.0, atol=1e-5)
+
+def test_probing_every_cluster_equals_exact_search(products):
+    vectors = HashingEmbedder(64).fit_transform(products)
+    index = IVFIndex(nprobe=10 ** 6).build(vectors)
+    for query in vectors[:10]:
+        rows, scores = index.search(query, 10, exclude=np.asarray([0, 1]))
+        exact_rows, exact_scores = index.exact_search(query, 10, exclude=np.asarray([0, 1]))
+        assert np.allclose(scores, exact_scores)
+        assert set(rows) == set(exact_rows)
+        assert not {0, 1} & set(rows.tolist())
+
+def test_every_vector_is_in_one_cluster(products):
+    index = IVFIndex().build(HashingEmbedder(64).fit_transform(products))
+    members = np.concatenate(index.lists)
+    assert sorted(members.tolist()) == list(range(len(products)))
+
+def test_retrieve_prefers_matching_neighbours(products):
+    retriever = make_retriever(CatalogSnapshot(products, "v1"))
+    assert retriever.retrieve({}, [], k=10) == []
+    browsed = products[:3]
+    preferences = {"categories": [products[0]['category']]}
+    results = retriever.retrieve(preferences, browsed, k=10)
+    assert len(results) == 10
+    assert not {p['id'] for p in browsed} & {p['id'] for p in results}
+    matched = [matches_preferences(p, preferences) for p in results]
+    # Matching neighbours come first
+    assert matched == sorted(matched, reverse=True)
+    
+    in_stock = retriever.retrieve(preferences, browsed, k=10, available=lambda p: p['inventory'] > 0)
+    assert all(p['inventory'] > 0 for p in in_stock)
+
+def test_index_is_persisted_per_catalog_version(products, tmp_path):
+    path = str(tmp_path / "retrieval")
+    snapshot = CatalogSnapshot(products, "v1")
+    built = make_retriever(snapshot, index_path=path)
+    assert built.index_path == path + ".npz"
+    loaded = make_retriever(snapshot, index_path=path)
+    assert np.array_equal(loaded.index.vectors, built.index.vectors)
+    assert loaded.retrieve({}, products[:2]) == built.retrieve({}, products[:2])
+    
+    stale = CatalogSnapshot(products[:-1], "v2")
+    rebuilt = make_retriever(stale, index_path=path)
+    assert len(rebuilt.product_ids) == len(products) - 1
+
+def test_stock_only_delta_shares_the_index(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    retriever = snapshot.derived('retriever', lambda s: make_retriever(s))
+    updated = snapshot.apply_delta([dict(p, inventory=0) for p in products[:5]])
+    incremental = updated.derived('retriever', CandidateRetriever.for_snapshot)
+    assert incremental is not retriever
+    assert incremental.index is retriever.index
+    assert incremental.product_service is updated
+    assert incremental.retrieve({}, products[10:12]) == [
+        updated.products_by_id[p['id']] for p in retriever.retrieve({}, products[10:12])
+    ]
+
+def test_text_delta_reembeds_changed_products(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    retriever = snapshot.derived('retriever', lambda s: make_retriever(s))
+    renamed = dict(products[0], name="Renamed Trail Runner", tags=["running", "trail"])
+    added = dict(products[1], id="added01", name="Added Espresso Grinder", tags=["coffee"])
+    deleted = products[2]['id']
+    updated = snapshot.apply_delta([renamed, added], [deleted])
+    incremental = updated.derived('retriever', CandidateRetriever.for_snapshot)
+    
+    # The original retriever is left untouched
+    assert deleted in retriever.rows_by_id and "added01" not in retriever.rows_by_id
+    assert deleted not in incremental.rows_by_id
+    for product in (renamed, added):
+        row = incremental.rows_by_id[product['id']]
+        assert np.allclose(incremental.index.vectors[row], retriever.embedder.transform([product])[0])
+    members = np.concatenate(incremental.index.lists)
+    assert sorted(members.tolist()) == live_rows(incremental).tolist()
+    
+    # Every live product is found again when every cluster is probed
+    incremental.index.nprobe = 10 ** 6
+    for product_id in (renamed['id'], "added01", products[3]['id']):
+        query = incremental.index.vectors[incremental.rows_by_id[product_id]]
+        rows, _ = incremental.index.search(query, 1)
+        assert incremental.product_ids[rows[0]] == product_id
+    assert all(p['id'] != deleted for p in incremental.retrieve({}, [renamed, added], k=50))
+
+@pytest.mark.parametrize("changed", [10, 200])
+def test_large_deltas_rebuild(products, changed):
+    snapshot = CatalogSnapshot(products, "v1")
+    retriever = snapshot.derived('retriever', lambda s: make_retriever(s))
+    updated = snapshot.apply_delta([dict(p, name=p['name'] + " v2") for p in products[:changed]])
+    incremental = updated.derived('retriever', CandidateRetriever.for_snapshot)
+    rebuilt = changed > 0.3 * len(products)
+    assert (incremental.embedder.idf is retriever.embedder.idf) != rebuilt
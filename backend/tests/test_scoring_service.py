@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from services.product_service import CatalogSnapshot
+from services.scoring_service import FallbackScorer
+from services.session_store import SessionHistory
+
+from baseline import baseline_scores
+
+PREFERENCES = [
+    {},
+    {"priceRange": "all"},
+    {"categories": ["Home"]},
+    {"categories": ["Home", "Sports"], "brands": ["AromaPure", "BrewMaster"]},
+    {"brands": ["AromaPure", "NoSuchBrand"], "priceRange": "under-50"},
+    {"categories": ["Electronics"], "priceRange": "50-100"},
+    {"priceRange": "100-200"},
+    {"categories": ["Books"], "brands": ["ArtisanTech"], "priceRange": "over-200"}
+]
+
+@pytest.mark.parametrize("preferences", PREFERENCES)
+@pytest.mark.parametrize("browsed", [(), (0,), (3, 40, 41)])
+@pytest.mark.parametrize("k", [1, 5, 50])
+def test_top_k_matches_baseline(products, preferences, browsed, k):
+    snapshot = CatalogSnapshot(products, "v1")
+    scorer = FallbackScorer(snapshot)
+    browsed_products = [products[i] for i in browsed]
+    candidates = products[::3]
+    expected = baseline_scores(preferences, browsed_products, candidates)[:k]
+    assert scorer.top_k(preferences, browsed_products, candidates, k) == expected
+
+def test_whole_catalog_rows_match_lookup(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    scorer = FallbackScorer(snapshot)
+    preferences = {"categories": ["Home"], "priceRange": "under-50"}
+    rows = np.arange(len(products))
+    assert scorer.top_k(preferences, [], products, 5, rows=rows) == scorer.top_k(preferences, [], products, 5)
+    assert scorer.top_k(preferences, [], products, 5) == baseline_scores(preferences, [], products)[:5]
+
+def test_empty_candidates():
+    assert FallbackScorer(CatalogSnapshot([], "v1")).top_k({}, [], [], 5) == []
+
+def test_session_categories_count_as_browsed(products):
+    scorer = FallbackScorer(CatalogSnapshot(products, "v1"))
+    history = SessionHistory([products[0]], categories=["Pets"])
+    stand_in = [products[0], next(p for p in products if p['category'] == "Pets")]
+    assert scorer.top_k({}, history, products, 10) == baseline_scores({}, stand_in, products)[:10]
+
+def test_demoted_products_score_lower(products):
+    snapshot = CatalogSnapshot(products, "v1")
+    scorer = FallbackScorer(snapshot)
+    best = scorer.top_k({}, [], products, 1)[0]
+    demoted = np.zeros(len(products), dtype=bool)
+    demoted[snapshot.positions[best["product"]['id']]] = True
+    results = scorer.top_k({}, [], products, len(products), demoted=demoted, penalty=0.5)
+    penalized = next(r for r in results if r["product"] is best["product"])
+    assert penalized["score"] == best["score"] - 0.5
+    assert results[0]["product"] is not best["product"]
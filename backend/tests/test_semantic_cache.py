@@ -0,0 +1,110 @@
+import pytest
+
+from services import semantic_cache
+from services.product_service import ProductService
+from services.semantic_cache import SemanticCache, candidate_similarity, history_similarity, minhash
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(semantic_cache, 'time', clock)
+    return clock
+
+@pytest.fixture
+def service(products):
+    return ProductService(products=products, store_path='')
+
+def make_cache(service, **options):
+    settings = dict(threshold=0.8, max_entries=10, ttl_seconds=60, enabled=True)
+    settings.update(options)
+    return SemanticCache(service, **settings)
+
+def ranking(products):
+    return {
+        "recommendations": [
+            {"product": product, "explanation": f"because {product['id']}", "confidence_score": 9.0 - i}
+            for i, product in enumerate(products)
+        ],
+        "count": len(products)
+    }
+
+def test_minhash_estimates_jaccard():
+    left = {f"t{i}" for i in range(100)}
+    right = {f"t{i}" for i in range(20, 120)}
+    exact = len(left & right) / len(left | right)
+    assert abs(history_similarity(minhash(left), minhash(right)) - exact) < 0.2
+    assert history_similarity(minhash(left), minhash(set(left))) == 1.0
+    assert history_similarity(minhash(set()), minhash(set())) == 1.0
+    assert candidate_similarity(frozenset(), frozenset()) == 1.0
+    assert candidate_similarity(frozenset("ab"), frozenset("bc")) == pytest.approx(1 / 3)
+
+def test_near_duplicate_request_reuses_the_ranking(service, products):
+    cache = make_cache(service)
+    candidates = [p['id'] for p in products[:30]]
+    browsed = products[40:42]
+    cache.store(cache.signature(candidates, browsed), ranking(products[:5]))
+    
+    # One candidate swapped: Jaccard 29/31
+    near = candidates[1:] + [products[35]['id']]
+    result = cache.lookup(cache.signature(near, browsed), browsed)
+    # The reused ranking loses the product that is no longer a candidate
+    assert [item["product"]["id"] for item in result["recommendations"]] == [p['id'] for p in products[1:5]]
+    assert result["recommendations"][0] == {"product": products[1], "explanation": f"because {products[1]['id']}", "confidence_score": 8.0}
+    assert result["semantic_cache"]["similarity"] >= 0.8
+
+def test_distant_requests_miss(service, products):
+    cache = make_cache(service)
+    candidates = [p['id'] for p in products[:30]]
+    browsed = products[40:42]
+    cache.store(cache.signature(candidates, browsed), ranking(products[:5]))
+    other = [p['id'] for p in products[10:40]]
+    assert cache.lookup(cache.signature(other, browsed), browsed) is None
+    different_history = [p for p in products if p['category'] != products[40]['category']][100:103]
+    assert cache.lookup(cache.signature(candidates, different_history), different_history) is None
+    assert cache.stats()["misses"] == 2
+
+def test_reused_ranking_is_revalidated(service, products):
+    cache = make_cache(service)
+    candidates = [p['id'] for p in products[:30]]
+    cache.store(cache.signature(candidates, []), ranking(products[:5]))
+    
+    # Browsed products are dropped, and too few remaining counts as a miss
+    browsed = products[:3]
+    signature = cache.signature(candidates, [])
+    assert cache.lookup(signature, browsed) is None
+    assert cache.stats()["rejected"] == 1
+    
+    # Product details come from the current catalog; deleted products are dropped
+    service.apply_delta([dict(products[0], price=1.0)], [products[1]['id']])
+    result = cache.lookup(signature, [])
+    assert [item["product"]["id"] for item in result["recommendations"]] == [products[i]['id'] for i in (0, 2, 3, 4)]
+    assert result["recommendations"][0]["product"]["price"] == 1.0
+
+def test_degraded_and_short_results_are_not_stored(service, products):
+    cache = make_cache(service)
+    signature = cache.signature([p['id'] for p in products[:30]], [])
+    cache.store(signature, dict(ranking(products[:5]), fallback=True))
+    cache.store(signature, dict(ranking(products[:5]), error="Failed to parse JSON"))
+    cache.store(signature, ranking(products[:2]))
+    assert cache.stats()["entries"] == 0
+
+def test_entries_expire_and_are_bounded(service, products, clock):
+    cache = make_cache(service, max_entries=2)
+    signatures = [cache.signature([p['id'] for p in products[i * 30:(i + 1) * 30]], []) for i in range(3)]
+    for signature, start in zip(signatures, (0, 30, 60)):
+        cache.store(signature, ranking(products[start:start + 5]))
+    assert cache.lookup(signatures[0], []) is None
+    assert cache.lookup(signatures[2], []) is not None
+    assert cache.stats()["evictions"] == 1
+    
+    clock.now += 61
+    assert cache.lookup(signatures[2], []) is None
+    assert cache.stats()["entries"] == 1
+    # The expired entry left its LSH buckets
+    assert set(cache._buckets) == set(signatures[1].bands)
+
+def test_disabled_cache(service, products):
+    cache = make_cache(service, enabled=False)
+    signature = cache.signature([p['id'] for p in products[:30]], [])
+    cache.store(signature, ranking(products[:5]))
+    assert cache.lookup(signature, []) is None
+    assert cache.stats()["entries"] == 0
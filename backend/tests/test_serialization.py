@@ -0,0 +1,136 @@
+import asyncio
+import gzip
+import json
+import threading
+
+import pytest
+
+from config import config
+from services import serialization
+from services.product_service import ProductService
+from services.serialization import (
+    COMPACT_FIELDS, CompressionMiddleware, ProductEncoder, acompress, brotli, dumps, negotiate_encoding
+)
+
+@pytest.fixture
+def service(products):
+    return ProductService(products=products, store_path='')
+
+def result_for(products):
+    return {
+        "recommendations": [
+            {"product": product, "explanation": "fits", "confidence_score": 8.5}
+            for product in products
+        ],
+        "count": len(products),
+        "timing": {"total_ms": 1.25}
+    }
+
+def compact(product):
+    return {field: product[field] for field in COMPACT_FIELDS if field in product}
+
+def test_dumps_is_compact_json():
+    value = {"a": [1, 2.5, "é"], "b": None}
+    assert json.loads(dumps(value)) == value
+    assert b' ' not in dumps(value)
+
+def test_encode_list_equals_encoding_the_products(service, products):
+    encoder = ProductEncoder(service)
+    assert encoder.encode_list(products[:10]) == dumps(products[:10])
+    assert encoder.encode_list([]) == b'[]'
+    assert json.loads(encoder.encode_list(products[:10], compact=True)) == [compact(p) for p in products[:10]]
+
+@pytest.mark.parametrize("count", [0, 1, 5])
+def test_encode_recommendations_equals_encoding_the_result(service, products, count):
+    encoder = ProductEncoder(service)
+    result = result_for(products[:count])
+    assert encoder.encode_recommendations(result) == dumps(result)
+    compacted = json.loads(encoder.encode_recommendations(result, compact=True))
+    assert compacted == dict(result, recommendations=[
+        dict(item, product=compact(item["product"])) for item in result["recommendations"]
+    ])
+
+def test_items_without_extra_keys(service, products):
+    encoder = ProductEncoder(service)
+    result = {"recommendations": [{"product": products[0]}, {"explanation": "no product"}]}
+    assert json.loads(encoder.encode_recommendations(result)) == {
+        "recommendations": [{"product": products[0]}, {"product": None, "explanation": "no product"}]
+    }
+
+def test_delta_reencodes_changed_products(service, products):
+    encoder = ProductEncoder(service)
+    old = service.snapshot
+    before = encoder.encodings(old)
+    service.apply_delta([dict(products[0], price=1.0)], [products[1]['id']])
+    after = encoder.encodings()
+    assert json.loads(after[products[0]['id']][0])["price"] == 1.0
+    assert products[1]['id'] not in after
+    assert after[products[2]['id']] is before[products[2]['id']]
+    current = [service.get_product_by_id(pid) for pid in service.ordered_ids[:5]]
+    assert encoder.encode_list(current) == dumps(current)
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("GZIP ; q=0.000", None),
+    ("identity", None),
+    ("br, gzip", "br" if brotli is not None else "gzip")
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+def run_middleware(body, accept_encoding="gzip", content_type="application/json", chunks=1, minimum_size=10):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type.encode())]})
+        size = len(body) // chunks + 1
+        for start in range(0, len(body), size):
+            await send({"type": "http.response.body", "body": body[start:start + size], "more_body": start + size < len(body)})
+    
+    messages = []
+    
+    async def send(message):
+        messages.append(message)
+    
+    async def receive():
+        return {"type": "http.request"}
+    
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(CompressionMiddleware(app, minimum_size=minimum_size, brotli_quality=4)(scope, receive, send))
+    headers = {key.decode().lower(): value.decode() for key, value in messages[0]["headers"]}
+    return headers, b''.join(message.get("body", b"") for message in messages[1:])
+
+def test_compresses_complete_json_responses():
+    body = dumps({"recommendations": ["x" * 50] * 20})
+    headers, sent = run_middleware(body)
+    assert headers["content-encoding"] == "gzip"
+    assert headers["content-length"] == str(len(sent))
+    assert "accept-encoding" in headers["vary"].lower()
+    assert gzip.decompress(sent) == body
+
+@pytest.mark.parametrize("options", [
+    dict(accept_encoding="identity"),
+    dict(content_type="text/event-stream"),
+    dict(chunks=3),
+    dict(minimum_size=10 ** 6)
+])
+def test_leaves_other_responses_alone(options):
+    body = dumps({"recommendations": ["x" * 50] * 20})
+    headers, sent = run_middleware(body, **options)
+    assert "content-encoding" not in headers
+    assert sent == body
+
+@pytest.mark.parametrize("offload_bytes, offloaded", [(10, True), (10 ** 6, False)])
+def test_large_bodies_are_compressed_off_the_loop(monkeypatch, offload_bytes, offloaded):
+    monkeypatch.setitem(config, 'COMPRESSION_OFFLOAD_BYTES', offload_bytes)
+    threads = []
+    compress = serialization.compress
+    
+    def recording_compress(*args):
+        threads.append(threading.current_thread())
+        return compress(*args)
+    monkeypatch.setattr(serialization, 'compress', recording_compress)
+    body = dumps({"recommendations": ["x" * 50] * 20})
+    assert gzip.decompress(asyncio.run(acompress(body, 'gzip'))) == body
+    assert (threads[0] is not threading.main_thread()) == offloaded
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+
+import pytest
+
+from services import session_store
+from services.product_service import ProductService
+from services.session_store import SessionHistory, SessionState, SessionStore, history_affinity
+
+@pytest.fixture
+def clock(clock, monkeypatch):
+    monkeypatch.setattr(session_store, 'time', clock)
+    return clock
+
+@pytest.fixture
+def service(products):
+    return ProductService(products=products, store_path='')
+
+def make_store(service, **options):
+    settings = dict(backend='memory', path='', window=5, max_affinities=4, affinity_top=2, ttl_seconds=60, max_sessions=100)
+    settings.update(options)
+    return SessionStore(service, **settings)
+
+def full_history_affinity(names, top):
+    """
+    Most viewed names over a whole history, recomputed from scratch; ties go
+    to the most recently viewed name
+    """
+    counts = {}
+    last_seen = {}
+    for i, name in enumerate(names):
+        counts[name] = counts.get(name, 0) + 1
+        last_seen[name] = i
+    ranked = sorted(counts, key=lambda name: (-counts[name], -last_seen[name]))
+    return tuple(ranked[:top])
+
+def test_recent_window_matches_history_tail(service, products):
+    store = make_store(service)
+    views = [products[i]['id'] for i in (1, 2, 3, 2, 4, 5, 6, 7)]
+    state = store.record_views("s1", views)
+    # Each product once, at its last view, oldest first
+    deduped = []
+    for product_id in views:
+        if product_id in deduped:
+            deduped.remove(product_id)
+        deduped.append(product_id)
+    assert state.recent == tuple(deduped[-5:])
+    assert state.events == len(views)
+
+def test_affinities_match_counts_over_the_whole_history(service, products):
+    store = make_store(service, max_affinities=50, affinity_top=3)
+    viewed = [products[i] for i in (0, 1, 2, 0, 3, 0, 4, 1, 5, 6)]
+    for product in viewed:
+        store.record_views("s1", [product['id']])
+    history = store.history(store.get("s1"))
+    assert history.categories == full_history_affinity([p['category'] for p in viewed], 3)
+    assert history.brands == full_history_affinity([p['brand'] for p in viewed], 3)
+    assert list(history) == list(store.get("s1").recent)
+
+def test_unknown_products_are_ignored(service, products):
+    store = make_store(service)
+    state = store.record_views("s1", ["missing", products[0]['id']])
+    assert state.recent == (products[0]['id'],)
+    assert store.stats()["ignored"] == 1
+
+def test_sessions_expire(service, products, clock):
+    store = make_store(service)
+    store.record_views("s1", [products[0]['id']])
+    clock.now += 60
+    assert store.get("s1") is not None
+    clock.now += 1
+    assert store.get("s1") is None
+    assert store.stats()["expirations"] == 1
+    # A view after expiry starts a new session
+    assert store.record_views("s1", [products[1]['id']]).recent == (products[1]['id'],)
+
+def test_memory_backend_evicts_least_recently_updated(service, products, clock):
+    store = make_store(service, max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        clock.now += 1
+        store.record_views(session_id, [products[0]['id']])
+    assert store.get("a") is None and store.get("b") is not None
+    assert store.stats()["evictions"] == 1
+
+def test_delete(service, products):
+    store = make_store(service)
+    store.record_views("s1", [products[0]['id']])
+    assert store.delete("s1") is True
+    assert store.delete("s1") is False
+    assert store.history(store.get("s1")) == SessionHistory()
+
+def test_disk_backend_is_shared_and_round_trips(service, products, tmp_path):
+    path = str(tmp_path / "sessions.db")
+    store = make_store(service, backend='disk', path=path)
+    state = store.record_views("s1", [p['id'] for p in products[:8]])
+    other_worker = make_store(service, backend='disk', path=path)
+    assert other_worker.backend_name == 'disk'
+    assert other_worker.get("s1").to_dict() == state.to_dict()
+
+def test_disk_sessions_are_handled_off_the_loop(service, products, tmp_path, monkeypatch):
+    store = make_store(service, backend='disk', path=str(tmp_path / "sessions.db"))
+    threads = []
+    put = store._backend.put
+    monkeypatch.setattr(store._backend, 'put', lambda *args: threads.append(threading.get_ident()) or put(*args))
+    
+    async def scenario():
+        state = await store.arecord_views("s1", [products[0]['id']])
+        assert (await store.aget("s1")).to_dict() == state.to_dict()
+        assert (await store.astats())["sessions"] == 1
+        assert await store.adelete("s1") is True
+        return threading.get_ident()
+    loop_thread = asyncio.run(scenario())
+    assert threads and loop_thread not in threads
+    assert store.get("s1") is None
+
+def test_unknown_backend_falls_back_to_memory(service):
+    assert make_store(service, backend='redis').backend_name == 'memory'
+
+def test_state_dict_round_trip():
+    state = SessionState()
+    for product in ({"id": "a", "category": "X", "brand": "B"}, {"id": "b", "category": "Y"}, {"id": "a", "category": "X"}):
+        state.record_view(product, window=3, max_affinities=2)
+    copy = SessionState.from_dict(state.to_dict())
+    assert copy.to_dict() == state.to_dict()
+    assert copy.categories == ("X", "Y") and copy.category_counts == (2, 1)
+
+def test_history_affinity():
+    assert history_affinity(["a"]) == ((), ())
+    assert history_affinity(SessionHistory(["a"], ["X"], ["B"])) == (("X",), ("B",))
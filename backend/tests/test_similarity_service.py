@@ -0,0 +1,138 @@
+import numpy as np
+import pytest
+
+from services import similarity_service
+from services.similarity_service import (
+    RECENCY_DECAY, AttributeEmbedder, SimilarityTable, build_similarity_table, load_similarity_table,
+    pair_scores, product_columns, product_hash, update_similarity_table
+)
+from services.product_service import CatalogSnapshot
+
+TOP_N = 5
+# Scores are stored as float16
+TOLERANCE = 2e-3
+
+def brute_force(products, vectors):
+    """
+    Score every pair of products; returns each row's scores sorted best first and the full matrix
+    """
+    rows = np.arange(len(products))
+    log_prices, ratings = product_columns(products)
+    scores = pair_scores(vectors.astype(np.float32), log_prices, ratings, rows, rows)
+    np.fill_diagonal(scores, -np.inf)
+    return -np.sort(-scores, axis=1), scores
+
+def assert_best_first(table, products, vectors, rows, complete):
+    """
+    Each row's neighbours must be its best-scoring products, all top_n of them when complete
+    """
+    ranked, scores = brute_force(products, vectors)
+    for row in rows:
+        found = table.neighbours[row][table.neighbours[row] >= 0]
+        assert row not in found and len(set(found.tolist())) == len(found)
+        if complete:
+            assert len(found) == TOP_N
+        assert np.allclose(scores[row, found], ranked[row, :len(found)], atol=TOLERANCE)
+        assert np.allclose(table.scores[row][:len(found)], scores[row, found], atol=TOLERANCE)
+
+def build(products, tmp_path, name="similarity.tbl", version="v1"):
+    path = str(tmp_path / name)
+    build_similarity_table(products, path, version, top_n=TOP_N, dim=64)
+    return SimilarityTable(path)
+
+def test_exact_build_matches_brute_force(products, tmp_path):
+    table = build(products, tmp_path)
+    assert len(table) == len(products)
+    assert [table.ids[row].decode() for row in range(3)] == [p['id'] for p in products[:3]]
+    vectors = AttributeEmbedder(64).fit_transform(products)
+    assert np.allclose(table.vectors, vectors, atol=TOLERANCE)
+    assert_best_first(table, products, vectors, range(len(products)), complete=True)
+
+def test_clustered_build_scores_real_pairs(products, tmp_path, monkeypatch):
+    monkeypatch.setattr(similarity_service, 'EXACT_LIMIT', 50)
+    table = build(products, tmp_path)
+    _, scores = brute_force(products, AttributeEmbedder(64).fit_transform(products))
+    for row in range(len(products)):
+        found = table.neighbours[row][table.neighbours[row] >= 0]
+        assert row not in found and len(set(found.tolist())) == len(found)
+        assert np.allclose(table.scores[row][:len(found)], scores[row, found], atol=TOLERANCE)
+
+def test_rows_of(products, tmp_path):
+    table = build(products, tmp_path)
+    assert table.rows_of([products[7]['id'], "missing", products[0]['id'] + "x" * 40]).tolist() == [7, -1, -1]
+    assert table.rows_of([]).tolist() == []
+
+def test_similar_merges_lists_by_recency(products, tmp_path):
+    table = build(products, tmp_path)
+    browsed = [products[0]['id'], products[1]['id'], "missing", products[2]['id']]
+    totals = {}
+    best = {}
+    for index, product_id in enumerate(browsed):
+        row = table.rows_of([product_id])[0]
+        if row < 0:
+            continue
+        weight = RECENCY_DECAY ** (len(browsed) - 1 - index)
+        for neighbour, score in zip(table.neighbours[row], table.scores[row]):
+            if neighbour < 0 or neighbour in (0, 1, 2):
+                continue
+            key = table.ids[neighbour].decode()
+            totals[key] = totals.get(key, 0.0) + weight * float(score)
+            if weight * float(score) > best.get(key, (-np.inf, None))[0]:
+                best[key] = (weight * float(score), index)
+    results = table.similar(browsed, 100)
+    assert {product_id for product_id, _, _ in results} == set(totals)
+    for product_id, total, source in results:
+        assert total == pytest.approx(totals[product_id], rel=1e-4)
+        assert source == best[product_id][1]
+    assert [total for _, total, _ in results] == sorted((total for _, total, _ in results), reverse=True)
+    assert table.similar(["missing"], 5) == []
+
+def test_product_hash_ignores_unscored_fields(products):
+    product = products[0]
+    assert product_hash(dict(product, inventory=0, description="new")) == product_hash(product)
+    assert product_hash(dict(product, price=product['price'] + 1)) != product_hash(product)
+
+def test_inventory_only_update_leaves_the_table(products, tmp_path):
+    table = build(products, tmp_path)
+    restocked = [dict(p, inventory=0) for p in products]
+    summary = update_similarity_table(table, restocked, table.table_path, "v2")
+    assert summary["unchanged"] and summary["changed"] == summary["deleted"] == 0
+    
+    snapshot = CatalogSnapshot(restocked, "v2")
+    assert load_similarity_table(snapshot, table.table_path) is not None
+    assert SimilarityTable(table.table_path).catalog_version == "v1"
+
+def test_update_matches_brute_force(products, tmp_path):
+    table = build(products, tmp_path)
+    catalog = [dict(p) for p in products]
+    catalog[0]['tags'] = ["espresso", "grinder"]
+    catalog[5]['price'] = catalog[5]['price'] * 3
+    catalog.append(dict(products[10], id="added01", tags=["camping"]))
+    del catalog[20]
+    path = str(tmp_path / "updated.tbl")
+    summary = update_similarity_table(table, catalog, path, "v2")
+    assert (summary["changed"], summary["deleted"], summary["rebuilt"]) == (3, 1, False)
+    
+    updated = SimilarityTable(path)
+    assert updated.catalog_version == "v2"
+    assert [updated.ids[row].decode() for row in range(len(catalog))] == [p['id'] for p in catalog]
+    # Kept products keep their vectors; changed ones are embedded with the table's IDF weights
+    changed = [0, 5, len(catalog) - 1]
+    vectors = np.array(table.vectors[table.rows_of([p['id'] for p in catalog])], dtype=np.float32)
+    vectors[changed] = AttributeEmbedder(64, idf=np.array(table.idf)).transform([catalog[row] for row in changed])
+    assert np.allclose(updated.vectors, vectors, atol=TOLERANCE)
+    # Changed products are compared with the whole catalog
+    assert_best_first(updated, catalog, vectors, changed, complete=True)
+    # Kept lists lose deleted and changed entries but stay exact as far as they go
+    kept = sorted(set(range(len(catalog))) - set(changed))
+    assert_best_first(updated, catalog, vectors, kept, complete=False)
+
+def test_large_update_rebuilds(products, tmp_path):
+    table = build(products, tmp_path)
+    catalog = [dict(p, tags=["retagged"]) if i % 2 else p for i, p in enumerate(products)]
+    path = str(tmp_path / "rebuilt.tbl")
+    assert update_similarity_table(table, catalog, path, "v2")["rebuilt"]
+    rebuilt = SimilarityTable(path)
+    vectors = AttributeEmbedder(64).fit_transform(catalog)
+    assert np.allclose(rebuilt.vectors, vectors, atol=TOLERANCE)
+    assert_best_first(rebuilt, catalog, vectors, range(len(catalog)), complete=True)
@@ -0,0 +1,158 @@
+import asyncio
+
+from services.speculation import POLL_INTERVAL, SpeculativeScheduler
+
+RESULT = {"recommendations": [], "count": 0}
+
+class Harness:
+    """
+    A scheduler with controllable LLM headroom and a log of the jobs that ran
+    """
+    
+    def __init__(self, **options):
+        self.spare = 8
+        self.cached = set()
+        self.ran = []
+        settings = dict(enabled=True, concurrency=2, reserved_slots=2, budget_per_minute=600,
+                        max_age_seconds=10, max_queued=10)
+        settings.update(options)
+        self.scheduler = SpeculativeScheduler(lambda: self.spare, self.cached.__contains__, **settings)
+    
+    def job(self, cache_key, result=RESULT, delay=0.0, error=None):
+        async def run():
+            self.ran.append(cache_key)
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            self.cached.add(cache_key)
+            return result
+        return run
+    
+    def schedule(self, session_id, cache_key, **job):
+        return self.scheduler.schedule(session_id, cache_key, self.job(cache_key, **job))
+
+async def settle(seconds=POLL_INTERVAL * 3):
+    await asyncio.sleep(seconds)
+
+def run(scenario, **settings):
+    """
+    Run a scenario against a fresh scheduler and return its final stats
+    """
+    async def main():
+        harness = Harness(**settings)
+        try:
+            await scenario(harness)
+        finally:
+            harness.scheduler.stop()
+        return harness.scheduler.stats()
+    return asyncio.run(main())
+
+def test_completed_job_is_used_by_the_real_request():
+    async def scenario(h):
+        assert h.schedule("s1", "k1")
+        await settle()
+        assert h.ran == ["k1"]
+        h.scheduler.record_request("k1", cached=True)
+    stats = run(scenario)
+    assert (stats["started"], stats["completed"], stats["used"], stats["joined"]) == (1, 1, 1, 0)
+    assert stats["hit_ratio"] == stats["request_hit_ratio"] == 1.0
+
+def test_newer_view_replaces_the_queued_job():
+    async def scenario(h):
+        h.spare = 2  # no headroom above the reserved slots
+        h.schedule("s1", "old")
+        h.schedule("s1", "new")
+        await settle()
+        assert h.ran == []
+        h.spare = 8
+        await settle()
+        assert h.ran == ["new"]
+    stats = run(scenario)
+    assert (stats["scheduled"], stats["superseded"], stats["started"]) == (2, 1, 1)
+
+def test_jobs_wait_for_headroom_above_the_reserved_slots():
+    async def scenario(h):
+        h.spare = 3
+        for session in range(3):
+            h.schedule(f"s{session}", f"k{session}", delay=0.2)
+        await settle()
+        # concurrency caps running jobs even with headroom
+        assert h.ran == ["k0", "k1"]
+        h.spare = 2
+        await settle(0.3)
+        assert h.ran == ["k0", "k1"]
+        h.spare = 3
+        await settle(0.3)
+        assert h.ran == ["k0", "k1", "k2"]
+    run(scenario)
+
+def test_budget_caps_jobs_per_minute():
+    async def scenario(h):
+        for session in range(4):
+            h.schedule(f"s{session}", f"k{session}")
+            await settle()
+        assert h.ran == ["k0", "k1"]
+        assert h.scheduler.stats()["queued"] == 2
+    run(scenario, budget_per_minute=2)
+
+def test_cached_and_running_requests_are_skipped():
+    async def scenario(h):
+        h.cached.add("cached")
+        assert not h.schedule("s1", "cached")
+        h.schedule("s2", "slow", delay=0.2)
+        await settle()
+        assert not h.schedule("s3", "slow")
+    stats = run(scenario)
+    assert stats["skipped"] == 2 and stats["scheduled"] == 1
+
+def test_joined_counts_only_completed_jobs():
+    async def scenario(h):
+        h.schedule("s1", "ok", delay=0.1)
+        h.schedule("s2", "fallback", result=dict(RESULT, fallback=True), delay=0.1)
+        await settle(0.02)
+        h.scheduler.record_request("ok", cached=False)
+        h.scheduler.record_request("fallback", cached=False)
+        await settle(0.2)
+        # The joined result was used; it isn't counted again as used
+        h.scheduler.record_request("ok", cached=True)
+    stats = run(scenario)
+    assert (stats["completed"], stats["fallbacks"], stats["joined"], stats["used"]) == (1, 1, 1, 0)
+    assert stats["requests"] == 3
+
+def test_failed_jobs_are_counted_and_not_used():
+    async def scenario(h):
+        h.schedule("s1", "broken", error=RuntimeError("boom"))
+        await settle()
+        h.scheduler.record_request("broken", cached=False)
+    stats = run(scenario)
+    assert (stats["failed"], stats["completed"], stats["used"]) == (1, 0, 0)
+    assert stats["request_hit_ratio"] == 0.0
+
+def test_old_queued_jobs_expire():
+    async def scenario(h):
+        h.spare = 0
+        h.schedule("s1", "k1")
+        await settle(0.1)
+        h.spare = 8
+        await settle()
+        assert h.ran == []
+    assert run(scenario, max_age_seconds=0.05)["expired"] == 1
+
+def test_queue_is_bounded():
+    async def scenario(h):
+        h.spare = 0
+        for session in range(3):
+            h.schedule(f"s{session}", f"k{session}")
+        h.spare = 8
+        await settle()
+        assert h.ran == ["k1", "k2"]
+    assert run(scenario, max_queued=2)["dropped"] == 1
+
+def test_disabled_scheduler_does_nothing():
+    async def scenario(h):
+        assert not h.schedule("s1", "k1")
+        h.scheduler.record_request("k1", cached=False)
+        await settle()
+        assert h.ran == []
+    stats = run(scenario, enabled=False)
+    assert stats["scheduled"] == stats["requests"] == 0
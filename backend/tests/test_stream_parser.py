@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+from services.stream_parser import IncrementalArrayParser
+
+ITEMS = [
+    {"product_id": "prod001", "explanation": "Braces } and brackets ] in \"quotes\"", "score": 9},
+    {"product_id": "prod002", "explanation": "Nested", "score": 8, "meta": {"tags": ["a", "b"]}},
+    {"product_id": "prod003", "explanation": "Last", "score": 7}
+]
+
+def feed_in_chunks(text, size):
+    parser = IncrementalArrayParser()
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return parser, items
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, 10000])
+def test_chunking_does_not_change_the_result(size):
+    text = "```json\n" + json.dumps(ITEMS, indent=2) + "\n```"
+    parser, items = feed_in_chunks(text, size)
+    assert items == ITEMS
+    assert parser.finished
+
+def test_objects_are_returned_as_soon_as_they_close():
+    text = json.dumps(ITEMS)
+    first_end = text.index('}, {') + 1
+    parser = IncrementalArrayParser()
+    assert parser.feed(text[:first_end - 1]) == []
+    assert parser.feed(text[first_end - 1:first_end]) == ITEMS[:1]
+    assert parser.feed(text[first_end:]) == ITEMS[1:]
+
+def test_trailing_commas_are_repaired():
+    parser = IncrementalArrayParser()
+    assert parser.feed('[{"product_id": "prod001", "score": 8,}]') == [{"product_id": "prod001", "score": 8}]
+
+def test_undecodable_objects_are_skipped():
+    parser = IncrementalArrayParser()
+    assert parser.feed('[{"product_id": prod001}, {"product_id": "prod002"}]') == [{"product_id": "prod002"}]
+
+def test_truncated_stream_keeps_complete_objects():
+    parser, items = feed_in_chunks(json.dumps(ITEMS)[:-15], 5)
+    assert items == ITEMS[:2]
+    assert not parser.finished
+
+def test_text_after_the_array_is_ignored():
+    parser = IncrementalArrayParser()
+    assert parser.feed(json.dumps(ITEMS[:1]) + ' and [{"product_id": "extra"}]') == ITEMS[:1]
+    assert parser.feed('{"product_id": "late"}') == []
+
+@pytest.mark.parametrize("prefix", ["See [5] and [a, b]. ", "Scores: [1, 2][] ", "[[ ", "[ 3 ] "])
+@pytest.mark.parametrize("size", [1, 3, 10000])
+def test_arrays_of_non_objects_before_the_answer_are_skipped(prefix, size):
+    parser, items = feed_in_chunks(prefix + json.dumps(ITEMS), size)
+    assert items == ITEMS
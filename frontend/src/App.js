@@ -1,10 +1,10 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import './styles/App.css';
 import Catalog from './components/Catalog';
 import UserPreferences from './components/UserPreferences';
 import Recommendations from './components/Recommendations';
 import BrowsingHistory from './components/BrowsingHistory';
-import { fetchProducts, getRecommendations } from './services/api';
+import { clearSession, fetchProducts, recordView, streamRecommendations } from './services/api';
 
 function App() {
   // State for products catalog
@@ -20,6 +20,17 @@ function App() {
   // State for browsing history
   const [browsingHistory, setBrowsingHistory] = useState([]);
   
+  // Server-side session mirroring the browsing history, one per page load;
+  // session calls are chained in order, and if a view couldn't be recorded
+  // the full history is sent instead
+  const [sessionId] = useState(() => (
+    window.crypto && window.crypto.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  ));
+  const sessionInSync = useRef(true);
+  const pendingView = useRef(Promise.resolve());
+  
   // State for recommendations
   const [recommendations, setRecommendations] = useState([]);
   
@@ -29,7 +40,9 @@ function App() {
   // State for error handling
   const [error, setError] = useState(null);
   
-  // Fetch products on component mount
+  // Fetch products on component mount, a page at a time, and again when the
+  // tab becomes visible so catalog updates show up; pages that haven't
+  // changed come back as 304s
   useEffect(() => {
     const loadProducts = async () => {
       try {
@@ -39,8 +52,15 @@ function App() {
         console.error('Error fetching products:', error);
       }
     };
+    const reloadWhenVisible = () => {
+      if (document.visibilityState === 'visible') {
+        loadProducts();
+      }
+    };
     
     loadProducts();
+    document.addEventListener('visibilitychange', reloadWhenVisible);
+    return () => document.removeEventListener('visibilitychange', reloadWhenVisible);
   }, []);
   
   // Handle product click to add to browsing history
@@ -48,6 +68,9 @@ function App() {
     // Avoid duplicates in browsing history
     if (!browsingHistory.includes(productId)) {
       setBrowsingHistory([...browsingHistory, productId]);
+      pendingView.current = pendingView.current.then(() => recordView(sessionId, productId, userPreferences)).catch(() => {
+        sessionInSync.current = false;
+      });
     }
   };
   
@@ -63,8 +86,18 @@ function App() {
   const handleGetRecommendations = async () => {
     setIsLoading(true);
     setError(null);
+    setRecommendations([]);
     try {
-      const data = await getRecommendations(userPreferences, browsingHistory);
+      // Show each recommendation as soon as it is streamed in
+      // Let the last view reach the session before asking for recommendations
+      await pendingView.current;
+      const onRecommendation = (recommendation) => {
+        setRecommendations(prev => [...prev, recommendation]);
+        setIsLoading(false);
+      };
+      const data = sessionInSync.current
+        ? await streamRecommendations(userPreferences, [], onRecommendation, sessionId)
+        : await streamRecommendations(userPreferences, browsingHistory, onRecommendation);
       setRecommendations(data.recommendations || []);
       
       // Smooth scroll to recommendations section after getting results
@@ -89,6 +122,11 @@ function App() {
   // Clear browsing history
   const handleClearHistory = () => {
     setBrowsingHistory([]);
+    pendingView.current = pendingView.current.then(() => clearSession(sessionId)).then(() => {
+      sessionInSync.current = true;
+    }).catch(() => {
+      sessionInSync.current = false;
+    });
   };
   
   return (
@@ -1,23 +1,61 @@
 const API_BASE_URL = 'http://localhost:5000/api';
 
-// Fetch all products from the API
-export const fetchProducts = async () => {
+// ETag and result of each products URL fetched, so fetching it again is a
+// conditional request and an unchanged page comes back as an empty 304
+const productPages = new Map();
+
+// Fetch one page of products. params may include category, brand, min_price,
+// max_price, min_rating, fields (comma-separated), limit, offset and cursor;
+// without limit the full catalog is returned. Resolves with
+// { products, nextCursor, total }.
+export const fetchProductsPage = async (params = {}) => {
   try {
-    const response = await fetch(`${API_BASE_URL}/products`);
+    const query = new URLSearchParams(params).toString();
+    const url = `${API_BASE_URL}/products${query ? `?${query}` : ''}`;
+    const cached = productPages.get(url);
+    const response = await fetch(url, {
+      headers: cached ? { 'If-None-Match': cached.etag } : {},
+    });
+    if (response.status === 304 && cached) {
+      return cached.page;
+    }
     if (!response.ok) {
       throw new Error(`HTTP error ${response.status}`);
     }
-    return await response.json();
+    const page = {
+      products: await response.json(),
+      nextCursor: response.headers.get('X-Next-Cursor'),
+      total: Number(response.headers.get('X-Total-Count')),
+    };
+    const etag = response.headers.get('ETag');
+    if (etag) {
+      productPages.set(url, { etag, page });
+    }
+    return page;
   } catch (error) {
     console.error('Error fetching products:', error);
     throw error;
   }
 };
 
-// Get recommendations based on user preferences and browsing history
+// Fetch every product matching params, following the cursor pageSize
+// products at a time (the server caps pages at PRODUCTS_MAX_PAGE_SIZE).
+export const fetchProducts = async (params = {}, pageSize = 500) => {
+  const products = [];
+  let cursor = null;
+  do {
+    const page = await fetchProductsPage({ ...params, limit: pageSize, ...(cursor ? { cursor } : {}) });
+    products.push(...page.products);
+    cursor = page.nextCursor;
+  } while (cursor);
+  return products;
+};
+
+// Get recommendations based on user preferences and browsing history.
+// Products come back in compact form, with just the fields the cards show.
 export const getRecommendations = async (preferences, browsingHistory) => {
   try {
-    const response = await fetch(`${API_BASE_URL}/recommendations`, {
+    const response = await fetch(`${API_BASE_URL}/recommendations?compact=true`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
@@ -37,4 +75,150 @@ export const getRecommendations = async (preferences, browsingHistory) => {
     console.error('Error getting recommendations:', error);
     throw error;
   }
+};
+// Get recommendations in tiers: resolves at once with rule-based
+// recommendations (or the refined ones, if ready), then calls onRefined with
+// the AI-refined result when the server pushes it.
+export const getTieredRecommendations = async (preferences, browsingHistory, onRefined) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/recommendations?tiered=true`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        preferences: preferences,
+        browsing_history: browsingHistory
+      }),
+    });
+    
+    if (!response.ok) {
+      throw new Error(`HTTP error ${response.status}`);
+    }
+    
+    const data = await response.json();
+    if (data.refinement) {
+      const events = new EventSource(API_BASE_URL.replace(/\/api$/, '') + data.refinement.events_url);
+      events.addEventListener('refined', (event) => {
+        events.close();
+        onRefined(JSON.parse(event.data));
+      });
+      events.addEventListener('error', () => events.close());
+    }
+    return data;
+  } catch (error) {
+    console.error('Error getting recommendations:', error);
+    throw error;
+  }
+};
+
+// Record a product view in the server-side session, so recommendation
+// requests can send the session ID instead of the whole browsing history.
+// With the current preferences, the server precomputes the recommendations
+// the next request will ask for.
+export const recordView = async (sessionId, productId, preferences = null) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/sessions/${encodeURIComponent(sessionId)}/views`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ product_ids: [productId], preferences }),
+    });
+    
+    if (!response.ok) {
+      throw new Error(`HTTP error ${response.status}`);
+    }
+    
+    return await response.json();
+  } catch (error) {
+    console.error('Error recording product view:', error);
+    throw error;
+  }
+};
+
+// Forget a server-side session, e.g. when the browsing history is cleared.
+export const clearSession = async (sessionId) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/sessions/${encodeURIComponent(sessionId)}`, {
+      method: 'DELETE',
+    });
+    
+    if (!response.ok) {
+      throw new Error(`HTTP error ${response.status}`);
+    }
+    
+    return await response.json();
+  } catch (error) {
+    console.error('Error clearing session:', error);
+    throw error;
+  }
+};
+
+// Stream recommendations over Server-Sent Events. onRecommendation is called
+// with each recommendation as soon as the server has it; resolves with the
+// final summary ({ recommendations, count, ... }). With a sessionId, the
+// server uses that session's history and browsingHistory can be empty.
+// Products come back in compact form, with just the fields the cards show.
+export const streamRecommendations = async (preferences, browsingHistory, onRecommendation, sessionId = null) => {
+  try {
+    const response = await fetch(`${API_BASE_URL}/recommendations/stream?compact=true`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': 'text/event-stream',
+      },
+      body: JSON.stringify({
+        preferences: preferences,
+        browsing_history: browsingHistory,
+        ...(sessionId ? { session_id: sessionId } : {})
+      }),
+    });
+    
+    if (!response.ok) {
+      throw new Error(`HTTP error ${response.status}`);
+    }
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let summary = null;
+    
+    while (summary === null) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      
+      // Events are separated by a blank line
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+        
+        let eventName = 'message';
+        let data = '';
+        rawEvent.split('\n').forEach((line) => {
+          if (line.startsWith('event: ')) {
+            eventName = line.slice(7);
+          } else if (line.startsWith('data: ')) {
+            data += line.slice(6);
+          }
+        });
+        
+        if (eventName === 'recommendation') {
+          onRecommendation(JSON.parse(data));
+        } else if (eventName === 'summary') {
+          summary = JSON.parse(data);
+        }
+      }
+    }
+    
+    return summary || { recommendations: [], count: 0 };
+  } catch (error) {
+    console.error('Error streaming recommendations:', error);
+    throw error;
+  }
 };
\ No newline at end of file